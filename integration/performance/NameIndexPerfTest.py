@@ -0,0 +1,92 @@
+from unittest import TestCase
+
+from cloudshell.core.logger.qs_logger import get_qs_logger
+from mock import Mock
+from pyVmomi import vim, vmodl
+from TimerWrapper import TimerWrapper
+from cloudshell.cp.vcenter.common.vcenter.name_index import VCenterNameIndex
+from cloudshell.cp.vcenter.common.vcenter.vmomi_service import pyVmomiService
+
+# consts
+INVENTORY_SIZES = [100, 1000, 10000]
+N_LOOKUPS = 20
+# seconds of a single round trip to the vCenter used to estimate the time of each lookup
+ROUND_TRIP = 0.002
+PERFORMANCE_TEST = '[Performance_Testing] [{0}] {1}'
+
+
+class SimulatedVCenter(object):
+    """
+    Counts the round trips a lookup makes to a vCenter holding the given number of datastores,
+    every lazy property read of a managed object and every PropertyCollector call is one round trip
+    """
+
+    def __init__(self, size):
+        self.round_trips = 0
+        self.stub = Mock()
+        self.stub.host = 'simulated:{0}'.format(size)
+        self.names = [('datastore-{0}'.format(i), 'ds{0}'.format(i)) for i in range(size)]
+        self.content = Mock()
+        self.content.rootFolder = vim.Folder('group-d1', self.stub)
+        self.content.viewManager.CreateContainerView = self._create_view
+        self.content.propertyCollector.RetrieveContents = self._retrieve_contents
+
+    def _create_view(self, *args):
+        self.round_trips += 1
+        view = Mock(spec=vim.view.ContainerView)
+        view.view = [self._lazy_object(name) for _, name in self.names]
+        view.DestroyView = self._count
+        return view
+
+    def _lazy_object(self, name):
+        vcenter = self
+
+        class LazyDatastore(object):
+            @property
+            def name(self):
+                vcenter.round_trips += 1
+                return name
+
+        return LazyDatastore()
+
+    def _retrieve_contents(self, specs):
+        self.round_trips += 1
+        return [vmodl.query.PropertyCollector.ObjectContent(obj=vim.Datastore(mo_id, self.stub),
+                                                            propSet=[vmodl.DynamicProperty(name='name', val=name)])
+                for mo_id, name in self.names]
+
+    def _count(self, *args):
+        self.round_trips += 1
+
+
+class NameIndexPerfTest(TestCase):
+    def setUp(self):
+        self.logger = get_qs_logger('performance')
+
+    def _run(self, pv_service, vcenter, size):
+        with TimerWrapper() as t:
+            for i in range(N_LOOKUPS):
+                # the last datastore is the worst case of a scan
+                pv_service.get_obj(vcenter.content, [[vim.Datastore]], 'ds{0}'.format(size - 1))
+        return t.secs, vcenter.round_trips
+
+    def test_get_obj_lookup_time_by_inventory_size(self):
+        self.logger.info(PERFORMANCE_TEST.format('test_get_obj_lookup_time_by_inventory_size', 'START'))
+        for size in INVENTORY_SIZES:
+            scan_secs, scan_round_trips = self._run(pyVmomiService(Mock(), Mock(), Mock()),
+                                                    SimulatedVCenter(size), size)
+            index_secs, index_round_trips = self._run(pyVmomiService(Mock(), Mock(), Mock(),
+                                                                     name_index=VCenterNameIndex()),
+                                                      SimulatedVCenter(size), size)
+
+            for name, secs, round_trips in [('container view scan', scan_secs, scan_round_trips),
+                                            ('name index', index_secs, index_round_trips)]:
+                self.logger.info('{0} datastores, {1}: {2} lookups, {3} round trips, '
+                                 'estimated {4:.3f} (sec) per lookup'
+                                 .format(size, name, N_LOOKUPS, round_trips,
+                                         (secs + round_trips * ROUND_TRIP) / N_LOOKUPS))
+
+            # create the view, read the names, destroy the view
+            self.assertEqual(index_round_trips, 3)
+            self.assertGreaterEqual(scan_round_trips, N_LOOKUPS * size)
+        self.logger.info(PERFORMANCE_TEST.format('test_get_obj_lookup_time_by_inventory_size', 'END'))
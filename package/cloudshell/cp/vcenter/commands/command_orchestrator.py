@@ -43,11 +43,13 @@ from cloudshell.cp.vcenter.models.vCenterCloneVMFromVMResourceModel import vCent
 from cloudshell.cp.vcenter.models.vCenterVMFromImageResourceModel import vCenterVMFromImageResourceModel
 from cloudshell.cp.vcenter.models.vCenterVMFromTemplateResourceModel import vCenterVMFromTemplateResourceModel
 from cloudshell.cp.vcenter.network.dvswitch.creator import DvPortGroupCreator
+from cloudshell.cp.vcenter.network.dvswitch.reaper import PortGroupReaper
 from cloudshell.cp.vcenter.network.dvswitch.name_generator import DvPortGroupNameGenerator
 from cloudshell.cp.vcenter.network.vlan.factory import VlanSpecFactory
 from cloudshell.cp.vcenter.network.vlan.range_parser import VLanIdRangeParser
 from cloudshell.cp.vcenter.network.vnic.vnic_service import VNicService
 from cloudshell.cp.vcenter.vm.deploy import VirtualMachineDeployer
+from cloudshell.cp.vcenter.vm.deploy_scheduler import DeployScheduler
 from cloudshell.cp.vcenter.vm.dvswitch_connector import VirtualSwitchToMachineConnector
 from cloudshell.cp.vcenter.vm.ip_manager import VMIPManager
 from cloudshell.cp.vcenter.vm.portgroup_configurer import VirtualMachinePortGroupConfigurer
@@ -56,8 +58,20 @@ from cloudshell.cp.vcenter.vm.vnic_to_network_mapper import VnicToNetworkMapper
 from cloudshell.cp.vcenter.models.DeployFromTemplateDetails import DeployFromTemplateDetails
 from cloudshell.cp.core.models import DeployApp, DeployAppResult, SaveApp, SaveAppResult
 from cloudshell.cp.vcenter.common.vcenter.folder_manager import FolderManager
+from cloudshell.cp.vcenter.common.vcenter.inventory_index import VCenterInventory
+from cloudshell.cp.vcenter.common.vcenter.clone_source_cache import CloneSourceCache
+from cloudshell.cp.vcenter.common.vcenter.name_index import VCenterNameIndex
+from cloudshell.cp.vcenter.common.vcenter.portgroup_index import DvPortGroupIndex
+from cloudshell.cp.vcenter.common.vcenter.datastore_placement import DatastorePlacement
+from cloudshell.cp.vcenter.common.vcenter.host_placement import HostPlacement, HOST_PLACEMENT_ENABLED
+from cloudshell.cp.vcenter.common.vcenter.task_completion_engine import TaskCompletionEngine
 from cloudshell.cp.vcenter.common.vcenter.cancellation_service import CommandCancellationService
 
+# the deployments a bulk deploy clones and the resource model of their attributes
+CLONE_DEPLOYMENT_MODELS = {'vCenter Clone VM From VM': vCenterCloneVMFromVMResourceModel,
+                           'VCenter Deploy VM From Linked Clone': VCenterDeployVMFromLinkedCloneResourceModel,
+                           'vCenter VM From Template': vCenterVMFromTemplateResourceModel}
+
 
 class CommandOrchestrator(object):
     def __init__(self):
@@ -66,9 +80,15 @@ class CommandOrchestrator(object):
         in here the driver is going to be bootstrapped
 
         """
-        synchronous_task_waiter = SynchronousTaskWaiter()
+        synchronous_task_waiter = SynchronousTaskWaiter(completion_engine=TaskCompletionEngine())
         cancellation_service = CommandCancellationService()
-        pv_service = pyVmomiService(connect=SmartConnect, disconnect=Disconnect, task_waiter=synchronous_task_waiter)
+        pv_service = pyVmomiService(connect=SmartConnect, disconnect=Disconnect, task_waiter=synchronous_task_waiter,
+                                    inventory=VCenterInventory(live_updates=True),
+                                    clone_source_cache=CloneSourceCache(),
+                                    name_index=VCenterNameIndex(),
+                                    datastore_placement=DatastorePlacement(),
+                                    host_placement=HostPlacement() if HOST_PLACEMENT_ENABLED else None,
+                                    portgroup_index=DvPortGroupIndex())
         self.resource_model_parser = ResourceModelParser()
         port_group_name_generator = DvPortGroupNameGenerator()
 
@@ -95,7 +115,10 @@ class CommandOrchestrator(object):
                                               synchronous_task_waiter=synchronous_task_waiter,
                                               vnic_to_network_mapper=vnic_to_network_mapper,
                                               vnic_service=VNicService(),
-                                              name_gen=port_group_name_generator)
+                                              name_gen=port_group_name_generator,
+                                              reaper=PortGroupReaper(synchronous_task_waiter=synchronous_task_waiter,
+                                                                     name_generator=port_group_name_generator,
+                                                                     pyvmomi_service=pv_service))
         virtual_switch_to_machine_connector = VirtualSwitchToMachineConnector(dv_port_group_creator,
                                                                               virtual_machine_port_group_configurer)
 
@@ -105,6 +128,7 @@ class CommandOrchestrator(object):
                                               context_based_logger_factory=ContextBasedLoggerFactory())
         # Deploy Command
         self.deploy_command = DeployCommand(deployer=vm_deployer)
+        self.deploy_scheduler = DeployScheduler()
 
         # Virtual Switch Revoke
         self.virtual_switch_disconnect_command = \
@@ -290,6 +314,46 @@ class CommandOrchestrator(object):
         deploy_result_action.actionId = deploy_action.actionId
         return deploy_result_action
 
+    def deploy_bulk(self, context, deploy_actions, cancellation_context):
+        """
+        Deploy Bulk Command, clones all the apps of a request over one connection
+
+        :param CancellationContext cancellation_context:
+        :param ResourceCommandContext context: the context of the command
+        :param list[DeployApp] deploy_actions: actions of the deployments in CLONE_DEPLOYMENT_MODELS
+        :return list[DeployAppResult] deploy results in the order the apps finished
+        """
+        results = []
+        data_holders = []
+        for deploy_action in deploy_actions:
+            try:
+                data_holders.append((deploy_action.actionId, self._create_clone_data_holder(deploy_action)))
+            except Exception as e:
+                results.append(DeployAppResult(actionId=deploy_action.actionId, success=False,
+                                               errorMessage=str(e)))
+
+        if data_holders:
+            results.extend(self.command_wrapper.execute_command_with_connection(
+                context,
+                self.deploy_command.execute_deploy_bulk,
+                data_holders,
+                cancellation_context,
+                self.folder_manager,
+                self.deploy_scheduler))
+        return results
+
+    def _create_clone_data_holder(self, deploy_action):
+        deployment = deploy_action.actionParams.deployment
+        resource_model = self.resource_model_parser.convert_to_resource_model(
+            attributes=deployment.attributes,
+            resource_model_type=CLONE_DEPLOYMENT_MODELS[deployment.deploymentPath])
+
+        if isinstance(resource_model, VCenterDeployVMFromLinkedCloneResourceModel) and \
+                not resource_model.vcenter_vm_snapshot:
+            raise ValueError('Please insert snapshot to deploy an app from a linked clone')
+
+        return DeployFromTemplateDetails(resource_model, deploy_action.actionParams.appName)
+
     def deploy_from_image(self, context, deploy_action, cancellation_context):
         """
         Deploy From Image Command, will deploy vm from ovf image
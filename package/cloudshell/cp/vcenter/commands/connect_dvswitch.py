@@ -54,6 +54,37 @@ class VirtualSwitchConnectCommand:
         updated_mappings = self.virtual_switch_to_machine_connector.connect_by_mapping(
             si, vm, mappings, default_network_instance, reserved_networks, logger, promiscuous_mode)
 
+        return self.get_connection_results(vm_uuid, updated_mappings)
+
+    def plan_connect(self, si, logger, plan, vm_network_mappings, reserved_networks, dv_switch_name,
+                     promiscuous_mode):
+        """
+        Adds the vNICs to connect to the change plan of the VM, the VM is reconfigured when the plan is applied
+        :param si: VmWare Service Instance - defined connection to vCenter
+        :param logger:
+        :param VmChangePlan plan: the changes of the VM
+        :param vm_network_mappings: <collection of 'VmNetworkMapping'>
+        :param reserved_networks:
+        :param dv_switch_name: <str> Default dvSwitch name
+        :param promiscuous_mode <str> 'True' or 'False' turn on/off promiscuous mode for the port group
+        """
+        if not plan.default_network:
+            raise ValueError('Default Network not found')
+
+        if vm_has_no_vnics(plan.vm):
+            raise ValueError('Trying to connect VM (uuid: {0}) but it has no vNics'.format(plan.vm_uuid))
+
+        mappings = self._prepare_mappings(dv_switch_name=dv_switch_name, vm_network_mappings=vm_network_mappings)
+        self.virtual_switch_to_machine_connector.plan_by_mapping(si, plan, mappings, reserved_networks, logger,
+                                                                 promiscuous_mode)
+
+    @staticmethod
+    def get_connection_results(vm_uuid, updated_mappings):
+        """
+        :param vm_uuid: <str> UUID for VM
+        :param updated_mappings: <collection of 'VNicDeviceMapper'> the connected vNICs
+        :rtype: list[ConnectionResult]
+        """
         connection_results = []
         for updated_mapping in updated_mappings:
 
@@ -1,11 +1,13 @@
+import json
 import traceback
-from multiprocessing.pool import ThreadPool
 
 import jsonpickle
 
 from cloudshell.cp.vcenter.models.ActionResult import ActionResult
-from cloudshell.cp.vcenter.models.DeployDataHolder import DeployDataHolder
+from cloudshell.cp.vcenter.models.DeployDataHolder import LazyDeployDataHolder
+from cloudshell.cp.vcenter.network.connectivity_executor import ConnectivityExecutor
 from cloudshell.cp.vcenter.vm.dvswitch_connector import VmNetworkMapping, VmNetworkRemoveMapping
+from cloudshell.cp.vcenter.common.vcenter.inventory_index import VCenterInventory
 from cloudshell.cp.vcenter.common.vcenter.vm_location import VMLocation
 from cloudshell.cp.vcenter.common.utilites.common_utils import get_error_message_from_exception
 
@@ -17,7 +19,7 @@ ACTION_TYPE_REMOVE_VLAN = 'removeVlan'
 
 
 class ConnectionCommandOrchestrator(object):
-    def __init__(self, connector, disconnector, resource_model_parser):
+    def __init__(self, connector, disconnector, resource_model_parser, executor=None):
         """
 
         :param connector:
@@ -25,17 +27,13 @@ class ConnectionCommandOrchestrator(object):
         :param disconnector:
         :type disconnector: cloudshell.cp.vcenter.commands.disconnect_dvswitch.VirtualSwitchToMachineDisconnectCommand
         :param resource_model_parser:
+        :param ConnectivityExecutor executor: runs the changes of every vm, shared by all the requests
         :return:
         """
         self.connector = connector
         self.disconnector = disconnector
         self.resource_model_parser = resource_model_parser
-        self.vcenter_data_model = None
-        self.reserved_networks = []
-        self.dv_switch_path = ''
-        self.dv_switch_name = ''
-        self.default_network = ''
-        self.logger = None
+        self.executor = executor or ConnectivityExecutor()
 
     def connect_bulk(self, si, logger, vcenter_data_model, request):
         """
@@ -45,37 +43,31 @@ class ConnectionCommandOrchestrator(object):
         :param request:
         :return:
         """
-        self.logger = logger
+        logger.info('Apply connectivity changes has started')
+        logger.debug('Apply connectivity changes has started with the requet: {0}'.format(request))
 
-        self.logger.info('Apply connectivity changes has started')
-        self.logger.debug('Apply connectivity changes has started with the requet: {0}'.format(request))
-
-        holder = DeployDataHolder(jsonpickle.decode(request))
-
-        self.vcenter_data_model = vcenter_data_model
-        if vcenter_data_model.reserved_networks:
-            self.reserved_networks = [name.strip() for name in vcenter_data_model.reserved_networks.split(',')]
+        # the request is plain json, the actions are converted when they are read
+        holder = LazyDeployDataHolder(json.loads(request))
 
         if not vcenter_data_model.default_dvswitch:
             return self._handle_no_dvswitch_error(holder)
 
-        dvswitch_location = VMLocation.create_from_full_path(vcenter_data_model.default_dvswitch)
-
-        self.dv_switch_path = VMLocation.combine([vcenter_data_model.default_datacenter, dvswitch_location.path])
-        self.dv_switch_name = dvswitch_location.name
-        self.default_network = VMLocation.combine(
-            [vcenter_data_model.default_datacenter, vcenter_data_model.holding_network])
+        context = self.RequestContext.create(logger, vcenter_data_model)
 
-        mappings = self._map_requsets(holder.driverRequest.actions)
-        self.logger.debug('Connectivity actions mappings: {0}'.format(jsonpickle.encode(mappings, unpicklable=False)))
+        mappings = self._map_requsets(holder.driverRequest.actions, context)
+        logger.debug('Connectivity actions mappings: {0}'.format(jsonpickle.encode(mappings, unpicklable=False)))
 
-        pool = ThreadPool()
-        async_results = self._run_async_connection_actions(si, mappings, pool, logger)
+        vcenter_key = VCenterInventory.get_vcenter_key(si)
+        runs = self._create_connection_actions(si, mappings, context)
+        logger.info('Connectivity changes of {0} vms queued, {1} changes are waiting for the vCenter'
+                    .format(len(runs), self.executor.queue_depth(vcenter_key)))
 
-        results = self._get_async_results(async_results, pool)
-        self.logger.info('Apply connectivity changes done')
-        self.logger.debug('Apply connectivity has finished with the results: {0}'.format(jsonpickle.encode(results,
-                                                                                                           unpicklable=False)))
+        results = []
+        for action_results in self.executor.run_all(vcenter_key, runs):
+            results += action_results
+        logger.info('Apply connectivity changes done')
+        logger.debug('Apply connectivity has finished with the results: {0}'.format(jsonpickle.encode(results,
+                                                                                                      unpicklable=False)))
         return results
 
     def _handle_no_dvswitch_error(self, holder):
@@ -85,9 +77,9 @@ class ConnectionCommandOrchestrator(object):
             err_res.append(self._create_error_action_res(action, error))
         return err_res
 
-    def _map_requsets(self, actions):
+    def _map_requsets(self, actions, context):
         grouped_by_vm_by_requset_by_mode = self._group_action(actions)
-        vm_mapping = self._create_mapping_from_groupings(grouped_by_vm_by_requset_by_mode)
+        vm_mapping = self._create_mapping_from_groupings(grouped_by_vm_by_requset_by_mode, context)
         return vm_mapping
 
     def _group_action(self, actions):
@@ -123,7 +115,7 @@ class ConnectionCommandOrchestrator(object):
             self._add_safely_to_dict(dictionary=grouped_by_vm, key=vm_uuid, value=action)
         return grouped_by_vm
 
-    def _create_mapping_from_groupings(self, grouped_by_vm_by_requset_by_mode):
+    def _create_mapping_from_groupings(self, grouped_by_vm_by_requset_by_mode, context):
         vm_mapping = dict()
         for vm, req_to_modes in grouped_by_vm_by_requset_by_mode.items():
             actions_mapping = self.ActionsMapping()
@@ -131,7 +123,7 @@ class ConnectionCommandOrchestrator(object):
             remove_mappings = self._get_remove_mappings(req_to_modes, vm)
             actions_mapping.remove_mapping = remove_mappings
 
-            set_mappings = self._get_set_mappings(req_to_modes)
+            set_mappings = self._get_set_mappings(req_to_modes, context)
             actions_mapping.set_mapping = set_mappings
 
             actions_mapping.action_tree = req_to_modes
@@ -161,7 +153,7 @@ class ConnectionCommandOrchestrator(object):
             macs += self._split_names(interface_attribute)
         return macs
 
-    def _get_set_mappings(self, req_to_modes):
+    def _get_set_mappings(self, req_to_modes, context):
         set_mappings = []
         if ACTION_TYPE_SET_VLAN in req_to_modes:
             set_requests = req_to_modes[ACTION_TYPE_SET_VLAN]
@@ -170,45 +162,110 @@ class ConnectionCommandOrchestrator(object):
                     vnic_name = self._get_vnic_name(action)
                     vnic_names = self._split_names(vnic_name)
                     for name in vnic_names:
-                        vnic_to_network = self._create_map(action.connectionParams.vlanId, mode, name)
+                        vnic_to_network = self._create_map(action.connectionParams.vlanId, mode, name, context)
                         set_mappings.append(vnic_to_network)
 
         # this line makes sure that the vNICS with names are first
         return sorted(set_mappings, key=lambda x: x.vnic_name, reverse=True)
 
-    def _create_map(self, vlan_id, mode, vnic_name):
+    def _create_map(self, vlan_id, mode, vnic_name, context):
         vnic_to_network = VmNetworkMapping()
         vnic_to_network.vnic_name = self._validate_vnic_name(vnic_name)
-        vnic_to_network.dv_switch_path = self.dv_switch_path
-        vnic_to_network.dv_switch_name = self.dv_switch_name
+        vnic_to_network.dv_switch_path = context.dv_switch_path
+        vnic_to_network.dv_switch_name = context.dv_switch_name
         vnic_to_network.vlan_id = vlan_id
         vnic_to_network.vlan_spec = mode
         return vnic_to_network
 
-    def _run_async_connection_actions(self, si, mappings, pool, logger):
-
-        async_results = []
+    def _create_connection_actions(self, si, mappings, context):
+        runs = []
         for vm, action_mappings in mappings.items():
-            async_results.append(pool.apply_async(self._apply_connectivity_changes, (si, vm, action_mappings, logger)))
-        return async_results
+            runs.append(self._create_connection_action(si, vm, action_mappings, context))
+        return runs
+
+    def _create_connection_action(self, si, vm_uuid, action_mappings, context):
+        def run():
+            return self._apply_connectivity_changes(si, vm_uuid, action_mappings, context)
+        return run
+
+    def _apply_connectivity_changes(self, si, vm_uuid, action_mappings, context):
+        if action_mappings.remove_mapping and action_mappings.set_mapping:
+            return self._apply_planned_changes(si, vm_uuid, action_mappings, context)
 
-    def _apply_connectivity_changes(self, si, vm_uuid, action_mappings, logger):
         results = []
         if action_mappings.remove_mapping:
-            remove_results = self._remove_vlan(action_mappings, si, vm_uuid, logger)
+            remove_results = self._remove_vlan(action_mappings, si, vm_uuid, context)
             results += remove_results
 
         if action_mappings.set_mapping:
-            set_results = self._set_vlan(action_mappings, si, vm_uuid, logger)
+            set_results = self._set_vlan(action_mappings, si, vm_uuid, context)
             results += set_results
         return results
 
-    def _set_vlan(self, action_mappings, si, vm_uuid, logger):
+    def _apply_planned_changes(self, si, vm_uuid, action_mappings, context):
+        """
+        merges the removeVlan and setVlan actions of the vm into one change plan, the vm and its devices are read
+        once and the vm is reconfigured with a single task
+        """
+        logger = context.logger
+        remove_vlan_actions = action_mappings.action_tree[ACTION_TYPE_REMOVE_VLAN]
+        set_vlan_actions = action_mappings.action_tree[ACTION_TYPE_SET_VLAN]
+        try:
+            plan = self.disconnector.create_change_plan(si, context.vcenter_data_model, vm_uuid)
+        except Exception as e:
+            logger.exception('Exception raised while reading vm({0})'.format(vm_uuid))
+            return self._get_error_results(remove_vlan_actions, e) + self._get_error_results(set_vlan_actions, e)
+
+        remove_error = None
+        try:
+            logger.info('planning the disconnection of vm({0})'.format(vm_uuid))
+            self.disconnector.plan_disconnect(logger, plan, action_mappings.remove_mapping)
+        except Exception as e:
+            logger.exception('Exception raised while disconnecting vm({0})'.format(vm_uuid))
+            remove_error = e
+
+        set_error = None
+        try:
+            logger.info('planning the connection of vm({0})'.format(vm_uuid))
+            self.connector.plan_connect(si=si,
+                                        logger=logger,
+                                        plan=plan,
+                                        vm_network_mappings=action_mappings.set_mapping,
+                                        reserved_networks=context.reserved_networks,
+                                        dv_switch_name=context.dv_switch_name,
+                                        promiscuous_mode=context.vcenter_data_model.promiscuous_mode)
+        except Exception as e:
+            logger.exception('Exception raised while connecting vm({0})'.format(vm_uuid))
+            set_error = e
+
+        try:
+            diff = self.disconnector.apply_change_plan(logger, plan, context.reserved_networks)
+            logger.info('vm({0}) reconfigured with {1} vNIC changes'.format(vm_uuid, len(diff)))
+            logger.debug('vNIC changes of vm({0}): {1}'.format(vm_uuid, diff))
+        except Exception as e:
+            logger.exception('Exception raised while reconfiguring vm({0})'.format(vm_uuid))
+            remove_error = remove_error or e
+            set_error = set_error or e
+
+        if remove_error:
+            results = self._get_error_results(remove_vlan_actions, remove_error)
+        else:
+            results = self._get_remove_vlan_results(remove_vlan_actions, plan.disconnected)
+
+        if set_error:
+            results += self._get_error_results(set_vlan_actions, set_error)
+        else:
+            connection_results = self.connector.get_connection_results(vm_uuid, plan.connected)
+            results += self._get_set_vlan_results(set_vlan_actions, connection_results)
+        return results
+
+    def _set_vlan(self, action_mappings, si, vm_uuid, context):
+        logger = context.logger
         results = []
         set_vlan_actions = action_mappings.action_tree[ACTION_TYPE_SET_VLAN]
         try:
-            self.logger.info('connecting vm({0})'.format(vm_uuid))
-            self.logger.debug('connecting vm({0}) with the mappings'.format(vm_uuid,
+            logger.info('connecting vm({0})'.format(vm_uuid))
+            logger.debug('connecting vm({0}) with the mappings'.format(vm_uuid,
                                                                             jsonpickle.encode(action_mappings,
                                                                                               unpicklable=False)))
             connection_results = self.connector.connect_to_networks(
@@ -216,25 +273,31 @@ class ConnectionCommandOrchestrator(object):
                 logger=logger,
                 vm_uuid=vm_uuid,
                 vm_network_mappings=action_mappings.set_mapping,
-                default_network_name=self.default_network,
-                reserved_networks=self.reserved_networks,
-                dv_switch_name=self.dv_switch_name,
-                promiscuous_mode=self.vcenter_data_model.promiscuous_mode)
+                default_network_name=context.default_network,
+                reserved_networks=context.reserved_networks,
+                dv_switch_name=context.dv_switch_name,
+                promiscuous_mode=context.vcenter_data_model.promiscuous_mode)
 
-            connection_res_map = self._prepare_connection_results_for_extraction(connection_results)
-            act_by_mode_by_vlan = self._group_action_by_vlan_id(set_vlan_actions)
-            act_by_mode_by_vlan_by_nic = self._group_actions_by_vlan_by_vnic(act_by_mode_by_vlan)
-            results += self._get_set_vlan_result_suc(act_by_mode_by_vlan_by_nic, connection_res_map)
+            results += self._get_set_vlan_results(set_vlan_actions, connection_results)
 
         except Exception as e:
-            self.logger.exception('Exception raised while connecting vm({})'.format(vm_uuid))
-            for mode, actions in set_vlan_actions.items():
-                for action in actions:
-                    error_result = self._create_error_action_res(action, e)
-                    results.append(error_result)
-            results = self._consolidate_duplicate_results(results)
+            logger.exception('Exception raised while connecting vm({})'.format(vm_uuid))
+            results = self._get_error_results(set_vlan_actions, e)
         return results
 
+    def _get_set_vlan_results(self, set_vlan_actions, connection_results):
+        connection_res_map = self._prepare_connection_results_for_extraction(connection_results)
+        act_by_mode_by_vlan = self._group_action_by_vlan_id(set_vlan_actions)
+        act_by_mode_by_vlan_by_nic = self._group_actions_by_vlan_by_vnic(act_by_mode_by_vlan)
+        return self._get_set_vlan_result_suc(act_by_mode_by_vlan_by_nic, connection_res_map)
+
+    def _get_error_results(self, mode_to_actions, e):
+        results = []
+        for mode, actions in mode_to_actions.items():
+            for action in actions:
+                results.append(self._create_error_action_res(action, e))
+        return self._consolidate_duplicate_results(results)
+
     def _prepare_connection_results_for_extraction(self, connection_results):
         connection_res_map = dict()
         for connection_result in connection_results:
@@ -315,48 +378,48 @@ class ConnectionCommandOrchestrator(object):
                 self._add_safely_to_dict(dictionary=set_actions_grouped_by_vlan_id[mode], key=vlan_id, value=action)
         return set_actions_grouped_by_vlan_id
 
-    def _remove_vlan(self, action_mappings, si, vm_uuid, logger):
+    def _remove_vlan(self, action_mappings, si, vm_uuid, context):
+        logger = context.logger
         final_res = []
         mode_to_actions = action_mappings.action_tree[ACTION_TYPE_REMOVE_VLAN]
         try:
-            self.logger.info('disconnecting vm({0})'.format(vm_uuid))
-            self.logger.debug('disconnecting vm({0}) with the mappings'.format(vm_uuid,
+            logger.info('disconnecting vm({0})'.format(vm_uuid))
+            logger.debug('disconnecting vm({0}) with the mappings'.format(vm_uuid,
                                                                                jsonpickle.encode(action_mappings,
                                                                                                  unpicklable=False)))
             connection_results = self.disconnector.disconnect_from_networks(si,
                                                                             logger,
-                                                                            self.vcenter_data_model,
+                                                                            context.vcenter_data_model,
                                                                             vm_uuid,
                                                                             action_mappings.remove_mapping)
 
-            interface_to_action = dict()
-            for mode, actions in mode_to_actions.items():
-                for action in actions:
-                    names = self._get_macs_from_action(action)
-                    for name in names:
-                        interface_to_action[name] = action
-            results = []
-            for res in connection_results:
-                action = interface_to_action[res.vnic_mac]
-                action_result = ActionResult()
-                action_result.actionId = action.actionId
-                action_result.success = True
-                action_result.infoMessage = SUCCESSFULLY_REMOVED
-                action_result.type = ACTION_TYPE_REMOVE_VLAN
-                action_result.errorMessage = None
-                action_result.updatedInterface = res.vnic_mac
-                results.append(action_result)
-            final_res = self._consolidate_duplicate_results(results)
+            final_res = self._get_remove_vlan_results(mode_to_actions, connection_results)
         except Exception as e:
-            self.logger.error('Exception raised while disconnecting vm({0}) with exception: {1}'
+            logger.error('Exception raised while disconnecting vm({0}) with exception: {1}'
                               .format(vm_uuid, traceback.format_exc()))
-            for mode, actions in mode_to_actions.items():
-                for action in actions:
-                    error_result = self._create_error_action_res(action, e)
-                    final_res.append(error_result)
-            final_res = self._consolidate_duplicate_results(final_res)
+            final_res = self._get_error_results(mode_to_actions, e)
         return final_res
 
+    def _get_remove_vlan_results(self, mode_to_actions, connection_results):
+        interface_to_action = dict()
+        for mode, actions in mode_to_actions.items():
+            for action in actions:
+                names = self._get_macs_from_action(action)
+                for name in names:
+                    interface_to_action[name] = action
+        results = []
+        for res in connection_results:
+            action = interface_to_action[res.vnic_mac]
+            action_result = ActionResult()
+            action_result.actionId = action.actionId
+            action_result.success = True
+            action_result.infoMessage = SUCCESSFULLY_REMOVED
+            action_result.type = ACTION_TYPE_REMOVE_VLAN
+            action_result.errorMessage = None
+            action_result.updatedInterface = res.vnic_mac
+            results.append(action_result)
+        return self._consolidate_duplicate_results(results)
+
     @staticmethod
     def _create_error_action_res(action, e):
         error_result = ActionResult()
@@ -392,16 +455,6 @@ class ConnectionCommandOrchestrator(object):
             return vnic_name_values[0]
         return None
 
-    @staticmethod
-    def _get_async_results(async_results, pool):
-        pool.close()
-        pool.join()
-        results = []
-        for async_result in async_results:
-            action_results = async_result.get()
-            results += action_results
-        return results
-
     @staticmethod
     def _get_mac(action):
         for att in action.connectorAttributes:
@@ -414,6 +467,40 @@ class ConnectionCommandOrchestrator(object):
             self.remove_mapping = ''
             self.set_mapping = ''
 
+    class RequestContext(object):
+        """
+        The state of one connectivity request, passed along instead of kept on the orchestrator
+        so requests of several sandboxes can run at the same time
+        """
+
+        def __init__(self, logger, vcenter_data_model, reserved_networks, dv_switch_path, dv_switch_name,
+                     default_network):
+            self.logger = logger
+            self.vcenter_data_model = vcenter_data_model
+            self.reserved_networks = reserved_networks
+            self.dv_switch_path = dv_switch_path
+            self.dv_switch_name = dv_switch_name
+            self.default_network = default_network
+
+        @classmethod
+        def create(cls, logger, vcenter_data_model):
+            """
+            :param VMwarevCenterResourceModel vcenter_data_model:
+            """
+            reserved_networks = []
+            if vcenter_data_model.reserved_networks:
+                reserved_networks = [name.strip() for name in vcenter_data_model.reserved_networks.split(',')]
+
+            dvswitch_location = VMLocation.create_from_full_path(vcenter_data_model.default_dvswitch)
+            return cls(logger=logger,
+                       vcenter_data_model=vcenter_data_model,
+                       reserved_networks=reserved_networks,
+                       dv_switch_path=VMLocation.combine([vcenter_data_model.default_datacenter,
+                                                          dvswitch_location.path]),
+                       dv_switch_name=dvswitch_location.name,
+                       default_network=VMLocation.combine([vcenter_data_model.default_datacenter,
+                                                           vcenter_data_model.holding_network]))
+
     @staticmethod
     def _validate_vnic_name(vnic_name):
         if not vnic_name:
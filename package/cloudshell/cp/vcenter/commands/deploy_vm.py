@@ -51,6 +51,34 @@ class DeployCommand(object):
                                                            reservation_id, cancellation_context)
         return deploy_result
 
+    def execute_deploy_bulk(self, si, logger, vcenter_data_model, reservation_id, deploy_actions,
+                            cancellation_context, folder_manager, scheduler):
+        """
+        Calls the deployer to clone all the apps of a request in one call
+        :param si:
+        :param logger:
+        :param vcenter_data_model:
+        :param str reservation_id:
+        :param list[(str, DeployFromTemplateDetails)] deploy_actions: the action id and data holder of every app
+        :param cancellation_context:
+        :param folder_manager:
+        :param cloudshell.cp.vcenter.vm.deploy_scheduler.DeployScheduler scheduler:
+        :return: the DeployAppResult of every action in the order the clones finished
+        :rtype: list[DeployAppResult]
+        """
+        prepared_locations = dict()
+        for _, data_holder in deploy_actions:
+            template_resource_model = data_holder.template_resource_model
+            vm_location = template_resource_model.vm_location
+            if vm_location not in prepared_locations:
+                self._prepare_deployed_apps_folder(data_holder, si, logger, folder_manager, vcenter_data_model)
+                prepared_locations[vm_location] = template_resource_model.vm_location
+            else:
+                template_resource_model.vm_location = prepared_locations[vm_location]
+
+        return list(self.deployer.deploy_clones(si, logger, deploy_actions, vcenter_data_model, reservation_id,
+                                                cancellation_context, scheduler))
+
     def _prepare_deployed_apps_folder(self, data_holder, si, logger, folder_manager, vcenter_resource_model):
         if isinstance(data_holder, DeployFromImageDetails):
             self._update_deploy_from_image_vm_location(data_holder, folder_manager, logger, si, vcenter_resource_model)
@@ -58,6 +58,52 @@ class VirtualSwitchToMachineDisconnectCommand(object):
                                                             logger)
         return res
 
+    def create_change_plan(self, si, vcenter_data_model, vm_uuid):
+        """
+        Reads the VM and its vNICs once for all the connectivity changes of the VM
+        :param VMwarevCenterResourceModel vcenter_data_model:
+        :param <str> vm_uuid: the uuid of the vm
+        :rtype: VmChangePlan
+        """
+        vm = self.pyvmomi_service.find_by_uuid(si, vm_uuid)
+        if not vm:
+            raise ValueError('VM having UUID {0} not found'.format(vm_uuid))
+
+        default_network = self.pyvmomi_service.get_network_by_full_name(
+            si, VMLocation.combine([vcenter_data_model.default_datacenter, vcenter_data_model.holding_network]))
+        return self.port_group_configurer.create_change_plan(vm, vm_uuid, default_network)
+
+    def plan_disconnect(self, logger, plan, vm_network_remove_mappings):
+        """
+        Adds the vNICs to move to the default network to the change plan of the VM
+        :param VmChangePlan plan: the changes of the VM
+        :param vm_network_remove_mappings: <collection of 'VmNetworkRemoveMapping'>
+        """
+        mappings = []
+        vnics = []
+        for vm_network_remove_mapping in vm_network_remove_mappings:
+            vnic = plan.get_vnic_by_mac_address(vm_network_remove_mapping.mac_address)
+            if vnic is None:
+                raise KeyError('VNIC having MAC address {0} not found on VM having UUID {1}'
+                               .format(vm_network_remove_mapping.mac_address, plan.vm_uuid))
+
+            vnics.append(vnic)
+            mappings.append(VNicDeviceMapper(connect=False, network=plan.default_network,
+                                             requested_vnic=vm_network_remove_mapping.mac_address,
+                                             vnic=vnic, mac=vm_network_remove_mapping.mac_address))
+
+        networks_to_remove = self.port_group_configurer.get_networks_on_vnics(plan.vm, vnics, logger)
+        plan.disconnect(mappings, networks_to_remove)
+
+    def apply_change_plan(self, logger, plan, reserved_networks):
+        """
+        Reconfigures the VM once with all the planned changes
+        :param VmChangePlan plan: the changes of the VM
+        :return: the diff report of the plan
+        :rtype: list[VnicDiff]
+        """
+        return self.port_group_configurer.apply_change_plan(plan, reserved_networks, logger)
+
     def disconnect_all(self, si, logger, vcenter_data_model, vm_uuid, vm=None):
         return self.disconnect(si, vcenter_data_model, vm_uuid, logger,  None, None)
 
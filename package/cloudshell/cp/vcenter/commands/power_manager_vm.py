@@ -1,5 +1,8 @@
 
 
+from cloudshell.cp.vcenter.common.vcenter.task_poll_policy import POWER_OFF, POWER_ON
+
+
 class VirtualMachinePowerManagementCommand(object):
     def __init__(self, pyvmomi_service, synchronous_task_waiter):
         """
@@ -38,7 +41,7 @@ class VirtualMachinePowerManagementCommand(object):
                 task = vm.PowerOff()
                 task_result = self.synchronous_task_waiter.wait_for_task(task=task,
                                                                          logger=logger,
-                                                                         action_name='Power Off')
+                                                                         action_name=POWER_OFF)
             else:
                 if vm.guest.toolsStatus == 'toolsNotInstalled':
                     logger.warning('VMWare Tools status on virtual machine \'{0}\' are not installed'.format(vm.name))
@@ -74,6 +77,6 @@ class VirtualMachinePowerManagementCommand(object):
             task = vm.PowerOn()
             task_result = self.synchronous_task_waiter.wait_for_task(task=task,
                                                                      logger=logger,
-                                                                     action_name='Power On')
+                                                                     action_name=POWER_ON)
 
         return task_result
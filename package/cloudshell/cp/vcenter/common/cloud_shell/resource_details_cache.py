@@ -0,0 +1,75 @@
+import copy
+import os
+import time
+from threading import Lock
+
+from cloudshell.cp.vcenter.common.cloud_shell.conn_details_retriever import ResourceConnectionDetailsRetriever
+from cloudshell.cp.vcenter.common.model_factory import ResourceModelParser
+
+# seconds the parsed vCenter resource and its decrypted password are reused
+DEFAULT_TTL = int(os.getenv('VCenterResourceDetailsCacheTTL', 300))
+
+
+class CachedResourceDetails(object):
+    def __init__(self, fingerprint, vcenter_data_model, connection_details, expires_at):
+        self.fingerprint = fingerprint
+        self.vcenter_data_model = vcenter_data_model
+        self.connection_details = connection_details
+        self.expires_at = expires_at
+
+
+class ResourceDetailsCache(object):
+    """
+    Memoizes the VMwarevCenterResourceModel parsed from a vCenter resource and its VCenterConnectionDetails
+    with the decrypted password, keyed by the resource name and a fingerprint of its address and attributes
+    so any change of the resource is parsed and decrypted again
+    """
+
+    def __init__(self, resource_model_parser, ttl=DEFAULT_TTL):
+        """
+        :param ResourceModelParser resource_model_parser:
+        :param int ttl: seconds an entry is reused
+        """
+        self.resource_model_parser = resource_model_parser
+        self.ttl = ttl
+        self._entries = dict()
+        self._lock = Lock()
+
+    def get_details(self, session, resource):
+        """
+        :param CloudShellAPISession session: used to decrypt the password when the resource is not cached
+        :param ResourceContextDetails resource: the vCenter resource of the command context
+        :return: the parsed resource model and the connection details
+        :rtype: (VMwarevCenterResourceModel, VCenterConnectionDetails)
+        """
+        fingerprint = self.get_fingerprint(resource)
+        entry = self._entries.get(resource.name) if fingerprint else None
+        if entry and entry.fingerprint == fingerprint and entry.expires_at > time.time():
+            return copy.copy(entry.vcenter_data_model), entry.connection_details
+
+        vcenter_data_model = self.resource_model_parser.convert_to_vcenter_model(resource)
+        connection_details = ResourceConnectionDetailsRetriever.get_connection_details(
+            session=session,
+            vcenter_resource_model=vcenter_data_model,
+            resource_context=resource)
+
+        if fingerprint:
+            with self._lock:
+                self._entries[resource.name] = CachedResourceDetails(fingerprint,
+                                                                     copy.copy(vcenter_data_model),
+                                                                     connection_details,
+                                                                     time.time() + self.ttl)
+        return vcenter_data_model, connection_details
+
+    @staticmethod
+    def get_fingerprint(resource):
+        """
+        :return: the address and attributes of the resource or None when its attributes can not be read
+        """
+        try:
+            attributes = ResourceModelParser.get_resource_attributes_as_dict(resource)
+        except (ValueError, AttributeError, TypeError):
+            return None
+        if not isinstance(attributes, dict):
+            return None
+        return resource.address, tuple(sorted(attributes.items()))
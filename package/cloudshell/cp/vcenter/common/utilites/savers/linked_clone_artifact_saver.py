@@ -6,6 +6,7 @@ from threading import Lock
 from cloudshell.cp.core.models import Artifact, SaveAppResult, Attribute, ActionResultBase
 
 from cloudshell.cp.vcenter.common.vcenter.folder_manager import SUCCESS
+from cloudshell.cp.vcenter.common.vcenter.task_poll_policy import POWER_OFF, DESTROY_VM
 from cloudshell.cp.vcenter.common.vcenter.vm_location import VMLocation
 from cloudshell.cp.vcenter.models.DeployFromTemplateDetails import DeployFromTemplateDetails
 from cloudshell.cp.vcenter.models.vCenterCloneVMFromVMResourceModel import vCenterCloneVMFromVMResourceModel
@@ -102,9 +103,11 @@ class LinkedCloneArtifactHandler(object):
         if self.cs.check_if_cancelled(cancellation_context):
             raise Exception('Delete saved sandbox was cancelled')
 
-        artifacts = [(artifact, cancellation_context) for task in tasks for artifact in task.artifacts]
+        artifacts = [artifact for task in tasks for artifact in task.artifacts]
 
-        pool.map(self._get_rid_of_vm_if_found, artifacts)
+        vms = [vm for vm in pool.map(self._find_artifact_vm, artifacts) if vm]
+
+        self._get_rid_of_vms(vms, cancellation_context)
 
         if self.cs.check_if_cancelled(cancellation_context):
             raise Exception('Delete saved sandbox was cancelled')
@@ -132,20 +135,62 @@ class LinkedCloneArtifactHandler(object):
 
         return [task.DeleteSavedAppResult() for task in tasks]
 
-    def _get_rid_of_vm_if_found(self, (artifact, cancellation_context)):
+    def _find_artifact_vm(self, artifact):
         self.logger.info('Checking if need to dispose of artifact: {0}'.format(artifact.artifactRef))
         vm = self.pv_service.get_vm_by_uuid(self.si, artifact.artifactRef)
         if vm:
             self.logger.info('Will dispose {0}, it is a VM'.format(artifact.artifactRef))
-
-            self._power_off_vm(vm, cancellation_context)
-            self.logger.info('Powered off {0}'.format(artifact.artifactRef))
-
-            self._delete_vm(vm, cancellation_context)
-            self.logger.info('Deleted {0}'.format(artifact.artifactRef))
-            return
+            return vm
         self.logger.info('{0} was not a vm or vm not found'.format(artifact.artifactRef))
 
+    def _get_rid_of_vms(self, vms, cancellation_context):
+        """
+        powers off and deletes the vms, all the tasks of a step are waited on together from this thread.
+        a vm that failed to power off is not deleted, the other vms are and then the errors are raised together
+        """
+        power_states = self.pv_service.get_power_states(self.si, vms)
+        powered_on = [vm for vm in vms if power_states.get(vm._moId) != 'poweredOff']
+        powered_off, power_off_errors = self._run_tasks(powered_on, lambda vm: vm.PowerOff(), POWER_OFF,
+                                                        cancellation_context)
+        self.logger.info('Powered off {0} vms'.format(len(powered_off)))
+
+        vms_to_delete = [vm for vm in vms if vm not in powered_on or vm in powered_off]
+        deleted, delete_errors = self._run_tasks(vms_to_delete, lambda vm: vm.Destroy_Task(), DESTROY_VM,
+                                                 cancellation_context)
+        self.logger.info('Deleted {0} vms'.format(len(deleted)))
+
+        errors = power_off_errors + delete_errors
+        if len(errors) == 1:
+            raise errors[0]
+        if errors:
+            raise Exception('\n'.join(str(error) for error in errors))
+
+    def _run_tasks(self, vms, start_task, action_name, cancellation_context):
+        """
+        :return: the vms their task succeeded and the errors of the others
+        """
+        tasks = []
+        vm_tasks = dict()
+        errors = []
+        for vm in vms:
+            try:
+                task = start_task(vm)
+            except Exception as e:
+                errors.append(e)
+                continue
+            tasks.append(task)
+            vm_tasks[task] = vm
+
+        succeeded = []
+        for task, result, error in self.task_waiter.wait_for_tasks(tasks, self.logger, action_name,
+                                                                   cancellation_context=cancellation_context):
+            if error:
+                self.logger.error('{0} failed for {1}: {2}'.format(action_name, vm_tasks[task].name, error))
+                errors.append(error)
+            else:
+                succeeded.append(vm_tasks[task])
+        return succeeded, errors
+
     def _get_delete_tasks(self, delete_saved_app_actions):
         return [DeleteAppTask(action.actionParams.artifacts, action) for action in delete_saved_app_actions]
 
@@ -280,10 +325,6 @@ class LinkedCloneArtifactHandler(object):
             task = vm.PowerOff()
             self.task_waiter.wait_for_task(task, self.logger, 'Power Off', cancellation_context)
 
-    def _delete_vm(self, vm, cancellation_context=None):
-        task = vm.Destroy_Task()
-        self.task_waiter.wait_for_task(task, self.logger, 'Delete VM', cancellation_context)
-
     def _should_vm_be_powered_off_during_clone(self, save_action):
         save_attributes = save_action.actionParams.deploymentPathAttributes
         behavior_during_save = save_attributes.get("Behavior during save") or self.vcenter_data_model.behavior_during_save
@@ -0,0 +1,119 @@
+import os
+import time
+from threading import Lock
+
+from pyVmomi import vim, vmodl
+
+from cloudshell.cp.vcenter.common.vcenter.inventory_index import VCenterInventory
+
+# seconds a resolved template and snapshot are reused, they are validated against the vCenter before every use
+DEFAULT_TTL = int(os.getenv('VCenterCloneSourceCacheTTL', 600))
+
+# the properties of the template that change when it is renamed, moved, reconfigured or gets a new snapshot
+TEMPLATE_PROPERTIES = ['name', 'parent', 'config.changeVersion']
+TEMPLATE_SNAPSHOT_PROPERTY = 'snapshot.currentSnapshot'
+SNAPSHOT_PROPERTIES = ['vm']
+
+
+class CloneSource(object):
+    def __init__(self, template_id, snapshot_id, version, expires_at):
+        """
+        :param str template_id: the moId of the template or vm the clone is created from
+        :param str snapshot_id: the moId of the snapshot of a linked clone, None for a full clone
+        :param tuple version: the TEMPLATE_PROPERTIES of the template when it was resolved
+        :param float expires_at:
+        """
+        self.template_id = template_id
+        self.snapshot_id = snapshot_id
+        self.version = version
+        self.expires_at = expires_at
+
+
+class CloneSourceCache(object):
+    """
+    Remembers the template and snapshot morefs a clone path resolved to, keyed by (vCenter, template path,
+    snapshot path). Before a cached entry is used one RetrievePropertiesEx call reads the name, parent and config
+    change version of the template and checks the snapshot still exists, any difference resolves the path again
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        """
+        :param int ttl: seconds an entry is reused
+        """
+        self.ttl = ttl
+        self._sources = dict()
+        self._lock = Lock()
+
+    def get_source(self, si, template_path, snapshot_path, resolve):
+        """
+        :param vim.ServiceInstance si:
+        :param str template_path: the full path of the template ('dc/folder/template')
+        :param str snapshot_path: the path of the snapshot ('snapshot/child snapshot'), empty for a full clone
+        :param resolve: callable that finds the template and snapshot in the vCenter, called when no valid entry
+        :return: the template and the snapshot, None when no snapshot_path is given
+        :rtype: (vim.VirtualMachine, vim.vm.Snapshot)
+        """
+        key = (VCenterInventory.get_vcenter_key(si), template_path, snapshot_path or '')
+        source = self._sources.get(key)
+        if source and source.expires_at > time.time():
+            template, snapshot = self._bind(si, source)
+            if self._read_version(si, template, snapshot) == source.version:
+                return template, snapshot
+
+        template, snapshot = resolve()
+        version = self._read_version(si, template, snapshot)
+        if version is not None:
+            with self._lock:
+                self._sources[key] = CloneSource(template._moId,
+                                                 snapshot._moId if snapshot is not None else None,
+                                                 version,
+                                                 time.time() + self.ttl)
+        return template, snapshot
+
+    def invalidate(self, si, template_path, snapshot_path):
+        with self._lock:
+            self._sources.pop((VCenterInventory.get_vcenter_key(si), template_path, snapshot_path or ''), None)
+
+    @staticmethod
+    def _bind(si, source):
+        template = vim.VirtualMachine(source.template_id, si._stub)
+        snapshot = vim.vm.Snapshot(source.snapshot_id, si._stub) if source.snapshot_id else None
+        return template, snapshot
+
+    @staticmethod
+    def _read_version(si, template, snapshot):
+        """
+        :return: the TEMPLATE_PROPERTIES of the template, None when the template or the snapshot no longer exist
+                 or could not be read
+        """
+        template_properties = list(TEMPLATE_PROPERTIES)
+        object_set = [vmodl.query.PropertyCollector.ObjectSpec(obj=template)]
+        prop_set = []
+        if snapshot is not None:
+            template_properties.append(TEMPLATE_SNAPSHOT_PROPERTY)
+            object_set.append(vmodl.query.PropertyCollector.ObjectSpec(obj=snapshot))
+            prop_set.append(vmodl.query.PropertyCollector.PropertySpec(type=vim.vm.Snapshot,
+                                                                       pathSet=SNAPSHOT_PROPERTIES))
+        prop_set.append(vmodl.query.PropertyCollector.PropertySpec(type=vim.VirtualMachine,
+                                                                   pathSet=template_properties))
+
+        spec = vmodl.query.PropertyCollector.FilterSpec(objectSet=object_set, propSet=prop_set)
+        try:
+            result = si.content.propertyCollector.RetrievePropertiesEx([spec],
+                                                                       vmodl.query.PropertyCollector.RetrieveOptions())
+        except Exception:
+            return None
+
+        found = dict()
+        for object_content in result.objects if result else []:
+            found[object_content.obj._moId] = dict((prop.name, prop.val) for prop in object_content.propSet)
+        if template._moId not in found or (snapshot is not None and snapshot._moId not in found):
+            return None
+
+        props = found[template._moId]
+        return tuple(_to_comparable(props.get(name)) for name in template_properties)
+
+
+def _to_comparable(value):
+    # managed objects are compared by moId, a fresh reference is created on every read
+    return getattr(value, '_moId', value)
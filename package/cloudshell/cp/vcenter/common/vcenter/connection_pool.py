@@ -0,0 +1,301 @@
+import os
+import time
+from contextlib import contextmanager
+from threading import Condition, Lock, Thread
+
+from pyVmomi import vim
+
+# the most ServiceInstance sessions kept for one vCenter user
+DEFAULT_MAX_SIZE = int(os.getenv('VCenterConnectionPoolSize', 4))
+
+# seconds a session may stay unused before it is logged out
+DEFAULT_IDLE_TIMEOUT = int(os.getenv('VCenterConnectionIdleTimeout', 900))
+
+# seconds between two keepalive checks of the unused sessions
+DEFAULT_KEEPALIVE_INTERVAL = int(os.getenv('VCenterKeepaliveInterval', 300))
+
+# seconds a session is trusted after it was last used, an older session is checked before a command runs on it
+DEFAULT_CHECK_AFTER = int(os.getenv('VCenterSessionCheckAfter', 60))
+
+
+class PooledSession(object):
+    def __init__(self, si, password):
+        """
+        :param vim.ServiceInstance si:
+        :param str password: the password the session logged in with
+        """
+        self.si = si
+        self.password = password
+        self.leases = 0
+        self.last_used = time.time()
+        self.last_alive = self.last_used
+
+
+class VCenterConnectionPool(object):
+    """
+    Keeps live ServiceInstance sessions keyed by (host, username, port).
+    A ServiceInstance can serve several threads, so a lease takes the least used session of the key and a new
+    session is only logged in when every session of the key is in use and the key is below max_size, a lease of a
+    key whose sessions are all still logging in waits for one of them,
+    commands against different vCenters never wait on each other.
+    Sessions are never checked when leased, a SessionKeeper keeps the unused ones alive in the background,
+    a command checks a session that was not used lately before it runs and discards a session it hits
+    NotAuthenticated on.
+    The sessions of an old password that are still leased are retired and logged out when their last lease is released
+    """
+
+    def __init__(self, pv_service, max_size=DEFAULT_MAX_SIZE, idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 keepalive_interval=DEFAULT_KEEPALIVE_INTERVAL, check_after=DEFAULT_CHECK_AFTER):
+        """
+        :param pv_service: cloudshell.cp.vcenter.common.vcenter.vmomi_service.pyVmomiService
+        :param int max_size: the most sessions kept for one key
+        :param int idle_timeout: seconds an unused session is kept
+        :param int keepalive_interval: seconds between two keepalive checks of the unused sessions
+        :param int check_after: seconds a session is trusted after it was last used
+        """
+        self.pv_service = pv_service
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.check_after = check_after
+        self._sessions = dict()
+        self._connecting = dict()
+        self._retired = []
+        self._lock = Lock()
+        self._connected = Condition(self._lock)
+        self.keeper = SessionKeeper(self, keepalive_interval)
+
+    @contextmanager
+    def connection(self, connection_details, logger):
+        """
+        :param cloudshell.cp.vcenter.models.VCenterConnectionDetails.VCenterConnectionDetails connection_details:
+        :param logger:
+        :rtype: vim.ServiceInstance
+        """
+        si = self.lease(connection_details, logger)
+        try:
+            yield si
+        finally:
+            self.release(si)
+
+    def lease(self, connection_details, logger):
+        """
+        :param cloudshell.cp.vcenter.models.VCenterConnectionDetails.VCenterConnectionDetails connection_details:
+        :param logger:
+        :return: a live session of the vCenter, must be given back with release
+        :rtype: vim.ServiceInstance
+        """
+        key = self.get_key(connection_details)
+        self.keeper.start()
+        self._evict_idle()
+
+        with self._lock:
+            sessions = self._sessions.setdefault(key, [])
+            stale = self._remove_other_passwords(sessions, connection_details.password)
+            session = self._pick_session(key, sessions)
+            while session is None and self._is_full(key, sessions):
+                # every session of the key is still logging in
+                self._connected.wait()
+                sessions = self._sessions.setdefault(key, [])
+                session = self._pick_session(key, sessions)
+            if session is None:
+                self._connecting[key] = self._connecting.get(key, 0) + 1
+            else:
+                session.leases += 1
+                session.last_used = time.time()
+
+        for stale_session in stale:
+            self._disconnect(stale_session)
+        if session is None:
+            return self._connect(key, connection_details, logger)
+        return session.si
+
+    def release(self, si):
+        """
+        gives back a leased session, the session was used successfully up to now
+        """
+        retired = None
+        with self._lock:
+            session = self._find_session(si)
+            if session:
+                session.leases = max(session.leases - 1, 0)
+                session.last_used = session.last_alive = time.time()
+            else:
+                retired = self._release_retired(si)
+        if retired:
+            self._disconnect(retired)
+
+    def check(self, si):
+        """
+        checks a leased session that was not used for check_after seconds with CurrentTime
+        :raises vim.fault.NotAuthenticated: when the vCenter no longer accepts the session
+        """
+        with self._lock:
+            session = self._find_session(si)
+        if session is None or time.time() - session.last_alive < self.check_after:
+            return
+        si.CurrentTime()
+        session.last_alive = time.time()
+
+    def discard(self, si):
+        """
+        drops a session the vCenter no longer accepts, the commands still using it keep their reference
+        """
+        with self._lock:
+            session = self._find_session(si)
+            if session:
+                self._sessions[self._find_key(session)].remove(session)
+            self._retired = [retired for retired in self._retired if retired.si is not si]
+
+    def get_idle_sessions(self):
+        """
+        :return: the sessions no command is using
+        :rtype: list[PooledSession]
+        """
+        with self._lock:
+            return [session for sessions in self._sessions.values() for session in sessions if session.leases == 0]
+
+    def close(self):
+        self.keeper.stop()
+        with self._lock:
+            sessions = [session for key_sessions in self._sessions.values() for session in key_sessions]
+            sessions += self._retired
+            self._sessions.clear()
+            self._retired = []
+        for session in sessions:
+            self._disconnect(session)
+
+    def _pick_session(self, key, sessions):
+        idle = [session for session in sessions if session.leases == 0]
+        if idle:
+            return max(idle, key=lambda s: s.last_used)
+        if sessions and self._is_full(key, sessions):
+            # every session is busy and the key is full, share the least used one rather than wait
+            return min(sessions, key=lambda s: s.leases)
+        return None
+
+    def _is_full(self, key, sessions):
+        return len(sessions) + self._connecting.get(key, 0) >= max(self.max_size, 1)
+
+    def _connect(self, key, connection_details, logger):
+        try:
+            logger.info("Creating a new connection.")
+            si = self.pv_service.connect(connection_details.host,
+                                         connection_details.username,
+                                         connection_details.password,
+                                         connection_details.port)
+            session = PooledSession(si, connection_details.password)
+            session.leases = 1
+            with self._lock:
+                self._sessions.setdefault(key, []).append(session)
+            return si
+        finally:
+            with self._lock:
+                self._connecting[key] -= 1
+                self._connected.notify_all()
+
+    def _find_session(self, si):
+        for sessions in self._sessions.values():
+            for session in sessions:
+                if session.si is si:
+                    return session
+        return None
+
+    def _find_key(self, session):
+        for key, sessions in self._sessions.items():
+            if session in sessions:
+                return key
+
+    def _remove_other_passwords(self, sessions, password):
+        """
+        drops the sessions logged in before the password of the user was changed,
+        the ones still leased are retired until their last lease is released
+        :return: the dropped sessions no command is using
+        """
+        stale = [s for s in sessions if s.password != password]
+        for session in stale:
+            sessions.remove(session)
+        self._retired += [s for s in stale if s.leases > 0]
+        return [s for s in stale if s.leases == 0]
+
+    def _release_retired(self, si):
+        """
+        :return: the retired session of the si when its last lease was released
+        """
+        for session in self._retired:
+            if session.si is si:
+                session.leases = max(session.leases - 1, 0)
+                if session.leases == 0:
+                    self._retired.remove(session)
+                    return session
+                return None
+        return None
+
+    def _evict_idle(self):
+        now = time.time()
+        evicted = []
+        with self._lock:
+            for sessions in self._sessions.values():
+                for session in [s for s in sessions if s.leases == 0 and now - s.last_used > self.idle_timeout]:
+                    sessions.remove(session)
+                    evicted.append(session)
+        for session in evicted:
+            self._disconnect(session)
+
+    def _disconnect(self, session):
+        try:
+            self.pv_service.disconnect(session.si)
+        except Exception:
+            pass
+
+    @staticmethod
+    def get_key(connection_details):
+        return connection_details.host, connection_details.username, connection_details.port
+
+
+class SessionKeeper(object):
+    """
+    Keeps the unused sessions of a pool logged in, every interval it calls CurrentTime on the sessions that were not
+    used since the last check and discards the ones the vCenter no longer accepts, so no command pays for a probe
+    """
+
+    def __init__(self, pool, interval=DEFAULT_KEEPALIVE_INTERVAL):
+        """
+        :param VCenterConnectionPool pool:
+        :param int interval: seconds between two checks, 0 keeps the sessions alive only when keep_alive is called
+        """
+        self.pool = pool
+        self.interval = interval
+        self._stopped = False
+        self._thread = None
+        self._lock = Lock()
+
+    def start(self):
+        if self._thread is not None or self.interval <= 0:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name='SessionKeeper')
+                self._thread.daemon = True
+                self._thread.start()
+
+    def stop(self):
+        self._stopped = True
+
+    def _run(self):
+        while not self._stopped:
+            time.sleep(self.interval)
+            if not self._stopped:
+                self.keep_alive()
+
+    def keep_alive(self):
+        now = time.time()
+        for session in self.pool.get_idle_sessions():
+            if now - session.last_alive < self.interval:
+                continue
+            try:
+                session.si.CurrentTime()
+                session.last_alive = now
+            except vim.fault.NotAuthenticated:
+                self.pool.discard(session.si)
+            except Exception:
+                pass
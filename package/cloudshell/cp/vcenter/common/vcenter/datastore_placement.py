@@ -0,0 +1,218 @@
+import os
+import time
+from threading import Lock
+
+from pyVmomi import vim, vmodl
+
+from cloudshell.cp.vcenter.common.vcenter.inventory_index import VCenterInventory
+
+# seconds the capacity of the datastores of a storage pod is reused before it is read again
+DEFAULT_SNAPSHOT_TTL = int(os.getenv('DatastorePlacementSnapshotTTL', 30))
+
+# the space every in-flight clone is expected to take on its datastore
+DEFAULT_CLONE_SIZE = int(os.getenv('DatastorePlacementCloneSizeGB', 20)) * 1024 ** 3
+
+# how a datastore of a storage pod is chosen for a clone
+FILL_FIRST = 'fill-first'
+SPREAD = 'spread'
+WEIGHTED = 'weighted'
+PLACEMENT_POLICIES = [FILL_FIRST, SPREAD, WEIGHTED]
+DEFAULT_POLICY = os.getenv('DatastorePlacementPolicy', SPREAD)
+
+# the properties read for every datastore of a storage pod
+CAPACITY_PROPERTIES = ['name', 'summary.freeSpace', 'summary.capacity', 'summary.accessible',
+                       'summary.maintenanceMode']
+
+
+class DatastoreCapacity(object):
+    def __init__(self, mo_id, name, free_space, capacity, accessible=True, maintenance_mode='normal'):
+        """
+        :param str mo_id: the moId of the datastore
+        :param str name:
+        :param long free_space: the free bytes of the datastore when the snapshot was read
+        :param long capacity: the size of the datastore in bytes
+        :param bool accessible:
+        :param str maintenance_mode: 'normal' when the datastore takes new disks
+        """
+        self.mo_id = mo_id
+        self.name = name
+        self.free_space = free_space
+        self.capacity = capacity
+        self.accessible = accessible
+        self.maintenance_mode = maintenance_mode
+
+    @property
+    def available(self):
+        return self.accessible and self.maintenance_mode in (None, 'normal')
+
+
+class CapacitySnapshot(object):
+    def __init__(self, datastores, read_at):
+        """
+        :param list[DatastoreCapacity] datastores: the datastores of the storage pod
+        :param float read_at:
+        """
+        self.datastores = datastores
+        self.read_at = read_at
+
+
+class DatastoreReservation(object):
+    def __init__(self, key, datastore, size):
+        """
+        :param key: the key of the datastore the reservation is accounted on
+        :param vim.Datastore datastore: the datastore the clone is placed on
+        :param long size: the bytes reserved for the clone
+        """
+        self.key = key
+        self.datastore = datastore
+        self.size = size
+
+
+class DatastorePlacement(object):
+    """
+    Chooses the datastore of a storage pod a clone is placed on.
+    The capacity of the datastores of a pod is read with one RetrievePropertiesEx call and reused for
+    snapshot_ttl seconds, every clone reserves clone_size bytes on the datastore it is placed on until it finishes
+    so clones that start together see the space and the number of clones already going to each datastore
+    """
+
+    def __init__(self, policy=DEFAULT_POLICY, snapshot_ttl=DEFAULT_SNAPSHOT_TTL, clone_size=DEFAULT_CLONE_SIZE):
+        """
+        :param str policy: fill-first fills the fullest datastore that still holds the clone,
+                           spread places the clone on the datastore with the fewest in-flight clones,
+                           weighted places the clone on the datastore with the most free space per in-flight clone
+        :param int snapshot_ttl: seconds the capacity of a storage pod is reused
+        :param long clone_size: the bytes reserved for every in-flight clone
+        """
+        if policy not in PLACEMENT_POLICIES:
+            raise ValueError('Unknown datastore placement policy: {0}, expected one of {1}'
+                             .format(policy, ', '.join(PLACEMENT_POLICIES)))
+        self.policy = policy
+        self.snapshot_ttl = snapshot_ttl
+        self.clone_size = clone_size
+        self._snapshots = dict()
+        self._in_flight = dict()
+        self._reserved = dict()
+        self._lock = Lock()
+        self.locks = dict()
+        self.locks_lock = Lock()
+
+    def reserve(self, si, storage_pod):
+        """
+        Chooses a datastore of the storage pod and reserves the space of one clone on it,
+        the reservation must be released when the clone finishes
+
+        :param vim.ServiceInstance si:
+        :param vim.StoragePod storage_pod:
+        :rtype: DatastoreReservation
+        """
+        vcenter_key = VCenterInventory.get_vcenter_key(si)
+        snapshot = self._get_snapshot(si, vcenter_key, storage_pod)
+
+        with self._lock:
+            datastore = self._choose(vcenter_key, snapshot.datastores)
+            if datastore is None:
+                raise ValueError('No accessible datastore in storage pod: "{0}"'.format(storage_pod.name))
+            key = (vcenter_key, datastore.mo_id)
+            self._in_flight[key] = self._in_flight.get(key, 0) + 1
+            self._reserved[key] = self._reserved.get(key, 0) + self.clone_size
+
+        return DatastoreReservation(key, vim.Datastore(datastore.mo_id, si._stub), self.clone_size)
+
+    def release(self, reservation, used=True):
+        """
+        :param DatastoreReservation reservation:
+        :param bool used: True when the clone was created, its space stays taken until the capacity is read again
+        """
+        key = reservation.key
+        with self._lock:
+            self._in_flight[key] = max(self._in_flight.get(key, 0) - 1, 0)
+            self._reserved[key] = max(self._reserved.get(key, 0) - reservation.size, 0)
+            if used:
+                for snapshot in self._snapshots.values():
+                    for datastore in snapshot.datastores:
+                        if (key[0], datastore.mo_id) == key:
+                            datastore.free_space -= reservation.size
+
+    def in_flight(self, si, datastore):
+        """
+        :return: the number of clones reserved on the datastore that did not finish yet
+        """
+        return self._in_flight.get((VCenterInventory.get_vcenter_key(si), datastore._moId), 0)
+
+    def invalidate(self, si, storage_pod):
+        with self._lock:
+            self._snapshots.pop((VCenterInventory.get_vcenter_key(si), storage_pod._moId), None)
+
+    def _choose(self, vcenter_key, datastores):
+        candidates = []
+        for datastore in datastores:
+            if not datastore.available:
+                continue
+            key = (vcenter_key, datastore.mo_id)
+            free = datastore.free_space - self._reserved.get(key, 0)
+            candidates.append((datastore, free, self._in_flight.get(key, 0)))
+        if not candidates:
+            return None
+
+        fitting = [c for c in candidates if c[1] >= self.clone_size]
+        if not fitting:
+            # none of them is known to hold the clone, the vCenter decides
+            return max(candidates, key=lambda c: c[1])[0]
+
+        if self.policy == FILL_FIRST:
+            return min(fitting, key=lambda c: c[1])[0]
+        if self.policy == SPREAD:
+            return min(fitting, key=lambda c: (c[2], -c[1]))[0]
+        return max(fitting, key=lambda c: float(c[1]) / (c[2] + 1))[0]
+
+    def _get_snapshot(self, si, vcenter_key, storage_pod):
+        key = (vcenter_key, storage_pod._moId)
+        snapshot = self._snapshots.get(key)
+        if snapshot and time.time() - snapshot.read_at < self.snapshot_ttl:
+            return snapshot
+
+        with self._get_lock(key):
+            snapshot = self._snapshots.get(key)
+            if not snapshot or time.time() - snapshot.read_at >= self.snapshot_ttl:
+                snapshot = CapacitySnapshot(self.read_capacity(si, storage_pod), time.time())
+                with self._lock:
+                    self._snapshots[key] = snapshot
+            return snapshot
+
+    def _get_lock(self, key):
+        if key not in self.locks:
+            with self.locks_lock:
+                if key not in self.locks:
+                    self.locks[key] = Lock()
+        return self.locks[key]
+
+    @staticmethod
+    def read_capacity(si, storage_pod):
+        """
+        :return: the capacity of every datastore of the storage pod
+        :rtype: list[DatastoreCapacity]
+        """
+        traversal_spec = vmodl.query.PropertyCollector.TraversalSpec(name='traversePod', path='childEntity',
+                                                                     skip=False, type=vim.StoragePod)
+        spec = vmodl.query.PropertyCollector.FilterSpec(
+            objectSet=[vmodl.query.PropertyCollector.ObjectSpec(obj=storage_pod, skip=True,
+                                                                selectSet=[traversal_spec])],
+            propSet=[vmodl.query.PropertyCollector.PropertySpec(type=vim.Datastore, pathSet=CAPACITY_PROPERTIES)])
+
+        collector = si.content.propertyCollector
+        result = collector.RetrievePropertiesEx([spec], vmodl.query.PropertyCollector.RetrieveOptions())
+        datastores = []
+        while result:
+            for object_content in result.objects:
+                props = dict((prop.name, prop.val) for prop in object_content.propSet)
+                datastores.append(DatastoreCapacity(object_content.obj._moId,
+                                                    props.get('name'),
+                                                    props.get('summary.freeSpace') or 0,
+                                                    props.get('summary.capacity') or 0,
+                                                    props.get('summary.accessible', True),
+                                                    props.get('summary.maintenanceMode')))
+            if not result.token:
+                break
+            result = collector.ContinueRetrievePropertiesEx(result.token)
+        return datastores
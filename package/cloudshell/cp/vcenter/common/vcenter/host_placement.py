@@ -0,0 +1,347 @@
+import json
+import os
+import time
+from threading import Lock
+
+from pyVmomi import vim, vmodl
+
+from cloudshell.cp.vcenter.common.vcenter.inventory_index import VCenterInventory
+
+# 1 places every clone of a cluster on a host chosen by the placement policy, 0 leaves the host to DRS
+HOST_PLACEMENT_ENABLED = int(os.getenv('HostPlacementEnabled', 0))
+
+# seconds the quick stats of the hosts of a cluster are reused before they are read again
+DEFAULT_STATS_TTL = int(os.getenv('HostPlacementStatsTTL', 30))
+
+# the load every in-flight clone is expected to add to its host once it is powered on
+DEFAULT_CLONE_CPU_MHZ = int(os.getenv('HostPlacementCloneCpuMhz', 1000))
+DEFAULT_CLONE_MEMORY_MB = int(os.getenv('HostPlacementCloneMemoryMB', 4096))
+
+# the load (0-1) a host is filled up to by the pack policy
+DEFAULT_PACK_MAX_LOAD = float(os.getenv('HostPlacementPackMaxLoad', 0.8))
+
+# the properties read for every host of a cluster
+HOST_STATS_PROPERTIES = ['name',
+                         'summary.quickStats.overallCpuUsage',
+                         'summary.quickStats.overallMemoryUsage',
+                         'summary.hardware.cpuMhz',
+                         'summary.hardware.numCpuCores',
+                         'summary.hardware.memorySize',
+                         'runtime.connectionState',
+                         'runtime.inMaintenanceMode',
+                         'datastore']
+
+
+class HostLoad(object):
+    def __init__(self, mo_id, name, cpu_usage, memory_usage, cpu_capacity, memory_capacity,
+                 connection_state='connected', in_maintenance=False, datastores=None):
+        """
+        :param str mo_id: the moId of the host
+        :param str name:
+        :param int cpu_usage: the used cpu of the host in MHz
+        :param int memory_usage: the used memory of the host in MB
+        :param int cpu_capacity: the cpu of the host in MHz
+        :param int memory_capacity: the memory of the host in MB
+        :param str connection_state: 'connected' when the host takes new vms
+        :param bool in_maintenance:
+        :param list[str] datastores: the moIds of the datastores the host mounts, None when they are not known
+        """
+        self.mo_id = mo_id
+        self.name = name
+        self.cpu_usage = cpu_usage
+        self.memory_usage = memory_usage
+        self.cpu_capacity = cpu_capacity
+        self.memory_capacity = memory_capacity
+        self.connection_state = connection_state
+        self.in_maintenance = in_maintenance
+        self.datastores = datastores
+
+    @property
+    def available(self):
+        return self.connection_state == 'connected' and not self.in_maintenance
+
+    def mounts(self, datastore_id):
+        return self.datastores is None or datastore_id in self.datastores
+
+
+class HostCandidate(object):
+    def __init__(self, host, in_flight, cpu_usage, memory_usage):
+        """
+        :param HostLoad host:
+        :param int in_flight: the clones reserved on the host that did not finish yet
+        :param int cpu_usage: the used cpu of the host with its in-flight clones in MHz
+        :param int memory_usage: the used memory of the host with its in-flight clones in MB
+        """
+        self.host = host
+        self.in_flight = in_flight
+        self.cpu_usage = cpu_usage
+        self.memory_usage = memory_usage
+
+    @property
+    def load(self):
+        """
+        :return: the busier of the cpu and the memory of the host with its in-flight clones, 0-1
+        """
+        cpu = float(self.cpu_usage) / self.host.cpu_capacity if self.host.cpu_capacity else 1.0
+        memory = float(self.memory_usage) / self.host.memory_capacity if self.host.memory_capacity else 1.0
+        return max(cpu, memory)
+
+
+def least_loaded(candidates):
+    """
+    Places the clone on the host with the lowest cpu or memory load
+    :param list[HostCandidate] candidates:
+    :rtype: HostCandidate
+    """
+    return min(candidates, key=lambda c: (c.load, c.in_flight))
+
+
+def spread(candidates):
+    """
+    Places the clone on the host with the fewest in-flight clones, the least loaded of them
+    :param list[HostCandidate] candidates:
+    :rtype: HostCandidate
+    """
+    return min(candidates, key=lambda c: (c.in_flight, c.load))
+
+
+def pack(candidates, max_load=DEFAULT_PACK_MAX_LOAD):
+    """
+    Fills the busiest host that stays under max_load so the other hosts are left free,
+    the least loaded host when all of them are over it
+    :param list[HostCandidate] candidates:
+    :rtype: HostCandidate
+    """
+    fitting = [c for c in candidates if c.load <= max_load]
+    if not fitting:
+        return least_loaded(candidates)
+    return max(fitting, key=lambda c: (c.load, -c.in_flight))
+
+
+PLACEMENT_POLICIES = {
+    'least-loaded': least_loaded,
+    'spread': spread,
+    'pack': pack
+}
+DEFAULT_POLICY = os.getenv('HostPlacementPolicy', 'least-loaded')
+
+
+class VCenterHostStats(object):
+    """
+    Reads the quick stats of the hosts of a cluster from the vCenter with one RetrievePropertiesEx call
+    """
+
+    def read(self, si, cluster):
+        """
+        :param vim.ServiceInstance si:
+        :param vim.ClusterComputeResource cluster:
+        :rtype: list[HostLoad]
+        """
+        traversal_spec = vmodl.query.PropertyCollector.TraversalSpec(name='traverseHosts', path='host',
+                                                                     skip=False, type=vim.ComputeResource)
+        spec = vmodl.query.PropertyCollector.FilterSpec(
+            objectSet=[vmodl.query.PropertyCollector.ObjectSpec(obj=cluster, skip=True, selectSet=[traversal_spec])],
+            propSet=[vmodl.query.PropertyCollector.PropertySpec(type=vim.HostSystem, pathSet=HOST_STATS_PROPERTIES)])
+
+        collector = si.content.propertyCollector
+        result = collector.RetrievePropertiesEx([spec], vmodl.query.PropertyCollector.RetrieveOptions())
+        hosts = []
+        while result:
+            for object_content in result.objects:
+                props = dict((prop.name, prop.val) for prop in object_content.propSet)
+                cores = props.get('summary.hardware.numCpuCores') or 0
+                hosts.append(HostLoad(object_content.obj._moId,
+                                      props.get('name'),
+                                      props.get('summary.quickStats.overallCpuUsage') or 0,
+                                      props.get('summary.quickStats.overallMemoryUsage') or 0,
+                                      (props.get('summary.hardware.cpuMhz') or 0) * cores,
+                                      (props.get('summary.hardware.memorySize') or 0) / (1024 * 1024),
+                                      props.get('runtime.connectionState', 'connected'),
+                                      props.get('runtime.inMaintenanceMode', False),
+                                      [datastore._moId for datastore in props.get('datastore') or []]))
+            if not result.token:
+                break
+            result = collector.ContinueRetrievePropertiesEx(result.token)
+        return hosts
+
+
+class RecordedHostStats(object):
+    """
+    Host stats recorded earlier, used to simulate placements without a vCenter.
+    The recording maps the moId of a cluster to the HostLoad fields of each of its hosts:
+    {"domain-c7": [{"mo_id": "host-10", "name": "esx1", "cpu_usage": 1200, "memory_usage": 8000,
+                    "cpu_capacity": 24000, "memory_capacity": 65536}]}
+    """
+
+    def __init__(self, recorded):
+        """
+        :param dict recorded: the hosts of every cluster by the cluster moId
+        """
+        self.recorded = recorded
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def read(self, si, cluster):
+        return [HostLoad(**host) for host in self.recorded.get(cluster._moId, [])]
+
+
+class HostStatsSnapshot(object):
+    def __init__(self, hosts, read_at):
+        """
+        :param list[HostLoad] hosts: the hosts of the cluster
+        :param float read_at:
+        """
+        self.hosts = hosts
+        self.read_at = read_at
+
+
+class HostReservation(object):
+    def __init__(self, key, host):
+        """
+        :param key: the key of the host the reservation is accounted on
+        :param vim.HostSystem host: the host the clone is placed on
+        """
+        self.key = key
+        self.host = host
+
+
+class HostPlacement(object):
+    """
+    Chooses the host of a cluster a clone is placed on.
+    The quick stats of the hosts of a cluster are read once and reused for stats_ttl seconds, every clone adds
+    its expected cpu and memory to the host it is placed on until it finishes so clones that start together
+    are spread by the policy instead of all landing on the same host
+    """
+
+    def __init__(self, policy=DEFAULT_POLICY, stats_ttl=DEFAULT_STATS_TTL, clone_cpu=DEFAULT_CLONE_CPU_MHZ,
+                 clone_memory=DEFAULT_CLONE_MEMORY_MB, stats_source=None):
+        """
+        :param policy: the name of one of the PLACEMENT_POLICIES or a callable that picks one of the HostCandidates
+        :param int stats_ttl: seconds the stats of a cluster are reused
+        :param int clone_cpu: the MHz every in-flight clone is expected to use
+        :param int clone_memory: the MB every in-flight clone is expected to use
+        :param stats_source: reads the HostLoads of a cluster, the vCenter when None,
+                             RecordedHostStats to simulate placements
+        """
+        if not callable(policy):
+            if policy not in PLACEMENT_POLICIES:
+                raise ValueError('Unknown host placement policy: {0}, expected one of {1}'
+                                 .format(policy, ', '.join(sorted(PLACEMENT_POLICIES.keys()))))
+            policy = PLACEMENT_POLICIES[policy]
+        self.policy = policy
+        self.stats_ttl = stats_ttl
+        self.clone_cpu = clone_cpu
+        self.clone_memory = clone_memory
+        self.stats_source = stats_source or VCenterHostStats()
+        self._snapshots = dict()
+        self._in_flight = dict()
+        self._lock = Lock()
+        self.locks = dict()
+        self.locks_lock = Lock()
+
+    def reserve(self, si, cluster, datastore=None):
+        """
+        Chooses a host of the cluster for one clone, the reservation must be released when the clone finishes
+
+        :param vim.ServiceInstance si:
+        :param vim.ClusterComputeResource cluster:
+        :param vim.Datastore datastore: the datastore of the clone, only the hosts that mount it are chosen
+        :rtype: HostReservation
+        """
+        vcenter_key = VCenterInventory.get_vcenter_key(si)
+        snapshot = self._get_snapshot(si, vcenter_key, cluster)
+        datastore_id = datastore._moId if isinstance(datastore, vim.Datastore) else None
+
+        with self._lock:
+            candidates = self._get_candidates(vcenter_key, snapshot.hosts, datastore_id)
+            if not candidates:
+                if datastore_id:
+                    raise ValueError('No connected host in cluster: "{0}" mounts datastore: "{1}"'
+                                     .format(cluster.name, datastore.name))
+                raise ValueError('No connected host in cluster: "{0}"'.format(cluster.name))
+            host = self.policy(candidates).host
+            key = (vcenter_key, host.mo_id)
+            self._in_flight[key] = self._in_flight.get(key, 0) + 1
+
+        return HostReservation(key, vim.HostSystem(host.mo_id, si._stub))
+
+    def release(self, reservation):
+        """
+        :param HostReservation reservation:
+        """
+        with self._lock:
+            self._in_flight[reservation.key] = max(self._in_flight.get(reservation.key, 0) - 1, 0)
+
+    def in_flight(self, si, host):
+        """
+        :return: the number of clones reserved on the host that did not finish yet
+        """
+        return self._in_flight.get((VCenterInventory.get_vcenter_key(si), host._moId), 0)
+
+    def invalidate(self, si, cluster):
+        with self._lock:
+            self._snapshots.pop((VCenterInventory.get_vcenter_key(si), cluster._moId), None)
+
+    def _get_candidates(self, vcenter_key, hosts, datastore_id=None):
+        candidates = []
+        for host in hosts:
+            if not host.available or (datastore_id and not host.mounts(datastore_id)):
+                continue
+            in_flight = self._in_flight.get((vcenter_key, host.mo_id), 0)
+            candidates.append(HostCandidate(host,
+                                            in_flight,
+                                            host.cpu_usage + in_flight * self.clone_cpu,
+                                            host.memory_usage + in_flight * self.clone_memory))
+        return candidates
+
+    def _get_snapshot(self, si, vcenter_key, cluster):
+        key = (vcenter_key, cluster._moId)
+        snapshot = self._snapshots.get(key)
+        if snapshot and time.time() - snapshot.read_at < self.stats_ttl:
+            return snapshot
+
+        with self._get_lock(key):
+            snapshot = self._snapshots.get(key)
+            if not snapshot or time.time() - snapshot.read_at >= self.stats_ttl:
+                snapshot = HostStatsSnapshot(self.stats_source.read(si, cluster), time.time())
+                with self._lock:
+                    self._snapshots[key] = snapshot
+            return snapshot
+
+    def _get_lock(self, key):
+        if key not in self.locks:
+            with self.locks_lock:
+                if key not in self.locks:
+                    self.locks[key] = Lock()
+        return self.locks[key]
+
+
+def simulate_placement(recorded_stats, cluster_id, clones, policy=DEFAULT_POLICY, **kwargs):
+    """
+    Places clones that start together on the recorded hosts of a cluster without a vCenter
+
+    :param RecordedHostStats recorded_stats:
+    :param str cluster_id: the moId of the cluster in the recording
+    :param int clones: the number of clones
+    :param policy: the policy to simulate
+    :param kwargs: the other HostPlacement parameters
+    :return: the name of the host of every clone in the order they were placed
+    :rtype: list[str]
+    """
+    placement = HostPlacement(policy=policy, stats_source=recorded_stats, **kwargs)
+    si = _SimulatedServiceInstance()
+    cluster = vim.ClusterComputeResource(cluster_id, si._stub)
+    names = dict((host.mo_id, host.name) for host in recorded_stats.read(si, cluster))
+    return [names[placement.reserve(si, cluster).host._moId] for _ in range(clones)]
+
+
+class _SimulatedServiceInstance(object):
+    def __init__(self):
+        self._stub = _SimulatedStub()
+
+
+class _SimulatedStub(object):
+    host = 'simulation'
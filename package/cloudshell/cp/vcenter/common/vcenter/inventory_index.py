@@ -0,0 +1,515 @@
+import time
+from threading import Lock, RLock, Thread
+
+from pyVmomi import vim, vmodl
+
+INVENTORY_PROPERTIES = ['name', 'parent']
+
+# the vCenter folders of a datacenter, ordered the same way pyVmomiService.get_folder looks into them
+DATACENTER_FOLDERS = ['vm', 'datastore', 'network', 'host']
+
+# maps the pyVmomiService type names to the datacenter folder that holds that type
+TYPE_NAME_TO_DATACENTER_FOLDER = {'vmFolder': 'vm',
+                                  'datastoreFolder': 'datastore',
+                                  'networkFolder': 'network',
+                                  'hostFolder': 'host'}
+
+DEFAULT_MAX_AGE = 60
+
+# seconds a WaitForUpdatesEx call blocks when nothing has changed
+DEFAULT_MAX_WAIT_SECONDS = 30
+
+LEAVE = 'leave'
+REMOVE_OPERATIONS = ['remove', 'indirectRemove']
+
+
+class InventoryNode(object):
+    def __init__(self, mo_id, mo_type, name, parent_id):
+        """
+        :param str mo_id: the managed object id (moref value)
+        :param type mo_type: the vim type of the managed object
+        :param str name: the name of the managed entity
+        :param str parent_id: the managed object id of the parent entity, None for the root folder
+        """
+        self.mo_id = mo_id
+        self.mo_type = mo_type
+        self.name = name
+        self.parent_id = parent_id
+        self.children = dict()
+
+    def is_a(self, vim_type):
+        return issubclass(self.mo_type, vim_type)
+
+    def get_children(self, name):
+        return self.children.get(name, [])
+
+
+class InventoryIndex(object):
+    """
+    In-memory trie of the vCenter inventory (folders, datacenters, networks, datastores, hosts,
+    resource pools and vms), resolves the same paths as pyVmomiService.get_folder without going to the vCenter
+    """
+
+    def __init__(self, root_id):
+        """
+        :param str root_id: the managed object id of the vCenter root folder
+        """
+        self.root_id = root_id
+        self.loaded_at = None
+        self.version = 0
+        self._nodes = dict()
+        self._orphans = dict()
+        self._lock = RLock()
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def get(self, mo_id):
+        return self._nodes.get(mo_id)
+
+    def add(self, mo_id, mo_type, name, parent_id):
+        """
+        Adds a managed entity to the index, an entity that was added before its parent
+        will be linked to the parent once the parent is added
+        :rtype: InventoryNode
+        """
+        with self._lock:
+            self.version += 1
+            node = self._nodes.get(mo_id)
+            if node:
+                # renamed or moved, the children stay with the node
+                self._unlink(node)
+                node.mo_type = mo_type
+                node.name = name
+                node.parent_id = parent_id
+                self._link(node)
+                return node
+
+            node = InventoryNode(mo_id, mo_type, name, parent_id)
+            self._nodes[mo_id] = node
+            self._link(node)
+            for orphan in self._orphans.pop(mo_id, []):
+                self._link(orphan)
+            return node
+
+    def remove(self, mo_id):
+        with self._lock:
+            self.version += 1
+            node = self._nodes.pop(mo_id, None)
+            if node:
+                self._unlink(node)
+            return node
+
+    def _link(self, node):
+        if node.parent_id is None:
+            return
+        parent = self._nodes.get(node.parent_id)
+        if parent is None:
+            self._orphans.setdefault(node.parent_id, []).append(node)
+            return
+        parent.children.setdefault(node.name, []).append(node)
+
+    def _unlink(self, node):
+        parent = self._nodes.get(node.parent_id)
+        siblings = parent.children.get(node.name, []) if parent else self._orphans.get(node.parent_id, [])
+        if node in siblings:
+            siblings.remove(node)
+
+    def resolve(self, path):
+        """
+        Finds the entity in the given path ('dc' or 'dc/folder' or 'dc/folder/folder/etc...')
+        :param str path:
+        :rtype: InventoryNode
+        """
+        root = self._nodes.get(self.root_id)
+        if root is None:
+            return None
+        if not path:
+            return root
+        with self._lock:
+            return self._resolve(root, [p for p in path.split('/') if p])
+
+    def _resolve(self, node, paths):
+        if not paths:
+            return node
+        for candidate in self._get_candidates(node, paths[0]):
+            child = self._resolve(candidate, paths[1:])
+            if child:
+                return child
+        return None
+
+    def _get_candidates(self, node, name):
+        """
+        returns the children of the node with the given name, the direct children first and then the children of
+        the datacenter folders or of the root resource pool of a cluster, same as pyVmomiService.get_folder
+        """
+        containers = [node]
+        if node.is_a(vim.Datacenter):
+            containers += [folder for folder_name in DATACENTER_FOLDERS
+                           for folder in node.get_children(folder_name) if folder.is_a(vim.Folder)]
+        elif node.is_a(vim.ComputeResource):
+            containers += [pool for pools in node.children.values()
+                           for pool in pools if pool.is_a(vim.ResourcePool)]
+
+        for container in containers:
+            for child in container.get_children(name):
+                yield child
+
+    def find_child(self, path, name, type_name):
+        """
+        Finds the entity with the given name in the folder of the path, same as pyVmomiService.find_obj_by_path
+        :param str path: the path to find the object ('dc' or 'dc/folder' or 'dc/folder/folder/etc...')
+        :param str name: the object name to return
+        :param str type_name: the name of the type, can be (vm, network, host, datastore)
+        :rtype: InventoryNode
+        """
+        with self._lock:
+            folder = self.resolve(path)
+            if folder is None:
+                return None
+
+            look_in = None
+            if type_name and hasattr(folder.mo_type, type_name):
+                look_in = next(iter(folder.get_children(TYPE_NAME_TO_DATACENTER_FOLDER.get(type_name))), None)
+            if hasattr(folder.mo_type, 'childEntity'):
+                look_in = folder
+            if look_in is None:
+                return None
+
+            return next(iter(look_in.get_children(name)), None)
+
+
+class VCenterInventory(object):
+    """
+    Keeps an InventoryIndex per vCenter.
+    Without live updates each index is loaded with a single PropertyCollector call and reloaded once it is older
+    than max_age seconds, with live updates an InventoryUpdater keeps the index in sync with the vCenter
+    """
+
+    def __init__(self, max_age=DEFAULT_MAX_AGE, live_updates=False, max_wait_seconds=DEFAULT_MAX_WAIT_SECONDS):
+        """
+        :param int max_age: seconds before a loaded index is considered out of date
+        :param bool live_updates: keep the index in sync with WaitForUpdatesEx instead of reloading it
+        :param int max_wait_seconds: seconds each WaitForUpdatesEx call of the updater blocks
+        """
+        self.max_age = max_age
+        self.live_updates = live_updates
+        self.max_wait_seconds = max_wait_seconds
+        self._indexes = dict()
+        self._updaters = dict()
+        self.locks = dict()
+        self.locks_lock = Lock()
+
+    def get_index(self, si):
+        """
+        :param vim.ServiceInstance si:
+        :return: the index of the vCenter or None when the index is lagging behind the vCenter
+        :rtype: InventoryIndex
+        """
+        key = self.get_vcenter_key(si)
+        if self.live_updates:
+            return self._get_live_index(si, key)
+
+        index = self._indexes.get(key)
+        if self._is_valid(index):
+            return index
+
+        with self._get_lock(key):
+            index = self._indexes.get(key)
+            if not self._is_valid(index):
+                index = self.load_index(si)
+                self._indexes[key] = index
+        return index
+
+    def _get_live_index(self, si, key):
+        updater = self._updaters.get(key)
+        if updater and updater.is_fresh():
+            return updater.index
+
+        with self._get_lock(key):
+            updater = self._updaters.get(key)
+            if updater and updater.is_fresh():
+                return updater.index
+            if updater and updater.is_alive():
+                # the updater is behind, the caller reads directly from the vCenter until it catches up
+                return None
+            if updater:
+                updater.stop()
+            updater = InventoryUpdater(si, self.max_wait_seconds)
+            updater.start()
+            self._updaters[key] = updater
+            return updater.index
+
+    def _get_lock(self, key):
+        if key not in self.locks:
+            with self.locks_lock:
+                if key not in self.locks:
+                    self.locks[key] = Lock()
+        return self.locks[key]
+
+    def invalidate(self, si, mo_id=None):
+        """
+        Called when an object was found in the vCenter but not in the index,
+        a live index will receive the object with the next update so only a loaded index is dropped.
+        Called with the managed object id of an indexed object that is gone from the vCenter,
+        the entry is evicted from the index in both modes
+        :param vim.ServiceInstance si:
+        :param str mo_id: the managed object id of the entry to evict
+        """
+        key = self.get_vcenter_key(si)
+        if mo_id is not None:
+            if self.live_updates:
+                updater = self._updaters.get(key)
+                index = updater.index if updater else None
+            else:
+                index = self._indexes.get(key)
+            if index:
+                index.remove(mo_id)
+            return
+
+        if not self.live_updates:
+            self._indexes.pop(key, None)
+
+    def stop(self):
+        for updater in self._updaters.values():
+            updater.stop()
+        self._updaters.clear()
+
+    def find_by_path(self, si, path):
+        """
+        :param vim.ServiceInstance si:
+        :param str path: the path to find the object ('dc' or 'dc/folder' or 'dc/folder/folder/etc...')
+        :return: the managed object or None if it is not in the index
+        """
+        try:
+            index = self.get_index(si)
+            node = index.resolve(path) if index else None
+        except Exception:
+            return None
+        return self._get_existing_object(si, node)
+
+    def find_child(self, si, path, name, type_name):
+        """
+        :param vim.ServiceInstance si:
+        :param str path: the path to find the object ('dc' or 'dc/folder' or 'dc/folder/folder/etc...')
+        :param str name: the object name to return
+        :param str type_name: the name of the type, can be (vm, network, host, datastore)
+        :return: the managed object or None if it is not in the index
+        """
+        try:
+            index = self.get_index(si)
+            node = index.find_child(path, name, type_name) if index else None
+        except Exception:
+            return None
+        return self._get_existing_object(si, node)
+
+    def _get_existing_object(self, si, node):
+        """
+        binds the indexed entity to the service instance and checks the vCenter still has it,
+        the entry of a deleted entity is evicted and None is returned so the caller falls back to the SearchIndex
+        """
+        obj = self.to_managed_object(si, node)
+        if obj is None:
+            return None
+        try:
+            obj.name
+        except vmodl.fault.ManagedObjectNotFound:
+            self.invalidate(si, node.mo_id)
+            return None
+        return obj
+
+    def _is_valid(self, index):
+        return index is not None and time.time() - index.loaded_at < self.max_age
+
+    @staticmethod
+    def get_vcenter_key(si):
+        stub = getattr(si, '_stub', None)
+        return getattr(stub, 'host', None) or id(si)
+
+    @staticmethod
+    def to_managed_object(si, node):
+        """
+        binds the indexed entity to the stub of the given service instance
+        """
+        if node is None:
+            return None
+        return node.mo_type(node.mo_id, si._stub)
+
+    @staticmethod
+    def load_index(si):
+        """
+        Loads the inventory tree with one RetrieveContents call
+        :param vim.ServiceInstance si:
+        :rtype: InventoryIndex
+        """
+        content = si.content
+        root = content.rootFolder
+        object_contents = content.propertyCollector.RetrieveContents([create_inventory_filter_spec(root)])
+
+        index = InventoryIndex(root._moId)
+        for object_content in object_contents:
+            props = dict((prop.name, prop.val) for prop in object_content.propSet)
+            parent = props.get('parent')
+            index.add(mo_id=object_content.obj._moId,
+                      mo_type=type(object_content.obj),
+                      name=props.get('name'),
+                      parent_id=parent._moId if parent is not None else None)
+        index.loaded_at = time.time()
+        return index
+
+
+class InventoryUpdater(object):
+    """
+    Keeps an InventoryIndex in sync with the vCenter, a dedicated PropertyCollector holds a PropertyFilter over
+    the inventory tree and a background thread applies the WaitForUpdatesEx deltas (created, renamed, moved and
+    deleted folders, vms, port groups, datastores etc.) to the index
+    """
+
+    def __init__(self, si, max_wait_seconds=DEFAULT_MAX_WAIT_SECONDS):
+        """
+        :param vim.ServiceInstance si:
+        :param int max_wait_seconds: seconds each WaitForUpdatesEx call blocks when nothing has changed
+        """
+        self.si = si
+        self.max_wait_seconds = max_wait_seconds
+        self.index = None
+        self.version = ''
+        self.last_sync = None
+        self.error = None
+        self._collector = None
+        self._stopped = False
+        self._thread = None
+
+    def start(self):
+        """
+        Loads the index and starts applying the updates in the background, the index is ready when start returns
+        """
+        self.sync()
+        self._thread = Thread(target=self._run, name='InventoryUpdater')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def sync(self):
+        """
+        Creates the filter and loads the index from the first update sets
+        """
+        content = self.si.content
+        root = content.rootFolder
+        self.index = InventoryIndex(root._moId)
+        self._collector = content.propertyCollector.CreatePropertyCollector()
+        self._collector.CreateFilter(create_inventory_filter_spec(root), partialUpdates=True)
+
+        while self.poll(max_wait_seconds=0):
+            pass
+        self.index.loaded_at = time.time()
+
+    def stop(self):
+        self._stopped = True
+        if self._collector is None:
+            return
+        try:
+            self._collector.CancelWaitForUpdates()
+            self._collector.DestroyPropertyCollector()
+        except Exception:
+            pass
+
+    def is_alive(self):
+        return not self._stopped and self.error is None and self._thread is not None and self._thread.is_alive()
+
+    def is_fresh(self):
+        """
+        the index is fresh when the last WaitForUpdatesEx call returned within two wait periods
+        """
+        return self.is_alive() and time.time() - self.last_sync < self.max_wait_seconds * 2
+
+    def _run(self):
+        while not self._stopped:
+            try:
+                self.poll()
+            except Exception as e:
+                if not self._stopped:
+                    self.error = e
+                return
+
+    def poll(self, max_wait_seconds=None):
+        """
+        Waits for the next update set and applies it to the index
+        :param int max_wait_seconds: overrides the wait of this call, 0 returns right away
+        :return: True when the update set was truncated and more updates are waiting
+        """
+        if max_wait_seconds is None:
+            max_wait_seconds = self.max_wait_seconds
+        options = vmodl.query.PropertyCollector.WaitOptions(maxWaitSeconds=max_wait_seconds)
+        update_set = self._collector.WaitForUpdatesEx(self.version, options)
+        self.last_sync = time.time()
+        if update_set is None:
+            return False
+
+        for filter_update in update_set.filterSet:
+            for object_update in filter_update.objectSet:
+                self._apply_object_update(object_update)
+        self.version = update_set.version
+        return bool(update_set.truncated)
+
+    def _apply_object_update(self, object_update):
+        mo_id = object_update.obj._moId
+        if object_update.kind == LEAVE:
+            self.index.remove(mo_id)
+            return
+
+        node = self.index.get(mo_id)
+        name = node.name if node else None
+        parent_id = node.parent_id if node else None
+        for change in object_update.changeSet:
+            val = None if change.op in REMOVE_OPERATIONS else change.val
+            if change.name == 'name':
+                name = val
+            elif change.name == 'parent':
+                parent_id = val._moId if val is not None else None
+        self.index.add(mo_id, type(object_update.obj), name, parent_id)
+
+
+def create_inventory_filter_spec(root):
+    """
+    Creates a filter spec that walks the whole inventory tree from the root folder and collects
+    the name and the parent of every managed entity
+    :param vim.Folder root:
+    :rtype: vmodl.query.PropertyCollector.FilterSpec
+    """
+    traversal_spec = vmodl.query.PropertyCollector.TraversalSpec
+    selection_spec = vmodl.query.PropertyCollector.SelectionSpec
+
+    folder_traversal = traversal_spec(name='folderTraversal', type=vim.Folder, path='childEntity', skip=False,
+                                      selectSet=[selection_spec(name='folderTraversal'),
+                                                 selection_spec(name='datacenterVmTraversal'),
+                                                 selection_spec(name='datacenterHostTraversal'),
+                                                 selection_spec(name='datacenterNetworkTraversal'),
+                                                 selection_spec(name='datacenterDatastoreTraversal'),
+                                                 selection_spec(name='computeResourceHostTraversal'),
+                                                 selection_spec(name='computeResourcePoolTraversal')])
+    datacenter_traversals = [traversal_spec(name=name, type=vim.Datacenter, path=path, skip=False,
+                                            selectSet=[selection_spec(name='folderTraversal')])
+                             for name, path in [('datacenterVmTraversal', 'vmFolder'),
+                                                ('datacenterHostTraversal', 'hostFolder'),
+                                                ('datacenterNetworkTraversal', 'networkFolder'),
+                                                ('datacenterDatastoreTraversal', 'datastoreFolder')]]
+    compute_resource_host = traversal_spec(name='computeResourceHostTraversal', type=vim.ComputeResource,
+                                           path='host', skip=False)
+    compute_resource_pool = traversal_spec(name='computeResourcePoolTraversal', type=vim.ComputeResource,
+                                           path='resourcePool', skip=False,
+                                           selectSet=[selection_spec(name='resourcePoolTraversal')])
+    resource_pool_traversal = traversal_spec(name='resourcePoolTraversal', type=vim.ResourcePool,
+                                             path='resourcePool', skip=False,
+                                             selectSet=[selection_spec(name='resourcePoolTraversal')])
+
+    object_spec = vmodl.query.PropertyCollector.ObjectSpec(obj=root,
+                                                           skip=False,
+                                                           selectSet=[folder_traversal,
+                                                                      compute_resource_host,
+                                                                      compute_resource_pool,
+                                                                      resource_pool_traversal] +
+                                                                     datacenter_traversals)
+    property_spec = vmodl.query.PropertyCollector.PropertySpec(type=vim.ManagedEntity,
+                                                               pathSet=INVENTORY_PROPERTIES,
+                                                               all=False)
+    return vmodl.query.PropertyCollector.FilterSpec(objectSet=[object_spec], propSet=[property_spec])
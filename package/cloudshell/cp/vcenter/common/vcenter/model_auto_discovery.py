@@ -12,6 +12,7 @@ from cloudshell.cp.vcenter.common.model_factory import ResourceModelParser
 from cloudshell.cp.vcenter.common.vcenter.vmomi_service import pyVmomiService
 
 from cloudshell.cp.vcenter.common.vcenter.task_waiter import SynchronousTaskWaiter
+from cloudshell.cp.vcenter.common.vcenter.name_index import VCenterNameIndex
 from cloudshell.shell.core.session.cloudshell_session import CloudShellSessionContext
 
 from cloudshell.cp.vcenter.common.utilites.common_utils import back_slash_to_front_converter
@@ -33,6 +34,9 @@ VM_RESOURCE_POOL = 'VM Resource Pool'
 VM_STORAGE = 'VM Storage'
 SHUTDOWN_METHODS = ['soft', 'hard']
 
+# the types of the datacenter objects the attributes fall back to when they are not configured
+DATACENTER_DEFAULT_TYPES = [vim.Datastore, vim.StoragePod, vim.ClusterComputeResource, vim.HostSystem]
+
 ATTRIBUTE_NAMES_THAT_ARE_SLASH_BACKSLASH_AGNOSTIC = [DEFAULT_DVSWITCH, DEFAULT_DATACENTER, VM_LOCATION, VM_STORAGE,
                                                      VM_RESOURCE_POOL, VM_CLUSTER]
 
@@ -48,7 +52,8 @@ class VCenterAutoModelDiscovery(object):
     def __init__(self):
         self.dc = None
         self.parser = ResourceModelParser()
-        self.pv_service = pyVmomiService(SmartConnect, Disconnect, SynchronousTaskWaiter())
+        self.pv_service = pyVmomiService(SmartConnect, Disconnect, SynchronousTaskWaiter(),
+                                         name_index=VCenterNameIndex())
         self.context_based_logger_factory = ContextBasedLoggerFactory()
 
     def _get_logger(self, context):
@@ -83,11 +88,11 @@ class VCenterAutoModelDiscovery(object):
             raise ValueError(error_message)
 
         try:
-            all_dc = self.pv_service.get_all_items_in_vcenter(si, vim.Datacenter)
+            all_dc = list(self.pv_service.query_inventory(si, [vim.Datacenter]))
             dc = self._validate_datacenter(si, all_dc, auto_attr, resource.attributes)
             self.dc = dc
 
-            all_items_in_dc = self.pv_service.get_all_items_in_vcenter(si, None, dc)
+            all_items_in_dc = list(self.pv_service.query_inventory(si, DATACENTER_DEFAULT_TYPES, root=dc))
             dc_name = dc.name
 
             for key, value in resource.attributes.items():
@@ -105,6 +110,9 @@ class VCenterAutoModelDiscovery(object):
 
     @staticmethod
     def _get_default_from_vc_by_type_and_name(items_in_vc, vim_type, name=None):
+        """
+        :param list[pyVmomiService.InventoryRecord] items_in_vc:
+        """
         items = []
         if not isinstance(vim_type, collections.Iterable):
             vim_type = [vim_type]
@@ -112,7 +120,7 @@ class VCenterAutoModelDiscovery(object):
             if item.name == name:
                 return item
 
-            item_type = type(item)
+            item_type = item.mo_type
             if [t for t in vim_type if item_type is t]:
                 items.append(item)
 
@@ -125,7 +133,7 @@ class VCenterAutoModelDiscovery(object):
     def _validate_datacenter(self, si, all_item_in_vc, auto_att, attributes):
         dc = self._validate_attribute(si, attributes, vim.Datacenter, DEFAULT_DATACENTER)
         if not dc:
-            dc = self._get_default(all_item_in_vc, vim.Datacenter, DEFAULT_DATACENTER)
+            dc = self._get_default(all_item_in_vc, vim.Datacenter, DEFAULT_DATACENTER).obj
         auto_att.append(AutoLoadAttribute('', DEFAULT_DATACENTER, dc.name))
         return dc
 
@@ -0,0 +1,162 @@
+import os
+import time
+from threading import Lock
+
+from pyVmomi import vim, vmodl
+
+# seconds before a loaded name index of a type is loaded again
+DEFAULT_MAX_AGE = int(os.getenv('VCenterNameIndexMaxAge', 60))
+
+# seconds a name that was not found waits before it reloads the names of its type
+DEFAULT_MISS_RELOAD_INTERVAL = 5
+
+# seconds a name that was still not found after its type was reloaded is not looked for again
+DEFAULT_MISS_TTL = int(os.getenv('VCenterNameIndexMissTTL', 60))
+
+
+class TypedNameIndex(object):
+    def __init__(self, vim_type, names):
+        """
+        :param type vim_type: the type of the indexed objects
+        :param list[(str, type, str)] names: the name, type and moId of every object of the type,
+                                             in the order of the vCenter
+        """
+        self.vim_type = vim_type
+        self.loaded_at = time.time()
+        self.first = names[0][1:] if names else None
+        self._refs = dict()
+        for name, mo_type, mo_id in names:
+            self._refs.setdefault(name, (mo_type, mo_id))
+
+    def __len__(self):
+        return len(self._refs)
+
+    def find(self, name):
+        """
+        :return: the type and moId of the first object with the name, of the first object of the type when no name
+                 is given, None when there is no such object
+        :rtype: (type, str)
+        """
+        if not name:
+            return self.first
+        return self._refs.get(name)
+
+
+class VCenterNameIndex(object):
+    """
+    Finds inventory objects by type and name without scanning the inventory.
+    The names of all the objects of a type are read with one RetrieveContents call over a ContainerView
+    that is destroyed right after, a name that is not found reloads the type in case it was just created,
+    at most once every miss_reload_interval seconds. Several types are usually tried for one name, so a name
+    still not found after the reload is remembered as missing from its type for miss_ttl seconds
+    """
+
+    def __init__(self, max_age=DEFAULT_MAX_AGE, miss_reload_interval=DEFAULT_MISS_RELOAD_INTERVAL,
+                 miss_ttl=DEFAULT_MISS_TTL):
+        """
+        :param int max_age: seconds before the names of a type are loaded again
+        :param int miss_reload_interval: seconds a loaded type is trusted to not hold a name that was not found
+        :param int miss_ttl: seconds a name not found after a reload is not looked for again in its type
+        """
+        self.max_age = max_age
+        self.miss_reload_interval = miss_reload_interval
+        self.miss_ttl = miss_ttl
+        self._indexes = dict()
+        self._misses = dict()
+        self.locks = dict()
+        self.locks_lock = Lock()
+
+    def find(self, content, vim_type, name):
+        """
+        :param vim.ServiceInstanceContent content:
+        :param type vim_type: the type of the object
+        :param str name: the object name, the first object of the type is returned when no name is given
+        :return: the managed object or None when there is no such object
+        """
+        stub = content.rootFolder._stub
+        key = (self.get_vcenter_key(stub), vim_type)
+
+        index = self._get_index(content, key, vim_type)
+        ref = index.find(name)
+        if ref is None and time.time() - index.loaded_at >= self.miss_reload_interval \
+                and time.time() - self._misses.get((key, name), 0) >= self.miss_ttl:
+            index = self._get_index(content, key, vim_type, reload_before=time.time())
+            ref = index.find(name)
+            if ref is None:
+                self._misses[(key, name)] = time.time()
+
+        if ref is None:
+            return None
+        mo_type, mo_id = ref
+        # bound to the stub of the caller, the names may have been loaded by another session
+        return mo_type(mo_id, stub)
+
+    def invalidate(self, content):
+        key = self.get_vcenter_key(content.rootFolder._stub)
+        with self.locks_lock:
+            for index_key in [k for k in self._indexes.keys() if k[0] == key]:
+                del self._indexes[index_key]
+            for miss_key in [k for k in self._misses.keys() if k[0][0] == key]:
+                del self._misses[miss_key]
+
+    def _get_index(self, content, key, vim_type, reload_before=None):
+        index = self._indexes.get(key)
+        if self._is_valid(index, reload_before):
+            return index
+
+        with self._get_lock(key):
+            index = self._indexes.get(key)
+            if not self._is_valid(index, reload_before):
+                index = TypedNameIndex(vim_type, self.load_names(content, vim_type))
+                self._indexes[key] = index
+            return index
+
+    def _get_lock(self, key):
+        if key not in self.locks:
+            with self.locks_lock:
+                if key not in self.locks:
+                    self.locks[key] = Lock()
+        return self.locks[key]
+
+    def _is_valid(self, index, reload_before):
+        if index is None or time.time() - index.loaded_at >= self.max_age:
+            return False
+        return reload_before is None or index.loaded_at >= reload_before
+
+    @staticmethod
+    def get_vcenter_key(stub):
+        return getattr(stub, 'host', None) or id(stub)
+
+    @staticmethod
+    def load_names(content, vim_type):
+        """
+        :return: the name, type and moId of every object of the type
+        :rtype: list[(str, type, str)]
+        """
+        view = content.viewManager.CreateContainerView(content.rootFolder, [vim_type], True)
+        try:
+            object_contents = content.propertyCollector.RetrieveContents([create_name_filter_spec(view, vim_type)])
+        finally:
+            view.DestroyView()
+
+        names = []
+        for object_content in object_contents or []:
+            name = next((prop.val for prop in object_content.propSet if prop.name == 'name'), None)
+            names.append((name, type(object_content.obj), object_content.obj._moId))
+        return names
+
+
+def create_name_filter_spec(view, vim_type):
+    """
+    Creates a filter spec that collects only the name of every object in the view
+    :param vim.view.ContainerView view:
+    :param type vim_type:
+    :rtype: vmodl.query.PropertyCollector.FilterSpec
+    """
+    traversal_spec = vmodl.query.PropertyCollector.TraversalSpec(name='traverseView',
+                                                                 path='view',
+                                                                 skip=False,
+                                                                 type=vim.view.ContainerView)
+    obj_spec = vmodl.query.PropertyCollector.ObjectSpec(obj=view, skip=True, selectSet=[traversal_spec])
+    property_spec = vmodl.query.PropertyCollector.PropertySpec(type=vim_type, pathSet=['name'], all=False)
+    return vmodl.query.PropertyCollector.FilterSpec(objectSet=[obj_spec], propSet=[property_spec])
@@ -0,0 +1,222 @@
+import os
+import time
+from threading import Lock
+
+from pyVmomi import vim, vmodl
+
+# seconds a dvSwitch index is trusted before it asks the vCenter for the port group changes made outside the driver
+DEFAULT_POLL_INTERVAL = int(os.getenv('DvPortGroupIndexPollInterval', 5))
+
+LEAVE = 'leave'
+REMOVE_OPERATIONS = ['remove', 'indirectRemove']
+
+
+class DvSwitchPortGroups(object):
+    """
+    The port groups of one dvSwitch by name.
+    A dedicated PropertyCollector holds a filter over the name of every port group of the switch, the first
+    WaitForUpdatesEx fills the index and the later ones return only the port groups that were created, renamed
+    or destroyed since the last call
+    """
+
+    def __init__(self, si, dv_switch):
+        """
+        :param vim.ServiceInstance si:
+        :param vim.DistributedVirtualSwitch dv_switch:
+        """
+        self.dv_switch_id = dv_switch._moId
+        self.version = ''
+        self.synced_at = None
+        self.lock = Lock()
+        self._by_name = dict()
+        self._names = dict()
+        self._collector = si.content.propertyCollector.CreatePropertyCollector()
+        self._collector.CreateFilter(create_portgroup_filter_spec(dv_switch), partialUpdates=True)
+
+    def __len__(self):
+        return len(self._by_name)
+
+    def find(self, name):
+        """
+        :return: the moId of the port group with the name, None when the switch has no such port group
+        """
+        return self._by_name.get(name)
+
+    def add(self, mo_id, name):
+        self.remove(mo_id)
+        if name is not None:
+            self._by_name[name] = mo_id
+            self._names[mo_id] = name
+
+    def remove(self, mo_id):
+        name = self._names.pop(mo_id, None)
+        if name is not None and self._by_name.get(name) == mo_id:
+            del self._by_name[name]
+
+    def sync(self):
+        """
+        Applies the port group changes since the last call, returns right away when there are none
+        """
+        options = vmodl.query.PropertyCollector.WaitOptions(maxWaitSeconds=0)
+        while True:
+            update_set = self._collector.WaitForUpdatesEx(self.version, options)
+            if update_set is None:
+                break
+            for filter_update in update_set.filterSet:
+                for object_update in filter_update.objectSet:
+                    self._apply_object_update(object_update)
+            self.version = update_set.version
+            if not update_set.truncated:
+                break
+        self.synced_at = time.time()
+
+    def destroy(self):
+        try:
+            self._collector.DestroyPropertyCollector()
+        except Exception:
+            pass
+
+    def _apply_object_update(self, object_update):
+        mo_id = object_update.obj._moId
+        if object_update.kind == LEAVE:
+            self.remove(mo_id)
+            return
+
+        name = self._names.get(mo_id)
+        for change in object_update.changeSet:
+            if change.name == 'name':
+                name = None if change.op in REMOVE_OPERATIONS else change.val
+        self.add(mo_id, name)
+
+
+class DvPortGroupIndex(object):
+    """
+    Finds the port groups of a dvSwitch by name without reading the name of every port group of the switch.
+    Each dvSwitch is indexed with one projected retrieval of the names of its port groups, the port groups the
+    driver creates or destroys are added or removed right away and the changes made outside the driver are read
+    from the PropertyCollector once the index is older than poll_interval seconds or a name is not found
+    """
+
+    def __init__(self, poll_interval=DEFAULT_POLL_INTERVAL):
+        """
+        :param int poll_interval: seconds before the index of a dvSwitch reads the changes made outside the driver
+        """
+        self.poll_interval = poll_interval
+        self._switches = dict()
+        self.locks = dict()
+        self.locks_lock = Lock()
+
+    def find(self, si, dv_switch, name):
+        """
+        :param vim.ServiceInstance si:
+        :param vim.DistributedVirtualSwitch dv_switch:
+        :param str name: the name of the port group
+        :return: the port group or None when the dvSwitch has no port group with the name
+        :rtype: vim.dvs.DistributedVirtualPortgroup
+        """
+        key = self._get_key(dv_switch)
+        switch = self._get_switch(si, dv_switch, key)
+        with switch.lock:
+            if time.time() - switch.synced_at >= self.poll_interval:
+                switch = self._sync(si, dv_switch, key, switch)
+            mo_id = switch.find(name)
+            if mo_id is None:
+                # the port group may have just been created outside the driver
+                switch = self._sync(si, dv_switch, key, switch)
+                mo_id = switch.find(name)
+
+        if mo_id is None:
+            return None
+        # bound to the stub of the caller, the index may have been loaded by another session
+        return vim.dvs.DistributedVirtualPortgroup(mo_id, si._stub)
+
+    def add(self, dv_switch, name, port_group):
+        """
+        Adds a port group the driver created to the index of its dvSwitch
+        """
+        switch = self._switches.get(self._get_key(dv_switch))
+        if switch is not None:
+            with switch.lock:
+                switch.add(port_group._moId, name)
+
+    def remove(self, port_group):
+        """
+        Removes a port group the driver destroyed from the index of its dvSwitch
+        """
+        vcenter_key = self.get_vcenter_key(port_group._stub)
+        for key, switch in self._switches.items():
+            if key[0] == vcenter_key:
+                with switch.lock:
+                    switch.remove(port_group._moId)
+
+    def invalidate(self, dv_switch):
+        with self.locks_lock:
+            switch = self._switches.pop(self._get_key(dv_switch), None)
+        if switch is not None:
+            switch.destroy()
+
+    def _get_switch(self, si, dv_switch, key):
+        switch = self._switches.get(key)
+        if switch is not None:
+            return switch
+
+        with self._get_lock(key):
+            switch = self._switches.get(key)
+            if switch is None:
+                switch = self.load(si, dv_switch)
+                self._switches[key] = switch
+            return switch
+
+    def _sync(self, si, dv_switch, key, switch):
+        # must be called while holding the lock of the switch
+        try:
+            switch.sync()
+            return switch
+        except Exception:
+            # the session that holds the collector is gone, the switch is loaded again with the current one
+            switch.destroy()
+        reloaded = self.load(si, dv_switch)
+        with self.locks_lock:
+            self._switches[key] = reloaded
+        return reloaded
+
+    def _get_lock(self, key):
+        if key not in self.locks:
+            with self.locks_lock:
+                if key not in self.locks:
+                    self.locks[key] = Lock()
+        return self.locks[key]
+
+    def _get_key(self, dv_switch):
+        return self.get_vcenter_key(dv_switch._stub), dv_switch._moId
+
+    @staticmethod
+    def get_vcenter_key(stub):
+        return getattr(stub, 'host', None) or id(stub)
+
+    @staticmethod
+    def load(si, dv_switch):
+        """
+        :param vim.ServiceInstance si:
+        :param vim.DistributedVirtualSwitch dv_switch:
+        :rtype: DvSwitchPortGroups
+        """
+        switch = DvSwitchPortGroups(si, dv_switch)
+        switch.sync()
+        return switch
+
+
+def create_portgroup_filter_spec(dv_switch):
+    """
+    Creates a filter spec that collects only the name of every port group of the dvSwitch
+    :param vim.DistributedVirtualSwitch dv_switch:
+    :rtype: vmodl.query.PropertyCollector.FilterSpec
+    """
+    traversal_spec = vmodl.query.PropertyCollector.TraversalSpec(name='traversePortgroup',
+                                                                 path='portgroup',
+                                                                 skip=False,
+                                                                 type=vim.DistributedVirtualSwitch)
+    obj_spec = vmodl.query.PropertyCollector.ObjectSpec(obj=dv_switch, skip=True, selectSet=[traversal_spec])
+    property_spec = vmodl.query.PropertyCollector.PropertySpec(type=vim.dvs.DistributedVirtualPortgroup,
+                                                               pathSet=['name'], all=False)
+    return vmodl.query.PropertyCollector.FilterSpec(objectSet=[obj_spec], propSet=[property_spec])
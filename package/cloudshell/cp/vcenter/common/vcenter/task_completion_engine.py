@@ -0,0 +1,202 @@
+import time
+from threading import Event, Lock, Thread
+
+from pyVmomi import vim, vmodl
+
+TASK_STATE_PROPERTY = 'info.state'
+COMPLETED_STATES = [vim.TaskInfo.State.success, vim.TaskInfo.State.error]
+
+# seconds a WaitForUpdatesEx call of a watcher blocks when no watched task has changed
+DEFAULT_MAX_WAIT_SECONDS = 30
+
+
+class TaskCompletionEngine(object):
+    """
+    Wakes task waiters when their vSphere task completes.
+    Each connection gets one TaskWatcher, a ListView that holds all the outstanding tasks of the connection and a
+    single PropertyCollector filter over the 'info.state' of the tasks in that view
+    """
+
+    def __init__(self, max_wait_seconds=DEFAULT_MAX_WAIT_SECONDS):
+        """
+        :param int max_wait_seconds: seconds each WaitForUpdatesEx call of a watcher blocks
+        """
+        self.max_wait_seconds = max_wait_seconds
+        self._watchers = dict()
+        self.locks_lock = Lock()
+
+    def wait(self, task, timeout):
+        """
+        Blocks until the task completes or the timeout passes, falls back to sleeping the timeout
+        when the update stream of the connection is not available
+        :param vim.Task task:
+        :param float timeout: seconds to wait
+        :return: True if the task completed or its state is not known without reading it,
+                 False if the task is still running
+        :rtype: bool
+        """
+        try:
+            watcher = self._get_watcher(task._stub)
+            return watcher.wait(task, timeout)
+        except Exception:
+            self._drop_watcher(task._stub)
+            time.sleep(timeout)
+            return True
+
+    def stop(self):
+        with self.locks_lock:
+            watchers = self._watchers.values()
+            self._watchers.clear()
+        for watcher in watchers:
+            watcher.stop()
+
+    def _get_watcher(self, stub):
+        watcher = self._watchers.get(stub)
+        if watcher and watcher.is_alive():
+            return watcher
+
+        with self.locks_lock:
+            watcher = self._watchers.get(stub)
+            if watcher and watcher.is_alive():
+                return watcher
+            if watcher:
+                watcher.stop()
+            watcher = TaskWatcher(self.get_content(stub), self.max_wait_seconds)
+            watcher.start()
+            self._watchers[stub] = watcher
+            return watcher
+
+    def _drop_watcher(self, stub):
+        with self.locks_lock:
+            watcher = self._watchers.pop(stub, None)
+        if watcher:
+            watcher.stop()
+
+    @staticmethod
+    def get_content(stub):
+        """
+        :return: the service content of the connection the stub belongs to
+        :rtype: vim.ServiceInstanceContent
+        """
+        return vim.ServiceInstance('ServiceInstance', stub).RetrieveContent()
+
+
+class TaskWatcher(object):
+    """
+    Watches the state of the tasks of one connection with a single update stream
+    """
+
+    def __init__(self, content, max_wait_seconds=DEFAULT_MAX_WAIT_SECONDS):
+        """
+        :param vim.ServiceInstanceContent content:
+        :param int max_wait_seconds: seconds each WaitForUpdatesEx call blocks
+        """
+        self.content = content
+        self.max_wait_seconds = max_wait_seconds
+        self.version = ''
+        self.error = None
+        self._events = dict()
+        self._lock = Lock()
+        self._view = None
+        self._collector = None
+        self._stopped = False
+        self._thread = None
+
+    def start(self):
+        self._view = self.content.viewManager.CreateListView()
+        self._collector = self.content.propertyCollector.CreatePropertyCollector()
+        self._collector.CreateFilter(self._create_filter_spec(self._view), partialUpdates=True)
+
+        self._thread = Thread(target=self._run, name='TaskWatcher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped = True
+        self._release_waiters()
+        if self._collector is None:
+            return
+        try:
+            self._collector.CancelWaitForUpdates()
+            self._collector.DestroyPropertyCollector()
+            self._view.DestroyView()
+        except Exception:
+            pass
+
+    def is_alive(self):
+        return not self._stopped and self.error is None and self._thread is not None and self._thread.is_alive()
+
+    def wait(self, task, timeout):
+        """
+        :param vim.Task task:
+        :param float timeout: seconds to wait
+        :return: True if the task completed
+        """
+        with self._lock:
+            event = self._events.get(task._moId)
+            if event is None:
+                event = Event()
+                self._events[task._moId] = event
+                self._view.ModifyListView(add=[task])
+        return event.wait(timeout)
+
+    def _run(self):
+        while not self._stopped:
+            try:
+                self.poll()
+            except Exception as e:
+                if not self._stopped:
+                    self.error = e
+                    self._release_waiters()
+                return
+
+    def poll(self):
+        """
+        Waits for the next update set and wakes the waiters of the tasks that completed
+        """
+        options = vmodl.query.PropertyCollector.WaitOptions(maxWaitSeconds=self.max_wait_seconds)
+        update_set = self._collector.WaitForUpdatesEx(self.version, options)
+        if update_set is None:
+            return
+
+        completed = []
+        for filter_update in update_set.filterSet:
+            for object_update in filter_update.objectSet:
+                for change in object_update.changeSet:
+                    if change.name == TASK_STATE_PROPERTY and change.val in COMPLETED_STATES:
+                        completed.append(object_update.obj)
+        self.version = update_set.version
+
+        if completed:
+            self._complete(completed)
+
+    def _complete(self, tasks):
+        with self._lock:
+            events = [self._events.pop(task._moId, None) for task in tasks]
+            self._view.ModifyListView(remove=tasks)
+        for event in events:
+            if event:
+                event.set()
+
+    def _release_waiters(self):
+        """
+        wakes all the waiters, they read the task state themselves and decide whether to wait again
+        """
+        with self._lock:
+            events = self._events.values()
+            self._events.clear()
+        for event in events:
+            event.set()
+
+    @staticmethod
+    def _create_filter_spec(view):
+        traversal_spec = vmodl.query.PropertyCollector.TraversalSpec(
+            name='traverseView',
+            path='view',
+            skip=False,
+            type=vim.view.ListView)
+
+        obj_spec = vmodl.query.PropertyCollector.ObjectSpec(obj=view, skip=True, selectSet=[traversal_spec])
+        property_spec = vmodl.query.PropertyCollector.PropertySpec(type=vim.Task, pathSet=[TASK_STATE_PROPERTY])
+
+        return vmodl.query.PropertyCollector.FilterSpec(objectSet=[obj_spec], propSet=[property_spec])
@@ -0,0 +1,106 @@
+from threading import Lock
+
+
+class PollSchedule(object):
+    def __init__(self, initial, factor, cap):
+        """
+        :param float initial: seconds before the first check of the task
+        :param float factor: the interval is multiplied by the factor after every check
+        :param float cap: the longest interval between two checks, the cancellation of the command is checked as often
+        """
+        self.initial = initial
+        self.factor = factor
+        self.cap = cap
+
+    def get_interval(self, polls):
+        """
+        :param int polls: number of times the task was already checked
+        """
+        return min(self.initial * self.factor ** polls, self.cap)
+
+
+DEFAULT_SCHEDULE = PollSchedule(initial=0.25, factor=2, cap=2)
+
+# the action names the task waiters are given, the schedules are looked up by them
+CLONE_VM = 'Clone VM'
+POWER_ON = 'Power On'
+POWER_OFF = 'Power Off'
+DESTROY_VM = 'Destroy VM'
+CREATE_DV_PORT_GROUP = 'Create dv port group'
+CREATE_DV_PORT_GROUPS = 'Create dv port groups'
+RECONFIGURE_VM = 'Reconfigure VM'
+
+# tuned by how long each task usually runs, a clone takes minutes while a power on takes a second
+DEFAULT_SCHEDULES = {CLONE_VM: PollSchedule(initial=1, factor=2, cap=5),
+                     POWER_ON: PollSchedule(initial=0.1, factor=1.5, cap=1),
+                     POWER_OFF: PollSchedule(initial=0.1, factor=1.5, cap=1),
+                     DESTROY_VM: PollSchedule(initial=0.25, factor=2, cap=2),
+                     CREATE_DV_PORT_GROUP: PollSchedule(initial=0.1, factor=1.5, cap=1),
+                     CREATE_DV_PORT_GROUPS: PollSchedule(initial=0.1, factor=1.5, cap=1),
+                     RECONFIGURE_VM: PollSchedule(initial=0.1, factor=1.5, cap=1)}
+
+
+class TaskPollPolicy(object):
+    """
+    Decides when a running vSphere task is checked next, polls start fast and back off exponentially up to the cap
+    of the action, once the task reports progress the next check is scheduled halfway to its estimated completion
+    """
+
+    def __init__(self, schedules=None, default_schedule=DEFAULT_SCHEDULE):
+        """
+        :param dict[str, PollSchedule] schedules: overrides the schedule of the given action names
+        :param PollSchedule default_schedule: the schedule of every other action
+        """
+        self.schedules = dict(DEFAULT_SCHEDULES)
+        self.schedules.update(schedules or {})
+        self.default_schedule = default_schedule
+        self.metrics = TaskPollMetrics()
+
+    def get_schedule(self, action_name):
+        """
+        :rtype: PollSchedule
+        """
+        return self.schedules.get(action_name, self.default_schedule)
+
+    def next_interval(self, action_name, polls, elapsed=0, progress=None):
+        """
+        :param str action_name: the action name the task waiter was given
+        :param int polls: number of times the task was already checked
+        :param float elapsed: seconds since the task was first checked
+        :param int progress: the task.info.progress percentage, None when the task does not report progress
+        :return: seconds to wait before the next check
+        """
+        schedule = self.get_schedule(action_name)
+        interval = schedule.get_interval(polls)
+        if isinstance(progress, int) and 0 < progress < 100 and elapsed > 0:
+            remaining = elapsed * (100 - progress) / float(progress)
+            interval = max(remaining / 2, schedule.initial)
+        return min(interval, schedule.cap)
+
+
+class TaskPollMetrics(object):
+    """
+    Counts how many times the tasks of each action were checked until they completed
+    """
+
+    def __init__(self):
+        self.tasks = dict()
+        self.polls = dict()
+        self.max_polls = dict()
+        self._lock = Lock()
+
+    def record(self, action_name, polls):
+        """
+        :param str action_name:
+        :param int polls: number of times the completed task was checked
+        """
+        with self._lock:
+            self.tasks[action_name] = self.tasks.get(action_name, 0) + 1
+            self.polls[action_name] = self.polls.get(action_name, 0) + polls
+            self.max_polls[action_name] = max(self.max_polls.get(action_name, 0), polls)
+
+    def average_polls(self, action_name):
+        tasks = self.tasks.get(action_name)
+        if not tasks:
+            return 0
+        return self.polls[action_name] / float(tasks)
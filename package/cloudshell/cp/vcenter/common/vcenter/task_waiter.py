@@ -1,15 +1,27 @@
 import time
 
-from pyVmomi import vim
+from pyVmomi import vim, vmodl
 
+from cloudshell.cp.vcenter.common.vcenter.task_poll_policy import TaskPollPolicy
 from cloudshell.cp.vcenter.exceptions.task_waiter import TaskFaultException
 
 
+# seconds the completion engine is waited on before the cancellation of the command is checked
+POLL_INTERVAL = 2
+
+RUNNING_STATES = [vim.TaskInfo.State.running, vim.TaskInfo.State.queued]
+
+
 class SynchronousTaskWaiter(object):
-    def __init__(self):
-        pass
+    def __init__(self, completion_engine=None, poll_policy=None):
+        """
+        :param completion_engine: wakes the waiter as soon as the task completes instead of polling it
+        :type completion_engine: cloudshell.cp.vcenter.common.vcenter.task_completion_engine.TaskCompletionEngine
+        :param TaskPollPolicy poll_policy: decides when a running task is checked next
+        """
+        self.completion_engine = completion_engine
+        self.poll_policy = poll_policy or TaskPollPolicy()
 
-    # noinspection PyMethodMayBeStatic
     def wait_for_task(self, task, logger, action_name='job', hide_result=False, cancellation_context=None):
         """
         Waits and provides updates on a vSphere task
@@ -20,9 +32,19 @@ class SynchronousTaskWaiter(object):
         :param logger:
         """
 
-        while task.info.state in [vim.TaskInfo.State.running, vim.TaskInfo.State.queued]:
-            time.sleep(2)
-            if cancellation_context is not None and task.info.cancelable and cancellation_context.is_cancelled and not task.info.cancelled:
+        started = time.time()
+        polls = 0
+        info = task.info
+        while info.state in RUNNING_STATES:
+            changed = self._wait_for_state_change(task, action_name, polls, time.time() - started,
+                                                  getattr(info, 'progress', None))
+            polls += 1
+            cancelled = cancellation_context is not None and cancellation_context.is_cancelled
+            if not changed and not cancelled:
+                # the task is still running, the completion engine wakes the waiter when it completes
+                continue
+            info = task.info
+            if cancelled and info.cancelable and not info.cancelled:
                 # some times the cancel operation doesn't really cancel the task
                 # so consider an additional handling of the canceling
                 task.CancelTask()
@@ -30,23 +52,113 @@ class SynchronousTaskWaiter(object):
                 logger.info("SynchronousTaskWaiter: task.info.cancelled " + str(task.info.cancelled))
                 logger.info("SynchronousTaskWaiter: task.info.state " + str(task.info.state))
 
-        if task.info.state == vim.TaskInfo.State.success:
-            if task.info.result is not None and not hide_result:
-                out = '%s completed successfully, result: %s' % (action_name, task.info.result)
+        self.poll_policy.metrics.record(action_name, polls)
+        return self._get_task_result(info, logger, action_name, hide_result)
+
+    def wait_for_tasks(self, tasks, logger, action_name='job', hide_result=False, cancellation_context=None):
+        """
+        Waits on many vSphere tasks from the calling thread, the state of all the outstanding tasks
+        is read with one batched RetrievePropertiesEx call per connection on every pass
+        :param list[vim.Task] tasks:
+        :param logger:
+        :param action_name:
+        :param hide_result:
+        :param cancellation_context: package.cloudshell.cp.vcenter.models.QualiDriverModels.CancellationContext
+                                     when cancelled every outstanding cancelable task is cancelled
+        :return: generator of (task, result, error) in the order the tasks complete,
+                 error is the TaskFaultException of a failed task or None
+        """
+        started = time.time()
+        polls = 0
+        pending = list(tasks)
+        while pending:
+            infos = self._retrieve_task_infos(pending)
+            for task in list(pending):
+                info = infos.get(task)
+                if info is None or info.state in RUNNING_STATES:
+                    continue
+                pending.remove(task)
+                self.poll_policy.metrics.record(action_name, polls)
+                try:
+                    yield task, self._get_task_result(info, logger, action_name, hide_result), None
+                except TaskFaultException as e:
+                    yield task, None, e
+
+            if not pending:
+                break
+
+            if cancellation_context is not None and cancellation_context.is_cancelled:
+                for task in pending:
+                    info = infos.get(task)
+                    if info is not None and info.cancelable and not info.cancelled:
+                        task.CancelTask()
+                        logger.info("SynchronousTaskWaiter: task.CancelTask() " + str(info.key))
+
+            time.sleep(self.poll_policy.next_interval(action_name, polls, time.time() - started))
+            polls += 1
+
+    @staticmethod
+    def _get_task_result(info, logger, action_name, hide_result):
+        if info.state == vim.TaskInfo.State.success:
+            if info.result is not None and not hide_result:
+                out = '%s completed successfully, result: %s' % (action_name, info.result)
                 logger.info(out)
             else:
                 out = '%s completed successfully.' % action_name
                 logger.info(out)
         else:  # error state
             multi_msg = ''
-            if task.info.error.faultMessage:
-                multi_msg = ', '.join([err.message for err in task.info.error.faultMessage])
-            elif task.info.error.msg:
-                multi_msg = task.info.error.msg
+            if info.error.faultMessage:
+                multi_msg = ', '.join([err.message for err in info.error.faultMessage])
+            elif info.error.msg:
+                multi_msg = info.error.msg
 
             logger.info("task execution failed due to: {}".format(multi_msg))
-            logger.info("task info dump: {0}".format(task.info))
-            
+            logger.info("task info dump: {0}".format(info))
+
             raise TaskFaultException(multi_msg)
 
-        return task.info.result
+        return info.result
+
+    def _retrieve_task_infos(self, tasks):
+        """
+        :param list[vim.Task] tasks:
+        :return: the info of every task
+        :rtype: dict[vim.Task, vim.TaskInfo]
+        """
+        tasks_by_stub = dict()
+        for task in tasks:
+            tasks_by_stub.setdefault(task._stub, []).append(task)
+
+        infos = dict()
+        for stub, stub_tasks in tasks_by_stub.items():
+            collector = self.get_property_collector(stub)
+            spec = vmodl.query.PropertyCollector.FilterSpec(
+                objectSet=[vmodl.query.PropertyCollector.ObjectSpec(obj=task) for task in stub_tasks],
+                propSet=[vmodl.query.PropertyCollector.PropertySpec(type=vim.Task, pathSet=['info'])])
+
+            result = collector.RetrievePropertiesEx([spec], vmodl.query.PropertyCollector.RetrieveOptions())
+            while result:
+                for object_content in result.objects:
+                    infos[object_content.obj] = object_content.propSet[0].val
+                if not result.token:
+                    break
+                result = collector.ContinueRetrievePropertiesEx(result.token)
+        return infos
+
+    @staticmethod
+    def get_property_collector(stub):
+        """
+        :return: the property collector of the connection the stub belongs to
+        :rtype: vmodl.query.PropertyCollector
+        """
+        return vim.ServiceInstance('ServiceInstance', stub).content.propertyCollector
+
+    def _wait_for_state_change(self, task, action_name, polls, elapsed, progress):
+        """
+        :return: True if the state of the task may have changed and must be read again
+        """
+        if self.completion_engine is None:
+            time.sleep(self.poll_policy.next_interval(action_name, polls, elapsed, progress))
+            return True
+        return self.completion_engine.wait(task, POLL_INTERVAL)
@@ -1,11 +1,13 @@
 ﻿import time
+from contextlib import contextmanager
 
 import requests
-from pyVmomi import vim
+from pyVmomi import vim, vmodl
 
 from cloudshell.cp.vcenter.common.utilites.io import get_path_and_name
 from cloudshell.cp.vcenter.common.vcenter.vm_location import VMLocation
 from cloudshell.cp.vcenter.common.utilites.common_utils import str2bool
+from cloudshell.cp.vcenter.common.vcenter.task_poll_policy import CLONE_VM, DESTROY_VM
 from cloudshell.cp.vcenter.common.vcenter.task_waiter import SynchronousTaskWaiter
 from cloudshell.cp.vcenter.exceptions.task_waiter import TaskFaultException
 
@@ -21,6 +23,13 @@ class VCenterAuthError(Exception):
         self.original_exception = original_exception
 
 
+# the most objects a page of query_inventory holds
+DEFAULT_QUERY_PAGE_SIZE = 500
+
+# the properties query_inventory reads for every object
+INVENTORY_RECORD_PROPERTIES = ['name', 'parent']
+
+
 class pyVmomiService:
     # region consts
     ChildEntity = 'childEntity'
@@ -33,14 +42,27 @@ class pyVmomiService:
 
     # endregion
 
-    def __init__(self, connect, disconnect, task_waiter, vim_import=None):
+    def __init__(self, connect, disconnect, task_waiter, vim_import=None, inventory=None, clone_source_cache=None,
+                 name_index=None, datastore_placement=None, host_placement=None, portgroup_index=None):
         """
         :param SynchronousTaskWaiter task_waiter:
+        :param VCenterInventory inventory: in-memory index used to resolve paths without going to the vCenter
+        :param CloneSourceCache clone_source_cache: reuses the template and snapshot a clone path resolved to
+        :param VCenterNameIndex name_index: finds objects by type and name for get_obj without scanning the inventory
+        :param DatastorePlacement datastore_placement: chooses the datastore of a storage pod every clone is placed on
+        :param HostPlacement host_placement: chooses the host of a cluster every clone is placed on, DRS does when None
+        :param DvPortGroupIndex portgroup_index: finds the port groups of a dvSwitch by name without reading them all
         :return:
         """
         self.pyvmomi_connect = connect
         self.pyvmomi_disconnect = disconnect
         self.task_waiter = task_waiter
+        self.inventory = inventory
+        self.clone_source_cache = clone_source_cache
+        self.name_index = name_index
+        self.datastore_placement = datastore_placement
+        self.host_placement = host_placement
+        self.portgroup_index = portgroup_index
         if vim_import is None:
             from pyVmomi import vim
             self.vim = vim
@@ -175,12 +197,36 @@ class pyVmomiService:
         :param si: service instance
         """
         dv_switch = self.get_folder(si, dv_switch_path)
+        if self.portgroup_index and isinstance(dv_switch, self.vim.DistributedVirtualSwitch):
+            return self.portgroup_index.find(si, dv_switch, name)
         if dv_switch and dv_switch.portgroup:
             for port in dv_switch.portgroup:
                 if port.name == name:
                     return port
         return None
 
+    def add_portgroup_to_index(self, si, dv_switch_path, name, port_group):
+        """
+        Adds a port group the driver created to the port group index of its dvSwitch
+        :param si: service instance
+        :param str dv_switch_path: the path of the dvSwitch ('dc/folder/dvSwitch')
+        :param str name: the name of the port group
+        :param port_group: <vim.dvs.DistributedVirtualPortgroup>
+        """
+        if not self.portgroup_index:
+            return
+        dv_switch = self.get_folder(si, dv_switch_path)
+        if isinstance(dv_switch, self.vim.DistributedVirtualSwitch):
+            self.portgroup_index.add(dv_switch, name, port_group)
+
+    def remove_portgroup_from_index(self, port_group):
+        """
+        Removes a port group the driver destroyed from the port group index of its dvSwitch
+        :param port_group: <vim.dvs.DistributedVirtualPortgroup>
+        """
+        if self.portgroup_index:
+            self.portgroup_index.remove(port_group)
+
     def find_network_by_name(self, si, path, name):
         """
         Finds network in the vCenter or returns "None"
@@ -211,6 +257,11 @@ class pyVmomiService:
         :param type_name:   the name of the type, can be (vm, network, host, datastore)
         """
 
+        if self.inventory:
+            obj = self.inventory.find_child(si, path, name, type_name)
+            if obj:
+                return obj
+
         folder = self.get_folder(si, path)
         if folder is None:
             raise ValueError('vmomi managed object not found at: {0}'.format(path))
@@ -225,7 +276,11 @@ class pyVmomiService:
 
         search_index = si.content.searchIndex
         '#searches for the specific vm in the folder'
-        return search_index.FindChild(look_in, name)
+        obj = search_index.FindChild(look_in, name)
+        if obj and self.inventory:
+            # the object was created after the index was loaded
+            self.inventory.invalidate(si)
+        return obj
 
     def find_dvs_by_path(self, si, path):
         """
@@ -250,6 +305,11 @@ class pyVmomiService:
         :param path:       the path to find the object ('dc' or 'dc/folder' or 'dc/folder/folder/etc...')
         """
 
+        if self.inventory and root is None:
+            folder = self.inventory.find_by_path(si, path)
+            if folder:
+                return folder
+
         search_index = si.content.searchIndex
         sub_folder = root if root else si.content.rootFolder
 
@@ -301,6 +361,10 @@ class pyVmomiService:
             if new_root:
                 child = self.get_folder(si, '/'.join(paths[1:]), new_root)
 
+        if child and self.inventory and root is None:
+            # the folder was created after the index was loaded
+            self.inventory.invalidate(si)
+
         return child
 
     def get_network_by_full_name(self, si, default_network_full_name):
@@ -324,19 +388,29 @@ class pyVmomiService:
         obj = None
 
         for vim_type in vimtypes:
-            container = self._get_all_objects_by_type(content, vim_type)
+            found = self._find_obj_by_type(content, vim_type, name)
+            if found is not None:
+                obj = found
+
+        return obj
 
+    def _find_obj_by_type(self, content, vim_type, name):
+        if self.name_index:
+            for t in vim_type if isinstance(vim_type, list) else [vim_type]:
+                obj = self.name_index.find(content, t, name)
+                if obj is not None:
+                    return obj
+            return None
+
+        container = self._get_all_objects_by_type(content, vim_type)
+        try:
             # If no name was given will return the first object from list of a objects matching the given vimtype type
             for c in container.view:
-                if name:
-                    if c.name == name:
-                        obj = c
-                        break
-                else:
-                    obj = c
-                    break
-
-        return obj
+                if not name or c.name == name:
+                    return c
+            return None
+        finally:
+            container.DestroyView()
 
     @staticmethod
     def _get_all_objects_by_type(content, vimtype):
@@ -357,7 +431,78 @@ class pyVmomiService:
     def get_all_items_in_vcenter(si, type_filter, root=None):
         root = root if root else si.content.rootFolder
         container = si.content.viewManager.CreateContainerView(container=root, recursive=True)
-        return [item for item in container.view if not type_filter or isinstance(item, type_filter)]
+        try:
+            return [item for item in container.view if not type_filter or isinstance(item, type_filter)]
+        finally:
+            container.DestroyView()
+
+    def query_inventory(self, si, vim_types, properties=None, root=None, page_size=DEFAULT_QUERY_PAGE_SIZE):
+        """
+        Finds the objects of the given types under the root with one PropertyCollector query,
+        the types are filtered by the vCenter and only the requested properties are read
+
+        :param vim.ServiceInstance si:
+        :param list[type] vim_types: the types of the objects, must be managed entities
+        :param list[str] properties: property paths read on top of the name and the parent
+        :param root: the folder or datacenter to search under, the root folder if None
+        :param int page_size: the most objects the vCenter returns in one page
+        :return: the objects, read page by page as they are iterated
+        :rtype: collections.Iterable[pyVmomiService.InventoryRecord]
+        """
+        content = si.content
+        root = root if root else content.rootFolder
+        path_set = INVENTORY_RECORD_PROPERTIES + [p for p in properties or [] if p not in INVENTORY_RECORD_PROPERTIES]
+        collector = content.propertyCollector
+
+        view = content.viewManager.CreateContainerView(root, vim_types, True)
+        token = None
+        try:
+            traversal_spec = vmodl.query.PropertyCollector.TraversalSpec(name='traverseView', path='view',
+                                                                         skip=False, type=vim.view.ContainerView)
+            spec = vmodl.query.PropertyCollector.FilterSpec(
+                objectSet=[vmodl.query.PropertyCollector.ObjectSpec(obj=view, skip=True, selectSet=[traversal_spec])],
+                propSet=[vmodl.query.PropertyCollector.PropertySpec(type=vim_type, pathSet=path_set, all=False)
+                         for vim_type in vim_types])
+
+            result = collector.RetrievePropertiesEx([spec],
+                                                    vmodl.query.PropertyCollector.RetrieveOptions(maxObjects=page_size))
+            while result:
+                token = result.token
+                for object_content in result.objects:
+                    yield self.InventoryRecord.from_object_content(object_content)
+                if not token:
+                    break
+                result = collector.ContinueRetrievePropertiesEx(token)
+            token = None
+        finally:
+            if token:
+                # the caller stopped before the last page
+                collector.CancelRetrievePropertiesEx(token)
+            view.DestroyView()
+
+    class InventoryRecord(object):
+        """
+        The reference, type, name, parent and the requested properties of an inventory object,
+        reading them does not go to the vCenter
+        """
+
+        def __init__(self, obj, name, parent, props):
+            """
+            :param vmodl.ManagedObject obj: the managed object
+            :param str name:
+            :param parent: the managed object of the parent entity
+            :param dict props: the requested properties by their path
+            """
+            self.obj = obj
+            self.mo_type = type(obj)
+            self.name = name
+            self.parent = parent
+            self.props = props
+
+        @classmethod
+        def from_object_content(cls, object_content):
+            props = dict((prop.name, prop.val) for prop in object_content.propSet)
+            return cls(object_content.obj, props.pop('name', None), props.pop('parent', None), props)
 
     class CloneVmParameters:
         """
@@ -396,6 +541,25 @@ class pyVmomiService:
             self.power_on = str2bool(power_on)
             self.snapshot = snapshot
 
+    class ClonePlacement:
+        """
+        The inventory objects a clone is created from and placed in,
+        clones with the same template, snapshot, folder, datastore and pool can share one placement
+        """
+
+        def __init__(self, datacenter, dest_folder, template, snapshot, resource_pool, host, datastore, cluster=None):
+            """
+            :param cluster: the cluster the host of every clone is chosen from when no host is configured
+            """
+            self.datacenter = datacenter
+            self.dest_folder = dest_folder
+            self.template = template
+            self.snapshot = snapshot
+            self.resource_pool = resource_pool
+            self.host = host
+            self.datastore = datastore
+            self.cluster = cluster
+
     class CloneVmResult:
         """
         Clone vm result object, will contain the cloned vm or error message
@@ -411,13 +575,15 @@ class pyVmomiService:
             self.vm = vm
             self.error = error
 
-    def clone_vm(self, clone_params, logger, cancellation_context):
+    def clone_vm(self, clone_params, logger, cancellation_context, placement=None, hold_slots=None):
         """
         Clone a VM from a template/VM and return the vm oject or throws argument is not valid
 
         :param cancellation_context:
         :param clone_params: CloneVmParameters =
         :param logger:
+        :param ClonePlacement placement: the already resolved placement of the clone, resolved from clone_params if None
+        :param hold_slots: context of the datastore and host the clone is placed on, held while the clone runs
         """
 
         result = self.CloneVmResult()
@@ -438,48 +604,58 @@ class pyVmomiService:
             result.error = 'vm_folder param cannot be None'
             return result
 
-        datacenter = self.get_datacenter(clone_params)
-
-        dest_folder = self._get_destination_folder(clone_params)
-
-        vm_location = VMLocation.create_from_full_path(clone_params.template_name)
-
-        template = self._get_template(clone_params, vm_location)
-
-        snapshot = self._get_snapshot(clone_params, template)
-
-        resource_pool, host = self.get_resource_pool(datacenter.name, clone_params)
-
-        if not resource_pool and not host:
-            raise ValueError('The specifed host, cluster or resource pool could not be found')
+        placement = placement or self.resolve_clone_placement(clone_params)
 
         '# set relo_spec'
-        placement = self.vim.vm.RelocateSpec()
-        if resource_pool:
-            placement.pool = resource_pool
-        if host:
-            placement.host = host
+        relocate_spec = self.vim.vm.RelocateSpec()
+        if placement.resource_pool:
+            relocate_spec.pool = placement.resource_pool
 
         clone_spec = self.vim.vm.CloneSpec()
 
-        if snapshot:
-            clone_spec.snapshot = snapshot
+        if placement.snapshot:
+            clone_spec.snapshot = placement.snapshot
             clone_spec.template = False
-            placement.diskMoveType = 'createNewChildDiskBacking'
+            relocate_spec.diskMoveType = 'createNewChildDiskBacking'
 
-        placement.datastore = self._get_datastore(clone_params)
+        reservation = None
+        if self.datastore_placement and isinstance(placement.datastore, self.vim.StoragePod):
+            # every clone of a shared placement gets its own datastore of the pod
+            reservation = self.datastore_placement.reserve(clone_params.si, placement.datastore)
+            relocate_spec.datastore = reservation.datastore
+        else:
+            relocate_spec.datastore = placement.datastore
+
+        # the host is chosen among the hosts of the cluster that mount the datastore of the clone
+        host_reservation = None
+        if placement.host:
+            relocate_spec.host = placement.host
+        elif self.host_placement and placement.cluster is not None:
+            try:
+                host_reservation = self.host_placement.reserve(clone_params.si, placement.cluster,
+                                                               relocate_spec.datastore)
+            except Exception:
+                # the clone never starts, the datastore space reserved for it is not kept
+                if reservation:
+                    self.datastore_placement.release(reservation, used=False)
+                raise
+            relocate_spec.host = host_reservation.host
 
         # after deployment the vm must be powered off and will be powered on if needed by orchestration driver
-        clone_spec.location = placement
+        clone_spec.location = relocate_spec
         # clone_params.power_on
         # due to hotfix 1 for release 1.0,
         clone_spec.powerOn = False
 
         logger.info("cloning VM...")
+        vm = None
+        hold_slots = hold_slots or _hold_no_slots
         try:
-            task = template.Clone(folder=dest_folder, name=clone_params.vm_name, spec=clone_spec)
-            vm = self.task_waiter.wait_for_task(task=task, logger=logger, action_name='Clone VM',
-                                                cancellation_context=cancellation_context)
+            with hold_slots(relocate_spec.datastore, relocate_spec.host):
+                task = placement.template.Clone(folder=placement.dest_folder, name=clone_params.vm_name,
+                                                spec=clone_spec)
+                vm = self.task_waiter.wait_for_task(task=task, logger=logger, action_name=CLONE_VM,
+                                                    cancellation_context=cancellation_context)
         except TaskFaultException:
             raise
         except vim.fault.NoPermission as error:
@@ -488,10 +664,42 @@ class pyVmomiService:
         except Exception as e:
             logger.error("error deploying: {0}".format(e))
             raise Exception('Error has occurred while deploying, please look at the log for more info.')
+        finally:
+            if reservation:
+                self.datastore_placement.release(reservation, used=vm is not None)
+            if host_reservation:
+                self.host_placement.release(host_reservation)
 
         result.vm = vm
         return result
 
+    def resolve_clone_placement(self, clone_params):
+        """
+        Finds the template, snapshot, destination folder, resource pool and datastore of a clone
+
+        :param clone_params: CloneVmParameters
+        :rtype: ClonePlacement
+        """
+        datacenter = self.get_datacenter(clone_params)
+
+        dest_folder = self._get_destination_folder(clone_params)
+
+        template, snapshot = self._get_clone_source(clone_params)
+
+        resource_pool, host = self.get_resource_pool(datacenter.name, clone_params)
+
+        if not resource_pool and not host:
+            raise ValueError('The specifed host, cluster or resource pool could not be found')
+
+        datastore = self._get_datastore(clone_params)
+
+        cluster = None
+        if self.host_placement and not host:
+            cluster = self._get_pool_cluster(resource_pool)
+
+        return self.ClonePlacement(datacenter, dest_folder, template, snapshot, resource_pool, host, datastore,
+                                   cluster)
+
     def get_datacenter(self, clone_params):
         splited = clone_params.vm_folder.split('/')
         root_path = splited[0]
@@ -509,6 +717,22 @@ class pyVmomiService:
             raise ValueError('Failed to find folder: {0}'.format(clone_params.vm_folder))
         return dest_folder
 
+    def _get_clone_source(self, clone_params):
+        """
+        :return: the template and the snapshot the clone is created from
+        """
+        def resolve():
+            vm_location = VMLocation.create_from_full_path(clone_params.template_name)
+            template = self._get_template(clone_params, vm_location)
+            return template, self._get_snapshot(clone_params, template)
+
+        if self.clone_source_cache is None:
+            return resolve()
+        return self.clone_source_cache.get_source(clone_params.si,
+                                                  clone_params.template_name,
+                                                  getattr(clone_params, 'snapshot', None),
+                                                  resolve)
+
     def _get_template(self, clone_params, vm_location):
         template = self.find_vm_by_name(clone_params.si, vm_location.path, vm_location.name)
         if not template:
@@ -530,6 +754,9 @@ class pyVmomiService:
             datastore = self.get_obj(clone_params.si.content,
                                      [[self.vim.StoragePod]],
                                      name)
+            if datastore and self.datastore_placement:
+                # the datastore of the pod is chosen for every clone when it starts
+                return datastore
             if datastore:
                 datastore = sorted(datastore.childEntity,
                                    key=lambda data: data.summary.freeSpace,
@@ -539,6 +766,15 @@ class pyVmomiService:
             raise ValueError('Could not find Datastore: "{0}"'.format(clone_params.datastore_name))
         return datastore
 
+    def _get_pool_cluster(self, resource_pool):
+        """
+        :return: the cluster that owns the resource pool, None for the pool of a standalone host
+        """
+        owner = resource_pool.owner
+        if isinstance(owner, self.vim.ClusterComputeResource):
+            return owner
+        return None
+
     def get_resource_pool(self, datacenter_name, clone_params):
 
         obj_name = '{0}/{1}/{2}'.format(datacenter_name,
@@ -574,7 +810,7 @@ class pyVmomiService:
         logger.info(("Destroying VM {0}".format(vm.name)))
 
         task = vm.Destroy_Task()
-        return self.task_waiter.wait_for_task(task=task, logger=logger, action_name="Destroy VM")
+        return self.task_waiter.wait_for_task(task=task, logger=logger, action_name=DESTROY_VM)
 
     def power_off_before_destroy(self, logger, vm):
         if vm.runtime.powerState == 'poweredOn':
@@ -616,6 +852,35 @@ class pyVmomiService:
     def get_vm_by_uuid(self, si, vm_uuid):
         return self.find_by_uuid(si, vm_uuid, True)
 
+    @staticmethod
+    def get_power_states(si, vms):
+        """
+        Reads the power state of many vms with one RetrievePropertiesEx call
+        :param vim.ServiceInstance si:
+        :param list[vim.VirtualMachine] vms:
+        :return: the power state of the vms that still exist by moId
+        :rtype: dict
+        """
+        if not vms:
+            return dict()
+        spec = vmodl.query.PropertyCollector.FilterSpec(
+            objectSet=[vmodl.query.PropertyCollector.ObjectSpec(obj=vm, skip=False) for vm in vms],
+            propSet=[vmodl.query.PropertyCollector.PropertySpec(type=vim.VirtualMachine,
+                                                                pathSet=['summary.runtime.powerState'], all=False)],
+            reportMissingObjectsInResults=True)
+
+        collector = si.content.propertyCollector
+        result = collector.RetrievePropertiesEx([spec], vmodl.query.PropertyCollector.RetrieveOptions())
+        power_states = dict()
+        while result:
+            for object_content in result.objects:
+                for prop in object_content.propSet:
+                    power_states[object_content.obj._moId] = prop.val
+            if not result.token:
+                break
+            result = collector.ContinueRetrievePropertiesEx(result.token)
+        return power_states
+
     def get_network_by_name_from_vm(self, vm, network_name):
         for network in vm.network:
             if network_name == network.name:
@@ -756,6 +1021,11 @@ class pyVmomiService:
         return VMLocation.combine([folder_name, vm.name]) if folder_name else vm.name
 
 
+@contextmanager
+def _hold_no_slots(datastore, host):
+    yield
+
+
 def vm_has_no_vnics(vm):
     # Is there any network device on vm
     return next((False for device in vm.config.hardware.device
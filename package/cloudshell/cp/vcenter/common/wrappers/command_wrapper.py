@@ -1,13 +1,13 @@
 import inspect
-from threading import Lock
 
 from retrying import retry
 
 from pyVmomi import vim
 from cloudshell.cp.vcenter.common.model_factory import ResourceModelParser
+from cloudshell.cp.vcenter.common.vcenter.connection_pool import VCenterConnectionPool
 from cloudshell.cp.vcenter.common.vcenter.vmomi_service import pyVmomiService, VCenterAuthError
 from cloudshell.shell.core.session.cloudshell_session import CloudShellSessionContext
-from cloudshell.cp.vcenter.common.cloud_shell.conn_details_retriever import ResourceConnectionDetailsRetriever
+from cloudshell.cp.vcenter.common.cloud_shell.resource_details_cache import ResourceDetailsCache
 
 
 DISCONNCTING_VCENERT = 'disconnecting from vcenter: {0}'
@@ -22,6 +22,7 @@ DEBUG_CONNECTION_INFO = 'connection params: host: {0} username: {1} port: {2}'
 LOGGER_CANNOT_BE_NONE = 'logger cannot be None'
 COMMAND_CANNOT_BE_NONE = 'command cannot be None'
 INFO_CONNECTING_TO_VCENTER = 'connecting to vcenter: {0}'
+SESSION_EXPIRED = 'ServiceInstance was disconnected. Will try to retrieve a new serviceinstance'
 START = 'START'
 END = 'END'
 LOG_FORMAT = 'action:{0} command_name:{1}'
@@ -32,7 +33,7 @@ def retry_if_auth_error(ex):
 
 
 class CommandWrapper:
-    def __init__(self, pv_service, resource_model_parser, context_based_logger_factory):
+    def __init__(self, pv_service, resource_model_parser, context_based_logger_factory, connection_pool=None):
         """
 
         :param pv_service:
@@ -40,15 +41,15 @@ class CommandWrapper:
         :param resource_model_parser:
         :param context_based_logger_factory:
         :type context_based_logger_factory: cloudshell.cp.vcenter.common.utilites.context_based_logger_factory.ContextBasedLoggerFactory
+        :param connection_pool: the live vCenter sessions shared by the commands
+        :type connection_pool: VCenterConnectionPool
         :return:
         """
         self.pv_service = pv_service  # type: pyVmomiService
         self.resource_model_parser = resource_model_parser  # type: ResourceModelParser
         self.context_based_logger_factory = context_based_logger_factory  # type ContextBasedLoggerFactory
-        # add lock
-        self.lock = Lock()
-        self.si = None
-        self.connection_details = None
+        self.connection_pool = connection_pool or VCenterConnectionPool(pv_service)
+        self.resource_details_cache = ResourceDetailsCache(resource_model_parser)
 
     @retry(stop_max_attempt_number=3, wait_fixed=2000, retry_on_exception=retry_if_auth_error)
     def execute_command_with_connection(self, context, command, *args):
@@ -68,11 +69,11 @@ class CommandWrapper:
             logger.error(COMMAND_CANNOT_BE_NONE)
             raise Exception(COMMAND_CANNOT_BE_NONE)
 
+        si = None
         try:
             command_name = command.__name__
             logger.info(LOG_FORMAT.format(START, command_name))
             command_args = []
-            si = None
             session = None
             connection_details = None
             vcenter_data_model = None
@@ -82,10 +83,8 @@ class CommandWrapper:
                 with CloudShellSessionContext(context) as cloudshell_session:
                     session = cloudshell_session
 
-                vcenter_data_model = self.resource_model_parser.convert_to_vcenter_model(context.resource)
-                connection_details = ResourceConnectionDetailsRetriever.get_connection_details(session=session,
-                                                                                               vcenter_resource_model=vcenter_data_model,
-                                                                                               resource_context=context.resource)
+                vcenter_data_model, connection_details = self.resource_details_cache.get_details(session,
+                                                                                                 context.resource)
 
             if connection_details:
                 logger.info(INFO_CONNECTING_TO_VCENTER.format(connection_details.host))
@@ -94,7 +93,7 @@ class CommandWrapper:
                                                  connection_details.username,
                                                  connection_details.port))
 
-                si = self.get_py_service_connection(connection_details, logger)
+                si = self._lease_live_session(connection_details, logger)
             if si:
                 logger.info(CONNECTED_TO_CENTER.format(connection_details.host))
                 command_args.append(si)
@@ -121,7 +120,13 @@ class CommandWrapper:
             logger.info(EXECUTING_COMMAND.format(command_name))
             logger.debug(DEBUG_COMMAND_PARAMS.format(COMMA.join([str(x) for x in command_args])))
 
-            results = command(*tuple(command_args))
+            try:
+                results = command(*tuple(command_args))
+            except vim.fault.NotAuthenticated:
+                # the command may have made changes already so it is not run again, the next one gets a new session
+                if si:
+                    self.connection_pool.discard(si)
+                raise
 
             logger.info(FINISHED_EXECUTING_COMMAND.format(command_name))
             logger.debug(DEBUG_COMMAND_RESULT.format(str(results)))
@@ -132,55 +137,26 @@ class CommandWrapper:
             logger.exception(str(type(ex)) + ': ' + str(ex))
             raise
         finally:
+            if si:
+                self.connection_pool.release(si)
             logger.info(LOG_FORMAT.format(END, command_name))
 
-    def get_py_service_connection(self, req_connection_details, logger):
-        logger.info("get_py_service_connection")
-        if self.need_a_new_service_connection(req_connection_details, logger):
-            with self.lock:
-                if self.need_a_new_service_connection(req_connection_details, logger):
-                    logger.info("Creating a new connection.")
-                    self.si = self.pv_service.connect(req_connection_details.host,
-                                                      req_connection_details.username,
-                                                      req_connection_details.password,
-                                                      req_connection_details.port)
-                    self.connection_details = req_connection_details
-        return self.si
-
-    def need_a_new_service_connection(self, req_connection_details, logger):
-        # the idea is if we haven't instantiated the ServiceInstance session,
-        # or if the connect details were changed
-        # or if an SI no longer is authorized to work with host due to timing out,
-        # we try to get a new connection
-        return (
-
-                self.si is None or
-                self.has_connection_details_changed(req_connection_details) or
-                self.service_instance_disconnected_by_server(logger)
-
-               )
-
-    def service_instance_disconnected_by_server(self, logger):
-        try:
-            self.si.CurrentTime()
-        except vim.fault.NotAuthenticated:
-            logger.info("ServiceInstance was disconnected. Will try to retrieve a new serviceinstance")
-            return True
-        return False
-
-    def has_connection_details_changed(self, req_connection_details):
+    def _lease_live_session(self, connection_details, logger):
         """
-        :param cloudshell.cp.vcenter.models.VCenterConnectionDetails.VCenterConnectionDetails req_connection_details:
-        :return:
+        a session the vCenter dropped is replaced before the command runs on it
         """
-        if self.connection_details is None and req_connection_details is None:
-            return False
-        if self.connection_details is None or req_connection_details is None:
-            return True
-        return not all([self.connection_details.host == req_connection_details.host,
-                        self.connection_details.username == req_connection_details.username,
-                        self.connection_details.password == req_connection_details.password,
-                        self.connection_details.port == req_connection_details.port])
+        si = self.connection_pool.lease(connection_details, logger)
+        try:
+            self.connection_pool.check(si)
+        except vim.fault.NotAuthenticated:
+            logger.info(SESSION_EXPIRED)
+            self.connection_pool.discard(si)
+            self.connection_pool.release(si)
+            si = self.connection_pool.lease(connection_details, logger)
+        except Exception:
+            self.connection_pool.release(si)
+            raise
+        return si
 
     @staticmethod
     def _get_domain(context):
@@ -51,3 +51,36 @@ class DeployDataHolder(object):
             'auto_delete': auto_delete
         }
         return cls(dic)
+
+
+class LazyDeployDataHolder(object):
+    """
+    A DeployDataHolder that wraps the decoded dictionary as is and converts a value when its attribute is first
+    read, so the parts of a large request that are never read are never converted
+    """
+
+    def __init__(self, d):
+        self._data = d
+
+    def __getattr__(self, name):
+        # called only for the attributes that were not read yet
+        data = self.__dict__.get('_data')
+        if data is None or name not in data:
+            raise AttributeError(name)
+        value = self._create_obj_by_type(data[name])
+        setattr(self, name, value)
+        return value
+
+    def __getstate__(self):
+        return self._data
+
+    def __setstate__(self, state):
+        self._data = state
+
+    @staticmethod
+    def _create_obj_by_type(obj):
+        if isinstance(obj, dict):
+            return LazyDeployDataHolder(obj)
+        if isinstance(obj, list):
+            return [LazyDeployDataHolder._create_obj_by_type(item) for item in obj]
+        return obj
@@ -0,0 +1,135 @@
+import os
+from collections import deque
+from multiprocessing.pool import ThreadPool
+from threading import Event, Lock
+
+# the threads shared by the connectivity changes of every request
+DEFAULT_MAX_WORKERS = int(os.getenv('ConnectivityThreadPoolSize', 20))
+
+# the most vms of all the requests reconfigured at the same time on one vCenter
+DEFAULT_MAX_PER_VCENTER = int(os.getenv('ConnectivityMaxPerVCenter', 8))
+
+
+class ConnectivityTask(object):
+    def __init__(self, run):
+        """
+        :param run: callable that applies the connectivity changes of one vm and returns its results
+        """
+        self.run = run
+        self.result = None
+        self.error = None
+        self._done = Event()
+
+    def execute(self):
+        try:
+            self.result = self.run()
+        except Exception as e:
+            self.error = e
+
+    def complete(self):
+        self._done.set()
+
+    def get(self):
+        """
+        waits for the task and returns its result, raises the exception the task raised
+        """
+        self._done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class ConnectivityExecutor(object):
+    """
+    Runs the connectivity changes of all the requests on one thread pool that is created on first use and reused.
+    Each vCenter runs at most max_per_vcenter tasks at the same time, the others wait in its queue without holding
+    a thread so a busy vCenter never blocks the requests of another one
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, max_per_vcenter=DEFAULT_MAX_PER_VCENTER):
+        """
+        :param int max_workers: the threads of the pool
+        :param int max_per_vcenter: the most tasks running at the same time against one vCenter
+        """
+        self.max_workers = max(max_workers, 1)
+        self.max_per_vcenter = max(max_per_vcenter, 1)
+        self._pool = None
+        self._pending = dict()
+        self._running = dict()
+        self._lock = Lock()
+
+    def submit(self, vcenter_key, run):
+        """
+        :param vcenter_key: the vCenter the task changes
+        :param run: callable that runs the task
+        :rtype: ConnectivityTask
+        """
+        task = ConnectivityTask(run)
+        with self._lock:
+            self._pending.setdefault(vcenter_key, deque()).append(task)
+            self._dispatch(vcenter_key)
+        return task
+
+    def run_all(self, vcenter_key, runs):
+        """
+        runs the tasks and waits for all of them
+        :param list runs: callables that run the tasks
+        :return: the result of every task in the order of runs
+        """
+        tasks = [self.submit(vcenter_key, run) for run in runs]
+        return [task.get() for task in tasks]
+
+    def queue_depth(self, vcenter_key=None):
+        """
+        :return: the number of tasks waiting for a slot of the vCenter, of all the vCenters when None
+        """
+        with self._lock:
+            if vcenter_key is not None:
+                return len(self._pending.get(vcenter_key, ()))
+            return sum(len(pending) for pending in self._pending.values())
+
+    def running(self, vcenter_key=None):
+        """
+        :return: the number of tasks running against the vCenter, against all the vCenters when None
+        """
+        with self._lock:
+            if vcenter_key is not None:
+                return self._running.get(vcenter_key, 0)
+            return sum(self._running.values())
+
+    def _dispatch(self, vcenter_key):
+        # must be called while holding the lock
+        pending = self._pending.get(vcenter_key)
+        while pending and self._running.get(vcenter_key, 0) < self.max_per_vcenter:
+            task = pending.popleft()
+            self._running[vcenter_key] = self._running.get(vcenter_key, 0) + 1
+            self._get_pool().apply_async(self._execute, (vcenter_key, task))
+        if not pending:
+            self._pending.pop(vcenter_key, None)
+
+    def _execute(self, vcenter_key, task):
+        try:
+            task.execute()
+        finally:
+            with self._lock:
+                self._running[vcenter_key] -= 1
+                if not self._running[vcenter_key]:
+                    del self._running[vcenter_key]
+                self._dispatch(vcenter_key)
+            # completed after the accounting so a caller that got the result sees the slot free
+            task.complete()
+
+    def close(self):
+        """
+        lets the threads of the pool exit once their tasks are done, the executor creates a new pool when it is used
+        again
+        """
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = ThreadPool(self.max_workers)
+        return self._pool
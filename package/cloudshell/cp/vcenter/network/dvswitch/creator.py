@@ -1,20 +1,128 @@
 # -*- coding: utf-8 -*-
-from threading import Lock
+import os
+import time
+from collections import OrderedDict
+from threading import Event, Lock
 from pyVmomi import vim
 
+from cloudshell.cp.vcenter.common.vcenter.task_poll_policy import CREATE_DV_PORT_GROUP, CREATE_DV_PORT_GROUPS
+
+# seconds the first missing port group of a dvSwitch waits for the ones other requests are missing
+DEFAULT_BATCH_WINDOW = float(os.getenv('PortGroupBatchWindowMs', 50)) / 1000
+
+
+class LockContention(object):
+    """
+    Counts how often a port group lock was already taken by another request and how long the requests waited
+    """
+
+    def __init__(self):
+        self.acquired = 0
+        self.contended = 0
+        self.wait_seconds = 0.0
+        self._lock = Lock()
+
+    def record(self, waited, wait_seconds):
+        with self._lock:
+            self.acquired += 1
+            if waited:
+                self.contended += 1
+                self.wait_seconds += wait_seconds
+
+    def snapshot(self):
+        """
+        :return: the number of acquisitions, how many of them waited and the total seconds waited
+        :rtype: dict
+        """
+        with self._lock:
+            return {'acquired': self.acquired, 'contended': self.contended, 'wait_seconds': self.wait_seconds}
+
+
+class PortGroupRequest(object):
+    def __init__(self, dv_port_name, dv_switch_name, dv_switch_path, vlan_id, vlan_spec, promiscuous_mode=None,
+                 logger=None):
+        self.dv_port_name = dv_port_name
+        self.dv_switch_name = dv_switch_name
+        self.dv_switch_path = dv_switch_path
+        self.vlan_id = vlan_id
+        self.vlan_spec = vlan_spec
+        self.promiscuous_mode = promiscuous_mode
+        self.logger = logger
+
+
+class PortGroupBatch(object):
+    def __init__(self):
+        self.requests = []
+        self.errors = dict()
+        self.done = Event()
+
+
+class PortGroupBatcher(object):
+    """
+    Gathers the port groups missing on a dvSwitch for window seconds, from one request or from several,
+    so they are created with one AddDVPortgroup_Task. The first request of a window creates the batch
+    with its own session, the others wait for it
+    """
+
+    def __init__(self, window=DEFAULT_BATCH_WINDOW):
+        """
+        :param float window: seconds a batch waits for more port groups before it is created
+        """
+        self.window = window
+        self.batches = 0
+        self._open = dict()
+        self._lock = Lock()
+
+    def create(self, key, requests, flush):
+        """
+        :param key: the session and the dvSwitch the port groups are created on
+        :param list[PortGroupRequest] requests:
+        :param flush: callable that creates the port groups of a batch and returns the errors by port group name
+        :return: the error of every port group of requests that could not be created by its name
+        """
+        with self._lock:
+            batch = self._open.get(key)
+            leader = batch is None
+            if leader:
+                batch = PortGroupBatch()
+                self._open[key] = batch
+            batch.requests.extend(requests)
+
+        if leader:
+            if self.window > 0:
+                time.sleep(self.window)
+            with self._lock:
+                del self._open[key]
+                self.batches += 1
+            try:
+                batch.errors = flush(batch.requests)
+            except Exception as e:
+                batch.errors = dict((request.dv_port_name, e) for request in batch.requests)
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+
+        return dict((request.dv_port_name, batch.errors[request.dv_port_name])
+                    for request in requests if request.dv_port_name in batch.errors)
+
 
 class DvPortGroupCreator(object):
-    def __init__(self, pyvmomi_service, synchronous_task_waiter):
+    def __init__(self, pyvmomi_service, synchronous_task_waiter, batcher=None):
         """
 
         :param pyvmomi_service:
         :param synchronous_task_waiter:
         :type synchronous_task_waiter: cloudshell.cp.vcenter.common.vcenter.task_waiter.SynchronousTaskWaiter
+        :param PortGroupBatcher batcher: creates the missing port groups of a dvSwitch together
         :return:
         """
         self.pyvmomi_service = pyvmomi_service
         self.synchronous_task_waiter = synchronous_task_waiter
-        self._lock = Lock()
+        self.batcher = batcher or PortGroupBatcher()
+        self.locks = dict()
+        self.locks_lock = Lock()
+        self.contention = LockContention()
 
     def get_or_create_network(self,
                               si,
@@ -26,46 +134,143 @@ class DvPortGroupCreator(object):
                               vlan_spec,
                               logger,
                               promiscuous_mode):
-        network = None
-        error = None
-        self._lock.acquire()
-        try:
-            # check if the network is attached to the vm and gets it, the function doesn't goes to the vcenter
-            network = self.pyvmomi_service.get_network_by_name_from_vm(vm, dv_port_name)
+        network_map = PortGroupRequest(dv_port_name, dv_switch_name, dv_switch_path, vlan_id, vlan_spec)
+        return self.get_or_create_networks(si, vm, [network_map], logger, promiscuous_mode)[0]
 
-            # if we didn't found the network on the vm
+    def get_or_create_networks(self, si, vm, network_maps, logger, promiscuous_mode):
+        """
+        Gets the port group of every mapping, the missing ones of a dvSwitch are created with one task
+        together with the ones other requests are missing at the same time
+
+        :param si:
+        :param vm:
+        :param network_maps: objects with the dv_port_name, dv_switch_name, dv_switch_path, vlan_id and vlan_spec
+        :param logger:
+        :param promiscuous_mode <str> 'True' or 'False' turn on/off promiscuous mode for the port group
+        :return: the network of every mapping in the order of network_maps
+        """
+        # check if the network is attached to the vm and gets it, the function doesn't goes to the vcenter
+        networks = [self.pyvmomi_service.get_network_by_name_from_vm(vm, network_map.dv_port_name)
+                    for network_map in network_maps]
+
+        missing = OrderedDict()
+        for network_map, network in zip(network_maps, networks):
             if network is None:
-                # try to get it from the vcenter
+                missing.setdefault(self._get_port_group_key(network_map), network_map)
+        if not missing:
+            return networks
+
+        found = self._get_or_create_port_groups(si, missing, logger, promiscuous_mode)
+        return [network if network is not None else found[self._get_port_group_key(network_map)]
+                for network_map, network in zip(network_maps, networks)]
+
+    def _get_or_create_port_groups(self, si, missing, logger, promiscuous_mode):
+        # only requests for the same port group of the same dvSwitch wait for each other,
+        # the locks are always taken in the same order so two requests never hold each other's lock
+        locks = [self._acquire(dv_switch_full_path, dv_port_name, logger)
+                 for dv_switch_full_path, dv_port_name in sorted(missing.keys())]
+        try:
+            found = dict()
+            to_create = OrderedDict()
+            for key, network_map in missing.items():
+                # try to get it from the vcenter, another request may have created it while we waited
                 try:
-                    network = self.pyvmomi_service.find_portgroup(si,
-                                                                  '{0}/{1}'.format(dv_switch_path, dv_switch_name),
-                                                                  dv_port_name)
+                    found[key] = self.pyvmomi_service.find_portgroup(si, key[0], network_map.dv_port_name)
                 except KeyError:
-                    logger.debug("Failed to find port group for {}".format(dv_port_name), exc_info=True)
-                    network = None
+                    logger.debug("Failed to find port group for {}".format(network_map.dv_port_name), exc_info=True)
+                    found[key] = None
+                if found[key] is None:
+                    to_create.setdefault((network_map.dv_switch_path, network_map.dv_switch_name), []) \
+                        .append(network_map)
 
             # if we still couldn't get the network ---> create it(can't find it, play god!)
-            if network is None:
-                self._create_dv_port_group(dv_port_name,
-                                           dv_switch_name,
-                                           dv_switch_path,
-                                           si,
-                                           vlan_spec,
-                                           vlan_id,
-                                           logger,
-                                           promiscuous_mode)
-                network = self.pyvmomi_service.find_network_by_name(si, dv_switch_path, dv_port_name)
-
-            if not network:
-                raise ValueError('Could not get or create vlan named: {0}'.format(dv_port_name))
-        except ValueError as e:
-            logger.debug("Failed to find network", exc_info=True)
-            error = e
+            for (dv_switch_path, dv_switch_name), network_maps in to_create.items():
+                errors = self._create_dv_port_groups(si, dv_switch_path, dv_switch_name, network_maps, logger,
+                                                     promiscuous_mode)
+                for network_map in network_maps:
+                    network = self.pyvmomi_service.find_network_by_name(si, dv_switch_path, network_map.dv_port_name)
+                    if not network:
+                        error = errors.get(network_map.dv_port_name)
+                        raise error or ValueError('Could not get or create vlan named: {0}'
+                                                  .format(network_map.dv_port_name))
+                    key = self._get_port_group_key(network_map)
+                    self.pyvmomi_service.add_portgroup_to_index(si, key[0], network_map.dv_port_name, network)
+                    found[key] = network
+            return found
         finally:
-            self._lock.release()
-            if error:
-                raise error
-            return network
+            for lock in locks:
+                lock.release()
+
+    def _create_dv_port_groups(self, si, dv_switch_path, dv_switch_name, network_maps, logger, promiscuous_mode):
+        """
+        :return: the error of every port group that could not be created by its name
+        """
+        requests = [PortGroupRequest(network_map.dv_port_name, dv_switch_name, dv_switch_path, network_map.vlan_id,
+                                     # the vlan spec of the factory is shared, every port group gets its own
+                                     type(network_map.vlan_spec)(), promiscuous_mode, logger)
+                    for network_map in network_maps]
+        # the batch is created with the session of the request that opened it,
+        # so only the requests that run on the same session and credentials share a batch
+        key = (id(si), dv_switch_path, dv_switch_name)
+        return self.batcher.create(key, requests,
+                                   lambda batch: self._flush(si, dv_switch_path, dv_switch_name, batch, logger))
+
+    def _flush(self, si, dv_switch_path, dv_switch_name, requests, logger):
+        dv_switch = self.pyvmomi_service.get_folder(si, '{0}/{1}'.format(dv_switch_path, dv_switch_name))
+        if not dv_switch:
+            raise ValueError('DV Switch {0} not found in path {1}'.format(dv_switch_name, dv_switch_path))
+
+        try:
+            task = DvPortGroupCreator.dv_port_groups_create_task(requests, dv_switch, logger)
+            self.synchronous_task_waiter.wait_for_task(task=task,
+                                                       logger=logger,
+                                                       action_name=CREATE_DV_PORT_GROUPS,
+                                                       hide_result=False)
+            for request in requests:
+                if request.logger is not None and request.logger is not logger:
+                    request.logger.info(u"DV Port Group '{0}' created together with {1} other port groups"
+                                        .format(request.dv_port_name, len(requests) - 1))
+            return dict()
+        except Exception as e:
+            if len(requests) == 1:
+                return {requests[0].dv_port_name: e}
+            logger.warning('Failed to create {0} port groups in one task, creating them one by one'
+                           .format(len(requests)), exc_info=True)
+
+        # one bad port group fails the whole task, the others are still created
+        errors = dict()
+        for request in requests:
+            try:
+                self._create_dv_port_group(request.dv_port_name, dv_switch_name, dv_switch_path, si,
+                                           request.vlan_spec, request.vlan_id, logger, request.promiscuous_mode)
+            except Exception as e:
+                errors[request.dv_port_name] = e
+        return errors
+
+    @staticmethod
+    def _get_port_group_key(network_map):
+        return '{0}/{1}'.format(network_map.dv_switch_path, network_map.dv_switch_name), network_map.dv_port_name
+
+    def _acquire(self, dv_switch_full_path, dv_port_name, logger):
+        lock = self._get_lock((dv_switch_full_path, dv_port_name))
+        if lock.acquire(False):
+            self.contention.record(False, 0)
+            return lock
+
+        started = time.time()
+        lock.acquire()
+        waited = time.time() - started
+        self.contention.record(True, waited)
+        logger.debug(u"Waited {0:.3f} seconds for port group '{1}' of '{2}'"
+                     .format(waited, dv_port_name, dv_switch_full_path))
+        return lock
+
+    def _get_lock(self, key):
+        if key not in self.locks:
+            with self.locks_lock:
+                if key not in self.locks:
+                    self.locks[key] = Lock()
+        return self.locks[key]
 
     def _create_dv_port_group(self, dv_port_name, dv_switch_name, dv_switch_path, si, spec, vlan_id,
                               logger, promiscuous_mode):
@@ -77,7 +282,7 @@ class DvPortGroupCreator(object):
                                                             logger, promiscuous_mode)
         self.synchronous_task_waiter.wait_for_task(task=task,
                                                    logger=logger,
-                                                   action_name='Create dv port group',
+                                                   action_name=CREATE_DV_PORT_GROUP,
                                                    hide_result=False)
 
     @staticmethod
@@ -93,7 +298,35 @@ class DvPortGroupCreator(object):
         :param promiscuous_mode <str> 'True' or 'False' turn on/off promiscuous mode for the port group
         :return: <vim.Task> Task which really provides update
         """
+        dv_pg_spec = DvPortGroupCreator.create_port_group_spec(dv_port_name, spec, vlan_id, promiscuous_mode,
+                                                               num_ports)
+
+        task = dv_switch.AddDVPortgroup_Task([dv_pg_spec])
+
+        logger.info(u"DV Port Group '{}' CREATE Task ...".format(dv_port_name))
+        return task
+
+    @staticmethod
+    def dv_port_groups_create_task(requests, dv_switch, logger, num_ports=32):
+        """
+        Create the ' Distributed Virtual Portgroup's of the requests in one Task
+        :param list[PortGroupRequest] requests:
+        :param dv_switch: <vim.dvs.VmwareDistributedVirtualSwitch> Switch the Portgroups will be belong to
+        :param logger:
+        :param num_ports: <int> number of ports in each Group
+        :return: <vim.Task> Task which really provides update
+        """
+        dv_pg_specs = [DvPortGroupCreator.create_port_group_spec(request.dv_port_name, request.vlan_spec,
+                                                                 request.vlan_id, request.promiscuous_mode, num_ports)
+                       for request in requests]
 
+        task = dv_switch.AddDVPortgroup_Task(dv_pg_specs)
+
+        logger.info(u"DV Port Groups '{}' CREATE Task ...".format("', '".join(r.dv_port_name for r in requests)))
+        return task
+
+    @staticmethod
+    def create_port_group_spec(dv_port_name, spec, vlan_id, promiscuous_mode, num_ports=32):
         dv_pg_spec = vim.dvs.DistributedVirtualPortgroup.ConfigSpec()
         dv_pg_spec.name = dv_port_name
         dv_pg_spec.numPorts = num_ports
@@ -112,11 +345,7 @@ class DvPortGroupCreator(object):
         dv_pg_spec.defaultPortConfig.vlan.inherited = False
         dv_pg_spec.defaultPortConfig.securityPolicy.macChanges = vim.BoolPolicy(value=False)
         dv_pg_spec.defaultPortConfig.securityPolicy.inherited = False
-
-        task = dv_switch.AddDVPortgroup_Task([dv_pg_spec])
-
-        logger.info(u"DV Port Group '{}' CREATE Task ...".format(dv_port_name))
-        return task
+        return dv_pg_spec
 
     @staticmethod
     def dv_port_group_destroy_task(port_group):
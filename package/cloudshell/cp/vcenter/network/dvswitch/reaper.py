@@ -0,0 +1,207 @@
+import os
+import time
+from threading import Event, Lock, Thread
+
+from pyVmomi import vim, vmodl
+
+from cloudshell.cp.vcenter.network.network_specifications import network_is_portgroup
+
+# seconds an unused port group is kept before it is destroyed, a VLAN used again within it keeps its port group
+DEFAULT_GRACE_PERIOD = int(os.getenv('PortGroupReaperGracePeriod', 30))
+
+# seconds between two runs of the reaper
+DEFAULT_INTERVAL = int(os.getenv('PortGroupReaperInterval', 5))
+
+# times the port groups of a vCenter that could not be read are checked again before they are dropped
+DEFAULT_READ_RETRIES = int(os.getenv('PortGroupReaperReadRetries', 3))
+
+# the port group properties the reaper reads to decide whether a port group is unused
+REAP_PROPERTIES = ['name', 'vm']
+
+
+class ReapCandidate(object):
+    def __init__(self, port_group, reserved_networks, logger, due_at, retries=0):
+        """
+        :param vim.dvs.DistributedVirtualPortgroup port_group:
+        :param list reserved_networks: the names of the networks that are never destroyed
+        :param logger: the logger of the request that left the port group
+        :param float due_at: the time the port group is checked and destroyed when it is unused
+        :param int retries: the times the port group could not be read
+        """
+        self.port_group = port_group
+        self.reserved_networks = reserved_networks or []
+        self.logger = logger
+        self.due_at = due_at
+        self.retries = retries
+
+
+class PortGroupReaper(object):
+    """
+    Destroys the port groups the driver created once no vm uses them, in the background.
+    The port groups a disconnect leaves wait for the grace period, then the name and the vms of all the due port
+    groups of a vCenter are read with one PropertyCollector call and the unused ones are destroyed.
+    A port group that is connected again before it is due is taken off the list, the port groups of a vCenter that
+    could not be read are checked again after the grace period
+    """
+
+    def __init__(self, synchronous_task_waiter, name_generator, pyvmomi_service=None,
+                 grace_period=DEFAULT_GRACE_PERIOD, interval=DEFAULT_INTERVAL, read_retries=DEFAULT_READ_RETRIES):
+        """
+        :param synchronous_task_waiter: waits for the destroy tasks
+        :param DvPortGroupNameGenerator name_generator: tells the port groups the driver created
+        :param pyvmomi_service: removes the destroyed port groups from the port group index
+        :param int grace_period: seconds an unused port group is kept before it is destroyed
+        :param int interval: seconds between two runs, 0 reaps only when reap is called
+        :param int read_retries: times the port groups that could not be read are checked again
+        """
+        self.synchronous_task_waiter = synchronous_task_waiter
+        self.name_generator = name_generator
+        self.pyvmomi_service = pyvmomi_service
+        self.grace_period = grace_period
+        self.interval = interval
+        self.read_retries = read_retries
+        self._candidates = dict()
+        self._lock = Lock()
+        self._stopped = Event()
+        self._thread = None
+
+    def submit(self, networks, reserved_networks, logger):
+        """
+        :param list networks: the networks the vnics of a vm left
+        :param list reserved_networks: the names of the networks that are never destroyed
+        """
+        due_at = time.time() + self.grace_period
+        with self._lock:
+            for network in networks:
+                if network_is_portgroup(network):
+                    self._candidates[self._get_key(network)] = ReapCandidate(network, reserved_networks, logger,
+                                                                             due_at)
+        self.start()
+
+    def discard(self, networks):
+        """
+        takes the networks that are connected again off the list
+        """
+        with self._lock:
+            for network in networks:
+                if network_is_portgroup(network):
+                    self._candidates.pop(self._get_key(network), None)
+
+    def pending(self):
+        with self._lock:
+            return len(self._candidates)
+
+    def start(self):
+        if self._thread is not None or self.interval <= 0:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name='PortGroupReaper')
+                self._thread.daemon = True
+                self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.reap()
+
+    def reap(self, now=None):
+        """
+        destroys the due port groups that no vm uses
+        :return: the destroyed port groups
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            due = [key for key, candidate in self._candidates.items() if candidate.due_at <= now]
+            candidates = [self._candidates.pop(key) for key in due]
+
+        by_vcenter = dict()
+        for candidate in candidates:
+            by_vcenter.setdefault(self.get_vcenter_key(candidate.port_group._stub), []).append(candidate)
+
+        destroyed = []
+        for vcenter_candidates in by_vcenter.values():
+            destroyed += self._reap_vcenter(vcenter_candidates, now)
+        return destroyed
+
+    def _reap_vcenter(self, candidates, now):
+        logger = candidates[-1].logger
+        try:
+            port_groups = self.read_port_groups([candidate.port_group for candidate in candidates])
+        except Exception:
+            logger.warning('Failed to check {0} port groups for removal'.format(len(candidates)), exc_info=True)
+            self._retry(candidates, now)
+            return []
+
+        destroyed = []
+        for candidate in candidates:
+            props = port_groups.get(candidate.port_group._moId)
+            if props is None or not self._is_unused(props, candidate.reserved_networks):
+                continue
+            try:
+                task = candidate.port_group.Destroy()
+                self.synchronous_task_waiter.wait_for_task(task=task,
+                                                           logger=candidate.logger,
+                                                           action_name='Erase dv Port Group')
+                if self.pyvmomi_service:
+                    self.pyvmomi_service.remove_portgroup_from_index(candidate.port_group)
+                destroyed.append(candidate.port_group)
+            except Exception:
+                # a vm was connected between the check and the destroy or the port group is already gone
+                candidate.logger.debug('Port group {0} was not removed'.format(props.get('name')), exc_info=True)
+        return destroyed
+
+    def _retry(self, candidates, now):
+        due_at = now + self.grace_period
+        with self._lock:
+            for candidate in candidates:
+                if candidate.retries >= self.read_retries:
+                    candidate.logger.warning('Port group {0} was not removed'.format(candidate.port_group._moId))
+                    continue
+                # a port group submitted again while it was read keeps its newer entry
+                self._candidates.setdefault(self._get_key(candidate.port_group),
+                                            ReapCandidate(candidate.port_group, candidate.reserved_networks,
+                                                          candidate.logger, due_at, candidate.retries + 1))
+
+    def _is_unused(self, props, reserved_networks):
+        name = props.get('name')
+        return self.name_generator.is_generated_name(name) and name not in reserved_networks and not props.get('vm')
+
+    def _get_key(self, port_group):
+        return self.get_vcenter_key(port_group._stub), port_group._moId
+
+    @staticmethod
+    def get_vcenter_key(stub):
+        return getattr(stub, 'host', None) or id(stub)
+
+    @staticmethod
+    def read_port_groups(port_groups):
+        """
+        Reads the name and the vms of the port groups of one vCenter with one RetrievePropertiesEx call
+        :param list port_groups: <vim.dvs.DistributedVirtualPortgroup>
+        :return: the properties of the port groups that still exist by moId
+        :rtype: dict
+        """
+        collector = vim.PropertyCollector('propertyCollector', port_groups[0]._stub)
+        obj_specs = [vmodl.query.PropertyCollector.ObjectSpec(obj=port_group, skip=False)
+                     for port_group in port_groups]
+        property_spec = vmodl.query.PropertyCollector.PropertySpec(type=vim.dvs.DistributedVirtualPortgroup,
+                                                                   pathSet=REAP_PROPERTIES, all=False)
+        filter_spec = vmodl.query.PropertyCollector.FilterSpec(objectSet=obj_specs, propSet=[property_spec],
+                                                               reportMissingObjectsInResults=True)
+        options = vmodl.query.PropertyCollector.RetrieveOptions()
+
+        port_group_props = dict()
+        result = collector.RetrievePropertiesEx([filter_spec], options)
+        while result:
+            for object_content in result.objects:
+                if object_content.missingSet and not object_content.propSet:
+                    continue
+                port_group_props[object_content.obj._moId] = \
+                    dict((prop.name, prop.val) for prop in object_content.propSet)
+            if not result.token:
+                break
+            result = collector.ContinueRetrievePropertiesEx(result.token)
+        return port_group_props
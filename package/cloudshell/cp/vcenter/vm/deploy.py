@@ -8,6 +8,7 @@ from cloudshell.cp.vcenter.models.VCenterDeployVMFromLinkedCloneResourceModel im
 from cloudshell.cp.vcenter.models.vCenterCloneVMFromVMResourceModel import vCenterCloneVMFromVMResourceModel
 from cloudshell.cp.vcenter.models.vCenterVMFromImageResourceModel import vCenterVMFromImageResourceModel
 from cloudshell.cp.vcenter.models.vCenterVMFromTemplateResourceModel import vCenterVMFromTemplateResourceModel
+from cloudshell.cp.vcenter.vm.deploy_scheduler import DeployJob
 from cloudshell.cp.vcenter.vm.ovf_image_params import OvfImageParams
 from cloudshell.cp.vcenter.vm.vcenter_details_factory import VCenterDetailsFactory
 from cloudshell.cp.vcenter.common.vcenter.vm_location import VMLocation
@@ -106,6 +107,72 @@ class VirtualMachineDeployer(object):
                                     reservation_id,
                                     cancellation_context)
 
+    def deploy_clones(self, si, logger, deploy_actions, vcenter_data_model, reservation_id, cancellation_context,
+                      scheduler):
+        """
+        deploys many clones in one call, the template, snapshot, folder, datastore and resource pool shared by
+        several apps are looked up once and the clones run through the scheduler
+
+        :param si:
+        :param logger:
+        :param list[(str, DeployFromTemplateDetails)] deploy_actions: the action id and data holder of every app
+        :param vcenter_data_model:
+        :param str reservation_id:
+        :param cancellation_context:
+        :param cloudshell.cp.vcenter.vm.deploy_scheduler.DeployScheduler scheduler:
+        :return: the DeployAppResult of every action in the order the clones finish
+        """
+        placements = dict()
+        jobs = []
+        for action_id, data_holder in deploy_actions:
+            other_params = data_holder.template_resource_model
+            template_name, snapshot = self._get_clone_source(other_params)
+            vm_name = self.name_generator(data_holder.app_name, reservation_id)
+            params = self._create_clone_params(si, vm_name, template_name, other_params, vcenter_data_model,
+                                               snapshot)
+
+            key = (params.template_name, params.snapshot, params.vm_folder, params.datastore_name,
+                   params.cluster_name, params.resource_pool)
+            if key not in placements:
+                try:
+                    placements[key] = self.pv_service.resolve_clone_placement(params)
+                except Exception as e:
+                    placements[key] = e
+
+            jobs.append(self._create_clone_job(action_id, params, other_params, vm_name, vcenter_data_model, logger,
+                                               cancellation_context, placements[key], scheduler))
+
+        for job, result, error in scheduler.run(jobs):
+            if error:
+                logger.error('Failed to deploy {0}: {1}'.format(job.action_id, error))
+                yield DeployAppResult(actionId=job.action_id, success=False, errorMessage=str(error))
+            else:
+                result.actionId = job.action_id
+                yield result
+
+    def _create_clone_job(self, action_id, params, other_params, vm_name, vcenter_data_model, logger,
+                          cancellation_context, placement, scheduler):
+        def run():
+            if isinstance(placement, Exception):
+                raise placement
+            # the datastore and host slots are held once the clone is placed, a storage pod or a cluster is not
+            # limited as a whole
+            return self._clone(params, other_params, vm_name, vcenter_data_model, logger, cancellation_context,
+                               placement, scheduler.hold)
+
+        return DeployJob(action_id, run)
+
+    @staticmethod
+    def _get_clone_source(template_resource_model):
+        """
+        :return: the template or vm the app is cloned from and the snapshot of a linked clone
+        """
+        if isinstance(template_resource_model, VCenterDeployVMFromLinkedCloneResourceModel):
+            return template_resource_model.vcenter_vm, template_resource_model.vcenter_vm_snapshot
+        if isinstance(template_resource_model, vCenterVMFromTemplateResourceModel):
+            return template_resource_model.vcenter_template, ''
+        return template_resource_model.vcenter_vm, ''
+
     def _deploy_a_clone(self, si, logger, app_name, template_name, other_params, vcenter_data_model, reservation_id,
                         cancellation_context,
                         snapshot=''):
@@ -115,27 +182,38 @@ class VirtualMachineDeployer(object):
         # generate unique name
         vm_name = self.name_generator(app_name, reservation_id)
 
+        params = self._create_clone_params(si, vm_name, template_name, other_params, vcenter_data_model, snapshot)
+
+        return self._clone(params, other_params, vm_name, vcenter_data_model, logger, cancellation_context)
+
+    def _create_clone_params(self, si, vm_name, template_name, other_params, vcenter_data_model, snapshot):
         VCenterDetailsFactory.set_deplyment_vcenter_params(
             vcenter_resource_model=vcenter_data_model, deploy_params=other_params)
 
         template_name = VMLocation.combine([other_params.default_datacenter,
                                             template_name])
 
-        params = self.pv_service.CloneVmParameters(si=si,
-                                                   template_name=template_name,
-                                                   vm_name=vm_name,
-                                                   vm_folder=other_params.vm_location,
-                                                   datastore_name=other_params.vm_storage,
-                                                   cluster_name=other_params.vm_cluster,
-                                                   resource_pool=other_params.vm_resource_pool,
-                                                   power_on=False,
-                                                   snapshot=snapshot)
-
+        return self.pv_service.CloneVmParameters(si=si,
+                                                 template_name=template_name,
+                                                 vm_name=vm_name,
+                                                 vm_folder=other_params.vm_location,
+                                                 datastore_name=other_params.vm_storage,
+                                                 cluster_name=other_params.vm_cluster,
+                                                 resource_pool=other_params.vm_resource_pool,
+                                                 power_on=False,
+                                                 snapshot=snapshot)
+
+    def _clone(self, params, other_params, vm_name, vcenter_data_model, logger, cancellation_context,
+               placement=None, hold_slots=None):
+        """
+        :rtype DeployAppResult:
+        """
         if cancellation_context.is_cancelled:
             raise Exception("Action 'Clone VM' was cancelled.")
 
         clone_vm_result = self.pv_service.clone_vm(clone_params=params, logger=logger,
-                                                   cancellation_context=cancellation_context)
+                                                   cancellation_context=cancellation_context, placement=placement,
+                                                   hold_slots=hold_slots)
         if clone_vm_result.error:
             raise Exception(clone_vm_result.error)
 
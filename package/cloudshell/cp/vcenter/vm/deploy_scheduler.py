@@ -0,0 +1,107 @@
+import os
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+from threading import BoundedSemaphore, Lock
+
+# the most clones a bulk deploy runs at the same time
+DEFAULT_MAX_PARALLEL = int(os.getenv('DeployThreadPoolSize', 10))
+
+# the most clones running at the same time against one datastore
+DEFAULT_MAX_PER_DATASTORE = int(os.getenv('DeployMaxClonesPerDatastore', 4))
+
+# the most clones running at the same time against one host
+DEFAULT_MAX_PER_HOST = int(os.getenv('DeployMaxClonesPerHost', 4))
+
+
+class DeployJob(object):
+    def __init__(self, action_id, run, datastore=None, host=None):
+        """
+        :param str action_id: the id of the DeployApp action the job deploys
+        :param run: callable that deploys the app and returns its result
+        :param str datastore: the datastore the clone is written to, None if it is not limited
+        :param str host: the host or cluster the clone is placed on, None if it is not limited
+        """
+        self.action_id = action_id
+        self.run = run
+        self.datastore = datastore
+        self.host = host
+
+
+class DeployScheduler(object):
+    """
+    Runs deploy jobs on a bounded thread pool, a job also holds a slot of its datastore and of its host
+    so one busy datastore or host never takes all the clones of a bulk deploy.
+    A clone placed on a datastore of a storage pod or a host of a cluster when it runs takes its slots with hold
+    once the datastore and host are chosen, so the slots are never shared by a whole pod or cluster
+    """
+
+    def __init__(self, max_parallel=DEFAULT_MAX_PARALLEL, max_per_datastore=DEFAULT_MAX_PER_DATASTORE,
+                 max_per_host=DEFAULT_MAX_PER_HOST):
+        """
+        :param int max_parallel: the most jobs running at the same time
+        :param int max_per_datastore: the most jobs running at the same time against one datastore
+        :param int max_per_host: the most jobs running at the same time against one host
+        """
+        self.max_parallel = max_parallel
+        self.max_per_datastore = max_per_datastore
+        self.max_per_host = max_per_host
+        self.locks = dict()
+        self.locks_lock = Lock()
+
+    def run(self, jobs):
+        """
+        :param list[DeployJob] jobs:
+        :return: (job, result, error) of every job in the order the jobs finish
+        """
+        if not jobs:
+            return
+        pool = ThreadPool(max(min(self.max_parallel, len(jobs)), 1))
+        try:
+            for job, result, error in pool.imap_unordered(self._run_job, jobs):
+                yield job, result, error
+        finally:
+            pool.close()
+
+    @contextmanager
+    def hold(self, datastore=None, host=None):
+        """
+        holds the slots of a datastore and of a host
+        :param datastore: the datastore or its name, None if it is not limited
+        :param host: the host or its name, None if it is not limited
+        """
+        # slots are always taken datastore first so two jobs never hold each other's slot
+        datastore_slot = self._get_slot('datastore', self._get_slot_name(datastore), self.max_per_datastore)
+        host_slot = self._get_slot('host', self._get_slot_name(host), self.max_per_host)
+        with datastore_slot, host_slot:
+            yield
+
+    def _run_job(self, job):
+        try:
+            with self.hold(job.datastore, job.host):
+                return job, job.run(), None
+        except Exception as e:
+            return job, None, e
+
+    @staticmethod
+    def _get_slot_name(managed_object):
+        # a managed object is keyed by its id, reading its name would be a call to the vCenter
+        return getattr(managed_object, '_moId', managed_object)
+
+    def _get_slot(self, kind, name, size):
+        if not name or size <= 0:
+            return _NoSlot()
+
+        key = (kind, name)
+        if key not in self.locks.keys():
+            with self.locks_lock:
+                if key not in self.locks.keys():
+                    self.locks[key] = BoundedSemaphore(size)
+        return self.locks[key]
+
+
+class _NoSlot(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
@@ -55,17 +55,9 @@ class VirtualSwitchToMachineConnector(object):
         logger.debug(
             'about to map to the vm: {0}, the following networks'.format(vm.name if vm.name else vm.config.uuid))
 
-        for network_map in mapping:
-            network = self.dv_port_group_creator.get_or_create_network(si,
-                                                                       vm,
-                                                                       network_map.dv_port_name,
-                                                                       network_map.dv_switch_name,
-                                                                       network_map.dv_switch_path,
-                                                                       network_map.vlan_id,
-                                                                       network_map.vlan_spec,
-                                                                       logger,
-                                                                       promiscuous_mode)
-
+        # the missing port groups of all the mappings are created together
+        networks = self.dv_port_group_creator.get_or_create_networks(si, vm, mapping, logger, promiscuous_mode)
+        for network_map, network in zip(mapping, networks):
             request_mapping.append(ConnectRequest(network_map.vnic_name, network))
 
         logger.debug(str(request_mapping))
@@ -75,3 +67,20 @@ class VirtualSwitchToMachineConnector(object):
                                                                                    reserved_networks,
                                                                                    logger)
 
+    def plan_by_mapping(self, si, plan, mapping, reserved_networks, logger, promiscuous_mode):
+        """
+        gets or creates the networks of the mapping and adds the vnics to connect to the plan
+        :param si: ServiceInstance
+        :param VmChangePlan plan:
+        :param mapping: [VmNetworkMapping]
+        :param reserved_networks:
+        :param logger:
+        :param promiscuous_mode <str> 'True' or 'False' turn on/off promiscuous mode for the port group
+        """
+        networks = self.dv_port_group_creator.get_or_create_networks(si, plan.vm, mapping, logger, promiscuous_mode)
+        request_mapping = [ConnectRequest(network_map.vnic_name, network)
+                           for network_map, network in zip(mapping, networks)]
+
+        logger.debug(str(request_mapping))
+        self.virtual_machine_port_group_configurer.plan_vnic_networks(plan, request_mapping, reserved_networks, logger)
+
@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 
+from cloudshell.cp.vcenter.common.vcenter.task_poll_policy import RECONFIGURE_VM
 from cloudshell.cp.vcenter.network.dvswitch.creator import DvPortGroupCreator
 from cloudshell.cp.vcenter.network.network_specifications import network_is_portgroup
+from cloudshell.cp.vcenter.vm.vnic_change_plan import VmChangePlan
 from threading import Lock
 from pyVmomi import vim
 
@@ -21,7 +23,8 @@ class VirtualMachinePortGroupConfigurer(object):
                  synchronous_task_waiter,
                  vnic_to_network_mapper,
                  vnic_service,
-                 name_gen):
+                 name_gen,
+                 reaper=None):
         """
         :param pyvmomi_service: vCenter API wrapper
         :param synchronous_task_waiter: Task Performer Service
@@ -29,6 +32,8 @@ class VirtualMachinePortGroupConfigurer(object):
         :param vnic_to_network_mapper: VnicToNetworkMapper
         :param vnic_service: VNicService
         :type vnic_service: cloudshell.cp.vcenter.network.vnic.vnic_service.VNicService
+        :param reaper: destroys the unused port groups in the background instead of inline
+        :type reaper: cloudshell.cp.vcenter.network.dvswitch.reaper.PortGroupReaper
         :return:
         """
         self.pyvmomi_service = pyvmomi_service
@@ -36,9 +41,11 @@ class VirtualMachinePortGroupConfigurer(object):
         self.vnic_to_network_mapper = vnic_to_network_mapper
         self.vnic_service = vnic_service
         self.network_name_gen = name_gen
+        self.reaper = reaper
         self._lock = Lock()
 
     def connect_vnic_to_networks(self, vm, mapping, default_network, reserved_networks, logger):
+        self._keep_networks(mapping)
         try:
 
             vnic_mapping = self.vnic_service.map_vnics(vm)
@@ -66,7 +73,59 @@ class VirtualMachinePortGroupConfigurer(object):
             logger.exception("Failed to connect VM: {}".format(vm.name))
             raise ValueError('VM: {0} failed with: "{1}"'.format(vm.name, e.message))
 
+    def create_change_plan(self, vm, vm_uuid, default_network):
+        """
+        :rtype: VmChangePlan
+        """
+        return VmChangePlan(vm, vm_uuid, self.vnic_service.map_vnics(vm), default_network)
+
+    def plan_vnic_networks(self, plan, mapping, reserved_networks, logger):
+        """
+        adds the vnics of the requests to the plan, the vnics the plan disconnects are free to take
+        :param VmChangePlan plan:
+        :param list[ConnectRequest] mapping:
+        """
+        self._keep_networks(mapping)
+        try:
+            vnic_to_network_mapping = self.vnic_to_network_mapper.map_request_to_vnics(
+                mapping, plan.vnics, plan.vm.network, plan.default_network, reserved_networks,
+                released_vnics=plan.released_vnics())
+
+            mappers = []
+            for vnic_name, (network, requested_vnic) in vnic_to_network_mapping.items():
+                vnic = plan.vnics[vnic_name]
+                mappers.append(VNicDeviceMapper(vnic, requested_vnic, network, True, vnic.macAddress))
+            plan.connect(mappers)
+        except Exception:
+            # the networks were created for this request and nothing is attached to them
+            self.erase_network_by_mapping([request.network for request in mapping], reserved_networks, logger)
+            raise
+
+    def apply_change_plan(self, plan, reserved_networks, logger):
+        """
+        reconfigures the vm once with the specs of all the vnics of the plan
+        and erases the networks the disconnected vnics left
+        :param VmChangePlan plan:
+        :return: the diff report of the plan
+        :rtype: list[VnicDiff]
+        """
+        diff = plan.diff()
+        mapping = plan.get_mapping()
+        if mapping:
+            self.update_vnic_by_mapping(plan.vm, mapping, logger)
+        self.erase_network_by_mapping(plan.networks_to_erase, reserved_networks, logger)
+        return diff
+
+    def _keep_networks(self, mapping):
+        # a network that is connected again is not destroyed by the reaper
+        if self.reaper:
+            self.reaper.discard([request.network for request in mapping])
+
     def erase_network_by_mapping(self, networks, reserved_networks, logger):
+        if self.reaper:
+            self.reaper.submit([network for network in networks if network is not None], reserved_networks, logger)
+            return
+
         nets = dict()
         self._lock.acquire()
         try:
@@ -87,6 +146,7 @@ class VirtualMachinePortGroupConfigurer(object):
                                     self.synchronous_task_waiter.wait_for_task(task=task,
                                                                                logger=logger,
                                                                                action_name='Erase dv Port Group')
+                                    self.pyvmomi_service.remove_portgroup_from_index(network)
                     except Exception as e:
                         continue
         finally:
@@ -168,7 +228,7 @@ class VirtualMachinePortGroupConfigurer(object):
         logger.debug('reconfigure task: {0}'.format(task.info))
         res = self.synchronous_task_waiter.wait_for_task(task=task,
                                                          logger=logger,
-                                                         action_name='Reconfigure VM')
+                                                         action_name=RECONFIGURE_VM)
         if res:
             logger.debug('reconfigure task result {0}'.format(res))
         return res
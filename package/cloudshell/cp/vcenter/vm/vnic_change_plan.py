@@ -0,0 +1,123 @@
+from collections import OrderedDict
+
+
+class VnicDiff(object):
+    def __init__(self, vnic_name, mac_address, from_network, to_network, connect):
+        """
+        one line of the diff report of a change plan
+        :param str vnic_name: the label of the vNIC
+        :param str mac_address: the mac address of the vNIC
+        :param str from_network: the network the vNIC is attached to before the change
+        :param str to_network: the network the vNIC is attached to after the change
+        :param bool connect: whether the vNIC is connected after the change
+        """
+        self.vnic_name = vnic_name
+        self.mac_address = mac_address
+        self.from_network = from_network
+        self.to_network = to_network
+        self.connect = connect
+
+    def __repr__(self):
+        return '{0} ({1}): {2} -> {3}{4}'.format(self.vnic_name, self.mac_address, self.from_network, self.to_network,
+                                               '' if self.connect else ' (disconnected)')
+
+
+class VmChangePlan(object):
+    """
+    The vNIC changes of all the removeVlan and setVlan actions of one vm.
+    The vm and its devices are read once, every vNIC ends up with a single VirtualDeviceSpec, a vNIC that is both
+    disconnected and connected keeps the last change, and all the specs are applied with one reconfigure task
+    """
+
+    def __init__(self, vm, vm_uuid, vnics, default_network):
+        """
+        :param vim.VirtualMachine vm:
+        :param str vm_uuid:
+        :param dict vnics: the vNICs of the vm by label
+        :param default_network: the network disconnected vNICs are attached to
+        """
+        self.vm = vm
+        self.vm_uuid = vm_uuid
+        self.vnics = vnics
+        self.default_network = default_network
+        self.disconnected = []
+        self.connected = []
+        self.networks_to_erase = []
+        self._changes = OrderedDict()
+        self._from_networks = dict()
+
+    def get_vnic_by_mac_address(self, mac_address):
+        for vnic in self.vnics.values():
+            if vnic.macAddress == mac_address:
+                return vnic
+        return None
+
+    def get_vnic_name(self, vnic):
+        for name, device in self.vnics.items():
+            if device is vnic:
+                return name
+        return vnic.deviceInfo.label
+
+    def released_vnics(self):
+        """
+        :return: the names of the vNICs this plan moves to the default network, free to be connected again
+        """
+        return [self.get_vnic_name(mapper.vnic) for mapper in self.disconnected]
+
+    def disconnect(self, mappers, networks_to_erase):
+        """
+        :param list[VNicDeviceMapper] mappers: the vNICs moved to the default network
+        :param list networks_to_erase: the networks the vNICs leave, erased when nothing else uses them
+        """
+        for mapper in mappers:
+            self._add(mapper)
+        self.disconnected += mappers
+        self.networks_to_erase += networks_to_erase
+
+    def connect(self, mappers):
+        """
+        :param list[VNicDeviceMapper] mappers: the vNICs attached to the requested networks
+        """
+        for mapper in mappers:
+            self._add(mapper)
+        self.connected += mappers
+
+    def get_mapping(self):
+        """
+        :return: the last change of every vNIC in the plan
+        :rtype: list[VNicDeviceMapper]
+        """
+        return list(self._changes.values())
+
+    def diff(self):
+        """
+        :rtype: list[VnicDiff]
+        """
+        return [VnicDiff(vnic_name=self.get_vnic_name(mapper.vnic),
+                         mac_address=mapper.vnic_mac,
+                         from_network=self._from_networks.get(key),
+                         to_network=self._get_network_name(mapper.network),
+                         connect=mapper.connect)
+                for key, mapper in self._changes.items()]
+
+    def _add(self, mapper):
+        key = mapper.vnic.key
+        if key not in self._from_networks:
+            # read before the change is applied, the specs are composed over the same device objects
+            self._from_networks[key] = self._get_attached_network_name(mapper.vnic)
+        self._changes[key] = mapper
+
+    def _get_attached_network_name(self, vnic):
+        backing = getattr(vnic, 'backing', None)
+        if hasattr(backing, 'network') and hasattr(backing.network, 'name'):
+            return backing.network.name
+        if hasattr(backing, 'port') and hasattr(backing.port, 'portgroupKey'):
+            for network in self.vm.network:
+                if getattr(network, 'key', None) == backing.port.portgroupKey:
+                    return network.name
+            return backing.port.portgroupKey
+        return None
+
+    @staticmethod
+    def _get_network_name(network):
+        return getattr(network, 'name', None)
@@ -2,7 +2,8 @@ class VnicToNetworkMapper(object):
     def __init__(self, quali_name_generator):
         self.quali_name_generator = quali_name_generator
 
-    def map_request_to_vnics(self, requests, vnics, existing_network, default_network, reserved_networks):
+    def map_request_to_vnics(self, requests, vnics, existing_network, default_network, reserved_networks,
+                             released_vnics=None):
         """
         gets the requests for connecting netwoks and maps it the suitable vnic of specific is not specified
         :param reserved_networks: array of reserved networks
@@ -10,12 +11,16 @@ class VnicToNetworkMapper(object):
         :param vnics:
         :param existing_network:
         :param default_network:
+        :param released_vnics: names of the vnics moved to the default network by the same change
         :return:
         """
         mapping = dict()
         reserved_networks = reserved_networks if reserved_networks else []
 
         vnics_to_network_mapping = self._map_vnic_to_network(vnics, existing_network, default_network, reserved_networks)
+        for vnic_name in released_vnics or []:
+            if vnic_name in vnics_to_network_mapping:
+                vnics_to_network_mapping[vnic_name] = default_network.name
         for request in requests:
             if request.vnic_name:
                 if request.vnic_name not in vnics_to_network_mapping:
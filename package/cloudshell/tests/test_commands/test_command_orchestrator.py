@@ -10,6 +10,11 @@ from cloudshell.shell.core.driver_context import ResourceRemoteCommandContext, R
 from cloudshell.shell.core.context import AppContext
 from mock import Mock, create_autospec, patch
 
+def terminate_pools(command_orchestrator):
+    command_orchestrator.save_app_command._pool.close()
+    command_orchestrator.delete_saved_sandbox_command._pool.close()
+
+
 RESTORE_SNAPSHOT = 'cloudshell.cp.vcenter.commands.command_orchestrator.CommandOrchestrator.restore_snapshot'
 SAVE_SNAPSHOT = 'cloudshell.cp.vcenter.commands.command_orchestrator.CommandOrchestrator.save_snapshot'
 
@@ -74,6 +79,7 @@ class TestCommandOrchestrator(TestCase):
         self.context.remote_endpoints = Mock()
         self.context.remote_endpoints = [self.resource]
         self.command_orchestrator = CommandOrchestrator()
+        self.addCleanup(terminate_pools, self.command_orchestrator)
         self.command_orchestrator.command_wrapper.execute_command_with_connection = Mock(return_value=DeployAppResult())
         self.ports = [Mock()]
         self.command_orchestrator._parse_remote_model = Mock(return_value=remote_resource)
@@ -117,6 +123,33 @@ class TestCommandOrchestrator(TestCase):
         # assert
         self.assertTrue(self.command_orchestrator.command_wrapper.execute_command_with_connection.called)
 
+    def test_deploy_bulk(self):
+        # arrange
+        cancellation_context = object()
+        self.deploy_action.actionParams.deployment.deploymentPath = 'vCenter VM From Template'
+        missing_snapshot_action = DeployApp()
+        missing_snapshot_action.actionId = 'missing snapshot'
+        missing_snapshot_action.actionParams = DeployAppParams()
+        missing_snapshot_action.actionParams.appName = 'myApp'
+        missing_snapshot_action.actionParams.deployment = DeployAppDeploymentInfo()
+        missing_snapshot_action.actionParams.deployment.deploymentPath = 'VCenter Deploy VM From Linked Clone'
+        missing_snapshot_action.actionParams.deployment.attributes = \
+            dict(self.deploy_action.actionParams.deployment.attributes, **{"VCenter VM Snapshot": ""})
+        deployed = DeployAppResult(actionId=self.deploy_action.actionId)
+        self.command_orchestrator.command_wrapper.execute_command_with_connection = Mock(return_value=[deployed])
+
+        # act
+        results = self.command_orchestrator.deploy_bulk(self.context, [self.deploy_action, missing_snapshot_action],
+                                                        cancellation_context)
+
+        # assert
+        self.assertEqual(results[0].actionId, 'missing snapshot')
+        self.assertFalse(results[0].success)
+        self.assertEqual(results[1], deployed)
+        args = self.command_orchestrator.command_wrapper.execute_command_with_connection.call_args[0]
+        self.assertEqual(args[1], self.command_orchestrator.deploy_command.execute_deploy_bulk)
+        self.assertEqual([action_id for action_id, _ in args[2]], [self.deploy_action.actionId])
+
     def test_deploy_from_image(self):
         # act
         cancellation_context = object()
@@ -179,10 +212,13 @@ class TestCommandOrchestrator(TestCase):
             endpoint.app_context.deployed_app_json = '{"vmdetails": {"uid": "vm_uuid1"}}'
             remote_command_context.remote_endpoints = [endpoint]
 
+            command_orchestrator = CommandOrchestrator()
+            self.addCleanup(terminate_pools, command_orchestrator)
+
             # Act
-            saved_result = CommandOrchestrator().orchestration_save(context=remote_command_context,
-                                                                    mode='shallow',
-                                                                    custom_params=None)
+            saved_result = command_orchestrator.orchestration_save(context=remote_command_context,
+                                                                   mode='shallow',
+                                                                   custom_params=None)
 
             # Assert
             save_snapshot_mock.assert_called_once()
@@ -208,10 +244,13 @@ class TestCommandOrchestrator(TestCase):
             endpoint.app_context.deployed_app_json = '{"vmdetails": {"uid": "vm_uuid1"}}'
             remote_command_context.remote_endpoints = [endpoint]
 
+            command_orchestrator = CommandOrchestrator()
+            self.addCleanup(terminate_pools, command_orchestrator)
+
             # Act
-            CommandOrchestrator().orchestration_save(context=remote_command_context,
-                                                     mode='shallow',
-                                                     custom_params=None)
+            command_orchestrator.orchestration_save(context=remote_command_context,
+                                                    mode='shallow',
+                                                    custom_params=None)
 
             # Assert
             args, kwargs = save_snapshot_mock.call_args
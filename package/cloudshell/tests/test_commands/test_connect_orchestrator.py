@@ -1,3 +1,5 @@
+from threading import Thread, Condition
+
 import jsonpickle
 from mock import Mock
 from unittest import TestCase
@@ -29,6 +31,7 @@ class TestCommandOrchestrator(TestCase):
         self.ConnectionCommandOrchestrator = ConnectionCommandOrchestrator(self.connector,
                                                                            self.disconnector,
                                                                            self.model_parser)
+        self.addCleanup(self.ConnectionCommandOrchestrator.executor.close)
 
     def test_connect_bulk_dvswitch_is_None(self):
         """
@@ -145,6 +148,87 @@ class TestCommandOrchestrator(TestCase):
                                                                   request=request)
         self._assert_as_expected(results, expected)
 
+    def test_overlapping_requests_keep_their_own_context(self):
+        request, expected = self._get_test1_params()
+        connection_results = self.connector.connect_to_networks.return_value
+        other_model = Mock()
+        other_model.reserved_networks = 'other_restricted'
+        other_model.default_dvswitch = 'otherSwitch'
+        other_model.default_datacenter = 'other datacenter'
+        other_model.holding_network = 'Other Holding Network'
+        other_model.promiscuous_mode = 'False'
+        both_connecting = Barrier(2)
+        calls = []
+
+        def connect_to_networks(**kwargs):
+            # the first request is still connecting when the second one starts
+            both_connecting.wait()
+            calls.append((kwargs['dv_switch_name'], kwargs['reserved_networks'], kwargs['default_network_name']))
+            return list(connection_results)
+
+        self.connector.connect_to_networks = Mock(side_effect=connect_to_networks)
+        threads = [Thread(target=self.ConnectionCommandOrchestrator.connect_bulk,
+                          args=(self.si, Mock(), model, request))
+                   for model in [self.vc_data_model, other_model]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+
+        self.assertEqual(sorted(calls),
+                         [('dvSwitch', ['restricted_network1', 'restricted_network2'], 'datacenter/Holding Network'),
+                          ('otherSwitch', ['other_restricted'], 'other datacenter/Other Holding Network')])
+
+    def test_remove_and_set_of_one_vm_are_applied_with_one_plan(self):
+        vm_uuid = '422203f6-eadd-9f88-5dc8-00c17f49fa21'
+        request = {'driverRequest': {'actions': [
+            {'actionId': 'remove', 'type': 'removeVlan',
+             'connectionParams': {'vlanId': '2', 'mode': 'Access'},
+             'connectorAttributes': [{'attributeName': 'Interface', 'attributeValue': 'mac1'}],
+             'customActionAttributes': [{'attributeName': 'VM_UUID', 'attributeValue': vm_uuid}]},
+            {'actionId': 'set', 'type': 'setVlan',
+             'connectionParams': {'vlanId': '3', 'mode': 'Access'},
+             'connectorAttributes': [],
+             'customActionAttributes': [{'attributeName': 'VM_UUID', 'attributeValue': vm_uuid},
+                                        {'attributeName': 'Vnic Name', 'attributeValue': '1'}]}]}}
+        plan = Mock()
+        plan.disconnected = [VNicDeviceMapper(vnic=Mock(), requested_vnic='mac1', network=Mock(), connect=False,
+                                              mac='mac1')]
+        self.disconnector.create_change_plan = Mock(return_value=plan)
+        self.disconnector.apply_change_plan = Mock(return_value=[])
+        self.connector.get_connection_results = Mock(return_value=[ConnectionResult(
+            mac_address='mac1', vnic_name='Network adapter 1', requested_vnic='Network adapter 1', vm_uuid=vm_uuid,
+            network_name=self.portgroup_name.generate_port_group_name('dvSwitch', '3', 'Access'), network_key='aa')])
+
+        results = self.ConnectionCommandOrchestrator.connect_bulk(self.si, Mock(), self.vc_data_model,
+                                                                  jsonpickle.encode(request))
+
+        self.disconnector.plan_disconnect.assert_called_once()
+        self.connector.plan_connect.assert_called_once()
+        self.disconnector.apply_change_plan.assert_called_once()
+        self.assertFalse(self.disconnector.disconnect_from_networks.called)
+        self.assertFalse(self.connector.connect_to_networks.called)
+        self.assertEqual(sorted((r.actionId, r.success, r.updatedInterface) for r in results),
+                         [('remove', True, 'mac1'), ('set', True, 'mac1')])
+
+    def test_failed_reconfigure_of_a_plan_fails_the_remove_and_set_actions(self):
+        vm_uuid = '422203f6-eadd-9f88-5dc8-00c17f49fa21'
+        request = {'driverRequest': {'actions': [
+            {'actionId': 'remove', 'type': 'removeVlan',
+             'connectionParams': {'vlanId': '2', 'mode': 'Access'},
+             'connectorAttributes': [{'attributeName': 'Interface', 'attributeValue': 'mac1'}],
+             'customActionAttributes': [{'attributeName': 'VM_UUID', 'attributeValue': vm_uuid}]},
+            {'actionId': 'set', 'type': 'setVlan',
+             'connectionParams': {'vlanId': '3', 'mode': 'Access'},
+             'connectorAttributes': [],
+             'customActionAttributes': [{'attributeName': 'VM_UUID', 'attributeValue': vm_uuid}]}]}}
+        self.disconnector.apply_change_plan = Mock(side_effect=ValueError('vm is locked'))
+
+        results = self.ConnectionCommandOrchestrator.connect_bulk(self.si, Mock(), self.vc_data_model,
+                                                                  jsonpickle.encode(request))
+
+        self.assertEqual(sorted((r.actionId, r.success) for r in results), [('remove', False), ('set', False)])
+
     def _assert_as_expected(self, res, exp):
         for r in res:
             for e in exp:
@@ -787,3 +871,17 @@ class TestCommandOrchestrator(TestCase):
         self._set_disconnect_from_networks(request)
         expected = self._get_disconnect_excepted_results(request)
         return jsonpickle.encode(request), expected
+
+
+class Barrier(object):
+    def __init__(self, parties):
+        self.parties = parties
+        self.arrived = 0
+        self.condition = Condition()
+
+    def wait(self, timeout=5):
+        with self.condition:
+            self.arrived += 1
+            self.condition.notify_all()
+            if self.arrived < self.parties:
+                self.condition.wait(timeout)
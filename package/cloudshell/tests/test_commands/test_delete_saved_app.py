@@ -27,19 +27,24 @@ class TestDeleteSavedSandboxCommand(TestCase):
         task_waiter = Mock()
         self.folder_manager = FolderManager(self.pyvmomi_service, task_waiter)
         self.pyvmomi_service.get_vm_by_uuid = Mock(return_value=vm)
+        self.pyvmomi_service.get_power_states = Mock(return_value=dict())
         self.cancellation_service = Mock()
         self.cancellation_service.check_if_cancelled = Mock(return_value=False)
         clone_result = Mock(vmName='whatever')
         self.deployer = Mock()
         self.deployer.deploy_clone_from_vm = Mock(return_value=clone_result)
+        self.task_waiter = Mock()
+        self.task_waiter.wait_for_tasks = Mock(side_effect=lambda tasks, *args, **kwargs:
+                                               [(task, None, None) for task in tasks])
         self.delete_command = DeleteSavedSandboxCommand(pyvmomi_service=self.pyvmomi_service,
-                                                        task_waiter=Mock(),
+                                                        task_waiter=self.task_waiter,
                                                         deployer=self.deployer,
                                                         resource_model_parser=MockResourceParser(),
                                                         snapshot_saver=Mock(),
                                                         folder_manager=self.folder_manager,
                                                         cancellation_service=self.cancellation_service,
                                                         port_group_configurer=Mock())
+        self.addCleanup(self.delete_command._pool.close)
 
     def test_delete_sandbox_runs_successfully(self):
         # receive a save request with 2 actions, return a save response with 2 results.
@@ -68,6 +73,69 @@ class TestDeleteSavedSandboxCommand(TestCase):
         self.assertTrue(result[1].actionId == delete_action2.actionId)
         self.assertTrue(result[1].success)
 
+    def test_delete_sandbox_waits_on_all_vm_tasks_together(self):
+        delete_action1 = self._create_arbitrary_delete_saved_app_action()
+        delete_action2 = self._create_arbitrary_delete_saved_app_action()
+        vcenter_data_model = Mock()
+        vcenter_data_model.default_datacenter = 'QualiSB Cluster'
+        vcenter_data_model.vm_location = 'QualiFolder'
+
+        self.delete_command.delete_sandbox(si=Mock(),
+                                           logger=Mock(),
+                                           vcenter_data_model=vcenter_data_model,
+                                           delete_sandbox_actions=[delete_action1, delete_action2],
+                                           cancellation_context=self.cancellation_context)
+
+        # one wait for the power off tasks and one for the destroy tasks of both vms
+        self.assertEqual(self.task_waiter.wait_for_tasks.call_count, 2)
+        self.assertEqual(len(self.task_waiter.wait_for_tasks.call_args_list[1][0][0]), 2)
+
+    def test_delete_sandbox_raises_task_error(self):
+        delete_action = self._create_arbitrary_delete_saved_app_action()
+        vcenter_data_model = Mock()
+        vcenter_data_model.default_datacenter = 'QualiSB Cluster'
+        vcenter_data_model.vm_location = 'QualiFolder'
+        self.task_waiter.wait_for_tasks = Mock(side_effect=lambda tasks, *args, **kwargs:
+                                               [(task, None, Exception('failed')) for task in tasks])
+
+        with self.assertRaises(Exception) as context:
+            self.delete_command.delete_sandbox(si=Mock(),
+                                               logger=Mock(),
+                                               vcenter_data_model=vcenter_data_model,
+                                               delete_sandbox_actions=[delete_action],
+                                               cancellation_context=self.cancellation_context)
+        self.assertEqual(context.exception.message, 'failed')
+
+    def test_vms_that_powered_off_are_deleted_when_another_fails(self):
+        delete_actions = [self._create_arbitrary_delete_saved_app_action() for _ in range(3)]
+        vms = [Mock(_moId='vm-{0}'.format(i)) for i in range(3)]
+        self.pyvmomi_service.get_vm_by_uuid = Mock(side_effect=vms + [None] * 3)
+        self.pyvmomi_service.get_power_states = Mock(return_value={'vm-2': 'poweredOff'})
+        vcenter_data_model = Mock()
+        vcenter_data_model.default_datacenter = 'QualiSB Cluster'
+        vcenter_data_model.vm_location = 'QualiFolder'
+
+        def wait_for_tasks(tasks, *args, **kwargs):
+            return [(task, None, Exception('power off failed') if task is vms[0].PowerOff.return_value else None)
+                    for task in tasks]
+
+        self.task_waiter.wait_for_tasks = Mock(side_effect=wait_for_tasks)
+        vms[1].Destroy_Task = Mock(side_effect=Exception('destroy failed'))
+
+        with self.assertRaises(Exception) as context:
+            self.delete_command.delete_sandbox(si=Mock(),
+                                               logger=Mock(),
+                                               vcenter_data_model=vcenter_data_model,
+                                               delete_sandbox_actions=delete_actions,
+                                               cancellation_context=self.cancellation_context)
+
+        self.assertEqual(context.exception.message, 'power off failed\ndestroy failed')
+        self.assertFalse(vms[0].Destroy_Task.called)
+        self.assertTrue(vms[1].Destroy_Task.called)
+        self.assertFalse(vms[2].PowerOff.called)
+        self.assertTrue(vms[2].Destroy_Task.called)
+        self.pyvmomi_service.get_power_states.assert_called_once()
+
     def test_delete_saved_sandbox_fails_when_actions_empty(self):
         # exception will be thrown if save actions list is empty in request
 
@@ -54,6 +54,41 @@ class TestDeployFromTemplateCommand(unittest.TestCase):
         deployer.deploy_from_template.assert_called_once_with(si, logger, deploy_params, vcenter_data_model,
                                                               reservation_id, cancellation_context)
 
+    def test_deploy_bulk_execute(self):
+        # arrange
+        deployer = Mock()
+        deployer.deploy_clones = Mock(return_value=iter(['result1', 'result2']))
+        si = Mock()
+        logger = Mock()
+        folder_manager = Mock()
+        scheduler = Mock()
+        vcenter_data_model = Mock()
+        vcenter_data_model.default_datacenter = 'QualiSB'
+        vcenter_data_model.vm_location = 'TargetFolder'
+        deploy_actions = [('action1', DeployFromTemplateDetails(vCenterVMFromTemplateResourceModel(), 'app1')),
+                          ('action2', DeployFromTemplateDetails(vCenterVMFromTemplateResourceModel(), 'app2'))]
+        reservation_id = Mock()
+        cancellation_context = object()
+
+        # act
+        result = DeployCommand(deployer).execute_deploy_bulk(si=si,
+                                                             logger=logger,
+                                                             vcenter_data_model=vcenter_data_model,
+                                                             reservation_id=reservation_id,
+                                                             deploy_actions=deploy_actions,
+                                                             cancellation_context=cancellation_context,
+                                                             folder_manager=folder_manager,
+                                                             scheduler=scheduler)
+
+        # assert
+        self.assertEqual(result, ['result1', 'result2'])
+        folder_manager.get_or_create_vcenter_folder.assert_called_once_with(si, logger, 'QualiSB/TargetFolder',
+                                                                            'Deployed Apps')
+        for _, data_holder in deploy_actions:
+            self.assertEqual(data_holder.template_resource_model.vm_location, 'TargetFolder/Deployed Apps')
+        deployer.deploy_clones.assert_called_once_with(si, logger, deploy_actions, vcenter_data_model,
+                                                       reservation_id, cancellation_context, scheduler)
+
     def test_deploy_image_execute(self):
         deployer = Mock()
         si = Mock()
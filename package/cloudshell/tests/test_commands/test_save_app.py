@@ -39,6 +39,7 @@ class TestSaveAppCommand(TestCase):
                                            folder_manager=self.folder_manager,
                                            cancellation_service=self.cancellation_service,
                                            port_group_configurer=Mock())
+        self.addCleanup(self.save_command._pool.close)
 
     def test_save_runs_successfully(self):
         # receive a save request with 2 actions, return a save response with 2 results.
@@ -109,6 +110,7 @@ class TestSaveAppCommand(TestCase):
                                            folder_manager=self.folder_manager,
                                            cancellation_service=cancellation_service,
                                            port_group_configurer=Mock())
+        self.addCleanup(self.save_command._pool.close)
 
         result = self.save_command.save_app(si=Mock(),
                                             logger=Mock(),
@@ -0,0 +1,81 @@
+from unittest import TestCase
+
+from mock import Mock
+
+from cloudshell.cp.vcenter.common.cloud_shell.resource_details_cache import ResourceDetailsCache
+from cloudshell.cp.vcenter.models.VMwarevCenterResourceModel import VMwarevCenterResourceModel
+from cloudshell.shell.core.context import ResourceContextDetails
+
+
+class TestResourceDetailsCache(TestCase):
+    def setUp(self):
+        self.session = Mock()
+        self.session.DecryptPassword = Mock(return_value=Mock(Value='decrypted'))
+        self.parser = Mock()
+        self.parser.convert_to_vcenter_model = Mock(side_effect=self._convert_to_vcenter_model)
+        self.resource = self._create_resource({'User': 'user', 'Password': 'encrypted',
+                                               'Default Datacenter': 'QualiSB'})
+        self.cache = ResourceDetailsCache(self.parser)
+
+    def test_parses_and_decrypts_once(self):
+        model1, details1 = self.cache.get_details(self.session, self.resource)
+        model2, details2 = self.cache.get_details(self.session, self.resource)
+
+        self.assertEqual(details1.password, 'decrypted')
+        self.assertEqual(details2.host, '10.0.0.1')
+        self.assertEqual(model2.default_datacenter, 'QualiSB')
+        self.assertEqual(self.session.DecryptPassword.call_count, 1)
+        self.assertEqual(self.parser.convert_to_vcenter_model.call_count, 1)
+
+    def test_hands_out_copies_of_the_model(self):
+        model1, details = self.cache.get_details(self.session, self.resource)
+        model1.default_datacenter = 'changed'
+
+        model2, details = self.cache.get_details(self.session, self.resource)
+
+        self.assertEqual(model2.default_datacenter, 'QualiSB')
+
+    def test_attribute_change_is_parsed_again(self):
+        self.cache.get_details(self.session, self.resource)
+
+        changed = self._create_resource({'User': 'user', 'Password': 'new encrypted',
+                                         'Default Datacenter': 'QualiSB'})
+        self.cache.get_details(self.session, changed)
+
+        self.assertEqual(self.session.DecryptPassword.call_count, 2)
+
+    def test_expired_entry_is_parsed_again(self):
+        cache = ResourceDetailsCache(self.parser, ttl=-1)
+
+        cache.get_details(self.session, self.resource)
+        cache.get_details(self.session, self.resource)
+
+        self.assertEqual(self.session.DecryptPassword.call_count, 2)
+
+    def test_resource_without_readable_attributes_is_not_cached(self):
+        resource = Mock(spec=[])
+        resource.name = 'vCenter'
+        resource.address = '10.0.0.1'
+        parser = Mock()
+
+        cache = ResourceDetailsCache(parser)
+        cache.get_details(self.session, resource)
+        cache.get_details(self.session, resource)
+
+        self.assertEqual(parser.convert_to_vcenter_model.call_count, 2)
+
+    @staticmethod
+    def _convert_to_vcenter_model(resource):
+        model = VMwarevCenterResourceModel()
+        model.user = resource.attributes['User']
+        model.password = resource.attributes['Password']
+        model.default_datacenter = resource.attributes['Default Datacenter']
+        return model
+
+    @staticmethod
+    def _create_resource(attributes):
+        resource = ResourceContextDetails()
+        resource.name = 'vCenter'
+        resource.address = '10.0.0.1'
+        resource.attributes = attributes
+        return resource
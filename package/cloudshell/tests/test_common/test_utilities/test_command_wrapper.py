@@ -2,6 +2,7 @@ from unittest import TestCase
 from cloudshell.shell.core.context import ResourceCommandContext, \
     ReservationContextDetails, ResourceContextDetails, ConnectivityContext
 from mock import Mock, create_autospec, patch
+from pyVmomi import vim
 
 from cloudshell.cp.vcenter.common.wrappers.command_wrapper import CommandWrapper
 
@@ -98,6 +99,86 @@ class TestCommandWrapper(TestCase):
             self.assertTrue(res)
             session.assert_called_with(context)
 
+    def test_execute_command_releases_connection_to_pool(self):
+        # arrange
+        def fake_command(si):
+            return si
+
+        connection_pool = Mock()
+        connection_pool.lease = Mock(return_value=self.si)
+        with patch('cloudshell.cp.vcenter.common.wrappers.command_wrapper.CloudShellSessionContext'):
+            wrapper = CommandWrapper(pv_service=self.pv_service,
+                                     resource_model_parser=self.resource_model_parser,
+                                     context_based_logger_factory=Mock(),
+                                     connection_pool=connection_pool)
+            context = self._create_resource_command_context()
+
+            # act
+            res = wrapper.execute_command_with_connection(context, fake_command)
+
+            # assert
+            self.assertEqual(res, self.si)
+            connection_pool.release.assert_called_once_with(self.si)
+
+    def test_expired_session_is_replaced_before_the_command_runs(self):
+        # arrange
+        new_si = Mock()
+        calls = []
+
+        def fake_command(si, fake1):
+            calls.append(si)
+            return fake1
+
+        connection_pool = Mock()
+        connection_pool.lease = Mock(side_effect=[self.si, new_si])
+        connection_pool.check = Mock(side_effect=lambda si: self._raise_if(si is self.si))
+        with patch('cloudshell.cp.vcenter.common.wrappers.command_wrapper.CloudShellSessionContext'):
+            wrapper = CommandWrapper(pv_service=self.pv_service,
+                                     resource_model_parser=self.resource_model_parser,
+                                     context_based_logger_factory=Mock(),
+                                     connection_pool=connection_pool)
+            context = self._create_resource_command_context()
+
+            # act
+            res = wrapper.execute_command_with_connection(context, fake_command, 'param 1')
+
+            # assert
+            self.assertEqual(res, 'param 1')
+            self.assertEqual(calls, [new_si])
+            connection_pool.discard.assert_called_once_with(self.si)
+            self.assertEqual([c[0][0] for c in connection_pool.release.call_args_list], [self.si, new_si])
+
+    def test_command_that_hits_an_expired_session_is_not_run_again(self):
+        # arrange
+        calls = []
+
+        def fake_command(si):
+            calls.append(si)
+            raise vim.fault.NotAuthenticated()
+
+        connection_pool = Mock()
+        connection_pool.lease = Mock(return_value=self.si)
+        with patch('cloudshell.cp.vcenter.common.wrappers.command_wrapper.CloudShellSessionContext'):
+            wrapper = CommandWrapper(pv_service=self.pv_service,
+                                     resource_model_parser=self.resource_model_parser,
+                                     context_based_logger_factory=Mock(),
+                                     connection_pool=connection_pool)
+            context = self._create_resource_command_context()
+
+            # act
+            self.assertRaises(vim.fault.NotAuthenticated, wrapper.execute_command_with_connection, context,
+                              fake_command)
+
+            # assert
+            self.assertEqual(calls, [self.si])
+            connection_pool.discard.assert_called_once_with(self.si)
+            connection_pool.release.assert_called_once_with(self.si)
+
+    @staticmethod
+    def _raise_if(expired):
+        if expired:
+            raise vim.fault.NotAuthenticated()
+
     def _create_resource_command_context(self):
         context = create_autospec(ResourceCommandContext)
         context.reservation = create_autospec(ReservationContextDetails)
@@ -0,0 +1,100 @@
+import unittest
+
+from mock import Mock
+from pyVmomi import vim, vmodl
+
+from cloudshell.cp.vcenter.common.vcenter.clone_source_cache import CloneSourceCache
+from cloudshell.cp.vcenter.common.vcenter.vmomi_service import pyVmomiService
+
+
+class TestCloneSourceCache(unittest.TestCase):
+    def setUp(self):
+        self.si = Mock()
+        self.si._stub = Mock()
+        self.si._stub.host = 'vcenter:443'
+        self.template = vim.VirtualMachine('vm-1', self.si._stub)
+        self.snapshot = vim.vm.Snapshot('snapshot-1', self.si._stub)
+        self.folder = vim.Folder('group-v1', self.si._stub)
+        self.resolve = Mock(return_value=(self.template, self.snapshot))
+        self.collector = self.si.content.propertyCollector
+        self.collector.RetrievePropertiesEx = Mock(return_value=self._retrieve_result(change_version='1'))
+        self.cache = CloneSourceCache()
+
+    def _retrieve_result(self, change_version, snapshot_exists=True, name='golden'):
+        objects = [vmodl.query.PropertyCollector.ObjectContent(
+            obj=self.template,
+            propSet=[vmodl.DynamicProperty(name='name', val=name),
+                     vmodl.DynamicProperty(name='parent', val=self.folder),
+                     vmodl.DynamicProperty(name='config.changeVersion', val=change_version),
+                     vmodl.DynamicProperty(name='snapshot.currentSnapshot', val=self.snapshot)])]
+        if snapshot_exists:
+            objects.append(vmodl.query.PropertyCollector.ObjectContent(
+                obj=self.snapshot,
+                propSet=[vmodl.DynamicProperty(name='vm', val=self.template)]))
+        return vmodl.query.PropertyCollector.RetrieveResult(objects=objects)
+
+    def test_repeated_lookups_are_resolved_once(self):
+        first = self.cache.get_source(self.si, 'dc/golden', 'base', self.resolve)
+        second = self.cache.get_source(self.si, 'dc/golden', 'base', self.resolve)
+
+        self.assertEqual(first, (self.template, self.snapshot))
+        self.assertEqual(second, (self.template, self.snapshot))
+        self.assertEqual(self.resolve.call_count, 1)
+        self.assertEqual(self.collector.RetrievePropertiesEx.call_count, 2)
+
+    def test_changed_template_is_resolved_again(self):
+        self.cache.get_source(self.si, 'dc/golden', 'base', self.resolve)
+        self.collector.RetrievePropertiesEx = Mock(return_value=self._retrieve_result(change_version='2'))
+
+        self.cache.get_source(self.si, 'dc/golden', 'base', self.resolve)
+
+        self.assertEqual(self.resolve.call_count, 2)
+
+    def test_deleted_snapshot_is_resolved_again(self):
+        self.cache.get_source(self.si, 'dc/golden', 'base', self.resolve)
+        self.collector.RetrievePropertiesEx = Mock(side_effect=[
+            self._retrieve_result(change_version='1', snapshot_exists=False),
+            self._retrieve_result(change_version='1')])
+
+        self.cache.get_source(self.si, 'dc/golden', 'base', self.resolve)
+
+        self.assertEqual(self.resolve.call_count, 2)
+
+    def test_entries_are_keyed_by_vcenter_and_paths(self):
+        self.cache.get_source(self.si, 'dc/golden', 'base', self.resolve)
+        self.cache.get_source(self.si, 'dc/golden', 'base/child', self.resolve)
+        other_si = Mock()
+        other_si._stub = Mock()
+        other_si._stub.host = 'other:443'
+        other_si.content.propertyCollector = self.collector
+        self.cache.get_source(other_si, 'dc/golden', 'base', self.resolve)
+
+        self.assertEqual(self.resolve.call_count, 3)
+
+    def test_expired_entry_is_resolved_again(self):
+        self.cache.ttl = -1
+        self.cache.get_source(self.si, 'dc/golden', 'base', self.resolve)
+        self.cache.get_source(self.si, 'dc/golden', 'base', self.resolve)
+
+        self.assertEqual(self.resolve.call_count, 2)
+
+    def test_source_is_not_cached_when_it_can_not_be_validated(self):
+        self.collector.RetrievePropertiesEx = Mock(side_effect=vmodl.fault.ManagedObjectNotFound())
+
+        self.cache.get_source(self.si, 'dc/golden', 'base', self.resolve)
+        self.cache.get_source(self.si, 'dc/golden', 'base', self.resolve)
+
+        self.assertEqual(self.resolve.call_count, 2)
+
+    def test_pv_service_resolves_clone_source_through_cache(self):
+        pv_service = pyVmomiService(Mock(), Mock(), Mock(), clone_source_cache=self.cache)
+        pv_service.find_vm_by_name = Mock(return_value=self.template)
+        pv_service._get_snapshot = Mock(return_value=self.snapshot)
+        clone_params = pv_service.CloneVmParameters(si=self.si, template_name='dc/golden', vm_name='vm',
+                                                    vm_folder='dc', snapshot='base')
+
+        pv_service._get_clone_source(clone_params)
+        result = pv_service._get_clone_source(clone_params)
+
+        self.assertEqual(result, (self.template, self.snapshot))
+        pv_service.find_vm_by_name.assert_called_once_with(self.si, 'dc', 'golden')
@@ -0,0 +1,167 @@
+import time
+import unittest
+from threading import Event, Thread
+
+from mock import Mock
+from pyVmomi import vim
+
+from cloudshell.cp.vcenter.common.vcenter.connection_pool import VCenterConnectionPool
+from cloudshell.cp.vcenter.models.VCenterConnectionDetails import VCenterConnectionDetails
+
+
+class TestVCenterConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.pv_service = Mock()
+        self.pv_service.connect = Mock(side_effect=lambda host, user, password, port: Mock(host=host))
+        self.pool = VCenterConnectionPool(self.pv_service, max_size=2)
+        self.logger = Mock()
+        self.vcenter1 = VCenterConnectionDetails('vcenter1', 'user', 'pass')
+        self.vcenter2 = VCenterConnectionDetails('vcenter2', 'user', 'pass')
+
+    def test_released_session_is_reused(self):
+        si = self.pool.lease(self.vcenter1, self.logger)
+        self.pool.release(si)
+
+        self.assertIs(self.pool.lease(self.vcenter1, self.logger), si)
+        self.assertEqual(self.pv_service.connect.call_count, 1)
+
+    def test_sessions_are_kept_per_vcenter(self):
+        si1 = self.pool.lease(self.vcenter1, self.logger)
+        si2 = self.pool.lease(self.vcenter2, self.logger)
+        self.pool.release(si1)
+        self.pool.release(si2)
+
+        self.assertEqual(self.pool.lease(self.vcenter1, self.logger).host, 'vcenter1')
+        self.assertEqual(self.pool.lease(self.vcenter2, self.logger).host, 'vcenter2')
+        self.assertEqual(self.pv_service.connect.call_count, 2)
+
+    def test_concurrent_leases_open_sessions_up_to_max_size_then_share(self):
+        si1 = self.pool.lease(self.vcenter1, self.logger)
+        si2 = self.pool.lease(self.vcenter1, self.logger)
+        si3 = self.pool.lease(self.vcenter1, self.logger)
+
+        self.assertIsNot(si1, si2)
+        self.assertIn(si3, [si1, si2])
+        self.assertEqual(self.pv_service.connect.call_count, 2)
+
+    def test_cold_leases_wait_for_the_sessions_logging_in(self):
+        logging_in = Event()
+        logged_in = Event()
+
+        def connect(host, user, password, port):
+            logging_in.set()
+            logged_in.wait(5)
+            return Mock(host=host)
+
+        self.pv_service.connect = Mock(side_effect=connect)
+        self.pool.max_size = 1
+        leased = []
+        threads = [Thread(target=lambda: leased.append(self.pool.lease(self.vcenter1, self.logger)))
+                   for _ in range(3)]
+        threads[0].start()
+        logging_in.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        time.sleep(0.05)
+        logged_in.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(leased), 3)
+        self.assertEqual(len(set(leased)), 1)
+        self.assertEqual(self.pv_service.connect.call_count, 1)
+
+    def test_idle_sessions_are_evicted(self):
+        pool = VCenterConnectionPool(self.pv_service, idle_timeout=-1)
+        si = pool.lease(self.vcenter1, self.logger)
+        pool.release(si)
+
+        self.assertIsNot(pool.lease(self.vcenter1, self.logger), si)
+        self.pv_service.disconnect.assert_called_once_with(si)
+
+    def test_lease_does_not_probe_session(self):
+        si = self.pool.lease(self.vcenter1, self.logger)
+        self.pool.release(si)
+
+        self.pool.lease(self.vcenter1, self.logger)
+
+        self.assertFalse(si.CurrentTime.called)
+
+    def test_keeper_checks_unused_sessions(self):
+        pool = VCenterConnectionPool(self.pv_service, keepalive_interval=0)
+        busy = pool.lease(self.vcenter1, self.logger)
+        idle = pool.lease(self.vcenter1, self.logger)
+        pool.release(idle)
+
+        pool.keeper.keep_alive()
+
+        self.assertTrue(idle.CurrentTime.called)
+        self.assertFalse(busy.CurrentTime.called)
+
+    def test_keeper_discards_expired_session(self):
+        pool = VCenterConnectionPool(self.pv_service, keepalive_interval=0)
+        si = pool.lease(self.vcenter1, self.logger)
+        pool.release(si)
+        si.CurrentTime = Mock(side_effect=vim.fault.NotAuthenticated())
+
+        pool.keeper.keep_alive()
+
+        self.assertIsNot(pool.lease(self.vcenter1, self.logger), si)
+        self.assertEqual(self.pv_service.connect.call_count, 2)
+
+    def test_keeper_skips_recently_used_sessions(self):
+        si = self.pool.lease(self.vcenter1, self.logger)
+        self.pool.release(si)
+
+        self.pool.keeper.keep_alive()
+
+        self.assertFalse(si.CurrentTime.called)
+
+    def test_session_not_used_lately_is_checked(self):
+        pool = VCenterConnectionPool(self.pv_service, check_after=-1)
+        si = pool.lease(self.vcenter1, self.logger)
+        si.CurrentTime = Mock(side_effect=vim.fault.NotAuthenticated())
+
+        self.assertRaises(vim.fault.NotAuthenticated, pool.check, si)
+
+    def test_recently_used_session_is_not_checked(self):
+        si = self.pool.lease(self.vcenter1, self.logger)
+
+        self.pool.check(si)
+
+        self.assertFalse(si.CurrentTime.called)
+
+    def test_discarded_session_is_not_leased(self):
+        si = self.pool.lease(self.vcenter1, self.logger)
+        self.pool.discard(si)
+
+        self.assertIsNot(self.pool.lease(self.vcenter1, self.logger), si)
+
+    def test_password_change_logs_in_again(self):
+        si = self.pool.lease(self.vcenter1, self.logger)
+        self.pool.release(si)
+
+        new_si = self.pool.lease(VCenterConnectionDetails('vcenter1', 'user', 'new pass'), self.logger)
+
+        self.assertIsNot(new_si, si)
+        self.pv_service.disconnect.assert_called_once_with(si)
+
+    def test_leased_session_of_old_password_is_logged_out_on_last_release(self):
+        self.pool.max_size = 1
+        si = self.pool.lease(self.vcenter1, self.logger)
+        self.assertIs(self.pool.lease(self.vcenter1, self.logger), si)
+
+        new_si = self.pool.lease(VCenterConnectionDetails('vcenter1', 'user', 'new pass'), self.logger)
+        self.pool.release(si)
+
+        self.assertIsNot(new_si, si)
+        self.assertFalse(self.pv_service.disconnect.called)
+        self.pool.release(si)
+        self.pv_service.disconnect.assert_called_once_with(si)
+
+    def test_connection_context_releases_session(self):
+        with self.pool.connection(self.vcenter1, self.logger) as si:
+            pass
+
+        self.assertIs(self.pool.lease(self.vcenter1, self.logger), si)
+        self.assertEqual(self.pv_service.connect.call_count, 1)
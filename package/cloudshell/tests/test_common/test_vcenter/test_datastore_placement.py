@@ -0,0 +1,165 @@
+import unittest
+
+from mock import Mock, MagicMock
+from pyVmomi import vim, vmodl
+
+from cloudshell.cp.vcenter.common.vcenter.datastore_placement import DatastorePlacement, FILL_FIRST, SPREAD, \
+    WEIGHTED
+from cloudshell.cp.vcenter.common.vcenter.vmomi_service import pyVmomiService
+
+GB = 1024 ** 3
+
+
+class TestDatastorePlacement(unittest.TestCase):
+    def setUp(self):
+        self.si = Mock()
+        self.si._stub = Mock()
+        self.si._stub.host = 'vcenter:443'
+        self.pod = vim.StoragePod('group-p1', self.si._stub)
+        self.collector = self.si.content.propertyCollector
+        self.capacity = [('datastore-1', 'ds1', 100 * GB, 'normal', True),
+                         ('datastore-2', 'ds2', 60 * GB, 'normal', True)]
+        self.collector.RetrievePropertiesEx = Mock(side_effect=lambda *args: self._retrieve_result())
+
+    def _retrieve_result(self):
+        objects = []
+        for mo_id, name, free_space, maintenance_mode, accessible in self.capacity:
+            objects.append(vmodl.query.PropertyCollector.ObjectContent(
+                obj=vim.Datastore(mo_id, self.si._stub),
+                propSet=[vmodl.DynamicProperty(name='name', val=name),
+                         vmodl.DynamicProperty(name='summary.freeSpace', val=free_space),
+                         vmodl.DynamicProperty(name='summary.capacity', val=200 * GB),
+                         vmodl.DynamicProperty(name='summary.accessible', val=accessible),
+                         vmodl.DynamicProperty(name='summary.maintenanceMode', val=maintenance_mode)]))
+        return vmodl.query.PropertyCollector.RetrieveResult(objects=objects)
+
+    def _reserve(self, placement, times):
+        return [placement.reserve(self.si, self.pod).datastore._moId for _ in range(times)]
+
+    def test_spread_places_concurrent_clones_on_different_datastores(self):
+        placement = DatastorePlacement(policy=SPREAD, clone_size=10 * GB)
+
+        self.assertEqual(self._reserve(placement, 4), ['datastore-1', 'datastore-2', 'datastore-1', 'datastore-2'])
+
+    def test_fill_first_fills_the_fullest_datastore_that_holds_the_clone(self):
+        placement = DatastorePlacement(policy=FILL_FIRST, clone_size=20 * GB)
+
+        self.assertEqual(self._reserve(placement, 4), ['datastore-2', 'datastore-2', 'datastore-2', 'datastore-1'])
+
+    def test_weighted_accounts_for_free_space_and_in_flight_clones(self):
+        placement = DatastorePlacement(policy=WEIGHTED, clone_size=10 * GB)
+
+        # 100/1 > 60/1, then 90/2 < 60/1, then 90/2 > 50/2
+        self.assertEqual(self._reserve(placement, 3), ['datastore-1', 'datastore-2', 'datastore-1'])
+
+    def test_capacity_is_read_once_per_snapshot_ttl(self):
+        placement = DatastorePlacement()
+        self._reserve(placement, 3)
+        self.assertEqual(self.collector.RetrievePropertiesEx.call_count, 1)
+
+        placement.snapshot_ttl = -1
+        self._reserve(placement, 1)
+
+        self.assertEqual(self.collector.RetrievePropertiesEx.call_count, 2)
+
+    def test_only_the_capacity_of_the_pod_datastores_is_read(self):
+        DatastorePlacement().reserve(self.si, self.pod)
+
+        spec = self.collector.RetrievePropertiesEx.call_args[0][0][0]
+        self.assertEqual(spec.objectSet[0].obj, self.pod)
+        self.assertEqual(spec.objectSet[0].selectSet[0].path, 'childEntity')
+        self.assertEqual(spec.propSet[0].type, vim.Datastore)
+        self.assertIn('summary.freeSpace', spec.propSet[0].pathSet)
+
+    def test_datastores_in_maintenance_or_not_accessible_are_skipped(self):
+        self.capacity = [('datastore-1', 'ds1', 100 * GB, 'inMaintenance', True),
+                         ('datastore-2', 'ds2', 90 * GB, 'normal', False),
+                         ('datastore-3', 'ds3', 10 * GB, 'normal', True)]
+        placement = DatastorePlacement(clone_size=20 * GB)
+
+        # ds3 does not hold the clone but it is the only one that can take it
+        self.assertEqual(self._reserve(placement, 1), ['datastore-3'])
+
+    def test_no_available_datastore_raises(self):
+        self.capacity = [('datastore-1', 'ds1', 100 * GB, 'inMaintenance', True)]
+        self.pod = Mock(spec=vim.StoragePod)
+        self.pod._moId = 'group-p1'
+        self.pod.name = 'pod'
+
+        self.assertRaises(ValueError, DatastorePlacement().reserve, self.si, self.pod)
+
+    def test_release_ends_the_in_flight_clone_and_keeps_its_space_taken(self):
+        placement = DatastorePlacement(policy=FILL_FIRST, clone_size=40 * GB)
+        reservation = placement.reserve(self.si, self.pod)
+        self.assertEqual(placement.in_flight(self.si, reservation.datastore), 1)
+
+        placement.release(reservation)
+
+        self.assertEqual(placement.in_flight(self.si, reservation.datastore), 0)
+        # ds2 has 20GB left after the clone, it no longer holds another one
+        self.assertEqual(self._reserve(placement, 1), ['datastore-1'])
+
+    def test_failed_clone_gives_its_space_back(self):
+        placement = DatastorePlacement(policy=FILL_FIRST, clone_size=40 * GB)
+        reservation = placement.reserve(self.si, self.pod)
+
+        placement.release(reservation, used=False)
+
+        self.assertEqual(self._reserve(placement, 1), ['datastore-2'])
+
+    def test_unknown_policy_raises(self):
+        self.assertRaises(ValueError, DatastorePlacement, policy='random')
+
+    def test_clone_vm_reserves_a_datastore_of_the_pod_for_the_clone(self):
+        placement_service = Mock()
+        reservation = Mock()
+        reservation.datastore = vim.Datastore('datastore-1', self.si._stub)
+        placement_service.reserve = Mock(return_value=reservation)
+        task_waiter = Mock()
+        pv_service = pyVmomiService(Mock(), Mock(), task_waiter, datastore_placement=placement_service)
+        si = MagicMock(spec=vim.ServiceInstance)
+        clone_params = pv_service.CloneVmParameters(si=si, template_name='dc/golden', vm_name='vm',
+                                                    vm_folder='dc', datastore_name='pod')
+        placement = pv_service.ClonePlacement(Mock(), Mock(), Mock(), None,
+                                              vim.ResourcePool('resgroup-1', self.si._stub), None, self.pod)
+
+        pv_service.clone_vm(clone_params, Mock(), Mock(), placement=placement)
+
+        placement_service.reserve.assert_called_once_with(si, self.pod)
+        clone_spec = placement.template.Clone.call_args[1]['spec']
+        self.assertEqual(clone_spec.location.datastore, reservation.datastore)
+        placement_service.release.assert_called_once_with(reservation, used=True)
+
+    def test_clone_vm_holds_the_slots_of_the_reserved_datastore(self):
+        placement_service = Mock()
+        reservation = Mock()
+        reservation.datastore = vim.Datastore('datastore-1', self.si._stub)
+        placement_service.reserve = Mock(return_value=reservation)
+        pv_service = pyVmomiService(Mock(), Mock(), Mock(), datastore_placement=placement_service)
+        clone_params = pv_service.CloneVmParameters(si=MagicMock(spec=vim.ServiceInstance), template_name='dc/golden',
+                                                    vm_name='vm', vm_folder='dc', datastore_name='pod')
+        host = vim.HostSystem('host-1', self.si._stub)
+        placement = pv_service.ClonePlacement(Mock(), Mock(), Mock(), None,
+                                              vim.ResourcePool('resgroup-1', self.si._stub), host, self.pod)
+        hold_slots = MagicMock()
+
+        pv_service.clone_vm(clone_params, Mock(), Mock(), placement=placement, hold_slots=hold_slots)
+
+        hold_slots.assert_called_once_with(reservation.datastore, host)
+        self.assertTrue(hold_slots.return_value.__exit__.called)
+
+    def test_clone_vm_releases_the_reservation_when_the_clone_fails(self):
+        placement_service = Mock()
+        reservation = Mock()
+        reservation.datastore = vim.Datastore('datastore-1', self.si._stub)
+        placement_service.reserve = Mock(return_value=reservation)
+        task_waiter = Mock()
+        task_waiter.wait_for_task = Mock(side_effect=Exception('no space'))
+        pv_service = pyVmomiService(Mock(), Mock(), task_waiter, datastore_placement=placement_service)
+        clone_params = pv_service.CloneVmParameters(si=MagicMock(spec=vim.ServiceInstance), template_name='dc/golden',
+                                                    vm_name='vm', vm_folder='dc', datastore_name='pod')
+        placement = pv_service.ClonePlacement(Mock(), Mock(), Mock(), None,
+                                              vim.ResourcePool('resgroup-1', self.si._stub), None, self.pod)
+
+        self.assertRaises(Exception, pv_service.clone_vm, clone_params, Mock(), Mock(), placement)
+        placement_service.release.assert_called_once_with(reservation, used=False)
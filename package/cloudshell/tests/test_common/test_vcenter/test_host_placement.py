@@ -0,0 +1,223 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import Mock, MagicMock
+from pyVmomi import vim, vmodl
+
+from cloudshell.cp.vcenter.common.vcenter.host_placement import HostPlacement, RecordedHostStats, VCenterHostStats, \
+    simulate_placement
+from cloudshell.cp.vcenter.common.vcenter.vmomi_service import pyVmomiService
+
+RECORDED = {
+    'domain-c7': [
+        {'mo_id': 'host-1', 'name': 'esx1', 'cpu_usage': 2000, 'memory_usage': 8192,
+         'cpu_capacity': 20000, 'memory_capacity': 65536},
+        {'mo_id': 'host-2', 'name': 'esx2', 'cpu_usage': 10000, 'memory_usage': 16384,
+         'cpu_capacity': 20000, 'memory_capacity': 65536},
+        {'mo_id': 'host-3', 'name': 'esx3', 'cpu_usage': 0, 'memory_usage': 0,
+         'cpu_capacity': 20000, 'memory_capacity': 65536, 'in_maintenance': True}
+    ]
+}
+
+
+class TestHostPlacement(unittest.TestCase):
+    def setUp(self):
+        self.stats = RecordedHostStats(RECORDED)
+
+    def test_least_loaded_accounts_for_in_flight_clones(self):
+        # esx1 is at 12.5% memory and goes up by 12.5% with every clone, esx2 is at 50% cpu,
+        # at the same load the host with fewer in-flight clones wins
+        names = simulate_placement(self.stats, 'domain-c7', 5, policy='least-loaded', clone_cpu=0, clone_memory=8192)
+
+        self.assertEqual(names, ['esx1', 'esx1', 'esx1', 'esx2', 'esx2'])
+
+    def test_spread_places_on_the_host_with_fewest_in_flight_clones(self):
+        names = simulate_placement(self.stats, 'domain-c7', 4, policy='spread')
+
+        self.assertEqual(names, ['esx1', 'esx2', 'esx1', 'esx2'])
+
+    def test_pack_fills_the_busiest_host_under_the_max_load(self):
+        names = simulate_placement(self.stats, 'domain-c7', 4, policy='pack', clone_cpu=2000, clone_memory=0)
+
+        # esx2 goes 50%, 60%, 70%, 80%, then it is over the max load
+        self.assertEqual(names, ['esx2', 'esx2', 'esx2', 'esx2'])
+        self.assertEqual(simulate_placement(self.stats, 'domain-c7', 5, policy='pack', clone_cpu=2000,
+                                            clone_memory=0)[-1], 'esx1')
+
+    def test_policy_can_be_a_callable(self):
+        policy = Mock(side_effect=lambda candidates: candidates[-1])
+
+        names = simulate_placement(self.stats, 'domain-c7', 1, policy=policy)
+
+        self.assertEqual(names, ['esx2'])
+        self.assertEqual([c.host.name for c in policy.call_args[0][0]], ['esx1', 'esx2'])
+
+    def test_unknown_policy_raises(self):
+        self.assertRaises(ValueError, HostPlacement, policy='random')
+
+    def test_only_hosts_that_mount_the_datastore_are_chosen(self):
+        recorded = {'domain-c7': [dict(host, datastores=datastores) for host, datastores in
+                                  zip(RECORDED['domain-c7'], [['datastore-1'], ['datastore-1', 'datastore-2'], None])]}
+        placement = HostPlacement(stats_source=RecordedHostStats(recorded))
+        si = Mock()
+        cluster = vim.ClusterComputeResource('domain-c7', si._stub)
+
+        host = placement.reserve(si, cluster, vim.Datastore('datastore-2', si._stub)).host
+
+        self.assertEqual(host._moId, 'host-2')
+        self.assertEqual(placement.reserve(si, cluster).host._moId, 'host-1')
+        self.assertRaises(ValueError, placement.reserve, si, cluster, vim.Datastore('datastore-3', si._stub))
+
+    def test_stats_are_read_once_per_ttl(self):
+        stats_source = Mock(wraps=self.stats)
+        placement = HostPlacement(stats_source=stats_source)
+        si = Mock()
+        si._stub.host = 'vcenter:443'
+        cluster = vim.ClusterComputeResource('domain-c7', si._stub)
+
+        placement.reserve(si, cluster)
+        placement.reserve(si, cluster)
+        self.assertEqual(stats_source.read.call_count, 1)
+
+        placement.stats_ttl = -1
+        placement.reserve(si, cluster)
+        self.assertEqual(stats_source.read.call_count, 2)
+
+    def test_release_ends_the_in_flight_clone(self):
+        placement = HostPlacement(stats_source=self.stats)
+        si = Mock()
+        si._stub.host = 'vcenter:443'
+        reservation = placement.reserve(si, vim.ClusterComputeResource('domain-c7', si._stub))
+        self.assertEqual(placement.in_flight(si, reservation.host), 1)
+
+        placement.release(reservation)
+
+        self.assertEqual(placement.in_flight(si, reservation.host), 0)
+
+    def test_recorded_stats_are_loaded_from_file(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'stats.json')
+            with open(path, 'w') as f:
+                json.dump(RECORDED, f)
+
+            names = simulate_placement(RecordedHostStats.from_file(path), 'domain-c7', 1)
+        finally:
+            shutil.rmtree(directory)
+
+        self.assertEqual(names, ['esx1'])
+
+
+class TestVCenterHostStats(unittest.TestCase):
+    def test_quick_stats_of_the_cluster_hosts_are_read_in_one_call(self):
+        si = Mock()
+        cluster = vim.ClusterComputeResource('domain-c7', si._stub)
+        props = [('name', 'esx1'),
+                 ('summary.quickStats.overallCpuUsage', 1000),
+                 ('summary.quickStats.overallMemoryUsage', 2048),
+                 ('summary.hardware.cpuMhz', 2000),
+                 ('summary.hardware.numCpuCores', 8),
+                 ('summary.hardware.memorySize', 64 * 1024 ** 3),
+                 ('runtime.connectionState', 'connected'),
+                 ('runtime.inMaintenanceMode', False),
+                 ('datastore', vim.Datastore.Array([vim.Datastore('datastore-1', si._stub)]))]
+        si.content.propertyCollector.RetrievePropertiesEx = Mock(
+            return_value=vmodl.query.PropertyCollector.RetrieveResult(objects=[
+                vmodl.query.PropertyCollector.ObjectContent(
+                    obj=vim.HostSystem('host-1', si._stub),
+                    propSet=[vmodl.DynamicProperty(name=name, val=val) for name, val in props])]))
+
+        hosts = VCenterHostStats().read(si, cluster)
+
+        spec = si.content.propertyCollector.RetrievePropertiesEx.call_args[0][0][0]
+        self.assertEqual(spec.objectSet[0].obj, cluster)
+        self.assertEqual(spec.objectSet[0].selectSet[0].path, 'host')
+        self.assertEqual(hosts[0].mo_id, 'host-1')
+        self.assertEqual(hosts[0].cpu_capacity, 16000)
+        self.assertEqual(hosts[0].memory_capacity, 65536)
+        self.assertTrue(hosts[0].available)
+        self.assertEqual(hosts[0].datastores, ['datastore-1'])
+        self.assertIn('datastore', spec.propSet[0].pathSet)
+
+
+class TestCloneHostPlacement(unittest.TestCase):
+    def setUp(self):
+        self.stub = Mock()
+        self.host_placement = Mock()
+        self.reservation = Mock()
+        self.reservation.host = vim.HostSystem('host-1', self.stub)
+        self.host_placement.reserve = Mock(return_value=self.reservation)
+        self.pv_service = pyVmomiService(Mock(), Mock(), Mock(), host_placement=self.host_placement)
+        self.si = MagicMock(spec=vim.ServiceInstance)
+        self.clone_params = self.pv_service.CloneVmParameters(si=self.si, template_name='dc/golden', vm_name='vm',
+                                                              vm_folder='dc', datastore_name='ds')
+        self.cluster = vim.ClusterComputeResource('domain-c7', self.stub)
+
+    def test_clone_vm_places_the_clone_on_a_host_of_the_cluster(self):
+        placement = self.pv_service.ClonePlacement(Mock(), Mock(), Mock(), None,
+                                                   vim.ResourcePool('resgroup-1', self.stub), None,
+                                                   vim.Datastore('datastore-1', self.stub), self.cluster)
+
+        self.pv_service.clone_vm(self.clone_params, Mock(), Mock(), placement=placement)
+
+        self.host_placement.reserve.assert_called_once_with(self.si, self.cluster, placement.datastore)
+        clone_spec = placement.template.Clone.call_args[1]['spec']
+        self.assertEqual(clone_spec.location.host, self.reservation.host)
+        self.host_placement.release.assert_called_once_with(self.reservation)
+
+    def test_host_is_chosen_for_the_datastore_of_the_pod_the_clone_is_placed_on(self):
+        datastore_placement = Mock()
+        datastore_reservation = Mock()
+        datastore_reservation.datastore = vim.Datastore('datastore-2', self.stub)
+        datastore_placement.reserve = Mock(return_value=datastore_reservation)
+        pv_service = pyVmomiService(Mock(), Mock(), Mock(), host_placement=self.host_placement,
+                                    datastore_placement=datastore_placement)
+        placement = pv_service.ClonePlacement(Mock(), Mock(), Mock(), None, vim.ResourcePool('resgroup-1', self.stub),
+                                              None, vim.StoragePod('group-p1', self.stub), self.cluster)
+
+        pv_service.clone_vm(self.clone_params, Mock(), Mock(), placement=placement)
+
+        self.host_placement.reserve.assert_called_once_with(self.si, self.cluster, datastore_reservation.datastore)
+
+    def test_datastore_is_released_when_no_host_mounts_it(self):
+        datastore_placement = Mock()
+        datastore_reservation = Mock()
+        datastore_reservation.datastore = vim.Datastore('datastore-2', self.stub)
+        datastore_placement.reserve = Mock(return_value=datastore_reservation)
+        self.host_placement.reserve = Mock(side_effect=ValueError('no host mounts the datastore'))
+        pv_service = pyVmomiService(Mock(), Mock(), Mock(), host_placement=self.host_placement,
+                                    datastore_placement=datastore_placement)
+        placement = pv_service.ClonePlacement(Mock(), Mock(), Mock(), None, vim.ResourcePool('resgroup-1', self.stub),
+                                              None, vim.StoragePod('group-p1', self.stub), self.cluster)
+
+        self.assertRaises(ValueError, pv_service.clone_vm, self.clone_params, Mock(), Mock(), placement)
+        datastore_placement.release.assert_called_once_with(datastore_reservation, used=False)
+        self.assertFalse(self.host_placement.release.called)
+        self.assertFalse(placement.template.Clone.called)
+
+    def test_configured_host_is_kept(self):
+        host = vim.HostSystem('host-9', self.stub)
+        placement = self.pv_service.ClonePlacement(Mock(), Mock(), Mock(), None,
+                                                   vim.ResourcePool('resgroup-1', self.stub), host,
+                                                   vim.Datastore('datastore-1', self.stub), self.cluster)
+
+        self.pv_service.clone_vm(self.clone_params, Mock(), Mock(), placement=placement)
+
+        self.assertFalse(self.host_placement.reserve.called)
+        self.assertEqual(placement.template.Clone.call_args[1]['spec'].location.host, host)
+
+    def test_placement_holds_the_cluster_of_the_pool(self):
+        pool = Mock()
+        pool.owner = Mock(spec=vim.ClusterComputeResource)
+        self.pv_service.get_datacenter = Mock()
+        self.pv_service._get_destination_folder = Mock()
+        self.pv_service._get_clone_source = Mock(return_value=(Mock(), None))
+        self.pv_service.get_resource_pool = Mock(return_value=(pool, None))
+        self.pv_service._get_datastore = Mock()
+
+        placement = self.pv_service.resolve_clone_placement(self.clone_params)
+
+        self.assertEqual(placement.cluster, pool.owner)
@@ -0,0 +1,178 @@
+import unittest
+
+from mock import Mock
+from pyVmomi import vim, vmodl
+
+from cloudshell.cp.vcenter.common.vcenter.inventory_index import InventoryIndex, VCenterInventory
+from cloudshell.cp.vcenter.common.vcenter.vmomi_service import pyVmomiService
+
+
+def object_content(obj, name, parent):
+    return vmodl.query.PropertyCollector.ObjectContent(
+        obj=obj,
+        propSet=[vmodl.DynamicProperty(name='name', val=name),
+                 vmodl.DynamicProperty(name='parent', val=parent)])
+
+
+class InventoryBuilder(object):
+    def __init__(self):
+        self.root = vim.Folder('group-d1')
+        self.contents = [object_content(self.root, 'Datacenters', None)]
+
+    def add(self, vim_type, mo_id, name, parent):
+        obj = vim_type(mo_id)
+        self.contents.append(object_content(obj, name, parent))
+        return obj
+
+    def create_si(self):
+        si = Mock()
+        si._stub = Mock()
+        si._stub.host = 'vcenter:443'
+        si.content.rootFolder = self.root
+        si.content.propertyCollector.RetrieveContents = Mock(return_value=self.contents)
+        si.content.searchIndex.FindChild = Mock(return_value=None)
+        return si
+
+
+class TestInventoryIndex(unittest.TestCase):
+    def setUp(self):
+        builder = InventoryBuilder()
+        self.dc = builder.add(vim.Datacenter, 'datacenter-2', 'DC0', builder.root)
+        self.vm_folder = builder.add(vim.Folder, 'group-v3', 'vm', self.dc)
+        self.host_folder = builder.add(vim.Folder, 'group-h4', 'host', self.dc)
+        self.network_folder = builder.add(vim.Folder, 'group-n5', 'network', self.dc)
+        self.raz_test = builder.add(vim.Folder, 'group-v10', 'raz_test', self.vm_folder)
+        self.raztest2 = builder.add(vim.Folder, 'group-v11', 'raztest2', self.raz_test)
+        self.final = builder.add(vim.Folder, 'group-v12', 'final', self.raztest2)
+        self.vm = builder.add(vim.VirtualMachine, 'vm-20', 'DC0_C0_RP0_VM0', self.final)
+        self.dvs = builder.add(vim.dvs.VmwareDistributedVirtualSwitch, 'dvs-30', 'dvSwitch', self.network_folder)
+        self.cluster = builder.add(vim.ClusterComputeResource, 'domain-c40', 'Cluster', self.host_folder)
+        self.pool = builder.add(vim.ResourcePool, 'resgroup-41', 'Resources', self.cluster)
+        self.child_pool = builder.add(vim.ResourcePool, 'resgroup-42', 'Pool', self.pool)
+        self.builder = builder
+        self.si = builder.create_si()
+        self.inventory = VCenterInventory()
+
+    @staticmethod
+    def _deleted(deleted):
+        def invoke_accessor(obj, info):
+            if obj._moId == deleted._moId:
+                raise vmodl.fault.ManagedObjectNotFound(obj=deleted)
+            return Mock()
+        return invoke_accessor
+
+    def test_get_folder_resolves_deep_path_from_index(self):
+        pv_service = pyVmomiService(None, None, Mock(), inventory=self.inventory)
+
+        result = pv_service.get_folder(self.si, 'DC0/raz_test/raztest2/final')
+
+        self.assertEqual(result, self.final)
+        self.assertEqual(result._stub, self.si._stub)
+        self.assertFalse(self.si.content.searchIndex.FindChild.called)
+
+    def test_index_is_loaded_once(self):
+        pv_service = pyVmomiService(None, None, Mock(), inventory=self.inventory)
+
+        pv_service.get_folder(self.si, 'DC0/raz_test')
+        pv_service.get_folder(self.si, 'DC0/raz_test/raztest2')
+        pv_service.find_dvs_by_path(self.si, 'DC0/dvSwitch')
+
+        self.assertEqual(self.si.content.propertyCollector.RetrieveContents.call_count, 1)
+
+    def test_find_vm_by_name(self):
+        pv_service = pyVmomiService(None, None, Mock(), inventory=self.inventory)
+
+        result = pv_service.find_vm_by_name(self.si, 'DC0/raz_test/raztest2/final', 'DC0_C0_RP0_VM0')
+
+        self.assertEqual(result, self.vm)
+        self.assertFalse(self.si.content.searchIndex.FindChild.called)
+
+    def test_find_vm_by_name_in_datacenter_looks_in_vm_folder(self):
+        vm = self.builder.add(vim.VirtualMachine, 'vm-21', 'root_vm', self.vm_folder)
+        si = self.builder.create_si()
+        pv_service = pyVmomiService(None, None, Mock(), inventory=self.inventory)
+
+        result = pv_service.find_vm_by_name(si, 'DC0', 'root_vm')
+
+        self.assertEqual(result, vm)
+
+    def test_find_dvs_by_path(self):
+        pv_service = pyVmomiService(None, None, Mock(), inventory=self.inventory)
+
+        result = pv_service.find_dvs_by_path(self.si, 'DC0/dvSwitch')
+
+        self.assertEqual(result, self.dvs)
+        self.assertIsInstance(result, vim.dvs.VmwareDistributedVirtualSwitch)
+
+    def test_resolves_resource_pool_through_cluster(self):
+        index = VCenterInventory.load_index(self.si)
+
+        self.assertEqual(index.resolve('DC0/Cluster/Pool').mo_id, 'resgroup-42')
+        self.assertEqual(index.resolve('DC0/Cluster/Resources/Pool').mo_id, 'resgroup-42')
+
+    def test_index_miss_falls_back_to_search_index(self):
+        pv_service = pyVmomiService(None, None, Mock(), inventory=self.inventory)
+        new_folder = Mock()
+        self.si.content.searchIndex.FindChild = Mock(return_value=new_folder)
+
+        result = pv_service.get_folder(self.si, 'new_folder')
+
+        self.assertEqual(result, new_folder)
+        self.assertTrue(self.si.content.searchIndex.FindChild.called)
+
+        # the index is reloaded on the next lookup
+        pv_service.get_folder(self.si, 'DC0')
+        self.assertEqual(self.si.content.propertyCollector.RetrieveContents.call_count, 2)
+
+    def test_expired_index_is_reloaded(self):
+        inventory = VCenterInventory(max_age=0)
+
+        inventory.find_by_path(self.si, 'DC0')
+        inventory.find_by_path(self.si, 'DC0')
+
+        self.assertEqual(self.si.content.propertyCollector.RetrieveContents.call_count, 2)
+
+    def test_child_added_before_parent_is_linked(self):
+        index = InventoryIndex('group-d1')
+        index.add('group-v2', vim.Folder, 'child', 'datacenter-1')
+        index.add('datacenter-1', vim.Datacenter, 'DC', 'group-d1')
+        index.add('group-d1', vim.Folder, 'Datacenters', None)
+
+        self.assertEqual(index.resolve('DC/child').mo_id, 'group-v2')
+
+    def test_rename_and_remove(self):
+        index = VCenterInventory.load_index(self.si)
+
+        index.add('group-v10', vim.Folder, 'renamed', 'group-v3')
+        self.assertIsNone(index.resolve('DC0/raz_test/raztest2'))
+        self.assertEqual(index.resolve('DC0/renamed/raztest2').mo_id, 'group-v11')
+
+        index.remove('group-v11')
+        self.assertIsNone(index.resolve('DC0/renamed/raztest2'))
+
+    def test_deleted_object_is_evicted_and_found_through_search_index(self):
+        pv_service = pyVmomiService(None, None, Mock(), inventory=self.inventory)
+        pv_service.find_vm_by_name(self.si, 'DC0/raz_test/raztest2/final', 'DC0_C0_RP0_VM0')
+        self.si._stub.InvokeAccessor = Mock(side_effect=self._deleted(self.vm))
+
+        result = pv_service.find_vm_by_name(self.si, 'DC0/raz_test/raztest2/final', 'DC0_C0_RP0_VM0')
+
+        self.assertIsNone(result)
+        self.assertTrue(self.si.content.searchIndex.FindChild.called)
+        index = self.inventory.get_index(self.si)
+        self.assertIsNone(index.get('vm-20'))
+        self.assertEqual(self.si.content.propertyCollector.RetrieveContents.call_count, 1)
+
+    def test_deleted_object_is_evicted_from_live_index(self):
+        inventory = VCenterInventory(live_updates=True)
+        updater = Mock()
+        updater.index = VCenterInventory.load_index(self.si)
+        updater.is_fresh = Mock(return_value=True)
+        inventory._updaters[VCenterInventory.get_vcenter_key(self.si)] = updater
+        self.si._stub.InvokeAccessor = Mock(side_effect=self._deleted(self.final))
+
+        result = inventory.find_by_path(self.si, 'DC0/raz_test/raztest2/final')
+
+        self.assertIsNone(result)
+        self.assertIsNone(updater.index.get('group-v12'))
+        self.assertIsNone(updater.index.resolve('DC0/raz_test/raztest2/final'))
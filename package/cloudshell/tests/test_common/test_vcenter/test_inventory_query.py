@@ -0,0 +1,117 @@
+import unittest
+
+from mock import Mock
+from pyVmomi import vim, vmodl
+
+from cloudshell.cp.vcenter.common.vcenter.model_auto_discovery import VCenterAutoModelDiscovery
+from cloudshell.cp.vcenter.common.vcenter.vmomi_service import pyVmomiService
+
+
+def object_content(obj, name, parent, **props):
+    prop_set = [vmodl.DynamicProperty(name='name', val=name), vmodl.DynamicProperty(name='parent', val=parent)]
+    prop_set.extend(vmodl.DynamicProperty(name=path.replace('_', '.'), val=val) for path, val in props.items())
+    return vmodl.query.PropertyCollector.ObjectContent(obj=obj, propSet=prop_set)
+
+
+class TestGetPowerStates(unittest.TestCase):
+    def test_power_states_are_read_with_one_call(self):
+        stub = Mock()
+        si = Mock()
+        vms = [vim.VirtualMachine('vm-1', stub), vim.VirtualMachine('vm-2', stub), vim.VirtualMachine('vm-3', stub)]
+        result = vmodl.query.PropertyCollector.RetrieveResult(objects=[
+            vmodl.query.PropertyCollector.ObjectContent(
+                obj=vm, propSet=[vmodl.DynamicProperty(name='summary.runtime.powerState', val=state)])
+            for vm, state in zip(vms, ['poweredOn', 'poweredOff'])])
+        si.content.propertyCollector.RetrievePropertiesEx = Mock(return_value=result)
+
+        power_states = pyVmomiService.get_power_states(si, vms)
+
+        self.assertEqual(power_states, {'vm-1': 'poweredOn', 'vm-2': 'poweredOff'})
+        spec = si.content.propertyCollector.RetrievePropertiesEx.call_args[0][0][0]
+        self.assertEqual(len(spec.objectSet), 3)
+        self.assertEqual(pyVmomiService.get_power_states(si, []), dict())
+        self.assertEqual(si.content.propertyCollector.RetrievePropertiesEx.call_count, 1)
+
+
+class TestQueryInventory(unittest.TestCase):
+    def setUp(self):
+        self.stub = Mock()
+        self.si = Mock()
+        self.si.content.rootFolder = vim.Folder('group-d1', self.stub)
+        self.view = Mock(spec=vim.view.ContainerView)
+        self.si.content.viewManager.CreateContainerView = Mock(return_value=self.view)
+        self.collector = self.si.content.propertyCollector
+        self.folder = vim.Folder('group-s1', self.stub)
+        self.first_page = vmodl.query.PropertyCollector.RetrieveResult(
+            token='page-2',
+            objects=[object_content(vim.Datastore('datastore-1', self.stub), 'ds1', self.folder,
+                                    summary_freeSpace=10)])
+        self.last_page = vmodl.query.PropertyCollector.RetrieveResult(
+            objects=[object_content(vim.StoragePod('group-p1', self.stub), 'pod1', self.folder,
+                                    summary_freeSpace=20)])
+        self.collector.RetrievePropertiesEx = Mock(return_value=self.first_page)
+        self.collector.ContinueRetrievePropertiesEx = Mock(return_value=self.last_page)
+        self.pv_service = pyVmomiService(Mock(), Mock(), Mock())
+
+    def test_all_pages_are_read(self):
+        records = list(self.pv_service.query_inventory(self.si, [vim.Datastore, vim.StoragePod],
+                                                       properties=['summary.freeSpace'], page_size=1))
+
+        self.assertEqual([r.name for r in records], ['ds1', 'pod1'])
+        self.collector.ContinueRetrievePropertiesEx.assert_called_once_with('page-2')
+        self.assertEqual(self.collector.RetrievePropertiesEx.call_args[0][1].maxObjects, 1)
+        self.assertFalse(self.collector.CancelRetrievePropertiesEx.called)
+        self.view.DestroyView.assert_called_once_with()
+
+    def test_only_the_requested_properties_of_the_types_are_read(self):
+        list(self.pv_service.query_inventory(self.si, [vim.Datastore, vim.StoragePod],
+                                             properties=['summary.freeSpace', 'name']))
+
+        spec = self.collector.RetrievePropertiesEx.call_args[0][0][0]
+        self.assertEqual([p.type for p in spec.propSet], [vim.Datastore, vim.StoragePod])
+        self.assertEqual(spec.propSet[0].pathSet, ['name', 'parent', 'summary.freeSpace'])
+        self.assertFalse(spec.propSet[0].all)
+        self.assertEqual(spec.objectSet[0].obj, self.view)
+        self.si.content.viewManager.CreateContainerView.assert_called_once_with(
+            self.si.content.rootFolder, [vim.Datastore, vim.StoragePod], True)
+
+    def test_search_starts_at_the_given_root(self):
+        dc = vim.Datacenter('datacenter-1', self.stub)
+
+        list(self.pv_service.query_inventory(self.si, [vim.Datastore], root=dc))
+
+        self.si.content.viewManager.CreateContainerView.assert_called_once_with(dc, [vim.Datastore], True)
+
+    def test_record_holds_the_object_and_its_properties(self):
+        record = next(self.pv_service.query_inventory(self.si, [vim.Datastore], properties=['summary.freeSpace']))
+
+        self.assertEqual(record.obj, vim.Datastore('datastore-1', self.stub))
+        self.assertIs(record.mo_type, vim.Datastore)
+        self.assertEqual(record.parent, self.folder)
+        self.assertEqual(record.props, {'summary.freeSpace': 10})
+
+    def test_stopping_early_cancels_the_query_and_destroys_the_view(self):
+        records = self.pv_service.query_inventory(self.si, [vim.Datastore])
+        next(records)
+
+        records.close()
+
+        self.collector.CancelRetrievePropertiesEx.assert_called_once_with('page-2')
+        self.assertFalse(self.collector.ContinueRetrievePropertiesEx.called)
+        self.view.DestroyView.assert_called_once_with()
+
+    def test_view_is_destroyed_when_the_query_fails(self):
+        self.collector.RetrievePropertiesEx = Mock(side_effect=vmodl.fault.ManagedObjectNotFound())
+
+        self.assertRaises(vmodl.fault.ManagedObjectNotFound, list,
+                          self.pv_service.query_inventory(self.si, [vim.Datastore]))
+        self.view.DestroyView.assert_called_once_with()
+
+    def test_auto_discovery_default_is_found_by_record_type(self):
+        records = [pyVmomiService.InventoryRecord(vim.HostSystem('host-1', self.stub), 'host1', self.folder, {}),
+                   pyVmomiService.InventoryRecord(vim.Datastore('datastore-1', self.stub), 'ds1', self.folder, {})]
+
+        default = VCenterAutoModelDiscovery._get_default_from_vc_by_type_and_name(
+            records, (vim.Datastore, vim.StoragePod))
+
+        self.assertEqual(default.name, 'ds1')
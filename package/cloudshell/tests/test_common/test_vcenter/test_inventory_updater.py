@@ -0,0 +1,168 @@
+import time
+import unittest
+from threading import Event
+
+from mock import Mock
+from pyVmomi import vim, vmodl
+
+from cloudshell.cp.vcenter.common.vcenter.inventory_index import InventoryUpdater, VCenterInventory
+from cloudshell.cp.vcenter.common.vcenter.vmomi_service import pyVmomiService
+
+
+def object_update(obj, kind='enter', **changes):
+    return vmodl.query.PropertyCollector.ObjectUpdate(
+        obj=obj,
+        kind=kind,
+        changeSet=[vmodl.query.PropertyCollector.Change(name=name, op='assign', val=val)
+                   for name, val in changes.items()])
+
+
+class FakePropertyCollector(object):
+    """
+    Returns the scripted update sets one WaitForUpdatesEx call at a time
+    """
+
+    def __init__(self):
+        self.update_sets = []
+        self.scripted = 0
+        self.versions = []
+        self.cancelled = Event()
+        self.destroyed = False
+
+    def script(self, object_updates, truncated=False):
+        self.scripted += 1
+        version = str(self.scripted)
+        self.update_sets.append(vmodl.query.PropertyCollector.UpdateSet(
+            version=version,
+            truncated=truncated,
+            filterSet=[vmodl.query.PropertyCollector.FilterUpdate(objectSet=object_updates)]))
+
+    def CreatePropertyCollector(self):
+        return self
+
+    def CreateFilter(self, spec, partialUpdates):
+        self.spec = spec
+
+    def WaitForUpdatesEx(self, version, options):
+        self.versions.append(version)
+        if self.update_sets:
+            return self.update_sets.pop(0)
+        if options.maxWaitSeconds:
+            self.cancelled.wait(0.01)
+        return None
+
+    def CancelWaitForUpdates(self):
+        self.cancelled.set()
+
+    def DestroyPropertyCollector(self):
+        self.destroyed = True
+
+
+class TestInventoryUpdater(unittest.TestCase):
+    def setUp(self):
+        self.root = vim.Folder('group-d1')
+        self.dc = vim.Datacenter('datacenter-2')
+        self.vm_folder = vim.Folder('group-v3')
+        self.network_folder = vim.Folder('group-n5')
+        self.collector = FakePropertyCollector()
+        self.collector.script([object_update(self.root, name='Datacenters', parent=None),
+                               object_update(self.dc, name='DC0', parent=self.root)], truncated=True)
+        self.collector.script([object_update(self.vm_folder, name='vm', parent=self.dc),
+                               object_update(self.network_folder, name='network', parent=self.dc)])
+
+        self.si = Mock()
+        self.si._stub = Mock()
+        self.si._stub.host = 'vcenter:443'
+        self.si.content.rootFolder = self.root
+        self.si.content.propertyCollector = self.collector
+        self.si.content.searchIndex.FindChild = Mock(return_value=None)
+
+    def test_sync_loads_truncated_update_sets(self):
+        updater = InventoryUpdater(self.si)
+
+        updater.sync()
+
+        self.assertEqual(updater.index.resolve('DC0/vm').mo_id, 'group-v3')
+        self.assertEqual(updater.version, '2')
+        self.assertEqual(self.collector.versions, ['', '1'])
+
+    def test_poll_applies_create_rename_and_delete(self):
+        updater = InventoryUpdater(self.si)
+        updater.sync()
+        folder = vim.Folder('group-v10')
+        dv_port_group = vim.dvs.DistributedVirtualPortgroup('dvportgroup-20')
+
+        self.collector.script([object_update(folder, name='raz_test', parent=self.vm_folder),
+                               object_update(dv_port_group, name='VM Network', parent=self.network_folder)])
+        updater.poll()
+        self.assertEqual(updater.index.resolve('DC0/raz_test').mo_id, 'group-v10')
+        self.assertEqual(updater.index.find_child('DC0', 'VM Network', 'networkFolder').mo_id, 'dvportgroup-20')
+
+        version = updater.index.version
+        self.collector.script([object_update(folder, kind='modify', name='renamed')])
+        updater.poll()
+        self.assertIsNone(updater.index.resolve('DC0/raz_test'))
+        self.assertEqual(updater.index.resolve('DC0/renamed').mo_id, 'group-v10')
+        self.assertGreater(updater.index.version, version)
+
+        self.collector.script([object_update(dv_port_group, kind='leave')])
+        updater.poll()
+        self.assertIsNone(updater.index.find_child('DC0', 'VM Network', 'networkFolder'))
+        self.assertEqual(updater.version, '5')
+
+    def test_background_thread_applies_updates(self):
+        updater = InventoryUpdater(self.si, max_wait_seconds=1)
+        updater.start()
+        try:
+            self.collector.script([object_update(vim.Folder('group-v10'), name='raz_test', parent=self.vm_folder)])
+            deadline = time.time() + 5
+            while updater.index.get('group-v10') is None and time.time() < deadline:
+                time.sleep(0.01)
+
+            self.assertTrue(updater.is_fresh())
+            self.assertEqual(updater.index.resolve('DC0/raz_test').mo_id, 'group-v10')
+        finally:
+            updater.stop()
+        self.assertTrue(self.collector.destroyed)
+
+    def test_inventory_uses_live_index_without_rescan(self):
+        inventory = VCenterInventory(live_updates=True, max_wait_seconds=1)
+        pv_service = pyVmomiService(None, None, Mock(), inventory=inventory)
+        try:
+            self.assertEqual(pv_service.get_folder(self.si, 'DC0/vm'), self.vm_folder)
+            pv_service.get_folder(self.si, 'DC0/network')
+
+            self.assertEqual(len(inventory._updaters), 1)
+            self.assertFalse(self.si.content.searchIndex.FindChild.called)
+        finally:
+            inventory.stop()
+
+    def test_lagging_updater_falls_back_to_direct_lookup(self):
+        inventory = VCenterInventory(live_updates=True)
+        updater = Mock()
+        updater.is_fresh.return_value = False
+        updater.is_alive.return_value = True
+        inventory._updaters['vcenter:443'] = updater
+        folder = Mock()
+        self.si.content.searchIndex.FindChild = Mock(return_value=folder)
+        pv_service = pyVmomiService(None, None, Mock(), inventory=inventory)
+
+        result = pv_service.get_folder(self.si, 'DC0')
+
+        self.assertEqual(result, folder)
+        self.assertFalse(updater.stop.called)
+
+    def test_failed_updater_is_restarted(self):
+        inventory = VCenterInventory(live_updates=True, max_wait_seconds=1)
+        failed = Mock()
+        failed.is_fresh.return_value = False
+        failed.is_alive.return_value = False
+        inventory._updaters['vcenter:443'] = failed
+        try:
+            result = inventory.find_by_path(self.si, 'DC0')
+
+            self.assertEqual(result, self.dc)
+            self.assertTrue(failed.stop.called)
+            self.assertIsInstance(inventory._updaters['vcenter:443'], InventoryUpdater)
+        finally:
+            inventory.stop()
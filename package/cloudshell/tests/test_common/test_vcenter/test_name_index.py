@@ -0,0 +1,121 @@
+import unittest
+
+from mock import Mock, patch
+from pyVmomi import vim, vmodl
+
+from cloudshell.cp.vcenter.common.vcenter.name_index import VCenterNameIndex
+from cloudshell.cp.vcenter.common.vcenter.vmomi_service import pyVmomiService
+
+
+def object_content(obj, name):
+    return vmodl.query.PropertyCollector.ObjectContent(obj=obj, propSet=[vmodl.DynamicProperty(name='name', val=name)])
+
+
+class TestVCenterNameIndex(unittest.TestCase):
+    def setUp(self):
+        self.stub = Mock()
+        self.stub.host = 'vcenter:443'
+        self.content = Mock()
+        self.content.rootFolder = vim.Folder('group-d1', self.stub)
+        self.view = Mock(spec=vim.view.ContainerView)
+        self.content.viewManager.CreateContainerView = Mock(return_value=self.view)
+        self.datastores = [object_content(vim.Datastore('datastore-1', self.stub), 'ds1'),
+                           object_content(vim.Datastore('datastore-2', self.stub), 'ds2')]
+        self.content.propertyCollector.RetrieveContents = Mock(return_value=self.datastores)
+        self.index = VCenterNameIndex()
+
+    def test_names_of_a_type_are_loaded_once(self):
+        first = self.index.find(self.content, vim.Datastore, 'ds2')
+        second = self.index.find(self.content, vim.Datastore, 'ds1')
+
+        self.assertEqual(first, vim.Datastore('datastore-2', self.stub))
+        self.assertEqual(second, vim.Datastore('datastore-1', self.stub))
+        self.assertEqual(self.content.propertyCollector.RetrieveContents.call_count, 1)
+        self.content.viewManager.CreateContainerView.assert_called_once_with(self.content.rootFolder,
+                                                                              [vim.Datastore], True)
+        self.view.DestroyView.assert_called_once_with()
+
+    def test_only_the_name_is_retrieved(self):
+        self.index.find(self.content, vim.Datastore, 'ds1')
+
+        spec = self.content.propertyCollector.RetrieveContents.call_args[0][0][0]
+        self.assertEqual(spec.propSet[0].type, vim.Datastore)
+        self.assertEqual(spec.propSet[0].pathSet, ['name'])
+        self.assertEqual(spec.objectSet[0].obj, self.view)
+
+    def test_view_is_destroyed_when_retrieve_fails(self):
+        self.content.propertyCollector.RetrieveContents = Mock(side_effect=vmodl.fault.ManagedObjectNotFound())
+
+        self.assertRaises(vmodl.fault.ManagedObjectNotFound, self.index.find, self.content, vim.Datastore, 'ds1')
+        self.view.DestroyView.assert_called_once_with()
+
+    def test_no_name_returns_first_object(self):
+        self.assertEqual(self.index.find(self.content, vim.Datastore, None), vim.Datastore('datastore-1', self.stub))
+
+    def test_keeps_the_type_of_the_object(self):
+        self.content.propertyCollector.RetrieveContents = Mock(
+            return_value=[object_content(vim.VirtualApp('resgroup-v1', self.stub), 'vapp')])
+
+        obj = self.index.find(self.content, vim.ResourcePool, 'vapp')
+
+        self.assertIsInstance(obj, vim.VirtualApp)
+
+    @patch('cloudshell.cp.vcenter.common.vcenter.name_index.time')
+    def test_missing_name_reloads_at_most_once_per_interval(self, time_module):
+        time_module.time.return_value = 100
+        self.index.find(self.content, vim.Datastore, 'ds1')
+        self.assertIsNone(self.index.find(self.content, vim.Datastore, 'new'))
+        self.assertEqual(self.content.propertyCollector.RetrieveContents.call_count, 1)
+
+        time_module.time.return_value = 110
+        self.datastores.append(object_content(vim.Datastore('datastore-3', self.stub), 'new'))
+        obj = self.index.find(self.content, vim.Datastore, 'new')
+
+        self.assertEqual(obj, vim.Datastore('datastore-3', self.stub))
+        self.assertEqual(self.content.propertyCollector.RetrieveContents.call_count, 2)
+
+    @patch('cloudshell.cp.vcenter.common.vcenter.name_index.time')
+    def test_name_missing_after_a_reload_does_not_reload_again(self, time_module):
+        self.index.max_age = 1000
+        time_module.time.return_value = 100
+        self.index.find(self.content, vim.Datastore, 'ds1')
+        time_module.time.return_value = 110
+        self.assertIsNone(self.index.find(self.content, vim.Datastore, 'other'))
+        self.assertEqual(self.content.propertyCollector.RetrieveContents.call_count, 2)
+
+        time_module.time.return_value = 120
+        self.assertIsNone(self.index.find(self.content, vim.Datastore, 'other'))
+        self.assertEqual(self.content.propertyCollector.RetrieveContents.call_count, 2)
+
+        time_module.time.return_value = 110 + self.index.miss_ttl
+        self.index.find(self.content, vim.Datastore, 'other')
+        self.assertEqual(self.content.propertyCollector.RetrieveContents.call_count, 3)
+
+    @patch('cloudshell.cp.vcenter.common.vcenter.name_index.time')
+    def test_names_are_reloaded_after_max_age(self, time_module):
+        time_module.time.return_value = 100
+        self.index.find(self.content, vim.Datastore, 'ds1')
+        time_module.time.return_value = 100 + self.index.max_age
+
+        self.index.find(self.content, vim.Datastore, 'ds1')
+
+        self.assertEqual(self.content.propertyCollector.RetrieveContents.call_count, 2)
+
+    def test_get_obj_uses_name_index(self):
+        pv_service = pyVmomiService(Mock(), Mock(), Mock(), name_index=self.index)
+
+        obj = pv_service.get_obj(self.content, [[vim.Datastore]], 'ds2')
+
+        self.assertEqual(obj, vim.Datastore('datastore-2', self.stub))
+        self.assertFalse(self.view.view.called)
+
+    def test_get_obj_without_index_destroys_the_view(self):
+        pv_service = pyVmomiService(Mock(), Mock(), Mock())
+        datastore = Mock()
+        datastore.name = 'ds1'
+        self.view.view = [datastore]
+
+        obj = pv_service.get_obj(self.content, [[vim.Datastore]], 'ds1')
+
+        self.assertEqual(obj, datastore)
+        self.view.DestroyView.assert_called_once_with()
@@ -0,0 +1,132 @@
+import unittest
+
+from mock import Mock, MagicMock
+from pyVmomi import vim, vmodl
+
+from cloudshell.cp.vcenter.common.vcenter.portgroup_index import DvPortGroupIndex
+from cloudshell.cp.vcenter.common.vcenter.vmomi_service import pyVmomiService
+
+
+class TestDvPortGroupIndex(unittest.TestCase):
+    def setUp(self):
+        self.si = Mock()
+        self.si._stub.host = 'vcenter:443'
+        self.dv_switch = vim.VmwareDistributedVirtualSwitch('dvs-1', self.si._stub)
+        self.collector = Mock()
+        self.si.content.propertyCollector.CreatePropertyCollector = Mock(return_value=self.collector)
+        self.updates = [self._update_set('1', [self._enter('dvportgroup-%d' % i, 'QS_%d' % i) for i in range(1000)])]
+        self.collector.WaitForUpdatesEx = Mock(side_effect=lambda *args: self.updates.pop(0) if self.updates else None)
+
+    @staticmethod
+    def _update_set(version, object_updates, truncated=False):
+        filter_update = vmodl.query.PropertyCollector.FilterUpdate(objectSet=object_updates)
+        return vmodl.query.PropertyCollector.UpdateSet(version=version, filterSet=[filter_update], truncated=truncated)
+
+    def _enter(self, mo_id, name, kind='enter'):
+        return vmodl.query.PropertyCollector.ObjectUpdate(
+            kind=kind,
+            obj=vim.dvs.DistributedVirtualPortgroup(mo_id, self.si._stub),
+            changeSet=[vmodl.query.PropertyCollector.Change(name='name', op='assign', val=name)])
+
+    def _leave(self, mo_id):
+        return vmodl.query.PropertyCollector.ObjectUpdate(
+            kind='leave', obj=vim.dvs.DistributedVirtualPortgroup(mo_id, self.si._stub), changeSet=[])
+
+    def test_port_groups_are_indexed_with_one_projected_retrieval(self):
+        index = DvPortGroupIndex()
+
+        port_group = index.find(self.si, self.dv_switch, 'QS_500')
+
+        self.assertEqual(port_group._moId, 'dvportgroup-500')
+        self.assertEqual(self.collector.WaitForUpdatesEx.call_count, 1)
+        spec = self.collector.CreateFilter.call_args[0][0]
+        self.assertEqual(spec.objectSet[0].obj, self.dv_switch)
+        self.assertEqual(spec.objectSet[0].selectSet[0].path, 'portgroup')
+        self.assertEqual(spec.propSet[0].pathSet, ['name'])
+
+        index.find(self.si, self.dv_switch, 'QS_7')
+        self.assertEqual(self.collector.WaitForUpdatesEx.call_count, 1)
+
+    def test_truncated_update_sets_are_read_to_the_end(self):
+        self.updates = [self._update_set('1', [self._enter('dvportgroup-1', 'QS_1')], truncated=True),
+                        self._update_set('2', [self._enter('dvportgroup-2', 'QS_2')])]
+
+        port_group = DvPortGroupIndex().find(self.si, self.dv_switch, 'QS_2')
+
+        self.assertEqual(port_group._moId, 'dvportgroup-2')
+        self.assertEqual(self.collector.WaitForUpdatesEx.call_args[0][0], '1')
+
+    def test_name_not_found_reads_the_changes_made_outside_the_driver(self):
+        index = DvPortGroupIndex()
+        index.find(self.si, self.dv_switch, 'QS_1')
+        self.updates = [self._update_set('2', [self._enter('dvportgroup-new', 'QS_new'), self._leave('dvportgroup-1'),
+                                               self._enter('dvportgroup-2', 'QS_renamed', kind='modify')])]
+
+        self.assertEqual(index.find(self.si, self.dv_switch, 'QS_new')._moId, 'dvportgroup-new')
+        self.assertEqual(self.collector.WaitForUpdatesEx.call_args[0][0], '1')
+        self.assertIsNone(index.find(self.si, self.dv_switch, 'QS_1'))
+        self.assertIsNone(index.find(self.si, self.dv_switch, 'QS_2'))
+        self.assertEqual(index.find(self.si, self.dv_switch, 'QS_renamed')._moId, 'dvportgroup-2')
+
+    def test_found_name_reads_the_changes_once_the_poll_interval_passed(self):
+        index = DvPortGroupIndex()
+        index.find(self.si, self.dv_switch, 'QS_1')
+        self.updates = [self._update_set('2', [self._leave('dvportgroup-1')])]
+
+        self.assertIsNotNone(index.find(self.si, self.dv_switch, 'QS_1'))
+
+        index.poll_interval = -1
+        self.assertIsNone(index.find(self.si, self.dv_switch, 'QS_1'))
+
+    def test_port_groups_of_the_driver_are_added_and_removed_without_the_vcenter(self):
+        index = DvPortGroupIndex()
+        index.find(self.si, self.dv_switch, 'QS_1')
+        calls = self.collector.WaitForUpdatesEx.call_count
+        created = vim.dvs.DistributedVirtualPortgroup('dvportgroup-created', self.si._stub)
+
+        index.add(self.dv_switch, 'QS_created', created)
+        self.assertEqual(index.find(self.si, self.dv_switch, 'QS_created'), created)
+
+        index.remove(vim.dvs.DistributedVirtualPortgroup('dvportgroup-1', self.si._stub))
+        self.assertEqual(self.collector.WaitForUpdatesEx.call_count, calls)
+        self.assertIsNone(index.find(self.si, self.dv_switch, 'QS_1'))
+
+    def test_switch_is_loaded_again_when_its_collector_fails(self):
+        index = DvPortGroupIndex()
+        index.find(self.si, self.dv_switch, 'QS_1')
+        broken = self.collector
+        broken.WaitForUpdatesEx = Mock(side_effect=vim.fault.NotAuthenticated())
+        self.collector = Mock()
+        self.si.content.propertyCollector.CreatePropertyCollector = Mock(return_value=self.collector)
+        self.updates = [self._update_set('1', [self._enter('dvportgroup-9', 'QS_reloaded')])]
+        self.collector.WaitForUpdatesEx = Mock(side_effect=lambda *args: self.updates.pop(0) if self.updates else None)
+
+        self.assertEqual(index.find(self.si, self.dv_switch, 'QS_reloaded')._moId, 'dvportgroup-9')
+        self.assertTrue(broken.DestroyPropertyCollector.called)
+
+
+class TestFindPortgroup(unittest.TestCase):
+    def test_find_portgroup_uses_the_index_of_the_dv_switch(self):
+        si = MagicMock()
+        dv_switch = vim.VmwareDistributedVirtualSwitch('dvs-1', Mock())
+        port_group = Mock()
+        portgroup_index = Mock()
+        portgroup_index.find = Mock(return_value=port_group)
+        pv_service = pyVmomiService(Mock(), Mock(), Mock(), portgroup_index=portgroup_index)
+        pv_service.get_folder = Mock(return_value=dv_switch)
+
+        result = pv_service.find_portgroup(si, 'dc/dvs', 'QS_1')
+
+        self.assertEqual(result, port_group)
+        portgroup_index.find.assert_called_once_with(si, dv_switch, 'QS_1')
+
+    def test_created_port_group_is_added_to_the_index(self):
+        dv_switch = vim.VmwareDistributedVirtualSwitch('dvs-1', Mock())
+        portgroup_index = Mock()
+        pv_service = pyVmomiService(Mock(), Mock(), Mock(), portgroup_index=portgroup_index)
+        pv_service.get_folder = Mock(return_value=dv_switch)
+        port_group = Mock()
+
+        pv_service.add_portgroup_to_index(Mock(), 'dc/dvs', 'QS_1', port_group)
+
+        portgroup_index.add.assert_called_once_with(dv_switch, 'QS_1', port_group)
@@ -0,0 +1,207 @@
+import time
+import unittest
+from threading import Event, Thread
+
+from mock import Mock, PropertyMock, patch
+from pyVmomi import vim, vmodl
+
+from cloudshell.cp.vcenter.common.vcenter.task_completion_engine import TaskCompletionEngine, TaskWatcher
+from cloudshell.cp.vcenter.common.vcenter.task_waiter import SynchronousTaskWaiter
+from cloudshell.cp.vcenter.exceptions.task_waiter import TaskFaultException
+
+
+def state_update(task, state):
+    return vmodl.query.PropertyCollector.UpdateSet(
+        version='1',
+        filterSet=[vmodl.query.PropertyCollector.FilterUpdate(objectSet=[
+            vmodl.query.PropertyCollector.ObjectUpdate(
+                obj=task,
+                kind='modify',
+                changeSet=[vmodl.query.PropertyCollector.Change(name='info.state', op='assign', val=state)])])])
+
+
+class FakeTaskCollector(object):
+    """
+    Returns the scripted update sets one WaitForUpdatesEx call at a time
+    """
+
+    def __init__(self):
+        self.update_sets = []
+        self.scripted = Event()
+        self.cancelled = False
+
+    def script(self, update_set):
+        self.update_sets.append(update_set)
+        self.scripted.set()
+
+    def CreatePropertyCollector(self):
+        return self
+
+    def CreateFilter(self, spec, partialUpdates):
+        self.spec = spec
+
+    def WaitForUpdatesEx(self, version, options):
+        self.scripted.wait(0.05)
+        self.scripted.clear()
+        if self.cancelled:
+            raise vmodl.fault.RequestCanceled()
+        if self.update_sets:
+            return self.update_sets.pop(0)
+        return None
+
+    def CancelWaitForUpdates(self):
+        self.cancelled = True
+        self.scripted.set()
+
+    def DestroyPropertyCollector(self):
+        pass
+
+
+class TestTaskCompletionEngine(unittest.TestCase):
+    def setUp(self):
+        self.collector = FakeTaskCollector()
+        self.view = Mock(spec=vim.view.ListView)
+        self.content = Mock()
+        self.content.propertyCollector = self.collector
+        self.content.viewManager.CreateListView = Mock(return_value=self.view)
+        self.task = vim.Task('task-1', Mock())
+
+    def test_waiter_wakes_when_task_completes(self):
+        watcher = TaskWatcher(self.content)
+        watcher.start()
+        try:
+            Thread(target=self._complete_later, args=(self.task, vim.TaskInfo.State.success)).start()
+            started = time.time()
+
+            completed = watcher.wait(self.task, 5)
+
+            self.assertTrue(completed)
+            self.assertLess(time.time() - started, 2)
+            self.view.ModifyListView.assert_any_call(add=[self.task])
+            self.view.ModifyListView.assert_any_call(remove=[self.task])
+        finally:
+            self._stop(watcher)
+
+    def test_wait_times_out_while_task_is_running(self):
+        watcher = TaskWatcher(self.content)
+        watcher.start()
+        try:
+            self.collector.script(state_update(self.task, vim.TaskInfo.State.running))
+
+            self.assertFalse(watcher.wait(self.task, 0.1))
+            self.assertEqual(self.view.ModifyListView.call_count, 1)
+        finally:
+            self._stop(watcher)
+
+    def test_filter_watches_task_state_through_view(self):
+        watcher = TaskWatcher(self.content)
+        watcher.start()
+        self._stop(watcher)
+
+        self.assertEqual(self.collector.spec.objectSet[0].obj, self.view)
+        self.assertEqual(self.collector.spec.propSet[0].pathSet, ['info.state'])
+
+    def test_engine_shares_one_watcher_per_connection(self):
+        engine = TaskCompletionEngine()
+        engine.get_content = Mock(return_value=self.content)
+        other_task = vim.Task('task-2', self.task._stub)
+        try:
+            engine.wait(self.task, 0.01)
+            engine.wait(other_task, 0.01)
+
+            self.assertEqual(engine.get_content.call_count, 1)
+        finally:
+            watchers = engine._watchers.values()
+            engine.stop()
+            for watcher in watchers:
+                watcher._thread.join()
+
+    @patch('time.sleep')
+    def test_engine_falls_back_to_sleep_when_stream_is_unavailable(self, sleep):
+        engine = TaskCompletionEngine()
+        engine.get_content = Mock(side_effect=Exception('not supported'))
+
+        # the task is read by the waiter after the sleep, no update tells it completed
+        self.assertTrue(engine.wait(self.task, 2))
+        sleep.assert_called_once_with(2)
+
+    def test_task_waiter_uses_engine(self):
+        task = Mock(spec=vim.Task)
+        task.info = Mock(spec=vim.TaskInfo)
+        task.info.state = vim.TaskInfo.State.running
+        task.info.result = 'result'
+        engine = Mock()
+
+        def complete(t, timeout):
+            t.info.state = vim.TaskInfo.State.success
+            return True
+
+        engine.wait = Mock(side_effect=complete)
+        waiter = SynchronousTaskWaiter(completion_engine=engine)
+
+        res = waiter.wait_for_task(task=task, logger=Mock(), action_name='job')
+
+        self.assertEqual(res, 'result')
+        engine.wait.assert_called_once_with(task, 2)
+
+    def test_task_waiter_does_not_read_the_task_when_the_wait_times_out(self):
+        task = Mock(spec=vim.Task)
+        info = Mock(spec=vim.TaskInfo)
+        info.state = vim.TaskInfo.State.running
+        info.result = 'result'
+        reads = []
+
+        def read_info():
+            reads.append(info.state)
+            return info
+
+        type(task).info = PropertyMock(side_effect=read_info)
+        engine = Mock()
+
+        def complete(t, timeout):
+            if engine.wait.call_count < 5:
+                return False
+            info.state = vim.TaskInfo.State.success
+            return True
+
+        engine.wait = Mock(side_effect=complete)
+        waiter = SynchronousTaskWaiter(completion_engine=engine)
+
+        res = waiter.wait_for_task(task=task, logger=Mock(), action_name='job')
+
+        self.assertEqual(res, 'result')
+        self.assertEqual(engine.wait.call_count, 5)
+        self.assertEqual(reads, [vim.TaskInfo.State.running, vim.TaskInfo.State.success])
+
+    def test_task_waiter_reads_the_task_when_the_command_is_cancelled(self):
+        task = Mock(spec=vim.Task)
+        task.info = Mock(spec=vim.TaskInfo)
+        task.info.state = vim.TaskInfo.State.running
+        task.info.cancelable = True
+        task.info.cancelled = False
+        cancellation_context = Mock()
+        cancellation_context.is_cancelled = False
+        engine = Mock()
+
+        def cancel(t, timeout):
+            cancellation_context.is_cancelled = True
+            t.CancelTask.side_effect = lambda: setattr(t.info, 'state', vim.TaskInfo.State.error)
+            return False
+
+        engine.wait = Mock(side_effect=cancel)
+        task.info.error = Mock(faultMessage=None, msg='cancelled')
+        task.info.name = Mock()
+        waiter = SynchronousTaskWaiter(completion_engine=engine)
+
+        self.assertRaises(TaskFaultException, waiter.wait_for_task, task=task, logger=Mock(), action_name='job',
+                          cancellation_context=cancellation_context)
+        task.CancelTask.assert_called_once_with()
+
+    @staticmethod
+    def _stop(watcher):
+        watcher.stop()
+        watcher._thread.join()
+
+    def _complete_later(self, task, state):
+        time.sleep(0.1)
+        self.collector.script(state_update(task, state))
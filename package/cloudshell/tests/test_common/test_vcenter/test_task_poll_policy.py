@@ -0,0 +1,90 @@
+import unittest
+
+from mock import Mock, patch
+from pyVmomi import vim
+
+from cloudshell.cp.vcenter.common.utilites.savers.linked_clone_artifact_saver import LinkedCloneArtifactHandler
+from cloudshell.cp.vcenter.common.vcenter.task_poll_policy import TaskPollPolicy, PollSchedule, DEFAULT_SCHEDULES, \
+    POWER_OFF, DESTROY_VM
+from cloudshell.cp.vcenter.common.vcenter.task_waiter import SynchronousTaskWaiter
+
+
+class TestTaskPollPolicy(unittest.TestCase):
+    def setUp(self):
+        self.policy = TaskPollPolicy()
+
+    def test_backs_off_exponentially_up_to_cap(self):
+        intervals = [self.policy.next_interval('job', polls) for polls in range(6)]
+
+        self.assertEqual(intervals, [0.25, 0.5, 1, 2, 2, 2])
+
+    def test_action_schedules(self):
+        self.assertEqual(self.policy.next_interval('Power On', 0), 0.1)
+        self.assertEqual(self.policy.next_interval('Clone VM', 0), 1)
+        self.assertEqual(self.policy.next_interval('Clone VM', 10), 5)
+
+    def test_schedule_override(self):
+        policy = TaskPollPolicy(schedules={'Power On': PollSchedule(initial=0.5, factor=1, cap=0.5)})
+
+        self.assertEqual(policy.next_interval('Power On', 3), 0.5)
+        self.assertEqual(policy.next_interval('Clone VM', 0), 1)
+
+    def test_progress_estimates_next_check(self):
+        # 40 seconds for 80% leaves about 10 seconds, the next check is halfway there
+        self.assertEqual(self.policy.next_interval('Clone VM', 1, elapsed=40, progress=80), 5)
+        self.assertEqual(self.policy.next_interval('Clone VM', 10, elapsed=40, progress=95), 40 * 5 / 95.0 / 2)
+        # never checks sooner than the initial interval
+        self.assertEqual(self.policy.next_interval('Clone VM', 10, elapsed=1, progress=99), 1)
+
+    def test_ignores_missing_progress(self):
+        self.assertEqual(self.policy.next_interval('job', 0, elapsed=10, progress=None), 0.25)
+        self.assertEqual(self.policy.next_interval('job', 0, elapsed=10, progress=0), 0.25)
+
+    def test_metrics(self):
+        self.policy.metrics.record('Clone VM', 3)
+        self.policy.metrics.record('Clone VM', 5)
+
+        self.assertEqual(self.policy.metrics.tasks['Clone VM'], 2)
+        self.assertEqual(self.policy.metrics.max_polls['Clone VM'], 5)
+        self.assertEqual(self.policy.metrics.average_polls('Clone VM'), 4)
+        self.assertEqual(self.policy.metrics.average_polls('Power On'), 0)
+
+    @patch('time.sleep')
+    def test_task_waiter_sleeps_by_policy_and_records_polls(self, sleep):
+        task = Mock(spec=vim.Task)
+        task.info = Mock(spec=vim.TaskInfo)
+        task.info.state = vim.TaskInfo.State.running
+        task.info.progress = None
+        task.info.result = None
+        sleeps = []
+
+        def sleep_and_complete(interval):
+            sleeps.append(interval)
+            if len(sleeps) == 3:
+                task.info.state = vim.TaskInfo.State.success
+
+        sleep.side_effect = sleep_and_complete
+        waiter = SynchronousTaskWaiter()
+
+        waiter.wait_for_task(task=task, logger=Mock(), action_name='Power On')
+
+        self.assertEqual([round(interval, 3) for interval in sleeps], [0.1, 0.15, 0.225])
+        self.assertEqual(waiter.poll_policy.metrics.polls['Power On'], 3)
+
+
+class TestCallerActionNames(unittest.TestCase):
+    def test_saver_tasks_select_their_schedules(self):
+        task_waiter = Mock()
+        task_waiter.wait_for_tasks = Mock(return_value=[])
+        handler = LinkedCloneArtifactHandler(Mock(), Mock(), Mock(), Mock(), Mock(), 'reservation', Mock(), Mock(),
+                                             task_waiter, Mock(), Mock(), Mock())
+        vm = Mock()
+        vm.summary.runtime.powerState = 'poweredOn'
+
+        handler._get_rid_of_vms([vm], Mock())
+
+        action_names = [call[0][2] for call in task_waiter.wait_for_tasks.call_args_list]
+        self.assertEqual(action_names, [POWER_OFF, DESTROY_VM])
+        policy = TaskPollPolicy()
+        self.assertIs(policy.get_schedule(action_names[0]), DEFAULT_SCHEDULES[POWER_OFF])
+        self.assertIs(policy.get_schedule(action_names[1]), DEFAULT_SCHEDULES[DESTROY_VM])
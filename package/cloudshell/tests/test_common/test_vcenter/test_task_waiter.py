@@ -1,9 +1,10 @@
 import unittest
 
 from mock import Mock, patch
-from pyVmomi import vim
+from pyVmomi import vim, vmodl
 
 from cloudshell.cp.vcenter.common.vcenter.task_waiter import SynchronousTaskWaiter
+from cloudshell.cp.vcenter.exceptions.task_waiter import TaskFaultException
 
 task = Mock(spec=vim.Task)
 
@@ -77,3 +78,67 @@ class TestTaskWaiter(unittest.TestCase):
         waiter = SynchronousTaskWaiter()
 
         self.assertRaises(Exception, waiter.wait_for_task, task)
+
+
+def retrieve_result(infos):
+    return vmodl.query.PropertyCollector.RetrieveResult(
+        objects=[vmodl.query.PropertyCollector.ObjectContent(
+            obj=task,
+            propSet=[vmodl.DynamicProperty(name='info', val=info)]) for task, info in infos])
+
+
+def task_info(state, result=None, cancelable=False, error=None):
+    return vim.TaskInfo(key='key', state=state, result=result, cancelable=cancelable, cancelled=False, error=error)
+
+
+class TestWaitForTasks(unittest.TestCase):
+    def setUp(self):
+        self.stub = Mock()
+        self.task1 = vim.Task('task-1', self.stub)
+        self.task2 = vim.Task('task-2', self.stub)
+        self.collector = Mock()
+        self.waiter = SynchronousTaskWaiter()
+        self.waiter.get_property_collector = Mock(return_value=self.collector)
+
+    @patch('time.sleep')
+    def test_yields_tasks_as_they_complete(self, sleep):
+        self.collector.RetrievePropertiesEx = Mock(side_effect=[
+            retrieve_result([(self.task1, task_info('running')), (self.task2, task_info('success', result='vm'))]),
+            retrieve_result([(self.task1, task_info('success', result='other vm'))])])
+
+        results = list(self.waiter.wait_for_tasks([self.task1, self.task2], Mock()))
+
+        self.assertEqual(results, [(self.task2, 'vm', None), (self.task1, 'other vm', None)])
+        self.assertEqual(self.collector.RetrievePropertiesEx.call_count, 2)
+        spec = self.collector.RetrievePropertiesEx.call_args_list[1][0][0][0]
+        self.assertEqual([obj_spec.obj for obj_spec in spec.objectSet], [self.task1])
+        sleep.assert_called_once_with(0.25)
+
+    @patch('time.sleep')
+    def test_failed_task_is_yielded_with_error(self, sleep):
+        error = vmodl.MethodFault(msg='no space left', faultMessage=[])
+        self.collector.RetrievePropertiesEx = Mock(return_value=retrieve_result(
+            [(self.task1, task_info('error', error=error)), (self.task2, task_info('success'))]))
+
+        results = list(self.waiter.wait_for_tasks([self.task1, self.task2], Mock()))
+
+        task, result, error = results[0]
+        self.assertEqual(task, self.task1)
+        self.assertIsInstance(error, TaskFaultException)
+        self.assertEqual(error.message, 'no space left')
+        self.assertEqual(results[1], (self.task2, None, None))
+
+    @patch('time.sleep')
+    def test_cancels_outstanding_tasks(self, sleep):
+        cancellation_context = Mock()
+        cancellation_context.is_cancelled = True
+        cancelled = vmodl.MethodFault(msg='cancelled', faultMessage=[])
+        self.collector.RetrievePropertiesEx = Mock(side_effect=[
+            retrieve_result([(self.task1, task_info('running', cancelable=True))]),
+            retrieve_result([(self.task1, task_info('error', error=cancelled))])])
+
+        results = list(self.waiter.wait_for_tasks([self.task1], Mock(), cancellation_context=cancellation_context))
+
+        self.assertEqual(results[0][2].message, 'cancelled')
+        invoked_method = self.stub.InvokeMethod.call_args[0][1]
+        self.assertEqual(invoked_method.wsdlName, 'CancelTask')
@@ -2,7 +2,7 @@ from unittest import TestCase
 
 import jsonpickle
 
-from cloudshell.cp.vcenter.models.DeployDataHolder import DeployDataHolder
+from cloudshell.cp.vcenter.models.DeployDataHolder import DeployDataHolder, LazyDeployDataHolder
 
 
 class TestDeployDataHolder(TestCase):
@@ -80,3 +80,27 @@ class TestDeployDataHolder(TestCase):
         self.assertEqual(holder.driverRequest.actions[0][1][0], '100-200')
         self.assertEqual(holder.driverRequest.actions[0][1][1], '300')
 
+
+class TestLazyDeployDataHolder(TestCase):
+    def test_values_are_converted_when_read(self):
+        dictionary = {'driverRequest': {'actions': [{'actionId': 'vlan1',
+                                                     'connectionParams': {'vlanIds': ['100-200', '300']},
+                                                     'connectorAttributes': [{'attributeName': 'QNQ'}]}]}}
+
+        holder = LazyDeployDataHolder(dictionary)
+
+        self.assertNotIn('driverRequest', holder.__dict__)
+        action = holder.driverRequest.actions[0]
+        self.assertIs(holder.driverRequest, holder.driverRequest)
+        self.assertNotIn('connectionParams', action.__dict__)
+        self.assertEqual(action.actionId, 'vlan1')
+        self.assertEqual(action.connectionParams.vlanIds, ['100-200', '300'])
+        self.assertEqual(action.connectorAttributes[0].attributeName, 'QNQ')
+        self.assertFalse(hasattr(action, 'customActionAttributes'))
+
+    def test_holder_is_encoded_as_its_dictionary(self):
+        holder = LazyDeployDataHolder({'actionId': 'vlan1', 'actionTarget': {'fullName': 'port1'}})
+        holder.actionTarget.fullName
+
+        self.assertEqual(jsonpickle.decode(jsonpickle.encode(holder, unpicklable=False)),
+                         {'actionId': 'vlan1', 'actionTarget': {'fullName': 'port1'}})
@@ -0,0 +1,90 @@
+import unittest
+from threading import Event, Lock
+
+from cloudshell.cp.vcenter.network.connectivity_executor import ConnectivityExecutor
+
+
+class TestConnectivityExecutor(unittest.TestCase):
+    def test_results_are_returned_in_the_order_of_the_tasks(self):
+        executor = ConnectivityExecutor(max_workers=4, max_per_vcenter=4)
+        self.addCleanup(executor.close)
+
+        results = executor.run_all('vcenter', [lambda i=i: i for i in range(10)])
+
+        self.assertEqual(results, range(10))
+
+    def test_task_error_is_raised_by_get(self):
+        executor = ConnectivityExecutor()
+        self.addCleanup(executor.close)
+
+        def fail():
+            raise ValueError('vm not found')
+
+        task = executor.submit('vcenter', fail)
+
+        self.assertRaises(ValueError, task.get)
+
+    def test_tasks_of_one_vcenter_are_limited_and_queued(self):
+        executor = ConnectivityExecutor(max_workers=10, max_per_vcenter=2)
+        self.addCleanup(executor.close)
+        release = Event()
+        started = []
+        lock = Lock()
+        all_started = Event()
+
+        def run():
+            with lock:
+                started.append(1)
+                if len(started) == 2:
+                    all_started.set()
+            release.wait()
+
+        tasks = [executor.submit('vcenter', run) for _ in range(5)]
+        all_started.wait(5)
+
+        self.assertEqual(executor.running('vcenter'), 2)
+        self.assertEqual(executor.queue_depth('vcenter'), 3)
+        self.assertEqual(executor.queue_depth(), 3)
+
+        release.set()
+        for task in tasks:
+            task.get()
+        self.assertEqual(len(started), 5)
+        self.assertEqual(executor.running(), 0)
+        self.assertEqual(executor.queue_depth(), 0)
+
+    def test_busy_vcenter_does_not_block_another_vcenter(self):
+        executor = ConnectivityExecutor(max_workers=2, max_per_vcenter=1)
+        self.addCleanup(executor.close)
+        release = Event()
+
+        busy = [executor.submit('busy', release.wait) for _ in range(3)]
+        result = executor.submit('other', lambda: 'done').get()
+
+        self.assertEqual(result, 'done')
+        release.set()
+        for task in busy:
+            task.get()
+
+    def test_pool_is_created_on_first_use_and_reused(self):
+        executor = ConnectivityExecutor()
+        self.addCleanup(executor.close)
+        self.assertIsNone(executor._pool)
+
+        executor.run_all('vcenter', [lambda: 1])
+        pool = executor._pool
+        executor.run_all('vcenter', [lambda: 2])
+
+        self.assertIs(executor._pool, pool)
+
+    def test_closed_executor_stops_its_threads(self):
+        executor = ConnectivityExecutor()
+        self.addCleanup(executor.close)
+        executor.run_all('vcenter', [lambda: 1])
+        pool = executor._pool
+
+        executor.close()
+
+        self.assertIsNone(executor._pool)
+        self.assertEqual(executor.run_all('vcenter', [lambda: 2]), [2])
+        self.assertIsNot(executor._pool, pool)
@@ -1,8 +1,12 @@
+import time
+from threading import Lock, Thread
 from unittest import TestCase
 
 from mock import Mock, create_autospec
 from pyVmomi import vim
 
+from cloudshell.cp.vcenter.common.vcenter.task_poll_policy import TaskPollPolicy, DEFAULT_SCHEDULES, \
+    CREATE_DV_PORT_GROUPS
 from cloudshell.cp.vcenter.network.dvswitch.creator import DvPortGroupCreator
 
 
@@ -65,3 +69,184 @@ class TestDvPortGroupCreator(TestCase):
 
         # assert
         self.assertTrue(dv_switch.AddDVPortgroup_Task.called)
+
+
+class FakeDvSwitch(object):
+    """
+    Creates port groups slowly, records duplicate creations and the port groups of every task
+    """
+
+    def __init__(self, create_seconds=0.05, fail_names=()):
+        self.create_seconds = create_seconds
+        self.fail_names = fail_names
+        self.portgroups = dict()
+        self.created = []
+        self.tasks = []
+        self._lock = Lock()
+
+    def AddDVPortgroup_Task(self, specs):
+        time.sleep(self.create_seconds)
+        with self._lock:
+            self.tasks.append([(spec.name, spec.defaultPortConfig.vlan.vlanId) for spec in specs])
+            if [spec for spec in specs if spec.name in self.fail_names]:
+                raise vim.fault.DuplicateName()
+            for spec in specs:
+                self.created.append(spec.name)
+                self.portgroups[spec.name] = Mock(name=spec.name)
+        return Mock()
+
+    def find_portgroup(self, si, path, name):
+        with self._lock:
+            if name not in self.portgroups:
+                raise KeyError(name)
+            return self.portgroups[name]
+
+    def find_network_by_name(self, si, path, name):
+        with self._lock:
+            return self.portgroups.get(name)
+
+
+class TestDvPortGroupCreatorConcurrency(TestCase):
+    def setUp(self):
+        self.dv_switch = FakeDvSwitch()
+        self.pyvmomi_service = Mock()
+        self.pyvmomi_service.get_network_by_name_from_vm = Mock(return_value=None)
+        self.pyvmomi_service.get_folder = Mock(return_value=self.dv_switch)
+        self.pyvmomi_service.find_portgroup = Mock(side_effect=self.dv_switch.find_portgroup)
+        self.pyvmomi_service.find_network_by_name = Mock(side_effect=self.dv_switch.find_network_by_name)
+        self.creator = DvPortGroupCreator(self.pyvmomi_service, Mock())
+        self.si = Mock()
+        self.si._stub.host = 'vcenter:443'
+
+    def _connect(self, port_name, vlan_id, results):
+        network = self.creator.get_or_create_network(si=self.si, vm=Mock(), dv_port_name=port_name,
+                                                     dv_switch_name='dvSwitch', dv_switch_path='dc',
+                                                     vlan_id=vlan_id,
+                                                     vlan_spec=vim.dvs.VmwareDistributedVirtualSwitch.VlanIdSpec(),
+                                                     logger=Mock(), promiscuous_mode='False')
+        results.append((port_name, network))
+
+    def test_stress_same_vlan_is_created_once_and_different_vlans_together(self):
+        self.creator.batcher.window = 0.2
+        results = []
+        threads = []
+        # 8 vlans, each requested by 5 sandboxes at the same time
+        for _ in range(5):
+            for vlan_id in range(8):
+                threads.append(Thread(target=self._connect, args=('QS_dvSwitch_VLAN_{0}_Access'.format(vlan_id),
+                                                                  vlan_id, results)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+
+        self.assertEqual(len(results), 40)
+        self.assertEqual(sorted(self.dv_switch.created), sorted(set(self.dv_switch.created)))
+        self.assertEqual(len(self.dv_switch.created), 8)
+        # different vlans do not wait for each other, they are created in the same tasks
+        self.assertLess(len(self.dv_switch.tasks), 8)
+        for port_name, network in results:
+            self.assertIs(network, self.dv_switch.portgroups[port_name])
+
+        contention = self.creator.contention.snapshot()
+        self.assertEqual(contention['acquired'], 40)
+        self.assertGreater(contention['contended'], 0)
+        self.assertGreater(contention['wait_seconds'], 0)
+
+    def test_network_already_on_the_vm_takes_no_lock(self):
+        network = Mock()
+        self.pyvmomi_service.get_network_by_name_from_vm = Mock(return_value=network)
+        results = []
+
+        self._connect('QS_dvSwitch_VLAN_1_Access', 1, results)
+
+        self.assertIs(results[0][1], network)
+        self.assertEqual(self.creator.contention.snapshot()['acquired'], 0)
+        self.assertEqual(self.dv_switch.created, [])
+
+    def _network_map(self, vlan_id):
+        network_map = Mock()
+        network_map.dv_port_name = 'QS_dvSwitch_VLAN_{0}_Access'.format(vlan_id)
+        network_map.dv_switch_name = 'dvSwitch'
+        network_map.dv_switch_path = 'dc'
+        network_map.vlan_id = vlan_id
+        # the factory hands out the same spec to every mapping
+        network_map.vlan_spec = self.shared_vlan_spec
+        return network_map
+
+    def test_missing_port_groups_of_a_vm_are_created_in_one_task(self):
+        self.shared_vlan_spec = vim.dvs.VmwareDistributedVirtualSwitch.VlanIdSpec()
+        network_maps = [self._network_map(vlan_id) for vlan_id in [10, 11, 12]]
+
+        networks = self.creator.get_or_create_networks(self.si, Mock(), network_maps, Mock(), 'False')
+
+        self.assertEqual(self.dv_switch.tasks, [[('QS_dvSwitch_VLAN_10_Access', 10),
+                                                 ('QS_dvSwitch_VLAN_11_Access', 11),
+                                                 ('QS_dvSwitch_VLAN_12_Access', 12)]])
+        self.assertEqual(networks, [self.dv_switch.portgroups[m.dv_port_name] for m in network_maps])
+        action_name = self.creator.synchronous_task_waiter.wait_for_task.call_args[1]['action_name']
+        self.assertIs(TaskPollPolicy().get_schedule(action_name), DEFAULT_SCHEDULES[CREATE_DV_PORT_GROUPS])
+
+    def test_missing_port_groups_of_concurrent_requests_are_created_in_one_task(self):
+        self.shared_vlan_spec = vim.dvs.VmwareDistributedVirtualSwitch.VlanIdSpec()
+        self.creator.batcher.window = 0.2
+        results = []
+        threads = [Thread(target=lambda vlan_id=vlan_id: results.append(self.creator.get_or_create_networks(
+            self.si, Mock(), [self._network_map(vlan_id)], Mock(), 'False'))) for vlan_id in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+
+        self.assertEqual(len(results), 4)
+        self.assertEqual(len(self.dv_switch.tasks), 1)
+        self.assertEqual(sorted(self.dv_switch.tasks[0]), [('QS_dvSwitch_VLAN_{0}_Access'.format(i), i)
+                                                           for i in range(4)])
+
+    def test_concurrent_requests_on_different_sessions_are_not_batched_together(self):
+        self.shared_vlan_spec = vim.dvs.VmwareDistributedVirtualSwitch.VlanIdSpec()
+        self.creator.batcher.window = 0.2
+        sessions = [Mock(), Mock()]
+        for si in sessions:
+            si._stub.host = 'vcenter:443'
+        threads = [Thread(target=self.creator.get_or_create_networks,
+                          args=(si, Mock(), [self._network_map(vlan_id)], Mock(), 'False'))
+                   for vlan_id, si in enumerate(sessions)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+
+        self.assertEqual(sorted(self.dv_switch.tasks), [[('QS_dvSwitch_VLAN_0_Access', 0)],
+                                                        [('QS_dvSwitch_VLAN_1_Access', 1)]])
+        flushed_with = [call[0][0] for call in self.pyvmomi_service.get_folder.call_args_list]
+        self.assertEqual(sorted(flushed_with, key=id), sorted(sessions, key=id))
+
+    def test_port_group_created_in_another_request_batch_is_logged_to_its_request(self):
+        self.shared_vlan_spec = vim.dvs.VmwareDistributedVirtualSwitch.VlanIdSpec()
+        self.creator.batcher.window = 0.2
+        loggers = [Mock(), Mock()]
+        threads = [Thread(target=self.creator.get_or_create_networks,
+                          args=(self.si, Mock(), [self._network_map(vlan_id)], logger, 'False'))
+                   for vlan_id, logger in enumerate(loggers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+
+        self.assertEqual(len(self.dv_switch.tasks), 1)
+        for vlan_id, logger in enumerate(loggers):
+            messages = ' '.join(call[0][0] for call in logger.info.call_args_list)
+            self.assertIn('QS_dvSwitch_VLAN_{0}_Access'.format(vlan_id), messages)
+
+    def test_failed_batch_is_created_one_by_one(self):
+        self.shared_vlan_spec = vim.dvs.VmwareDistributedVirtualSwitch.VlanIdSpec()
+        self.dv_switch.fail_names = ['QS_dvSwitch_VLAN_11_Access']
+        network_maps = [self._network_map(vlan_id) for vlan_id in [10, 11]]
+
+        self.assertRaises(vim.fault.DuplicateName, self.creator.get_or_create_networks,
+                          self.si, Mock(), network_maps, Mock(), 'False')
+
+        self.assertEqual(len(self.dv_switch.tasks), 3)
+        self.assertEqual(self.dv_switch.created, ['QS_dvSwitch_VLAN_10_Access'])
+        self.assertEqual(self.creator.locks[('dc/dvSwitch', 'QS_dvSwitch_VLAN_11_Access')].acquire(False), True)
@@ -0,0 +1,139 @@
+from unittest import TestCase
+
+from mock import Mock, patch
+from pyVmomi import vim, vmodl
+
+from cloudshell.cp.vcenter.network.dvswitch.name_generator import DvPortGroupNameGenerator
+from cloudshell.cp.vcenter.network.dvswitch.reaper import PortGroupReaper
+from cloudshell.cp.vcenter.vm.dvswitch_connector import ConnectRequest
+from cloudshell.cp.vcenter.vm.portgroup_configurer import VirtualMachinePortGroupConfigurer
+
+
+class TestPortGroupReaper(TestCase):
+    def setUp(self):
+        self.stub = Mock()
+        self.stub.host = 'vcenter:443'
+        self.task_waiter = Mock()
+        self.pyvmomi_service = Mock()
+        self.reaper = PortGroupReaper(self.task_waiter, DvPortGroupNameGenerator(), self.pyvmomi_service,
+                                      grace_period=30, interval=0)
+        self.port_groups = {'dvportgroup-1': ('QS_dvSwitch_VLAN_10_Access', []),
+                            'dvportgroup-2': ('QS_dvSwitch_VLAN_11_Access', [vim.VirtualMachine('vm-1', self.stub)]),
+                            'dvportgroup-3': ('Reserved', []),
+                            'dvportgroup-4': ('QS_dvSwitch_VLAN_12_Access', [])}
+        self.retrieve = Mock(side_effect=self._retrieve)
+        self.destroyed = []
+        patcher = patch.object(vim.PropertyCollector, 'RetrievePropertiesEx', self.retrieve, create=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _retrieve(self, specs, options):
+        objects = []
+        for obj_spec in specs[0].objectSet:
+            name, vms = self.port_groups[obj_spec.obj._moId]
+            objects.append(vmodl.query.PropertyCollector.ObjectContent(
+                obj=obj_spec.obj,
+                propSet=[vmodl.DynamicProperty(name='name', val=name),
+                         vmodl.DynamicProperty(name='vm', val=vim.VirtualMachine.Array(vms))]))
+        return vmodl.query.PropertyCollector.RetrieveResult(objects=objects)
+
+    def _port_group(self, mo_id):
+        port_group = Mock(spec=vim.dvs.DistributedVirtualPortgroup)
+        port_group._moId = mo_id
+        port_group._stub = self.stub
+        port_group.Destroy = Mock(side_effect=lambda: self.destroyed.append(mo_id))
+        return port_group
+
+    def test_unused_port_groups_are_destroyed_after_the_grace_period(self):
+        port_groups = [self._port_group(mo_id) for mo_id in sorted(self.port_groups.keys())]
+        self.reaper.submit(port_groups, ['Reserved'], Mock())
+
+        self.assertEqual(self.reaper.reap(), [])
+        self.assertEqual(self.reaper.pending(), 4)
+
+        destroyed = self.reaper.reap(now=self.reaper._candidates.values()[0].due_at)
+
+        self.assertEqual(sorted(p._moId for p in destroyed), ['dvportgroup-1', 'dvportgroup-4'])
+        self.assertEqual(sorted(self.destroyed), ['dvportgroup-1', 'dvportgroup-4'])
+        self.assertEqual(self.reaper.pending(), 0)
+        self.pyvmomi_service.remove_portgroup_from_index.assert_any_call(port_groups[0])
+
+    def test_port_groups_of_a_vcenter_are_checked_with_one_call(self):
+        self.reaper.grace_period = 0
+        self.reaper.submit([self._port_group('dvportgroup-1'), self._port_group('dvportgroup-4')], [], Mock())
+
+        self.reaper.reap()
+
+        self.assertEqual(self.retrieve.call_count, 1)
+        spec = self.retrieve.call_args[0][0][0]
+        self.assertEqual(len(spec.objectSet), 2)
+        self.assertEqual(spec.propSet[0].pathSet, ['name', 'vm'])
+
+    def test_port_group_connected_again_is_kept(self):
+        self.reaper.grace_period = 0
+        port_group = self._port_group('dvportgroup-1')
+        self.reaper.submit([port_group], [], Mock())
+
+        self.reaper.discard([port_group])
+
+        self.assertEqual(self.reaper.reap(), [])
+        self.assertFalse(self.retrieve.called)
+
+    def test_port_groups_that_could_not_be_read_are_checked_again(self):
+        self.reaper.grace_period = 0
+        self.reaper.read_retries = 1
+        self.retrieve.side_effect = Exception('not connected')
+        self.reaper.submit([self._port_group('dvportgroup-1')], [], Mock())
+
+        self.assertEqual(self.reaper.reap(), [])
+        self.assertEqual(self.reaper.pending(), 1)
+
+        self.retrieve.side_effect = self._retrieve
+        self.assertEqual([p._moId for p in self.reaper.reap()], ['dvportgroup-1'])
+
+    def test_port_groups_are_dropped_after_the_read_retries(self):
+        self.reaper.grace_period = 0
+        self.reaper.read_retries = 1
+        self.retrieve.side_effect = Exception('not connected')
+        logger = Mock()
+        self.reaper.submit([self._port_group('dvportgroup-1')], [], logger)
+
+        self.reaper.reap()
+        self.reaper.reap()
+
+        self.assertEqual(self.retrieve.call_count, 2)
+        self.assertEqual(self.reaper.pending(), 0)
+        self.assertTrue(logger.warning.called)
+
+    def test_only_port_groups_are_submitted(self):
+        self.reaper.submit([Mock(spec=vim.Network)], [], Mock())
+
+        self.assertEqual(self.reaper.pending(), 0)
+
+
+class TestConfigurerWithReaper(TestCase):
+    def test_erase_hands_the_networks_to_the_reaper(self):
+        reaper = Mock()
+        task_waiter = Mock()
+        configurer = VirtualMachinePortGroupConfigurer(Mock(), task_waiter, Mock(), Mock(),
+                                                       DvPortGroupNameGenerator(), reaper=reaper)
+        network = Mock(spec=vim.dvs.DistributedVirtualPortgroup)
+        logger = Mock()
+
+        configurer.erase_network_by_mapping([network, None], ['Reserved'], logger)
+
+        reaper.submit.assert_called_once_with([network], ['Reserved'], logger)
+        self.assertFalse(task_waiter.wait_for_task.called)
+
+    def test_connected_networks_are_kept(self):
+        reaper = Mock()
+        mapper = Mock()
+        mapper.map_request_to_vnics = Mock(return_value=dict())
+        configurer = VirtualMachinePortGroupConfigurer(Mock(), Mock(), mapper, Mock(), DvPortGroupNameGenerator(),
+                                                       reaper=reaper)
+        network = Mock()
+
+        configurer.connect_vnic_to_networks(Mock(), [ConnectRequest('Network adapter 1', network)], Mock(), [],
+                                            Mock())
+
+        reaper.discard.assert_called_once_with([network])
@@ -0,0 +1,90 @@
+import time
+from threading import Lock, Thread
+from unittest import TestCase
+
+from mock import Mock
+
+from cloudshell.cp.vcenter.vm.deploy_scheduler import DeployJob, DeployScheduler
+
+
+class TestDeployScheduler(TestCase):
+    def setUp(self):
+        self.running = dict()
+        self.max_running = dict()
+        self.lock = Lock()
+
+    def _create_job(self, action_id, datastore=None, host=None, error=None):
+        def run():
+            with self.lock:
+                for key in [datastore, host, 'all']:
+                    self.running[key] = self.running.get(key, 0) + 1
+                    self.max_running[key] = max(self.max_running.get(key, 0), self.running[key])
+            time.sleep(0.02)
+            with self.lock:
+                for key in [datastore, host, 'all']:
+                    self.running[key] -= 1
+            if error:
+                raise error
+            return action_id
+
+        return DeployJob(action_id, run, datastore, host)
+
+    def test_run_returns_every_job(self):
+        scheduler = DeployScheduler(max_parallel=3, max_per_datastore=0, max_per_host=0)
+        jobs = [self._create_job(str(i)) for i in range(6)]
+
+        results = list(scheduler.run(jobs))
+
+        self.assertEqual(sorted(result for _, result, _ in results), sorted(job.action_id for job in jobs))
+        self.assertTrue(all(error is None for _, _, error in results))
+        self.assertLessEqual(self.max_running['all'], 3)
+
+    def test_run_limits_jobs_per_datastore_and_host(self):
+        scheduler = DeployScheduler(max_parallel=8, max_per_datastore=2, max_per_host=3)
+        jobs = [self._create_job(str(i), datastore='ds1', host='host{0}'.format(i % 2)) for i in range(6)] + \
+               [self._create_job('other{0}'.format(i), datastore='ds2', host='host1') for i in range(2)]
+
+        results = list(scheduler.run(jobs))
+
+        self.assertEqual(len(results), 8)
+        self.assertLessEqual(self.max_running['ds1'], 2)
+        self.assertLessEqual(self.max_running['ds2'], 2)
+        self.assertLessEqual(self.max_running['host1'], 3)
+
+    def test_run_returns_the_error_of_a_failed_job(self):
+        scheduler = DeployScheduler(max_parallel=2)
+        error = ValueError('clone failed')
+        jobs = [self._create_job('ok', datastore='ds'), self._create_job('failed', datastore='ds', error=error)]
+
+        results = dict((job.action_id, (result, job_error)) for job, result, job_error in scheduler.run(jobs))
+
+        self.assertEqual(results['ok'], ('ok', None))
+        self.assertEqual(results['failed'], (None, error))
+
+    def test_hold_limits_the_chosen_datastores_and_hosts(self):
+        scheduler = DeployScheduler(max_parallel=8, max_per_datastore=1, max_per_host=2)
+        datastores = [Mock(_moId='datastore-1'), Mock(_moId='datastore-1'), Mock(_moId='datastore-2')]
+
+        def run(datastore, host):
+            with scheduler.hold(datastore, host):
+                with self.lock:
+                    for key in [datastore._moId, host]:
+                        self.running[key] = self.running.get(key, 0) + 1
+                        self.max_running[key] = max(self.max_running.get(key, 0), self.running[key])
+                time.sleep(0.02)
+                with self.lock:
+                    for key in [datastore._moId, host]:
+                        self.running[key] -= 1
+
+        threads = [Thread(target=run, args=(datastores[i % 3], 'host-1')) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.max_running['datastore-1'], 1)
+        self.assertEqual(self.max_running['datastore-2'], 1)
+        self.assertLessEqual(self.max_running['host-1'], 2)
+
+    def test_run_without_jobs(self):
+        self.assertEqual(list(DeployScheduler().run([])), [])
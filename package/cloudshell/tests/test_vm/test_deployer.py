@@ -8,6 +8,7 @@ from cloudshell.cp.vcenter.models.VCenterDeployVMFromLinkedCloneResourceModel im
 from cloudshell.cp.vcenter.models.vCenterCloneVMFromVMResourceModel import vCenterCloneVMFromVMResourceModel
 from cloudshell.cp.vcenter.models.vCenterVMFromTemplateResourceModel import vCenterVMFromTemplateResourceModel
 from cloudshell.cp.vcenter.vm.deploy import VirtualMachineDeployer
+from cloudshell.cp.vcenter.vm.deploy_scheduler import DeployScheduler
 
 from cloudshell.cp.vcenter.common.model_factory import ResourceModelParser
 
@@ -114,6 +115,64 @@ class TestVirtualMachineDeployer(TestCase):
 
         return vc
 
+    def test_deploy_clones_resolves_shared_placement_once(self):
+        self.pv_service.CloneVmParameters = Mock(side_effect=lambda **kwargs: Mock(**kwargs))
+        cancellation_context = Mock()
+        cancellation_context.is_cancelled = False
+        deploy_actions = [('action1', self._create_template_details('template1')),
+                          ('action2', self._create_template_details('template1')),
+                          ('action3', self._create_template_details('template2'))]
+
+        results = list(self.deployer.deploy_clones(self.si, Mock(), deploy_actions,
+                                                   self._create_vcenter_resource_context(), Mock(),
+                                                   cancellation_context, DeployScheduler(max_parallel=2)))
+
+        self.assertEqual(sorted(r.actionId for r in results), ['action1', 'action2', 'action3'])
+        self.assertTrue(all(r.success and r.vmUuid == self.uuid for r in results))
+        self.assertEqual(self.pv_service.resolve_clone_placement.call_count, 2)
+        self.assertEqual(self.pv_service.clone_vm.call_count, 3)
+        placement = self.pv_service.clone_vm.call_args[1]['placement']
+        self.assertEqual(placement, self.pv_service.resolve_clone_placement.return_value)
+
+    def test_deploy_clones_hold_the_slots_of_the_placed_clone(self):
+        self.pv_service.CloneVmParameters = Mock(side_effect=lambda **kwargs: Mock(**kwargs))
+        cancellation_context = Mock()
+        cancellation_context.is_cancelled = False
+        scheduler = DeployScheduler(max_parallel=1)
+
+        list(self.deployer.deploy_clones(self.si, Mock(), [('action1', self._create_template_details('template1'))],
+                                         self._create_vcenter_resource_context(), Mock(), cancellation_context,
+                                         scheduler))
+
+        self.assertEqual(self.pv_service.clone_vm.call_args[1]['hold_slots'], scheduler.hold)
+
+    def test_deploy_clones_reports_failed_actions(self):
+        self.pv_service.CloneVmParameters = Mock(side_effect=lambda **kwargs: Mock(**kwargs))
+        self.pv_service.resolve_clone_placement = Mock(side_effect=[ValueError('no template'), Mock()])
+        cancellation_context = Mock()
+        cancellation_context.is_cancelled = False
+        deploy_actions = [('action1', self._create_template_details('missing')),
+                          ('action2', self._create_template_details('missing')),
+                          ('action3', self._create_template_details('template'))]
+
+        results = list(self.deployer.deploy_clones(self.si, Mock(), deploy_actions,
+                                                   self._create_vcenter_resource_context(), Mock(),
+                                                   cancellation_context, DeployScheduler(max_parallel=1)))
+
+        results = dict((r.actionId, r) for r in results)
+        self.assertFalse(results['action1'].success)
+        self.assertEqual(results['action1'].errorMessage, 'no template')
+        self.assertFalse(results['action2'].success)
+        self.assertTrue(results['action3'].success)
+        self.assertEqual(self.pv_service.clone_vm.call_count, 1)
+
+    @staticmethod
+    def _create_template_details(template):
+        details = DeployFromTemplateDetails(vCenterVMFromTemplateResourceModel(), 'VM Deployment')
+        details.template_resource_model.vcenter_name = 'vcenter_resource_name'
+        details.template_resource_model.vcenter_template = template
+        return details
+
     def test_vm_deployer_error(self):
         self.clone_res.error = Mock()
 
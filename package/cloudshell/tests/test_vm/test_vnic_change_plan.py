@@ -0,0 +1,103 @@
+from unittest import TestCase
+
+from mock import Mock
+from pyVmomi import vim
+
+from cloudshell.cp.vcenter.network.dvswitch.name_generator import DvPortGroupNameGenerator
+from cloudshell.cp.vcenter.vm.dvswitch_connector import ConnectRequest
+from cloudshell.cp.vcenter.vm.portgroup_configurer import VirtualMachinePortGroupConfigurer, VNicDeviceMapper
+from cloudshell.cp.vcenter.vm.vnic_change_plan import VmChangePlan
+from cloudshell.cp.vcenter.vm.vnic_to_network_mapper import VnicToNetworkMapper
+
+
+def create_vnic(key, label, mac, network_name):
+    vnic = Mock(spec=vim.vm.device.VirtualEthernetCard)
+    vnic.key = key
+    vnic.macAddress = mac
+    vnic.deviceInfo = Mock()
+    vnic.deviceInfo.label = label
+    vnic.backing = Mock(spec=['network'])
+    vnic.backing.network.name = network_name
+    return vnic
+
+
+def create_network(name):
+    network = Mock()
+    network.name = name
+    return network
+
+
+class TestVmChangePlan(TestCase):
+    def setUp(self):
+        self.vnic1 = create_vnic(4000, 'Network adapter 1', 'mac1', 'QS_dvSwitch_VLAN_10_Access')
+        self.vnic2 = create_vnic(4001, 'Network adapter 2', 'mac2', 'Holding Network')
+        self.default_network = create_network('Holding Network')
+        self.plan = VmChangePlan(Mock(), 'uuid', {'Network adapter 1': self.vnic1, 'Network adapter 2': self.vnic2},
+                                 self.default_network)
+
+    def test_vnic_disconnected_and_connected_keeps_the_last_change(self):
+        old_network = create_network('QS_dvSwitch_VLAN_10_Access')
+        new_network = create_network('QS_dvSwitch_VLAN_20_Access')
+
+        self.plan.disconnect([VNicDeviceMapper(self.vnic1, 'mac1', self.default_network, False, 'mac1')],
+                             [old_network])
+        self.plan.connect([VNicDeviceMapper(self.vnic1, None, new_network, True, 'mac1'),
+                           VNicDeviceMapper(self.vnic2, None, new_network, True, 'mac2')])
+
+        mapping = self.plan.get_mapping()
+        self.assertEqual([(m.vnic, m.network, m.connect) for m in mapping],
+                         [(self.vnic1, new_network, True), (self.vnic2, new_network, True)])
+        self.assertEqual(self.plan.networks_to_erase, [old_network])
+        self.assertEqual([(d.vnic_name, d.from_network, d.to_network) for d in self.plan.diff()],
+                         [('Network adapter 1', 'QS_dvSwitch_VLAN_10_Access', 'QS_dvSwitch_VLAN_20_Access'),
+                          ('Network adapter 2', 'Holding Network', 'QS_dvSwitch_VLAN_20_Access')])
+
+    def test_disconnected_vnics_are_released(self):
+        self.plan.disconnect([VNicDeviceMapper(self.vnic1, 'mac1', self.default_network, False, 'mac1')], [])
+
+        self.assertEqual(self.plan.released_vnics(), ['Network adapter 1'])
+        self.assertEqual(self.plan.get_vnic_by_mac_address('mac1'), self.vnic1)
+        self.assertIsNone(self.plan.get_vnic_by_mac_address('mac3'))
+
+    def test_released_vnic_is_available_to_the_mapper(self):
+        mapper = VnicToNetworkMapper(DvPortGroupNameGenerator())
+        request = ConnectRequest('Network adapter 1', create_network('QS_dvSwitch_VLAN_20_Access'))
+
+        self.assertRaises(ValueError, mapper.map_request_to_vnics, [request], self.plan.vnics, [],
+                          self.default_network, [])
+        mapping = mapper.map_request_to_vnics([request], self.plan.vnics, [], self.default_network, [],
+                                              released_vnics=['Network adapter 1'])
+
+        self.assertEqual(mapping['Network adapter 1'], (request.network, 'Network adapter 1'))
+
+
+class TestApplyChangePlan(TestCase):
+    def setUp(self):
+        self.pyvmomi_service = Mock()
+        self.task_waiter = Mock()
+        self.vnic1 = create_vnic(4000, 'Network adapter 1', 'mac1', 'QS_dvSwitch_VLAN_10_Access')
+        self.vnic2 = create_vnic(4001, 'Network adapter 2', 'mac2', 'Holding Network')
+        self.vnic_service = Mock()
+        self.vnic_service.map_vnics = Mock(return_value={'Network adapter 1': self.vnic1,
+                                                         'Network adapter 2': self.vnic2})
+        self.configurer = VirtualMachinePortGroupConfigurer(self.pyvmomi_service, self.task_waiter,
+                                                            VnicToNetworkMapper(DvPortGroupNameGenerator()),
+                                                            self.vnic_service, DvPortGroupNameGenerator())
+        self.default_network = create_network('Holding Network')
+
+    def test_remove_and_set_changes_are_applied_with_one_reconfigure(self):
+        plan = self.configurer.create_change_plan(Mock(), 'uuid', self.default_network)
+        old_network = create_network('QS_dvSwitch_VLAN_10_Access')
+        old_network.vm = []
+        new_network = create_network('QS_dvSwitch_VLAN_20_Access')
+        plan.disconnect([VNicDeviceMapper(self.vnic1, 'mac1', self.default_network, False, 'mac1')], [old_network])
+        self.configurer.destroy_port_group_task = Mock()
+
+        self.configurer.plan_vnic_networks(plan, [ConnectRequest('Network adapter 1', new_network),
+                                                  ConnectRequest(None, new_network)], [], Mock())
+        diff = self.configurer.apply_change_plan(plan, [], Mock())
+
+        self.assertEqual(self.pyvmomi_service.vm_reconfig_task.call_count, 1)
+        self.assertEqual(len(self.pyvmomi_service.vm_reconfig_task.call_args[0][1]), 2)
+        self.configurer.destroy_port_group_task.assert_called_once_with(old_network)
+        self.assertEqual(sorted(d.vnic_name for d in diff), ['Network adapter 1', 'Network adapter 2'])
@@ -0,0 +1,109 @@
+from contextlib import closing
+import os
+import sqlite3
+import tempfile
+import time
+import uuid
+
+
+# the file the driver processes of an execution server share the pool slot reservations through
+DEFAULT_STORE_PATH = os.getenv('AppPoolSlotStore',
+                               os.path.join(tempfile.gettempdir(), 'vcentershell_app_pool_slots.db'))
+
+# seconds a slot is held for a deploy in progress, the slot of a driver process that died is freed after it
+DEFAULT_LEASE_TTL = int(os.getenv('AppPoolSlotLeaseTtl', 3600))
+
+# seconds the slot of a deployed app is kept, until every driver process has read the app in its pool occupancy
+DEFAULT_COMMITTED_TTL = int(os.getenv('AppPoolSlotCommittedTtl', 300))
+
+# seconds to wait for the store while another process reserves a slot
+DEFAULT_STORE_TIMEOUT = int(os.getenv('AppPoolSlotStoreTimeout', 30))
+
+
+class AppPoolSlots(object):
+    """
+    Reserves the slots of the restricted app pools, so concurrent deploys can not go over the pool limit.
+    A deploy reserves a slot before it starts, commits it with the name of the deployed app when it succeeds and
+    releases it when it fails or is cancelled. The reservations are kept in a SQLite file shared by the driver
+    processes, a reservation is taken under the write lock of the file, and every reservation has a lease that
+    frees the slot when the process that holds it never settles it
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH, lease_ttl=DEFAULT_LEASE_TTL, committed_ttl=DEFAULT_COMMITTED_TTL,
+                 timeout=DEFAULT_STORE_TIMEOUT):
+        """
+        :param str path: the SQLite file of the reservations
+        :param int lease_ttl: seconds a slot is held for a deploy in progress
+        :param int committed_ttl: seconds the slot of a deployed app is kept
+        :param int timeout: seconds to wait for the write lock of the file
+        """
+        self.path = path
+        self.lease_ttl = lease_ttl
+        self.committed_ttl = committed_ttl
+        self.timeout = timeout
+        self._created = False
+
+    def reserve(self, pool_name, limit, deployed_apps):
+        """
+        :param str pool_name:
+        :param int limit: the number of apps the pool allows
+        :param deployed_apps: the names of the apps deployed in the pool
+        :return: the id of the reserved slot, None when the pool is full
+        """
+        deployed_apps = set(deployed_apps)
+        now = time.time()
+        with closing(self._connect()) as connection:
+            # takes the write lock of the file, the count and the insert are not interleaved with another process
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.execute('DELETE FROM slots WHERE expires_at <= ?', (now,))
+                reserved = [app_name for app_name, in connection.execute(
+                    'SELECT app_name FROM slots WHERE pool_name = ?', (pool_name,))]
+                # a committed slot of an app the pool occupancy already holds is not counted twice
+                reserved = [app_name for app_name in reserved if app_name is None or app_name not in deployed_apps]
+                if len(deployed_apps) + len(reserved) >= limit:
+                    connection.execute('COMMIT')
+                    return None
+                slot_id = uuid.uuid4().hex
+                connection.execute('INSERT INTO slots (slot_id, pool_name, app_name, expires_at) VALUES (?, ?, ?, ?)',
+                                   (slot_id, pool_name, None, now + self.lease_ttl))
+                connection.execute('COMMIT')
+                return slot_id
+            except Exception:
+                connection.execute('ROLLBACK')
+                raise
+
+    def commit(self, slot_id, app_name):
+        """
+        called when the app the slot was reserved for is deployed
+        """
+        if slot_id is None:
+            return
+        self._execute('UPDATE slots SET app_name = ?, expires_at = ? WHERE slot_id = ?',
+                      (app_name, time.time() + self.committed_ttl, slot_id))
+
+    def release(self, slot_id):
+        """
+        called when the deploy the slot was reserved for failed or was cancelled
+        """
+        if slot_id is None:
+            return
+        self._execute('DELETE FROM slots WHERE slot_id = ?', (slot_id,))
+
+    def release_app(self, app_name):
+        """
+        called when a deployed app is deleted
+        """
+        self._execute('DELETE FROM slots WHERE app_name = ?', (app_name,))
+
+    def _execute(self, statement, parameters):
+        with closing(self._connect()) as connection:
+            connection.execute(statement, parameters)
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        if not self._created:
+            connection.execute('CREATE TABLE IF NOT EXISTS slots '
+                               '(slot_id TEXT PRIMARY KEY, pool_name TEXT, app_name TEXT, expires_at REAL)')
+            self._created = True
+        return connection
@@ -1,13 +1,14 @@
 from cloudshell.cp.core import DriverRequestParser
-from cloudshell.cp.core.models import DeployApp, DriverResponse, SaveApp, DeleteSavedApp
+from cloudshell.cp.core.models import DeployApp, DeployAppResult, DriverResponse, SaveApp, DeleteSavedApp
 from cloudshell.cp.core.utils import single
 
-from cloudshell.cp.vcenter.commands.command_orchestrator import CommandOrchestrator
+from cloudshell.cp.vcenter.commands.command_orchestrator import CommandOrchestrator, CLONE_DEPLOYMENT_MODELS
 from cloudshell.shell.core.context import ResourceCommandContext, CancellationContext
 from cloudshell.shell.core.resource_driver_interface import ResourceDriverInterface
 from cloudshell.cp.vcenter.common.vcenter.model_auto_discovery import VCenterAutoModelDiscovery
 from cloudshell.cp.vcenter.models.DeployFromTemplateDetails import DeployFromTemplateDetails
-from validate_app_deployment_helper import validate_app_deployment
+from validate_app_deployment_helper import validate_app_deployment, get_app_pool_name, PoolOccupancy
+from app_pool_slots import AppPoolSlots
 
 
 class VCenterShellDriver(ResourceDriverInterface):
@@ -20,6 +21,8 @@ class VCenterShellDriver(ResourceDriverInterface):
         """
         self.request_parser = DriverRequestParser()
         self.command_orchestrator = CommandOrchestrator()  # type: CommandOrchestrator
+        self.pool_occupancy = PoolOccupancy()
+        self.pool_slots = AppPoolSlots()
         self.deployments = dict()
         self.deployments['vCenter Clone VM From VM'] = self.deploy_clone_from_vm
         self.deployments['VCenter Deploy VM From Linked Clone'] = self.deploy_from_linked_clone
@@ -39,7 +42,10 @@ class VCenterShellDriver(ResourceDriverInterface):
         return self.command_orchestrator.disconnect(context, ports, network_name)
 
     def DeleteInstance(self, context, ports):
-        return self.command_orchestrator.DeleteInstance(context, ports)
+        res = self.command_orchestrator.DeleteInstance(context, ports)
+        self.pool_occupancy.remove(context.remote_endpoints[0].fullname)
+        self.pool_slots.release_app(context.remote_endpoints[0].fullname)
+        return res
 
     def remote_refresh_ip(self, context, cancellation_context, ports):
         return self.command_orchestrator.refresh_ip(context, cancellation_context, ports)
@@ -61,18 +67,79 @@ class VCenterShellDriver(ResourceDriverInterface):
         return self.command_orchestrator.power_cycle(context, ports, delay)
 
     def Deploy(self, context, request=None, cancellation_context=None):
-        validate_app_deployment(context, request)
+        # the request is parsed once, the validation and the deployments share its actions
         actions = self.request_parser.convert_driver_request_to_actions(request)
+        deploy_actions = [x for x in actions if isinstance(x, DeployApp)]
+        slot_ids = validate_app_deployment(context, request, self.pool_occupancy, self.pool_slots, deploy_actions)
+        try:
+            deploy_results = self._deploy(context, actions, deploy_actions, cancellation_context)
+        except Exception:
+            for slot_id in slot_ids.values():
+                self.pool_slots.release(slot_id)
+            raise
+
+        self._add_to_pools(deploy_actions, deploy_results, slot_ids)
+        return DriverResponse(deploy_results).to_driver_response_json()
+
+    def _deploy(self, context, actions, deploy_actions, cancellation_context):
+        if len(deploy_actions) > 1:
+            return self._deploy_bulk(context, deploy_actions, cancellation_context)
+
         deploy_action = single(actions, lambda x: isinstance(x, DeployApp))
         deployment_name = deploy_action.actionParams.deployment.deploymentPath
 
         if deployment_name in self.deployments.keys():
             deploy_method = self.deployments[deployment_name]
-            deploy_result = deploy_method(context, deploy_action, cancellation_context)
-            return DriverResponse([deploy_result]).to_driver_response_json()
+            return [deploy_method(context, deploy_action, cancellation_context)]
         else:
             raise Exception('Could not find the deployment')
 
+    def _deploy_bulk(self, context, deploy_actions, cancellation_context):
+        """
+        clones share one connection and run in parallel, every other deployment is deployed one after the other
+        """
+        for deploy_action in deploy_actions:
+            if deploy_action.actionParams.deployment.deploymentPath not in self.deployments.keys():
+                raise Exception('Could not find the deployment')
+
+        clone_actions = [x for x in deploy_actions
+                         if x.actionParams.deployment.deploymentPath in CLONE_DEPLOYMENT_MODELS]
+        deploy_results = []
+        if clone_actions:
+            deploy_results.extend(self.command_orchestrator.deploy_bulk(context, clone_actions, cancellation_context))
+
+        for deploy_action in deploy_actions:
+            if deploy_action in clone_actions:
+                continue
+            deploy_method = self.deployments[deploy_action.actionParams.deployment.deploymentPath]
+            try:
+                deploy_results.append(deploy_method(context, deploy_action, cancellation_context))
+            except Exception as e:
+                deploy_results.append(DeployAppResult(actionId=deploy_action.actionId, success=False,
+                                                      errorMessage=str(e)))
+
+        return deploy_results
+
+    def _add_to_pools(self, deploy_actions, deploy_results, slot_ids=None):
+        """
+        counts the deployed apps in their pools, the app resource is named after the deployed vm.
+        the slot reserved for an app is committed when it is deployed and released otherwise
+        :param dict slot_ids: the id of the slot reserved for every app of a restricted pool by action id
+        """
+        slot_ids = dict(slot_ids or {})
+        pools = dict((deploy_action.actionId, get_app_pool_name(deploy_action)) for deploy_action in deploy_actions)
+        for deploy_result in deploy_results:
+            slot_id = slot_ids.pop(deploy_result.actionId, None)
+            if deploy_result.success:
+                self.pool_occupancy.add(pools.get(deploy_result.actionId), deploy_result.vmName)
+                self.pool_slots.commit(slot_id, deploy_result.vmName)
+            else:
+                self.pool_slots.release(slot_id)
+
+        # an app without a result was not deployed
+        for slot_id in slot_ids.values():
+            self.pool_slots.release(slot_id)
+
     def SaveApp(self, context, request, cancellation_context=None):
         actions = self.request_parser.convert_driver_request_to_actions(request)
         save_actions = [x for x in actions if isinstance(x, SaveApp)]
@@ -0,0 +1,51 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from vcentershell_driver.app_pool_slots import AppPoolSlots
+
+
+class TestAppPoolSlots(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'slots.db')
+        self.slots = AppPoolSlots(self.path)
+
+    def test_reservations_count_against_the_limit(self):
+        first = self.slots.reserve('pool A', 3, ['app1'])
+        second = self.slots.reserve('pool A', 3, ['app1'])
+
+        self.assertIsNotNone(first)
+        self.assertIsNotNone(second)
+        self.assertIsNone(self.slots.reserve('pool A', 3, ['app1']))
+        self.assertIsNotNone(self.slots.reserve('pool B', 3, ['app1']))
+
+    def test_reservations_are_shared_by_processes(self):
+        self.slots.reserve('pool A', 1, [])
+
+        self.assertIsNone(AppPoolSlots(self.path).reserve('pool A', 1, []))
+
+    def test_released_slot_is_free(self):
+        slot_id = self.slots.reserve('pool A', 1, [])
+
+        self.slots.release(slot_id)
+
+        self.assertIsNotNone(self.slots.reserve('pool A', 1, []))
+
+    def test_committed_slot_is_not_counted_twice(self):
+        slot_id = self.slots.reserve('pool A', 2, [])
+        self.slots.commit(slot_id, 'app1')
+
+        # another process has not read app1 in its pool occupancy yet
+        self.assertIsNotNone(AppPoolSlots(self.path).reserve('pool A', 2, []))
+        self.assertIsNone(self.slots.reserve('pool A', 2, []))
+        self.slots.release_app('app1')
+        self.assertIsNotNone(self.slots.reserve('pool A', 3, ['app1']))
+
+    def test_expired_lease_frees_the_slot(self):
+        slots = AppPoolSlots(self.path, lease_ttl=-1)
+        slots.reserve('pool A', 1, [])
+
+        self.assertIsNotNone(slots.reserve('pool A', 1, []))
@@ -0,0 +1,257 @@
+import json
+import time
+from multiprocessing.pool import ThreadPool
+from threading import Lock
+from unittest import TestCase
+
+from mock import Mock, patch
+
+from vcentershell_driver.validate_app_deployment_helper import PoolOccupancy, AppLimitDeploymentError, \
+    validate_app_deployment, get_app_pool_name, PoolPolicy, PoolPolicyError, get_pool_policy
+
+
+def create_api(app_pools):
+    """
+    :param dict app_pools: the pool of every deployed app by app name
+    """
+    api = Mock()
+    api.FindResources = Mock(side_effect=lambda resourceFamily: Mock(Resources=[Mock(Name=name)
+                                                                                for name in sorted(app_pools)]))
+
+    def get_resource_details(name):
+        attr = Mock(Value=app_pools[name])
+        attr.Name = 'App Pool Name'
+        return Mock(ResourceAttributes=[attr])
+
+    api.GetResourceDetails = Mock(side_effect=get_resource_details)
+    return api
+
+
+def create_request(pool_name):
+    return json.dumps({'driverRequest': {'actions': [{'type': 'deployApp', 'actionId': '1', 'actionParams': {
+        'type': 'deployAppParams',
+        'appName': 'app',
+        'deployment': {'type': 'deployAppDeploymentInfo', 'deploymentPath': 'vCenter VM From Template'},
+        'appResource': {'type': 'appResourceInfo',
+                        'attributes': [{'attributeName': 'App Pool Name', 'attributeValue': pool_name}]}}}]}})
+
+
+class TestPoolOccupancy(TestCase):
+    def setUp(self):
+        self.api = create_api({'app1': 'pool A', 'app2': 'pool A', 'app3': 'pool B'})
+
+    def test_pools_are_scanned_once(self):
+        occupancy = PoolOccupancy()
+
+        self.assertEqual(occupancy.get_apps(self.api, 'pool A'), {'app1', 'app2'})
+        self.assertEqual(occupancy.get_apps(self.api, 'pool B'), {'app3'})
+        self.assertEqual(occupancy.get_apps(self.api, 'pool C'), set())
+
+        self.assertEqual(self.api.FindResources.call_count, 1)
+        self.assertEqual(self.api.GetResourceDetails.call_count, 3)
+
+    def test_deployed_and_deleted_apps_update_the_pools(self):
+        occupancy = PoolOccupancy()
+        occupancy.get_apps(self.api, 'pool A')
+
+        occupancy.add('pool A', 'app4')
+        occupancy.remove('app1')
+        occupancy.remove('unknown app')
+
+        self.assertEqual(occupancy.get_apps(self.api, 'pool A'), {'app2', 'app4'})
+        self.assertEqual(self.api.FindResources.call_count, 1)
+
+    def test_pools_are_reconciled_after_the_interval(self):
+        occupancy = PoolOccupancy(reconcile_interval=-1)
+        occupancy.get_apps(self.api, 'pool A')
+        api = create_api({'app2': 'pool A'})
+
+        self.assertEqual(occupancy.get_apps(api, 'pool A'), {'app2'})
+
+    def test_apps_deployed_while_scanning_are_kept(self):
+        occupancy = PoolOccupancy()
+        find_resources = self.api.FindResources.side_effect
+
+        def find_resources_while_deploying(resourceFamily):
+            occupancy.add('pool A', 'app4')
+            return find_resources(resourceFamily)
+
+        self.api.FindResources.side_effect = find_resources_while_deploying
+
+        self.assertEqual(occupancy.get_apps(self.api, 'pool A'), {'app1', 'app2', 'app4'})
+
+    def test_thousands_of_apps_are_scanned_in_parallel(self):
+        app_pools = dict(('app{0}'.format(i), 'pool {0}'.format(i % 7) if i % 5 else '') for i in range(3000))
+        api = create_api(app_pools)
+        get_resource_details = api.GetResourceDetails.side_effect
+        running = [0, 0, 0]
+        running_lock = Lock()
+
+        def get_resource_details_slowly(name):
+            with running_lock:
+                running[0] += 1
+                running[1] = max(running[:2])
+                running[2] += 1
+            time.sleep(0.0005)
+            with running_lock:
+                running[0] -= 1
+            return get_resource_details(name)
+
+        api.GetResourceDetails.side_effect = get_resource_details_slowly
+        logger = Mock()
+
+        apps = PoolOccupancy(scan_threads=8).get_apps(api, 'pool 3', logger)
+
+        self.assertEqual(apps, set(name for name, pool_name in app_pools.items() if pool_name == 'pool 3'))
+        self.assertEqual(running[2], 3000)
+        self.assertGreater(running[1], 1)
+        self.assertLessEqual(running[1], 8)
+        self.assertTrue(logger.debug.called)
+
+    def test_failed_scan_stops_its_threads(self):
+        api = create_api(dict(('app{0}'.format(i), 'pool A') for i in range(200)))
+        get_resource_details = api.GetResourceDetails.side_effect
+
+        def get_resource_details_or_fail(name):
+            if name == 'app0':
+                raise ValueError(name)
+            time.sleep(0.01)
+            return get_resource_details(name)
+
+        api.GetResourceDetails.side_effect = get_resource_details_or_fail
+        pools = []
+
+        def create_pool(processes):
+            pools.append(ThreadPool(processes))
+            return pools[-1]
+
+        with patch('vcentershell_driver.validate_app_deployment_helper.ThreadPool', side_effect=create_pool):
+            self.assertRaises(ValueError, PoolOccupancy.read_app_pools, api, 4)
+
+        self.assertEqual([worker for worker in pools[0]._pool if worker.is_alive()], [])
+
+
+class TestPoolPolicy(TestCase):
+    def test_pool_limits(self):
+        policy = PoolPolicy.parse(' pool A , 3;pool B,4;')
+
+        self.assertEqual(policy.get_limit('pool A'), 3)
+        self.assertEqual(policy.get_limit('pool B', 'Global'), 4)
+        self.assertIsNone(policy.get_limit('pool C'))
+
+    def test_domain_and_wildcard_limits(self):
+        policy = PoolPolicy.parse('web-*,2;web-*,1,QA;web-1,5;web-1,4,QA;db,3,QA')
+
+        self.assertEqual(policy.get_limit('web-1', 'QA'), 4)
+        self.assertEqual(policy.get_limit('web-1', 'Global'), 5)
+        self.assertEqual(policy.get_limit('web-2', 'QA'), 1)
+        self.assertEqual(policy.get_limit('web-2', 'Global'), 2)
+        self.assertEqual(policy.get_limit('db', 'QA'), 3)
+        self.assertIsNone(policy.get_limit('db', 'Global'))
+
+    def test_malformed_policy_is_rejected(self):
+        for raw_value in ['pool A', 'pool A,three', 'pool A,-1', ',3', 'pool A,3,', 'pool A,3,QA,4']:
+            self.assertRaises(PoolPolicyError, PoolPolicy.parse, raw_value)
+
+    def test_policy_is_parsed_once(self):
+        with patch.object(PoolPolicy, 'parse', Mock(side_effect=PoolPolicy.parse)) as parse:
+            policy = get_pool_policy('pool cached,3')
+
+            self.assertIs(get_pool_policy('pool cached,3'), policy)
+            self.assertRaises(PoolPolicyError, get_pool_policy, 'pool cached')
+            self.assertRaises(PoolPolicyError, get_pool_policy, 'pool cached')
+            self.assertEqual(parse.call_count, 2)
+
+
+class TestValidateAppDeployment(TestCase):
+    def setUp(self):
+        self.context = Mock()
+        self.context.resource.attributes = {'Restricted App Model Pools': 'pool A,2;pool B,2'}
+        self.api = create_api({'app1': 'pool A', 'app2': 'pool A', 'app3': 'pool B'})
+        for target, value in [('get_api', self.api), ('get_qs_logger', Mock())]:
+            patcher = patch('vcentershell_driver.validate_app_deployment_helper.{0}'.format(target),
+                            Mock(return_value=value))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_full_pool_raises(self):
+        self.assertRaises(AppLimitDeploymentError, validate_app_deployment, self.context, create_request('pool A'),
+                          PoolOccupancy())
+
+    def test_pool_with_room_passes(self):
+        occupancy = PoolOccupancy()
+
+        validate_app_deployment(self.context, create_request('pool B'), occupancy)
+        occupancy.add('pool B', 'app4')
+
+        self.assertRaises(AppLimitDeploymentError, validate_app_deployment, self.context, create_request('pool B'),
+                          occupancy)
+        self.assertEqual(self.api.FindResources.call_count, 1)
+
+    def test_malformed_policy_raises(self):
+        self.context.resource.attributes = {'Restricted App Model Pools': 'pool A;pool B,2'}
+
+        self.assertRaises(PoolPolicyError, validate_app_deployment, self.context, create_request('pool B'),
+                          PoolOccupancy())
+        self.assertTrue(self.api.WriteMessageToReservationOutput.called)
+
+    def test_slot_is_reserved_in_a_pool_with_room(self):
+        pool_slots = Mock()
+        pool_slots.reserve = Mock(side_effect=['slot', None])
+
+        self.assertEqual(validate_app_deployment(self.context, create_request('pool B'), PoolOccupancy(), pool_slots),
+                         {'1': 'slot'})
+        pool_slots.reserve.assert_called_once_with('pool B', 2, ['app3'])
+        self.assertRaises(AppLimitDeploymentError, validate_app_deployment, self.context, create_request('pool B'),
+                          PoolOccupancy(), pool_slots)
+
+    def test_every_app_of_a_bulk_request_takes_a_slot(self):
+        self.context.resource.attributes = {'Restricted App Model Pools': 'pool B,4;pool C,1'}
+        pool_slots = Mock()
+        pool_slots.reserve = Mock(side_effect=['slot1', 'slot2', 'slot3', None])
+        deploy_actions = [self._create_deploy_action(action_id, pool_name)
+                          for action_id, pool_name in [('1', 'pool B'), ('2', 'pool C'), ('3', 'pool B')]]
+
+        self.assertEqual(validate_app_deployment(self.context, None, PoolOccupancy(), pool_slots, deploy_actions),
+                         {'1': 'slot1', '3': 'slot2', '2': 'slot3'})
+        self.assertRaises(AppLimitDeploymentError, validate_app_deployment, self.context, None, PoolOccupancy(),
+                          pool_slots, deploy_actions[:1])
+
+    def test_bulk_request_over_the_pool_limit_raises_and_frees_its_slots(self):
+        pool_slots = Mock()
+        pool_slots.reserve = Mock(side_effect=['slot1', None])
+        deploy_actions = [self._create_deploy_action(str(i), 'pool B') for i in range(2)]
+
+        self.assertRaises(AppLimitDeploymentError, validate_app_deployment, self.context, None, PoolOccupancy(),
+                          pool_slots, deploy_actions)
+        pool_slots.release.assert_called_once_with('slot1')
+
+    def test_bulk_request_is_counted_without_slots(self):
+        deploy_actions = [self._create_deploy_action(str(i), 'pool B') for i in range(2)]
+
+        self.assertRaises(AppLimitDeploymentError, validate_app_deployment, self.context, None, PoolOccupancy(),
+                          deploy_actions=deploy_actions)
+        self.assertEqual(validate_app_deployment(self.context, None, PoolOccupancy(), deploy_actions=deploy_actions[:1]),
+                         {'0': None})
+
+    @staticmethod
+    def _create_deploy_action(action_id, pool_name):
+        deploy_action = Mock()
+        deploy_action.actionId = action_id
+        deploy_action.actionParams.appResource.attributes = {'App Pool Name': pool_name}
+        return deploy_action
+
+    def test_parsed_deploy_actions_are_validated_without_the_request(self):
+        deploy_action = Mock()
+        deploy_action.actionParams.appResource.attributes = {'App Pool Name': 'pool A'}
+
+        self.assertRaises(AppLimitDeploymentError, validate_app_deployment, self.context, None, PoolOccupancy(),
+                          deploy_actions=[deploy_action])
+
+    def test_app_pool_name_of_a_deploy_action(self):
+        deploy_action = Mock()
+        deploy_action.actionParams.appResource.attributes = {'App Pool Name': 'pool A'}
+
+        self.assertEqual(get_app_pool_name(deploy_action), 'pool A')
+        deploy_action.actionParams.appResource = None
+        self.assertIsNone(get_app_pool_name(deploy_action))
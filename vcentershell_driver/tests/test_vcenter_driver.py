@@ -1,7 +1,15 @@
+import os
+import shutil
+import tempfile
+import time
 from unittest import TestCase
 from cloudshell.api.cloudshell_api import ResourceInfo
+from cloudshell.cp.core.models import DeployApp, DeployAppParams, DeployAppDeploymentInfo, DeployAppResult, \
+    AppResourceInfo
 from mock import Mock, patch, MagicMock, create_autospec
+from vcentershell_driver.app_pool_slots import AppPoolSlots
 from vcentershell_driver.driver import VCenterShellDriver
+from vcentershell_driver.validate_app_deployment_helper import AppLimitDeploymentError
 
 
 class TestCommandOrchestrator(TestCase):
@@ -25,7 +33,11 @@ class TestCommandOrchestrator(TestCase):
                                             'Default Datacenter': 'QualiSB'}
         self.context = Mock()
         self.context.resource = self.resource
+        self.context.remote_endpoints = [Mock()]
+        self.addCleanup(self.driver.command_orchestrator.save_app_command._pool.close)
+        self.addCleanup(self.driver.command_orchestrator.delete_saved_sandbox_command._pool.close)
         self.driver.command_orchestrator = MagicMock()
+        self.driver.pool_slots = Mock()
         self.cancellation_context = Mock()
         self.ports = Mock()
 
@@ -76,6 +88,132 @@ class TestCommandOrchestrator(TestCase):
         self.assertTrue(self.driver.command_orchestrator.deploy_from_template.called_with(self.context,
                                                                                           deploy_data, Mock()))
 
+    @patch('vcentershell_driver.driver.validate_app_deployment')
+    def test_deploy_many_apps(self, validate_app_deployment):
+        clone_actions = [self._create_deploy_action('1', 'vCenter VM From Template'),
+                         self._create_deploy_action('2', 'VCenter Deploy VM From Linked Clone')]
+        image_action = self._create_deploy_action('3', 'vCenter VM From Image')
+        self.driver.request_parser = Mock()
+        self.driver.request_parser.convert_driver_request_to_actions = Mock(
+            return_value=clone_actions + [image_action])
+        self.driver.command_orchestrator.deploy_bulk = Mock(
+            return_value=[DeployAppResult(actionId='2'), DeployAppResult(actionId='1')])
+        self.driver.command_orchestrator.deploy_from_image = Mock(side_effect=Exception('no image'))
+
+        res = self.driver.Deploy(self.context, 'request', self.cancellation_context)
+
+        self.assertIn('"actionId": "2"', res)
+        self.assertIn('no image', res)
+        self.driver.command_orchestrator.deploy_bulk.assert_called_once_with(self.context, clone_actions,
+                                                                             self.cancellation_context)
+
+    @patch('vcentershell_driver.driver.validate_app_deployment')
+    def test_deployed_apps_are_counted_in_their_pools(self, validate_app_deployment):
+        validate_app_deployment.return_value = {'1': 'slot'}
+        deploy_action = self._create_deploy_action('1', 'vCenter VM From Template')
+        deploy_action.actionParams.appResource = AppResourceInfo()
+        deploy_action.actionParams.appResource.attributes = {'App Pool Name': 'pool A'}
+        self.driver.request_parser = Mock()
+        self.driver.request_parser.convert_driver_request_to_actions = Mock(return_value=[deploy_action])
+        self.driver.command_orchestrator.deploy_from_template = Mock(
+            return_value=DeployAppResult(actionId='1', vmName='app1'))
+        self.driver.pool_occupancy.loaded_at = time.time()
+
+        self.driver.Deploy(self.context, 'request', self.cancellation_context)
+
+        validate_app_deployment.assert_called_once_with(self.context, 'request', self.driver.pool_occupancy,
+                                                        self.driver.pool_slots, [deploy_action])
+        self.driver.request_parser.convert_driver_request_to_actions.assert_called_once_with('request')
+        self.assertEqual(self.driver.pool_occupancy.get_apps(Mock(), 'pool A'), {'app1'})
+        self.driver.pool_slots.commit.assert_called_once_with('slot', 'app1')
+
+        self.context.remote_endpoints[0].fullname = 'app1'
+        self.driver.DeleteInstance(self.context, self.ports)
+
+        self.assertEqual(self.driver.pool_occupancy.get_apps(Mock(), 'pool A'), set())
+        self.driver.pool_slots.release_app.assert_called_once_with('app1')
+
+    @patch('vcentershell_driver.driver.validate_app_deployment')
+    def test_slot_of_a_failed_deploy_is_released(self, validate_app_deployment):
+        validate_app_deployment.return_value = {'1': 'slot'}
+        self.driver.request_parser = Mock()
+        self.driver.request_parser.convert_driver_request_to_actions = Mock(
+            return_value=[self._create_deploy_action('1', 'vCenter VM From Template')])
+        self.driver.command_orchestrator.deploy_from_template = Mock(side_effect=Exception('cancelled'))
+
+        self.assertRaises(Exception, self.driver.Deploy, self.context, 'request', self.cancellation_context)
+
+        self.driver.pool_slots.release.assert_called_once_with('slot')
+        self.assertFalse(self.driver.pool_slots.commit.called)
+
+    def test_bulk_deploy_over_the_pool_limit_is_refused(self):
+        self._use_pool_slots({'app1': 'pool A'})
+        self.driver.request_parser = Mock()
+        self.driver.request_parser.convert_driver_request_to_actions = Mock(
+            return_value=[self._create_pool_deploy_action(str(i), 'pool A') for i in range(3)])
+
+        self.assertRaises(AppLimitDeploymentError, self.driver.Deploy, self.context, 'request',
+                          self.cancellation_context)
+
+        self.assertFalse(self.driver.command_orchestrator.deploy_bulk.called)
+        # the slots reserved for the apps that had room are freed with the refused request
+        self.assertIsNotNone(self.driver.pool_slots.reserve('pool A', 3, ['app1']))
+        self.assertIsNotNone(self.driver.pool_slots.reserve('pool A', 3, ['app1']))
+
+    def test_every_app_of_a_bulk_deploy_settles_its_own_slot(self):
+        self._use_pool_slots({'app1': 'pool A'})
+        self.driver.request_parser = Mock()
+        self.driver.request_parser.convert_driver_request_to_actions = Mock(
+            return_value=[self._create_pool_deploy_action(str(i), 'pool A') for i in range(2)])
+        self.driver.command_orchestrator.deploy_bulk = Mock(
+            return_value=[DeployAppResult(actionId='1', success=False), DeployAppResult(actionId='0', vmName='app2')])
+
+        self.driver.Deploy(self.context, 'request', self.cancellation_context)
+
+        self.assertEqual(self.driver.pool_occupancy.get_apps(Mock(), 'pool A'), {'app1', 'app2'})
+        # the slot of the failed app is free, the one of the deployed app is kept
+        self.assertIsNotNone(self.driver.pool_slots.reserve('pool A', 3, ['app1']))
+        self.assertIsNone(self.driver.pool_slots.reserve('pool A', 3, ['app1']))
+
+    def _use_pool_slots(self, app_pools):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.driver.pool_slots = AppPoolSlots(os.path.join(directory, 'slots.db'))
+        for app_name, pool_name in app_pools.items():
+            self.driver.pool_occupancy.add(pool_name, app_name)
+        self.driver.pool_occupancy.loaded_at = time.time()
+        self.context.resource = Mock(attributes={'Restricted App Model Pools': 'pool A,3'})
+        for target in ['get_api', 'get_qs_logger']:
+            patcher = patch('vcentershell_driver.validate_app_deployment_helper.{0}'.format(target), Mock())
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _create_pool_deploy_action(self, action_id, pool_name):
+        deploy_action = self._create_deploy_action(action_id, 'vCenter VM From Template')
+        deploy_action.actionParams.appName = 'app{0}'.format(action_id)
+        deploy_action.actionParams.appResource = AppResourceInfo()
+        deploy_action.actionParams.appResource.attributes = {'App Pool Name': pool_name}
+        return deploy_action
+
+    @patch('vcentershell_driver.driver.validate_app_deployment')
+    def test_deploy_many_apps_unknown_deployment(self, validate_app_deployment):
+        self.driver.request_parser = Mock()
+        self.driver.request_parser.convert_driver_request_to_actions = Mock(
+            return_value=[self._create_deploy_action('1', 'vCenter VM From Template'),
+                          self._create_deploy_action('2', 'unknown')])
+
+        self.assertRaises(Exception, self.driver.Deploy, self.context, 'request', self.cancellation_context)
+        self.assertFalse(self.driver.command_orchestrator.deploy_bulk.called)
+
+    @staticmethod
+    def _create_deploy_action(action_id, deployment_path):
+        deploy_action = DeployApp()
+        deploy_action.actionId = action_id
+        deploy_action.actionParams = DeployAppParams()
+        deploy_action.actionParams.deployment = DeployAppDeploymentInfo()
+        deploy_action.actionParams.deployment.deploymentPath = deployment_path
+        return deploy_action
+
     def test_deploy_from_image(self):
         self.setUp()
         deploy_data = Mock()
@@ -1,7 +1,13 @@
+from cloudshell.cp.core import DriverRequestParser
+from cloudshell.cp.core.models import DeployApp
 from cloudshell.shell.core.session.cloudshell_session import CloudShellSessionContext
 from cloudshell.shell.core.context import ResourceCommandContext
 from cloudshell.core.logger.qs_logger import get_qs_logger
-import json
+from fnmatch import fnmatchcase
+from multiprocessing.pool import ThreadPool
+from threading import Lock
+import os
+import time
 
 
 # custom attribute attached to app resource models
@@ -10,41 +16,319 @@ VM_RESOURCE_POOL_ATTR = "App Pool Name"
 # custom attribute attached to cloud provider resource, where pool limits will be defined
 CP_RESOURCE_RESTRICTED_ATTR = "Restricted App Model Pools"
 
+# the family of the deployed app resources counted against the pool limits
+APP_RESOURCE_FAMILY = "Generic App Family"
+
+# seconds before the pool occupancy is read again from CloudShell, to pick up apps deployed or deleted elsewhere
+DEFAULT_RECONCILE_INTERVAL = int(os.getenv('AppPoolReconcileInterval', 300))
+
+# the most app resource details read at the same time while the pools are scanned
+DEFAULT_SCAN_THREADS = int(os.getenv('AppPoolScanThreadPoolSize', 10))
+
+# the CloudShell API sessions reused by the validations, by server, port, token and domain
+_api_sessions = dict()
+_api_sessions_lock = Lock()
+
+# the parsed pool policies by the raw value of the restricted pools attribute, a malformed value keeps its error
+_pool_policies = dict()
+_pool_policies_lock = Lock()
+
 
 class AppLimitDeploymentError(Exception):
     pass
 
 
-def _get_cp_restricted_attrs_dict(input_str):
+class PoolPolicyError(AppLimitDeploymentError):
+    pass
+
+
+class PoolLimit(object):
+    def __init__(self, pool_name, limit, domain=None):
+        """
+        :param str pool_name: the name of the pool, may hold the wildcards * and ?
+        :param int limit: the most apps deployed in the pool
+        :param str domain: the domain the limit applies to, None when it applies to every domain
+        """
+        self.pool_name = pool_name
+        self.limit = limit
+        self.domain = domain
+        self.is_wildcard = '*' in pool_name or '?' in pool_name
+
+    def matches(self, pool_name, domain):
+        if self.domain is not None and self.domain != domain:
+            return False
+        if self.is_wildcard:
+            return fnmatchcase(pool_name, self.pool_name)
+        return self.pool_name == pool_name
+
+
+class PoolPolicy(object):
+    """
+    The limits of the restricted app pools, parsed from the restricted pools attribute of the cloud provider.
+    sample input: 'poolA,3;poolB,4;poolB,1,QA;web-*,2'
+    every entry is 'pool,limit' or 'pool,limit,domain', a pool with * or ? limits every pool it matches.
+    the limit of a pool is taken from the first entry that matches, in this order: the pool in the domain,
+    the pool in every domain, a wildcard in the domain and a wildcard in every domain
+    """
+
+    def __init__(self, raw_value, limits):
+        """
+        :param str raw_value: the value of the attribute the policy was parsed from
+        :param list[PoolLimit] limits:
+        """
+        self.raw_value = raw_value
+        self.limits = limits
+        self._ranked = sorted(limits, key=lambda pool_limit: (pool_limit.is_wildcard, pool_limit.domain is None))
+
+    def get_limit(self, pool_name, domain=None):
+        """
+        :return: the most apps deployed in the pool, None when the pool is not restricted
+        :rtype: int
+        """
+        for pool_limit in self._ranked:
+            if pool_limit.matches(pool_name, domain):
+                return pool_limit.limit
+        return None
+
+    @staticmethod
+    def parse(raw_value):
+        """
+        :param str raw_value: the value of the restricted pools attribute
+        :rtype: PoolPolicy
+        :raises PoolPolicyError: when an entry of the value is malformed
+        """
+        limits = []
+        errors = []
+        for entry in raw_value.split(";"):
+            if not entry.strip():
+                continue
+            fields = [field.strip() for field in entry.split(",")]
+            try:
+                if len(fields) not in (2, 3) or not fields[0] or (len(fields) == 3 and not fields[2]):
+                    raise ValueError()
+                limit = int(fields[1])
+                if limit < 0:
+                    raise ValueError()
+            except ValueError:
+                errors.append("'{}'".format(entry.strip()))
+                continue
+            limits.append(PoolLimit(fields[0], limit, fields[2] if len(fields) == 3 else None))
+
+        if errors:
+            raise PoolPolicyError("The '{}' attribute has malformed entries {}, "
+                                  "expected 'pool,limit' or 'pool,limit,domain'".format(CP_RESOURCE_RESTRICTED_ATTR,
+                                                                                        ', '.join(errors)))
+        return PoolPolicy(raw_value, limits)
+
+
+def get_pool_policy(raw_value):
+    """
+    returns the pool policy of the attribute value, a value is parsed once
+    :param str raw_value: the value of the restricted pools attribute
+    :rtype: PoolPolicy
+    :raises PoolPolicyError: when the value is malformed
+    """
+    policy = _pool_policies.get(raw_value)
+    if policy is None:
+        with _pool_policies_lock:
+            policy = _pool_policies.get(raw_value)
+            if policy is None:
+                try:
+                    policy = PoolPolicy.parse(raw_value)
+                except PoolPolicyError as e:
+                    policy = e
+                _pool_policies[raw_value] = policy
+    if isinstance(policy, PoolPolicyError):
+        raise policy
+    return policy
+
+
+class PoolOccupancy(object):
+    """
+    The deployed app resources of every pool (pool name -> set of app resource names).
+    CloudShell is scanned once to fill the index, the driver adds the apps it deploys and removes the apps it
+    deletes, and the index is scanned again every reconcile_interval seconds for the apps deployed or deleted
+    outside this driver, so checking a pool limit does not read every deployed app
+    """
+
+    def __init__(self, reconcile_interval=DEFAULT_RECONCILE_INTERVAL, scan_threads=DEFAULT_SCAN_THREADS):
+        """
+        :param int reconcile_interval: seconds before the index is scanned again from CloudShell
+        :param int scan_threads: the most app resource details read at the same time while scanning
+        """
+        self.reconcile_interval = reconcile_interval
+        self.scan_threads = scan_threads
+        self.loaded_at = None
+        self._pools = dict()
+        self._app_pools = dict()
+        self._changes = None
+        self._lock = Lock()
+        self._reconcile_lock = Lock()
+
+    def get_apps(self, api, pool_name, logger=None):
+        """
+        :param CloudShellAPISession api:
+        :param str pool_name:
+        :param logger: logs the time the pools were scanned in
+        :return: the names of the app resources deployed in the pool
+        :rtype: set
+        """
+        if not self._is_fresh():
+            with self._reconcile_lock:
+                if not self._is_fresh():
+                    self.reconcile(api, logger)
+        with self._lock:
+            return set(self._pools.get(pool_name, ()))
+
+    def add(self, pool_name, app_name):
+        """
+        called when the driver deployed an app in a pool
+        """
+        if not pool_name or not app_name:
+            return
+        with self._lock:
+            self._add(pool_name, app_name)
+            if self._changes is not None:
+                self._changes.append((pool_name, app_name))
+
+    def remove(self, app_name):
+        """
+        called when the driver deleted an app
+        """
+        with self._lock:
+            self._remove(app_name)
+            if self._changes is not None:
+                self._changes.append((None, app_name))
+
+    def invalidate(self):
+        self.loaded_at = None
+
+    def reconcile(self, api, logger=None):
+        """
+        scans the pool of every deployed app, the apps added or removed while scanning are applied over the scan
+        :param CloudShellAPISession api:
+        """
+        with self._lock:
+            self._changes = []
+        started = time.time()
+        try:
+            app_pools = self.read_app_pools(api, self.scan_threads)
+        except Exception:
+            with self._lock:
+                self._changes = None
+            raise
+        if logger:
+            logger.debug('Scanned the pools of {0} apps in {1:.2f} seconds'.format(len(app_pools),
+                                                                                   time.time() - started))
+
+        with self._lock:
+            changes, self._changes = self._changes, None
+            self._pools = dict()
+            self._app_pools = dict()
+            for app_name, pool_name in app_pools.items():
+                self._add(pool_name, app_name)
+            for pool_name, app_name in changes:
+                if pool_name:
+                    self._add(pool_name, app_name)
+                else:
+                    self._remove(app_name)
+            self.loaded_at = time.time()
+
+    def _add(self, pool_name, app_name):
+        # must be called while holding the lock
+        self._remove(app_name)
+        self._pools.setdefault(pool_name, set()).add(app_name)
+        self._app_pools[app_name] = pool_name
+
+    def _remove(self, app_name):
+        # must be called while holding the lock
+        pool_name = self._app_pools.pop(app_name, None)
+        if pool_name is not None:
+            self._pools[pool_name].discard(app_name)
+
+    def _is_fresh(self):
+        return self.loaded_at is not None and time.time() - self.loaded_at < self.reconcile_interval
+
+    @staticmethod
+    def read_app_pools(api, scan_threads=DEFAULT_SCAN_THREADS):
+        """
+        reads the details of the app resources in parallel, every read is a request of its own so the threads
+        share the API session
+        :param CloudShellAPISession api:
+        :param int scan_threads: the most app resource details read at the same time
+        :return: the pool of every deployed app resource that has one, by app resource name
+        :rtype: dict
+        """
+        def read_app_pool(resource_name):
+            attrs = api.GetResourceDetails(resource_name).ResourceAttributes
+            attr_search = [attr for attr in attrs if attr.Name == VM_RESOURCE_POOL_ATTR]
+            return resource_name, attr_search[0].Value if attr_search else None
+
+        resource_names = [resource.Name for resource in
+                          api.FindResources(resourceFamily=APP_RESOURCE_FAMILY).Resources]
+        if not resource_names:
+            return dict()
+
+        pool = ThreadPool(max(min(scan_threads, len(resource_names)), 1))
+        try:
+            return dict((resource_name, pool_name) for resource_name, pool_name
+                        in pool.imap_unordered(read_app_pool, resource_names, chunksize=16) if pool_name)
+        finally:
+            # a failed read leaves the other reads queued, they are dropped and the threads are done on return
+            pool.terminate()
+            pool.join()
+
+
+def get_app_pool_name(deploy_action):
     """
-    sample input: 'poolA,3;poolB,4'
-    output: {'poolA': 3, 'pool B', 4}
-    :param str input_str:
-    :return dict:
+    :param DeployApp deploy_action:
+    :return: the pool of the app the action deploys, None when the app has no pool
     """
-    result = {}
-    semicolon_split = input_str.split(";")
-    for item in semicolon_split:
-        comma_split = item.split(",")
-        key = comma_split[0].strip()
-        value = comma_split[1].strip()
-        result[key] = value
-    return result
+    app_resource = getattr(deploy_action.actionParams, 'appResource', None)
+    attributes = getattr(app_resource, 'attributes', None) or dict()
+    return attributes.get(VM_RESOURCE_POOL_ATTR) or None
 
 
-def validate_app_deployment(context, request):
+def get_api(context):
+    """
+    returns the CloudShell API session of the context, a session is logged in once and reused
+    until the token of the server changes
+    :param ResourceCommandContext context:
+    """
+    connectivity = context.connectivity
+    key = (connectivity.server_address, connectivity.cloudshell_api_port, context.reservation.domain)
+    token = connectivity.admin_auth_token
+    session = _api_sessions.get(key)
+    if session and session[0] == token:
+        return session[1]
+
+    with _api_sessions_lock:
+        session = _api_sessions.get(key)
+        if not session or session[0] != token:
+            session = (token, CloudShellSessionContext(context).get_api())
+            _api_sessions[key] = session
+        return session[1]
+
+
+def validate_app_deployment(context, request, pool_occupancy=None, pool_slots=None, deploy_actions=None):
     """
     See sample json file for example of request
     :param ResourceCommandContext context:
     :param str request: json str of app deploy request
-    :return:
+    :param list[DeployApp] deploy_actions: the actions parsed from the request, the request is parsed when not given
+    :param PoolOccupancy pool_occupancy: the deployed apps of every pool, the pools are scanned when not given
+    :param AppPoolSlots pool_slots: reserves a slot of the pool for every app, the pools are only counted when not given
+    :return: the id of the slot reserved for every app of a restricted pool by action id
+    :rtype: dict
     """
-    api = CloudShellSessionContext(context).get_api()
+    api = get_api(context)
     res_id = context.reservation.reservation_id
     logger = get_qs_logger(log_group=res_id,
                            log_category=context.resource.model,
                            log_file_prefix=context.resource.name)
 
+    slot_ids = dict()
+
     # VALIDATE THAT CLOUD PROVIDER RESOURCE HAS POOL LIST Attribute
     cp_attrs = context.resource.attributes
     try:
@@ -60,48 +344,75 @@ def validate_app_deployment(context, request):
         # api.WriteMessageToReservationOutput(res_id, header_msg)
         # api.WriteMessageToReservationOutput(res_id, request)
 
-        # UNPACK JSON OBJECT
-        request_obj = json.loads(request)
-        request_action_params = request_obj["driverRequest"]["actions"][0]["actionParams"]
-        app_name = request_action_params["appName"]
-        deployment = request_action_params["deployment"]
-        app_resource = request_action_params["appResource"]
-        app_resource_attrs = app_resource["attributes"]
-
-        pool_attr_search = [attr for attr in app_resource_attrs if attr["attributeName"] == VM_RESOURCE_POOL_ATTR]
-        if pool_attr_search:
-            app_pool_attr_val = pool_attr_search[0]["attributeValue"]
-            restricted_attrs_dict = _get_cp_restricted_attrs_dict(cp_pool_list_val)
+        # UNPACK THE DEPLOY ACTIONS, grouped by their pool in the order of the request
+        if deploy_actions is None:
+            deploy_actions = [action for action in DriverRequestParser().convert_driver_request_to_actions(request)
+                              if isinstance(action, DeployApp)]
+        pool_names = []
+        pool_actions = dict()
+        for deploy_action in deploy_actions:
+            app_pool_attr_val = get_app_pool_name(deploy_action)
+            if app_pool_attr_val:
+                if app_pool_attr_val not in pool_actions:
+                    pool_names.append(app_pool_attr_val)
+                pool_actions.setdefault(app_pool_attr_val, []).append(deploy_action)
+
+        if pool_names:
             try:
-                app_pool_limit = restricted_attrs_dict[app_pool_attr_val]
-            except KeyError:
-                not_found_msg = "{} pool name key not in cp restricted list {}".format(app_pool_attr_val,
-                                                                                       restricted_attrs_dict)
-                api.WriteMessageToReservationOutput(res_id, not_found_msg)
-                logger.error(not_found_msg)
-            else:
-                # count deployed apps
-                all_generic_app_resources = api.FindResources(resourceFamily="Generic App Family").Resources
-
-                # collect matching apps
-                matching_apps = []
-                for resource in all_generic_app_resources:
-                    attrs = api.GetResourceDetails(resource.Name).ResourceAttributes
-                    attr_search = [attr for attr in attrs if attr.Name == VM_RESOURCE_POOL_ATTR]
-                    if attr_search:
-                        attr_val = attr_search[0].Value
-                        if attr_val == app_pool_attr_val:
-                            matching_apps.append(resource)
-
-                # PERFORM VALIDATION
-                if len(matching_apps) >= int(app_pool_limit):
-                    matching_app_names = [r.Name for r in matching_apps]
-                    exc_msg = "Can not deploy '{}'. The pool '{}' has reached it's limit of {}. Current Apps in Pool: {}".format(
-                        app_name,
-                        app_pool_attr_val,
-                        app_pool_limit,
-                        matching_app_names)
-                    api.WriteMessageToReservationOutput(res_id, '<span style="color:red">{}</span>'.format(exc_msg))
-                    logger.error(exc_msg)
-                    raise AppLimitDeploymentError(exc_msg)
+                pool_policy = get_pool_policy(cp_pool_list_val)
+            except PoolPolicyError as e:
+                api.WriteMessageToReservationOutput(res_id, '<span style="color:red">{}</span>'.format(e))
+                logger.error(str(e))
+                raise
+        try:
+            for app_pool_attr_val in pool_names:
+                _validate_pool(api, res_id, logger, app_pool_attr_val, pool_actions[app_pool_attr_val],
+                               pool_policy.get_limit(app_pool_attr_val, context.reservation.domain),
+                               cp_pool_list_val, pool_occupancy, pool_slots, slot_ids)
+        except Exception:
+            # the request is not deployed, the slots already reserved for its other apps are freed
+            if pool_slots is not None:
+                for slot_id in slot_ids.values():
+                    pool_slots.release(slot_id)
+            raise
+    return slot_ids
+
+
+def _validate_pool(api, res_id, logger, app_pool_attr_val, deploy_actions, app_pool_limit, cp_pool_list_val,
+                   pool_occupancy, pool_slots, slot_ids):
+    """
+    reserves a slot of one pool for every app of the request deployed in it
+    :raises AppLimitDeploymentError: when the pool has no room for all of the apps
+    """
+    if app_pool_limit is None:
+        not_found_msg = "{} pool name key not in cp restricted list {}".format(app_pool_attr_val, cp_pool_list_val)
+        api.WriteMessageToReservationOutput(res_id, not_found_msg)
+        logger.error(not_found_msg)
+        return
+
+    # count deployed apps
+    if pool_occupancy is None:
+        pool_occupancy = PoolOccupancy(reconcile_interval=0)
+    matching_app_names = sorted(pool_occupancy.get_apps(api, app_pool_attr_val, logger))
 
+    # PERFORM VALIDATION, every app of the request takes its own slot
+    for requested, deploy_action in enumerate(deploy_actions):
+        slot_id = None
+        if pool_slots is not None:
+            slot_id = pool_slots.reserve(app_pool_attr_val, app_pool_limit, matching_app_names)
+            pool_is_full = slot_id is None
+        else:
+            pool_is_full = len(matching_app_names) + requested >= app_pool_limit
+        if pool_is_full:
+            exc_msg = "Can not deploy '{}'. The pool '{}' has reached it's limit of {}. Current Apps in Pool: {}".format(
+                deploy_action.actionParams.appName,
+                app_pool_attr_val,
+                app_pool_limit,
+                matching_app_names)
+            if requested:
+                exc_msg += ". Apps of this request in Pool: {}".format(
+                    [action.actionParams.appName for action in deploy_actions[:requested]])
+            api.WriteMessageToReservationOutput(res_id, '<span style="color:red">{}</span>'.format(exc_msg))
+            logger.error(exc_msg)
+            raise AppLimitDeploymentError(exc_msg)
+        slot_ids[deploy_action.actionId] = slot_id